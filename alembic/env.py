@@ -2,7 +2,7 @@
 import asyncio
 from logging.config import fileConfig
 
-from sqlalchemy import pool
+from sqlalchemy import pool, text
 from sqlalchemy.engine import Connection
 from sqlalchemy.ext.asyncio import async_engine_from_config
 
@@ -23,7 +23,7 @@ import os
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
 from app.config import settings
-from app.database import Base
+from app.database import Base, database_url
 from app.models import (
     User, Library, LibraryPermission, Author, Book,
     Tag, BookTag, Favorite, UserBookTag, ReadingProgress
@@ -32,8 +32,10 @@ from app.models import (
 # 设置 target_metadata 为我们的模型 Base
 target_metadata = Base.metadata
 
-# 从应用配置获取数据库 URL
-config.set_main_option("sqlalchemy.url", settings.database.url)
+# 从应用配置获取数据库 URL（ConfigParser 中 % 需转义）
+config.set_main_option(
+    "sqlalchemy.url", database_url().render_as_string(hide_password=False).replace("%", "%%")
+)
 
 
 def run_migrations_offline() -> None:
@@ -63,6 +65,15 @@ def run_migrations_offline() -> None:
 
 def do_run_migrations(connection: Connection) -> None:
     """在给定连接上运行迁移"""
+    # 部分修订号超过 alembic_version 默认的 VARCHAR(32)（SQLite 不校验长度，PostgreSQL 会拒绝写入）
+    if connection.dialect.name == "postgresql":
+        connection.execute(text(
+            "CREATE TABLE IF NOT EXISTS alembic_version ("
+            "version_num VARCHAR(64) NOT NULL, CONSTRAINT alembic_version_pkc PRIMARY KEY (version_num))"
+        ))
+        connection.execute(text("ALTER TABLE alembic_version ALTER COLUMN version_num TYPE VARCHAR(64)"))
+        connection.commit()
+
     context.configure(
         connection=connection, 
         target_metadata=target_metadata,
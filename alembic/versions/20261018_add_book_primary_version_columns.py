@@ -0,0 +1,51 @@
+"""add book primary version columns
+
+Revision ID: 20261018_add_book_primary_version_columns
+Revises: 20261018_add_user_token_version
+Create Date: 2026-10-18 14:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "20261018_add_book_primary_version_columns"
+down_revision: Union[str, Sequence[str], None] = "20261018_add_user_token_version"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def _primary(column: str) -> str:
+    return (
+        f"(SELECT v.{column} FROM book_versions v WHERE v.book_id = books.id "
+        f"ORDER BY v.is_primary DESC, v.id LIMIT 1)"
+    )
+
+
+def upgrade() -> None:
+    op.add_column("books", sa.Column("file_size", sa.Integer(), nullable=False, server_default="0"))
+    op.add_column("books", sa.Column("file_format", sa.String(length=20), nullable=False, server_default=""))
+    op.add_column("books", sa.Column("file_hash", sa.String(length=64), nullable=True))
+    op.create_index(op.f("ix_books_file_size"), "books", ["file_size"], unique=False)
+    op.create_index(op.f("ix_books_file_format"), "books", ["file_format"], unique=False)
+    op.create_index(op.f("ix_books_file_hash"), "books", ["file_hash"], unique=False)
+
+    # 回填主版本（无主版本时取最早的版本）的文件信息
+    op.execute(
+        "UPDATE books SET "
+        f"file_size = COALESCE({_primary('file_size')}, 0), "
+        f"file_format = COALESCE({_primary('file_format')}, ''), "
+        f"file_hash = {_primary('file_hash')}"
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_books_file_hash"), table_name="books")
+    op.drop_index(op.f("ix_books_file_format"), table_name="books")
+    op.drop_index(op.f("ix_books_file_size"), table_name="books")
+    op.drop_column("books", "file_hash")
+    op.drop_column("books", "file_format")
+    op.drop_column("books", "file_size")
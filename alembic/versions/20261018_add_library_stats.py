@@ -0,0 +1,94 @@
+"""add library stats tables
+
+Revision ID: 20261018_add_library_stats
+Revises: 20261018_add_book_primary_version_columns
+Create Date: 2026-10-18 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "20261018_add_library_stats"
+down_revision: Union[str, Sequence[str], None] = "20261018_add_book_primary_version_columns"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "library_stats",
+        sa.Column("library_id", sa.Integer(), nullable=False),
+        sa.Column("book_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("author_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("group_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("version_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("cover_count", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("total_size", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("primary_size", sa.BigInteger(), nullable=False, server_default="0"),
+        sa.Column("reconciled_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["library_id"], ["libraries.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("library_id"),
+    )
+    op.create_table(
+        "library_stat_authors",
+        sa.Column("library_id", sa.Integer(), nullable=False),
+        sa.Column("author_id", sa.Integer(), nullable=False),
+        sa.Column("book_count", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("library_id", "author_id"),
+    )
+    op.create_table(
+        "library_stat_groups",
+        sa.Column("library_id", sa.Integer(), nullable=False),
+        sa.Column("group_id", sa.Integer(), nullable=False),
+        sa.Column("book_count", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("library_id", "group_id"),
+    )
+    op.create_table(
+        "library_stat_formats",
+        sa.Column("library_id", sa.Integer(), nullable=False),
+        sa.Column("file_format", sa.String(length=20), nullable=False),
+        sa.Column("version_count", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("library_id", "file_format"),
+    )
+    op.create_table(
+        "library_stat_daily",
+        sa.Column("library_id", sa.Integer(), nullable=False),
+        sa.Column("day", sa.String(length=10), nullable=False),
+        sa.Column("book_count", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("library_id", "day"),
+    )
+    # 统计数据与维护触发器在应用启动时创建并全量计算（app.core.library_stats）
+
+
+def downgrade() -> None:
+    # 触发器名 -> 所在表
+    triggers = {
+        "library_stats_book_insert": "books",
+        "library_stats_book_delete": "books",
+        "library_stats_book_update": "books",
+        "library_stats_book_move": "books",
+        "library_stats_version_insert": "book_versions",
+        "library_stats_version_delete": "book_versions",
+        "library_stats_version_update": "book_versions",
+        "library_stats_library_delete": "libraries",
+        "library_stat_authors_insert": "library_stat_authors",
+        "library_stat_authors_delete": "library_stat_authors",
+        "library_stat_groups_insert": "library_stat_groups",
+        "library_stat_groups_delete": "library_stat_groups",
+    }
+    dialect = op.get_bind().dialect.name
+    for name, table in triggers.items():
+        if dialect == "sqlite":
+            op.execute(f"DROP TRIGGER IF EXISTS {name}")
+        elif dialect == "postgresql":
+            op.execute(f"DROP TRIGGER IF EXISTS {name} ON {table}")
+            op.execute(f"DROP FUNCTION IF EXISTS {name}()")
+    op.drop_table("library_stat_daily")
+    op.drop_table("library_stat_formats")
+    op.drop_table("library_stat_groups")
+    op.drop_table("library_stat_authors")
+    op.drop_table("library_stats")
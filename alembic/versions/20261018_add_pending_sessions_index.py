@@ -0,0 +1,33 @@
+"""add partial index for reading sessions pending rollup
+
+Revision ID: 20261018_add_pending_sessions_index
+Revises: 20261018_widen_file_size_columns
+Create Date: 2026-10-18 23:30:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "20261018_add_pending_sessions_index"
+down_revision: Union[str, Sequence[str], None] = "20261018_widen_file_size_columns"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# 与 app.models.READING_SESSION_PENDING 一致
+PENDING = "counted_seconds IS NULL OR counted_seconds <> coalesce(duration_seconds, 0)"
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_reading_sessions_pending", "reading_sessions",
+        ["user_id", "book_id", "start_time", "duration_seconds", "counted_seconds"], unique=False,
+        sqlite_where=sa.text(PENDING), postgresql_where=sa.text(PENDING),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_reading_sessions_pending", table_name="reading_sessions")
@@ -0,0 +1,85 @@
+"""add reading stats rollups
+
+Revision ID: 20261018_add_reading_stats_rollups
+Revises: 20261018_add_library_stats
+Create Date: 2026-10-18 18:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "20261018_add_reading_stats_rollups"
+down_revision: Union[str, Sequence[str], None] = "20261018_add_library_stats"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column("reading_sessions", sa.Column("counted_seconds", sa.Integer(), nullable=True))
+    op.create_index("ix_reading_sessions_user_start", "reading_sessions", ["user_id", "start_time"], unique=False)
+
+    op.create_table(
+        "reading_stats_daily",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("day", sa.String(length=10), nullable=False),
+        sa.Column("duration_seconds", sa.Integer(), nullable=False),
+        sa.Column("session_count", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("user_id", "day"),
+    )
+    op.create_table(
+        "reading_stats_hourly",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("day", sa.String(length=10), nullable=False),
+        sa.Column("hour", sa.Integer(), nullable=False),
+        sa.Column("duration_seconds", sa.Integer(), nullable=False),
+        sa.Column("session_count", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("user_id", "day", "hour"),
+    )
+    op.create_table(
+        "reading_stats_books",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("book_id", sa.Integer(), nullable=False),
+        sa.Column("duration_seconds", sa.Integer(), nullable=False),
+        sa.Column("session_count", sa.Integer(), nullable=False),
+        sa.Column("last_read_at", sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint("user_id", "book_id"),
+    )
+    op.create_index(op.f("ix_reading_stats_books_book_id"), "reading_stats_books", ["book_id"], unique=False)
+
+    # 回填已有会话（按会话开始时间的 UTC 日期与小时），并标记为已计入
+    if op.get_bind().dialect.name == "postgresql":
+        day = "to_char(start_time, 'YYYY-MM-DD')"
+        hour = "CAST(extract(hour FROM start_time) AS INTEGER)"
+    else:
+        day = "date(start_time)"
+        hour = "CAST(strftime('%H', start_time) AS INTEGER)"
+    duration = "coalesce(duration_seconds, 0)"
+    op.execute(
+        "INSERT INTO reading_stats_daily (user_id, day, duration_seconds, session_count) "
+        f"SELECT user_id, {day}, sum({duration}), count(*) FROM reading_sessions "
+        f"GROUP BY user_id, {day}"
+    )
+    op.execute(
+        "INSERT INTO reading_stats_hourly (user_id, day, hour, duration_seconds, session_count) "
+        f"SELECT user_id, {day}, {hour}, sum({duration}), count(*) FROM reading_sessions "
+        f"GROUP BY user_id, {day}, {hour}"
+    )
+    op.execute(
+        "INSERT INTO reading_stats_books (user_id, book_id, duration_seconds, session_count, last_read_at) "
+        f"SELECT user_id, book_id, sum({duration}), count(*), max(start_time) FROM reading_sessions "
+        "GROUP BY user_id, book_id"
+    )
+    op.execute(f"UPDATE reading_sessions SET counted_seconds = {duration}")
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_reading_stats_books_book_id"), table_name="reading_stats_books")
+    op.drop_table("reading_stats_books")
+    op.drop_table("reading_stats_hourly")
+    op.drop_table("reading_stats_daily")
+    op.drop_index("ix_reading_sessions_user_start", table_name="reading_sessions")
+    op.drop_column("reading_sessions", "counted_seconds")
@@ -0,0 +1,49 @@
+"""backfill books.added_at and make it not null
+
+Revision ID: 20261018_books_added_at_not_null
+Revises: 20261018_add_pending_sessions_index
+Create Date: 2026-10-18 23:45:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "20261018_books_added_at_not_null"
+down_revision: Union[str, Sequence[str], None] = "20261018_add_pending_sessions_index"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # 书籍列表按 (added_at, id) 键集分页，NULL 无法参与比较，会被翻页跳过
+    # 回填为最早版本的添加时间，没有版本时为当前时间（UTC）
+    if op.get_bind().dialect.name == "postgresql":
+        now = "(now() AT TIME ZONE 'UTC')"
+    else:
+        now = "CURRENT_TIMESTAMP"
+    op.execute(
+        "UPDATE books SET added_at = coalesce("
+        "(SELECT min(book_versions.added_at) FROM book_versions WHERE book_versions.book_id = books.id), "
+        f"{now}) WHERE added_at IS NULL"
+    )
+    _alter_nullable(False)
+
+
+def downgrade() -> None:
+    _alter_nullable(True)
+
+
+def _alter_nullable(nullable: bool) -> None:
+    if op.get_bind().dialect.name == "sqlite":
+        # SQLite 需重建 books 表：引用 books 的触发器（含其他表上的）会使重命名失败，先删除，应用启动时自动重建
+        triggers = op.get_bind().execute(sa.text(
+            "SELECT name FROM sqlite_master WHERE type = 'trigger' AND sql LIKE '%books%'"
+        )).scalars().all()
+        for name in triggers:
+            op.execute(f"DROP TRIGGER IF EXISTS {name}")
+    with op.batch_alter_table("books") as batch_op:
+        batch_op.alter_column("added_at", existing_type=sa.DateTime(), nullable=nullable)
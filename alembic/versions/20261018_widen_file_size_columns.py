@@ -0,0 +1,44 @@
+"""widen file size columns to bigint
+
+Revision ID: 20261018_widen_file_size_columns
+Revises: 20261018_add_reading_stats_rollups
+Create Date: 2026-10-18 23:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "20261018_widen_file_size_columns"
+down_revision: Union[str, Sequence[str], None] = "20261018_add_reading_stats_rollups"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# 引用 file_size 列的触发器（修改列类型前需删除；应用启动时自动重建并全量校正冗余数据）
+TRIGGERS = {
+    "book_primary_version_update": "book_versions",
+    "library_stats_book_update": "books",
+    "library_stats_version_update": "book_versions",
+}
+COLUMNS = (("books", False), ("book_versions", False))
+
+
+def _alter(type_: sa.types.TypeEngine, existing_type: sa.types.TypeEngine) -> None:
+    # SQLite 的 INTEGER 本身即 64 位，无需修改
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    for name, table in TRIGGERS.items():
+        op.execute(f"DROP TRIGGER IF EXISTS {name} ON {table}")
+    for table, nullable in COLUMNS:
+        op.alter_column(table, "file_size", type_=type_, existing_type=existing_type, existing_nullable=nullable)
+
+
+def upgrade() -> None:
+    _alter(sa.BigInteger(), sa.Integer())
+
+
+def downgrade() -> None:
+    _alter(sa.Integer(), sa.BigInteger())
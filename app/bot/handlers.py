@@ -12,15 +12,23 @@ from typing import Optional
 
 from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import ContextTypes
-from sqlalchemy import select, desc, func, or_
+from sqlalchemy import select, desc, func
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import joinedload, selectinload
 
+from app.core.backplane import backplane
+from app.core.library_stats import summarize_libraries
+from app.core.reading_stats import reading_totals
+from app.core.search_index import apply_keyword_search
 from app.database import get_db
-from app.models import User, Book, Library, Author, ReadingProgress, ReadingSession, BookVersion, Favorite
+from app.models import User, Book, Library, Author, ReadingProgress, BookVersion, Favorite
+from app.utils.auth_cache import invalidate_user
 from app.utils.logger import logger
 from app.utils.permissions import (
+    build_book_access_filters,
     get_accessible_library_ids,
+    get_accessible_book_ids,
+    filter_accessible_items,
     filter_books_by_access,
     check_book_access,
 )
@@ -37,8 +45,9 @@ PAGE_SIZE = 10
 READ_PAGE_BYTES = 3500
 READ_MAX_CHARS = 3000
 
-# Telegram TXT 阅读会话缓存
-_tg_reading_sessions = {}
+# Telegram TXT 阅读会话（保存在 backplane 中，主节点切换后仍可续读）
+TG_READING_SESSION_PREFIX = "tg:reading_session:"
+TG_READING_SESSION_TTL = 30 * 24 * 3600
 
 
 def _escape(text: Optional[str]) -> str:
@@ -383,6 +392,7 @@ async def bind_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             # 更新绑定
             user.telegram_id = telegram_id
             await db.commit()
+            invalidate_user(user.username)
             
             # 删除已使用的绑定码
             del _bind_codes[bind_code]
@@ -457,27 +467,14 @@ async def _perform_search(
                     await update.message.reply_text(msg)
                 return
             
-            # 搜索书籍（同时搜索书名和作者）
-            search_term = f"%{keyword}%"
-            query = (
-                select(Book)
-                .options(joinedload(Book.author), joinedload(Book.versions))
-                .outerjoin(Author, Book.author_id == Author.id)
-                .where(Book.library_id.in_(library_ids))
-                .where(or_(Book.title.like(search_term), Author.name.like(search_term)))
-                .order_by(desc(Book.added_at))
-            )
-            
-            result = await db.execute(query)
-            all_books = result.unique().scalars().all()
+            # 搜索书籍（全文检索按相关度排序，索引不可用时搜索书名和作者；权限在 SQL 中过滤）
+            query = select(Book).where(*build_book_access_filters(user, library_ids))
+            query, _ = apply_keyword_search(query, keyword)
             
-            # 应用权限过滤
-            accessible_books = []
-            for book in all_books:
-                if await check_book_access(user, book.id, db):
-                    accessible_books.append(book)
-            
-            total = len(accessible_books)
+            count_result = await db.execute(
+                select(func.count()).select_from(query.order_by(None).subquery())
+            )
+            total = int(count_result.scalar() or 0)
             
             if total == 0:
                 msg = f"未找到包含 '{keyword}' 的书籍"
@@ -487,11 +484,16 @@ async def _perform_search(
                     await update.message.reply_text(msg)
                 return
             
-            # 分页
+            # 分页（只加载当前页）
             total_pages = math.ceil(total / PAGE_SIZE)
             start = (page - 1) * PAGE_SIZE
-            end = start + PAGE_SIZE
-            books = accessible_books[start:end]
+            result = await db.execute(
+                query.options(selectinload(Book.author), selectinload(Book.versions))
+                .order_by(desc(Book.added_at))
+                .offset(start)
+                .limit(PAGE_SIZE)
+            )
+            books = result.scalars().all()
             
             # 构建结果消息
             message = f"🔍 搜索: {_escape(keyword)}\n"
@@ -588,10 +590,7 @@ async def _perform_author_books(
                 .order_by(desc(Book.added_at))
             )
             all_books = result.unique().scalars().all()
-            accessible = []
-            for book in all_books:
-                if await check_book_access(user, book.id, db):
-                    accessible.append(book)
+            accessible = await filter_accessible_items(user, all_books, db)
 
             total = len(accessible)
             if total == 0:
@@ -698,10 +697,7 @@ async def _perform_library_books(
                 .where(Book.library_id == library_id)
             )
             books = result.unique().scalars().all()
-            accessible = []
-            for book in books:
-                if await check_book_access(user, book.id, db):
-                    accessible.append(book)
+            accessible = await filter_accessible_items(user, books, db)
 
             filtered = [book for book in accessible if _book_has_format(book, format_code)]
 
@@ -843,10 +839,7 @@ async def _perform_recent(
             all_books = result.unique().scalars().all()
             
             # 应用权限过滤
-            accessible_books = []
-            for book in all_books:
-                if await check_book_access(user, book.id, db):
-                    accessible_books.append(book)
+            accessible_books = await filter_accessible_items(user, all_books, db)
             
             total = len(accessible_books)
             
@@ -1438,8 +1431,8 @@ async def _perform_read_page(
                 return
 
             file_size = txt_version.file_size or file_path.stat().st_size
-            session_key = (telegram_id, book_id)
-            session = _tg_reading_sessions.get(session_key)
+            session_key = f"{TG_READING_SESSION_PREFIX}{telegram_id}:{book_id}"
+            session = await backplane.get(session_key)
 
             if offset is None:
                 offset = session["offset"] if session else 0
@@ -1505,12 +1498,12 @@ async def _perform_read_page(
                     disable_web_page_preview=True,
                 )
 
-            _tg_reading_sessions[session_key] = {
+            await backplane.set(session_key, {
                 "offset": offset,
                 "encoding": encoding,
                 "file_path": str(file_path),
                 "file_size": file_size,
-            }
+            }, ttl=TG_READING_SESSION_TTL)
 
             progress_value = min(1.0, (next_offset / max(1, file_size)))
             result = await db.execute(
@@ -1642,10 +1635,9 @@ async def _perform_favorites(
                 .order_by(Favorite.created_at.desc())
             )
             favorites = result.unique().all()
-            filtered = []
-            for favorite, book in favorites:
-                if await check_book_access(user, book.id, db):
-                    filtered.append((favorite, book))
+            filtered = await filter_accessible_items(
+                user, favorites, db, book_id_of=lambda row: row[1].id
+            )
 
             total = len(filtered)
             if total == 0:
@@ -1733,10 +1725,10 @@ async def _perform_continue(
                 .order_by(desc(ReadingProgress.last_read_at))
             )
             progress_list = result.scalars().all()
-            filtered = []
-            for progress in progress_list:
-                if progress.book and await check_book_access(user, progress.book.id, db):
-                    filtered.append(progress)
+            filtered = await filter_accessible_items(
+                user, progress_list, db,
+                book_id_of=lambda progress: progress.book.id if progress.book else None
+            )
 
             total = len(filtered)
             if total == 0:
@@ -1974,20 +1966,17 @@ async def progress_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             # 构建消息
             message = f"📊 阅读进度 (最近 {len(progress_list)} 本):\n\n"
             
+            # 批量获取书籍信息并检查权限
+            book_ids = [progress.book_id for progress in progress_list]
+            accessible_ids = await get_accessible_book_ids(user, book_ids, db)
+            book_result = await db.execute(select(Book).where(Book.id.in_(list(accessible_ids))))
+            books_by_id = {book.id: book for book in book_result.scalars().all()}
+            
             for progress in progress_list:
-                # 获取书籍信息
-                book_result = await db.execute(
-                    select(Book).where(Book.id == progress.book_id)
-                )
-                book = book_result.scalar_one_or_none()
-                
+                book = books_by_id.get(progress.book_id)
                 if not book:
                     continue
                 
-                # 检查权限
-                if not await check_book_access(user, book.id, db):
-                    continue
-                
                 status = "✅" if progress.finished else "📖"
                 percent = int(progress.progress * 100)
                 
@@ -2031,10 +2020,10 @@ async def _perform_history(
                 .order_by(desc(ReadingProgress.last_read_at))
             )
             progress_list = result.scalars().all()
-            filtered = []
-            for progress in progress_list:
-                if progress.book and await check_book_access(user, progress.book.id, db):
-                    filtered.append(progress)
+            filtered = await filter_accessible_items(
+                user, progress_list, db,
+                book_id_of=lambda progress: progress.book.id if progress.book else None
+            )
 
             total = len(filtered)
             if total == 0:
@@ -2099,17 +2088,9 @@ async def stats_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
                 await update.message.reply_text("暂无可访问的书库")
                 return
 
-            book_count = await db.execute(
-                select(func.count(Book.id)).where(Book.library_id.in_(library_ids))
-            )
-            total_books = book_count.scalar() or 0
-
-            author_count = await db.execute(
-                select(func.count(func.distinct(Book.author_id)))
-                .where(Book.library_id.in_(library_ids))
-                .where(Book.author_id.isnot(None))
-            )
-            total_authors = author_count.scalar() or 0
+            summary = await summarize_libraries(db, library_ids)
+            total_books = summary.book_count
+            total_authors = summary.author_count
 
             favorite_count = await db.execute(
                 select(func.count(Favorite.id)).where(Favorite.user_id == user.id)
@@ -2126,10 +2107,7 @@ async def stats_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
             )
             last_read_at = last_read_result.scalar()
 
-            session_seconds_result = await db.execute(
-                select(func.sum(ReadingSession.duration_seconds)).where(ReadingSession.user_id == user.id)
-            )
-            total_seconds = session_seconds_result.scalar() or 0
+            total_seconds = (await reading_totals(db, user.id)).duration_seconds
             hours = total_seconds // 3600
             minutes = (total_seconds % 3600) // 60
 
@@ -5,14 +5,14 @@
 import asyncio
 from datetime import datetime
 from pathlib import Path
-from typing import List, Optional
+from typing import List, Optional, Set
 from contextlib import asynccontextmanager
 
 from sqlalchemy import select
-from sqlalchemy.exc import OperationalError
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.config import settings
+from app.database import AsyncSessionLocal
 from app.models import Library, LibraryPath, ScanTask, Book, BookVersion, Author
 from app.core.extractor import Extractor
 from app.core.deduplicator import Deduplicator
@@ -20,9 +20,11 @@ from app.core.metadata.epub_parser import EpubParser
 from app.core.metadata.mobi_parser import MobiParser
 from app.core.metadata.txt_parser import TxtParser
 from app.core.metadata.cleaner import clean_author, clean_title
+from app.utils.cover_manager import cover_manager
 from app.utils.file_hash import calculate_file_hash
 from app.utils.logger import log
 from app.core.websocket import manager
+from app.core.write_queue import write_queue
 
 
 class BackgroundScanner:
@@ -31,6 +33,9 @@ class BackgroundScanner:
     # 最大错误日志条数（防止过多错误占用存储）
     MAX_ERROR_LOGS = 100
     
+    # 应用关闭时等待封面派生图生成完成的最长时间（秒），超时后取消尚未开始的任务
+    DERIVATIVE_SHUTDOWN_TIMEOUT = 10.0
+    
     def __init__(self):
         self.extractor = Extractor()
         self.txt_parser = None  # 将在 worker 中初始化
@@ -42,17 +47,11 @@ class BackgroundScanner:
         self._error_logs: List[dict] = []
         self._detail_counter = 0
         
-        # 创建异步引擎（用于后台任务）
-        self.engine = create_async_engine(
-            settings.database.url,
-            echo=False,
-            pool_pre_ping=True,
-        )
-        self.async_session_maker = async_sessionmaker(
-            self.engine,
-            class_=AsyncSession,
-            expire_on_commit=False
-        )
+        # 与应用共用写引擎（连接参数含 busy_timeout，扫描事务与其他写入交替获得写锁）
+        self.async_session_maker = AsyncSessionLocal
+        
+        # 线程池中执行的封面派生图生成任务（保留引用以便记录错误与关闭时等待）
+        self._derivative_tasks: Set[asyncio.Future] = set()
     
     @asynccontextmanager
     async def get_session(self):
@@ -428,6 +427,10 @@ class BackgroundScanner:
         db.add(book)
         await db.flush()
         
+        # 后台生成封面派生图（不阻塞扫描）
+        if book.cover_path:
+            self._schedule_derivatives(Path(book.cover_path))
+        
         # 创建主版本
         file_hash = calculate_file_hash(file_path, settings.deduplicator.hash_algorithm)
         
@@ -444,6 +447,35 @@ class BackgroundScanner:
         
         db.add(version)
     
+    def _schedule_derivatives(self, cover_path: Path):
+        """在线程池中生成封面派生图，完成后记录错误"""
+        future = asyncio.get_running_loop().run_in_executor(
+            None, cover_manager.generate_derivatives, cover_path
+        )
+        self._derivative_tasks.add(future)
+        
+        def on_done(future: asyncio.Future):
+            self._derivative_tasks.discard(future)
+            if future.cancelled():
+                return
+            error = future.exception()
+            if error is not None:
+                log.error(f"生成封面派生图失败: {cover_path}, 错误: {error}")
+        
+        future.add_done_callback(on_done)
+    
+    async def shutdown(self, timeout: Optional[float] = None):
+        """应用关闭时等待进行中的封面派生图生成，超时后取消尚未开始的任务"""
+        if not self._derivative_tasks:
+            return
+        timeout = self.DERIVATIVE_SHUTDOWN_TIMEOUT if timeout is None else timeout
+        _, pending = await asyncio.wait(set(self._derivative_tasks), timeout=timeout)
+        for future in pending:
+            future.cancel()
+        self._derivative_tasks.difference_update(pending)
+        if pending:
+            log.warning(f"关闭时取消了 {len(pending)} 个未完成的封面派生图任务")
+    
     async def _save_book_version(self, file_path: Path, book_id: int, metadata: dict, db: AsyncSession):
         """为现有书籍添加新版本"""
         file_hash = calculate_file_hash(file_path, settings.deduplicator.hash_algorithm)
@@ -552,30 +584,15 @@ class BackgroundScanner:
         Returns:
             是否成功取消
         """
-        retry_delays = [0.1, 0.3, 0.6]
-        for attempt, delay in enumerate(retry_delays, start=1):
-            async with self.async_session_maker() as db:
-                try:
-                    task = await db.get(ScanTask, task_id)
-                    if not task:
-                        return False
-                    if task.status != 'running':
-                        return False
+        async def cancel(db: AsyncSession) -> bool:
+            task = await db.get(ScanTask, task_id)
+            if not task or task.status != 'running':
+                return False
+            task.status = 'cancelled'
+            task.completed_at = datetime.utcnow()
+            return True
 
-                    task.status = 'cancelled'
-                    task.completed_at = datetime.utcnow()
-                    await db.commit()
-                    return True
-                except OperationalError as e:
-                    await db.rollback()
-                    if "database is locked" in str(e).lower() and attempt < len(retry_delays):
-                        await asyncio.sleep(delay)
-                        continue
-                    raise
-                except Exception:
-                    await db.rollback()
-                    raise
-        return False
+        return await write_queue.submit(cancel)
 
 
 # 全局单例
@@ -0,0 +1,572 @@
+"""
+多进程协作后端（backplane）
+多个 worker 进程之间的消息发布/订阅、共享键值状态与主节点选举。
+
+- memory（默认）：单进程，发布不出进程，键值保存在内存中，行为与原先的进程内字典一致
+- sqlite：同一主机上的多个 worker 共享一个 SQLite 文件（事件表轮询 + 键值表）
+- redis：Redis（或兼容服务）的 Pub/Sub 与键值，可跨主机（需安装 redis 包）
+
+publish 只投递给其他 worker，本进程的订阅回调不会收到自己发布的消息（本地投递由调用方直接完成）；
+publish 为同步调用，只入队，由后台任务批量发送，可在 ORM 事件等同步上下文中调用。
+消息与键值均以 JSON 序列化。
+"""
+import asyncio
+import inspect
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from collections import deque
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional, Tuple
+
+from app.config import settings
+from app.utils.logger import log
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:  # 未安装时仅可使用 memory / sqlite 后端
+    aioredis = None
+
+MessageHandler = Callable[[dict], Any]
+
+# SQLite 后端事件保留时间（秒），超过即清理
+EVENT_RETENTION = 60
+# 主节点锁有效期（秒），持有者每 1/3 有效期续期一次
+LEADER_LOCK_TTL = 30
+
+
+def _dumps(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, default=str)
+
+
+class Backplane:
+    """协作后端基类（同时是 memory 后端）"""
+
+    name = "memory"
+
+    def __init__(self):
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._handlers: Dict[str, List[MessageHandler]] = {}
+        self._outbox: Deque[Tuple[str, dict]] = deque()
+        self._outbox_ready: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: List[asyncio.Task] = []
+        self._leader_task: Optional[asyncio.Task] = None
+        self._kv: Dict[str, Tuple[Any, Optional[float]]] = {}
+        self.is_leader = False
+        self.published = 0
+        self.received = 0
+        self.failures = 0
+
+    # ===== 生命周期 =====
+
+    async def start(self) -> None:
+        """启动后台收发任务"""
+        self._loop = asyncio.get_running_loop()
+        self._outbox_ready = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._run_sender()), *self._listeners()]
+
+    async def stop(self) -> None:
+        """停止后台任务（先发送完已入队的消息，并释放主节点锁）"""
+        if self._leader_task is not None:
+            self._leader_task.cancel()
+            try:
+                await self._leader_task
+            except asyncio.CancelledError:
+                pass
+            self._leader_task = None
+        if self.is_leader:
+            await self.release_lock("leader", self.worker_id)
+            self.is_leader = False
+        await self._flush_outbox()
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._tasks = []
+        self._loop = None
+
+    def _listeners(self) -> List[asyncio.Task]:
+        return []
+
+    # ===== 发布/订阅 =====
+
+    def subscribe(self, channel: str, handler: MessageHandler) -> None:
+        """订阅其他 worker 发布到 channel 的消息（回调可为同步或异步函数）"""
+        self._handlers.setdefault(channel, []).append(handler)
+
+    def subscribe_to(self, channel: str) -> Callable[[MessageHandler], MessageHandler]:
+        """subscribe 的装饰器形式"""
+        def decorator(handler: MessageHandler) -> MessageHandler:
+            self.subscribe(channel, handler)
+            return handler
+        return decorator
+
+    def publish(self, channel: str, message: dict) -> None:
+        """向其他 worker 发布消息（未启动或单进程后端时不做任何事）"""
+        loop = self._loop
+        if loop is None or self.name == "memory":
+            return
+        self._outbox.append((channel, message))
+        try:
+            if asyncio.get_running_loop() is loop:
+                self._outbox_ready.set()
+                return
+        except RuntimeError:
+            pass
+        loop.call_soon_threadsafe(self._outbox_ready.set)
+
+    async def _run_sender(self) -> None:
+        while True:
+            await self._outbox_ready.wait()
+            self._outbox_ready.clear()
+            await self._flush_outbox()
+
+    async def _flush_outbox(self) -> None:
+        if not self._outbox:
+            return
+        batch = []
+        while self._outbox:
+            batch.append(self._outbox.popleft())
+        try:
+            await self._send(batch)
+            self.published += len(batch)
+        except Exception as e:
+            self.failures += 1
+            log.warning(f"backplane 消息发送失败，丢弃 {len(batch)} 条: {e}")
+
+    async def _send(self, batch: List[Tuple[str, dict]]) -> None:
+        pass
+
+    async def _dispatch(self, channel: str, origin: str, message: dict) -> None:
+        if origin == self.worker_id:
+            return
+        self.received += 1
+        for handler in self._handlers.get(channel, ()):
+            try:
+                result = handler(message)
+                if inspect.isawaitable(result):
+                    await result
+            except Exception as e:
+                log.error(f"backplane 消息处理失败 ({channel}): {e}")
+
+    # ===== 键值 =====
+
+    async def get(self, key: str) -> Optional[Any]:
+        entry = self._kv.get(key)
+        if entry is None:
+            return None
+        if entry[1] is not None and entry[1] <= time.time():
+            self._kv.pop(key, None)
+            return None
+        return json.loads(entry[0])
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        self._kv[key] = (_dumps(value), time.time() + ttl if ttl else None)
+
+    async def set_if_absent(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        """键不存在（或已过期）时写入，返回是否写入"""
+        if await self.get(key) is not None:
+            return False
+        await self.set(key, value, ttl)
+        return True
+
+    async def compare_and_set(self, key: str, expected: Any, value: Any, ttl: Optional[float] = None) -> bool:
+        """当前值等于 expected 时写入 value，返回是否写入（键不存在或已过期时不写入）"""
+        if await self.get(key) is None or self._kv[key][0] != _dumps(expected):
+            return False
+        await self.set(key, value, ttl)
+        return True
+
+    async def delete(self, key: str) -> bool:
+        return self._kv.pop(key, None) is not None
+
+    async def scan(self, prefix: str) -> Dict[str, Any]:
+        """返回以 prefix 开头的全部键值"""
+        result = {}
+        for key in [key for key in self._kv if key.startswith(prefix)]:
+            value = await self.get(key)
+            if value is not None:
+                result[key] = value
+        return result
+
+    # ===== 锁与主节点选举 =====
+
+    async def acquire_lock(self, name: str, owner: str, ttl: float) -> bool:
+        """获取或续期锁；锁由其他 owner 持有且未过期时返回 False"""
+        key = f"lock:{name}"
+        current = await self.get(key)
+        if current is not None and current != owner:
+            return False
+        await self.set(key, owner, ttl)
+        return True
+
+    async def release_lock(self, name: str, owner: str) -> None:
+        key = f"lock:{name}"
+        if await self.get(key) == owner:
+            await self.delete(key)
+
+    async def start_leader(
+        self,
+        on_elected: Callable[[], Awaitable[None]],
+        on_demoted: Callable[[], Awaitable[None]],
+    ) -> None:
+        """
+        参与主节点选举：只有主节点运行定时任务、Telegram Bot 等全局单实例服务
+
+        首次尝试在调用时完成（单进程后端总能当选，启动顺序与原先一致），之后后台定期续期；
+        主节点退出或失联后，其他 worker 在锁过期后接任
+        """
+        await self._try_lead(on_elected, on_demoted)
+        self._leader_task = asyncio.create_task(self._run_leader(on_elected, on_demoted))
+
+    async def _try_lead(self, on_elected, on_demoted) -> None:
+        try:
+            acquired = await self.acquire_lock("leader", self.worker_id, LEADER_LOCK_TTL)
+        except Exception as e:
+            log.warning(f"主节点锁续期失败: {e}")
+            acquired = False
+        if acquired and not self.is_leader:
+            self.is_leader = True
+            log.info(f"当前 worker 成为主节点: {self.worker_id}")
+            await on_elected()
+        elif not acquired and self.is_leader:
+            self.is_leader = False
+            log.warning(f"当前 worker 失去主节点身份: {self.worker_id}")
+            await on_demoted()
+
+    async def _run_leader(self, on_elected, on_demoted) -> None:
+        while True:
+            await asyncio.sleep(LEADER_LOCK_TTL / 3)
+            await self._try_lead(on_elected, on_demoted)
+
+    def stats(self) -> dict:
+        return {
+            "backend": self.name,
+            "worker_id": self.worker_id,
+            "is_leader": self.is_leader,
+            "subscriptions": {channel: len(handlers) for channel, handlers in self._handlers.items()},
+            "pending": len(self._outbox),
+            "published": self.published,
+            "received": self.received,
+            "failures": self.failures,
+        }
+
+
+class SqliteBackplane(Backplane):
+    """同一主机多 worker 共享的 SQLite 协作后端"""
+
+    name = "sqlite"
+
+    def __init__(self, path: str, poll_interval: float):
+        super().__init__()
+        self.path = path
+        self.poll_interval = poll_interval
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+        self._last_event_id = 0
+        self._last_prune = 0.0
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            Path(self.path).parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS bp_kv ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS bp_events ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT NOT NULL, origin TEXT NOT NULL, "
+                "payload TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._conn = conn
+        return self._conn
+
+    async def _run(self, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        def call():
+            with self._lock:
+                return fn(self._connect())
+        return await asyncio.to_thread(call)
+
+    async def start(self) -> None:
+        row = await self._run(lambda conn: conn.execute("SELECT MAX(id) FROM bp_events").fetchone())
+        self._last_event_id = row[0] or 0
+        await super().start()
+
+    async def stop(self) -> None:
+        await super().stop()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def _listeners(self) -> List[asyncio.Task]:
+        return [asyncio.create_task(self._run_poller())]
+
+    async def _send(self, batch: List[Tuple[str, dict]]) -> None:
+        now = time.time()
+        rows = [(channel, self.worker_id, _dumps(message), now) for channel, message in batch]
+
+        def insert(conn):
+            conn.executemany(
+                "INSERT INTO bp_events (channel, origin, payload, created_at) VALUES (?, ?, ?, ?)", rows
+            )
+        await self._run(insert)
+
+    async def _run_poller(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self._poll()
+            except Exception as e:
+                self.failures += 1
+                log.warning(f"backplane 事件读取失败: {e}")
+
+    async def _poll(self) -> None:
+        last_id = self._last_event_id
+        prune = time.time() - self._last_prune > EVENT_RETENTION / 2
+
+        def fetch(conn):
+            if prune:
+                conn.execute("DELETE FROM bp_events WHERE created_at < ?", (time.time() - EVENT_RETENTION,))
+                conn.execute(
+                    "DELETE FROM bp_kv WHERE expires_at IS NOT NULL AND expires_at <= ?", (time.time(),)
+                )
+            return conn.execute(
+                "SELECT id, channel, origin, payload FROM bp_events WHERE id > ? ORDER BY id LIMIT 1000",
+                (last_id,),
+            ).fetchall()
+
+        rows = await self._run(fetch)
+        if prune:
+            self._last_prune = time.time()
+        for event_id, channel, origin, payload in rows:
+            self._last_event_id = event_id
+            await self._dispatch(channel, origin, json.loads(payload))
+
+    async def get(self, key: str) -> Optional[Any]:
+        row = await self._run(lambda conn: conn.execute(
+            "SELECT value FROM bp_kv WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (key, time.time()),
+        ).fetchone())
+        return json.loads(row[0]) if row else None
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        payload, expires_at = _dumps(value), time.time() + ttl if ttl else None
+        await self._run(lambda conn: conn.execute(
+            "INSERT INTO bp_kv (key, value, expires_at) VALUES (?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at",
+            (key, payload, expires_at),
+        ))
+
+    async def set_if_absent(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        payload, expires_at = _dumps(value), time.time() + ttl if ttl else None
+
+        def insert(conn):
+            cursor = conn.execute(
+                "INSERT INTO bp_kv (key, value, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at "
+                "WHERE bp_kv.expires_at IS NOT NULL AND bp_kv.expires_at <= ?",
+                (key, payload, expires_at, time.time()),
+            )
+            return cursor.rowcount == 1
+        return await self._run(insert)
+
+    async def compare_and_set(self, key: str, expected: Any, value: Any, ttl: Optional[float] = None) -> bool:
+        payload, expires_at = _dumps(value), time.time() + ttl if ttl else None
+        cursor = await self._run(lambda conn: conn.execute(
+            "UPDATE bp_kv SET value = ?, expires_at = ? "
+            "WHERE key = ? AND value = ? AND (expires_at IS NULL OR expires_at > ?)",
+            (payload, expires_at, key, _dumps(expected), time.time()),
+        ))
+        return cursor.rowcount == 1
+
+    async def delete(self, key: str) -> bool:
+        cursor = await self._run(lambda conn: conn.execute("DELETE FROM bp_kv WHERE key = ?", (key,)))
+        return cursor.rowcount == 1
+
+    async def scan(self, prefix: str) -> Dict[str, Any]:
+        escaped = prefix.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+        rows = await self._run(lambda conn: conn.execute(
+            "SELECT key, value FROM bp_kv WHERE key LIKE ? ESCAPE '\\' "
+            "AND (expires_at IS NULL OR expires_at > ?)",
+            (escaped + "%", time.time()),
+        ).fetchall())
+        return {key: json.loads(value) for key, value in rows}
+
+    async def acquire_lock(self, name: str, owner: str, ttl: float) -> bool:
+        key, payload = f"lock:{name}", _dumps(owner)
+
+        def upsert(conn):
+            now = time.time()
+            cursor = conn.execute(
+                "INSERT INTO bp_kv (key, value, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at "
+                "WHERE bp_kv.value = excluded.value OR bp_kv.expires_at <= ?",
+                (key, payload, now + ttl, now),
+            )
+            return cursor.rowcount == 1
+        return await self._run(upsert)
+
+    async def release_lock(self, name: str, owner: str) -> None:
+        await self._run(lambda conn: conn.execute(
+            "DELETE FROM bp_kv WHERE key = ? AND value = ?", (f"lock:{name}", _dumps(owner))
+        ))
+
+
+# 比较后写入：KEYS[1] 的值等于 ARGV[1] 时写入 ARGV[2]，ARGV[3] 为有效期（毫秒，0 表示不过期）
+_REDIS_COMPARE_AND_SET = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+if tonumber(ARGV[3]) > 0 then
+    redis.call('SET', KEYS[1], ARGV[2], 'PX', ARGV[3])
+else
+    redis.call('SET', KEYS[1], ARGV[2])
+end
+return 1
+"""
+
+# 获取或续期锁：未被持有时以 ARGV[1] 为持有者写入，已由 ARGV[1] 持有时续期，ARGV[2] 为有效期（毫秒）
+_REDIS_ACQUIRE_LOCK = """
+local current = redis.call('GET', KEYS[1])
+if current == ARGV[1] then
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    return 1
+end
+if not current then
+    redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+    return 1
+end
+return 0
+"""
+
+# 释放锁：仅当持有者为 ARGV[1] 时删除
+_REDIS_RELEASE_LOCK = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisBackplane(Backplane):
+    """Redis（或兼容服务）协作后端"""
+
+    name = "redis"
+
+    def __init__(self, url: str, prefix: str):
+        super().__init__()
+        self.prefix = prefix
+        self._redis = aioredis.from_url(url, decode_responses=True)
+        self._compare_and_set = self._redis.register_script(_REDIS_COMPARE_AND_SET)
+        self._acquire_lock = self._redis.register_script(_REDIS_ACQUIRE_LOCK)
+        self._release_lock = self._redis.register_script(_REDIS_RELEASE_LOCK)
+
+    def _key(self, key: str) -> str:
+        return f"{self.prefix}kv:{key}"
+
+    async def stop(self) -> None:
+        await super().stop()
+        await self._redis.aclose()
+
+    def _listeners(self) -> List[asyncio.Task]:
+        return [asyncio.create_task(self._run_subscriber())]
+
+    async def _send(self, batch: List[Tuple[str, dict]]) -> None:
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for channel, message in batch:
+                pipe.publish(
+                    f"{self.prefix}events:{channel}",
+                    _dumps({"origin": self.worker_id, "message": message}),
+                )
+            await pipe.execute()
+
+    async def _run_subscriber(self) -> None:
+        channel_prefix = f"{self.prefix}events:"
+        while True:
+            pubsub = self._redis.pubsub()
+            try:
+                await pubsub.psubscribe(f"{channel_prefix}*")
+                async for item in pubsub.listen():
+                    if item.get("type") != "pmessage":
+                        continue
+                    data = json.loads(item["data"])
+                    await self._dispatch(item["channel"][len(channel_prefix):], data["origin"], data["message"])
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.failures += 1
+                log.warning(f"backplane 订阅中断，稍后重连: {e}")
+                await asyncio.sleep(1)
+            finally:
+                await pubsub.aclose()
+
+    async def get(self, key: str) -> Optional[Any]:
+        value = await self._redis.get(self._key(key))
+        return json.loads(value) if value is not None else None
+
+    async def set(self, key: str, value: Any, ttl: Optional[float] = None) -> None:
+        await self._redis.set(self._key(key), _dumps(value), px=int(ttl * 1000) if ttl else None)
+
+    async def set_if_absent(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        return bool(await self._redis.set(
+            self._key(key), _dumps(value), px=int(ttl * 1000) if ttl else None, nx=True
+        ))
+
+    async def compare_and_set(self, key: str, expected: Any, value: Any, ttl: Optional[float] = None) -> bool:
+        return bool(await self._compare_and_set(
+            keys=[self._key(key)], args=[_dumps(expected), _dumps(value), int(ttl * 1000) if ttl else 0]
+        ))
+
+    async def delete(self, key: str) -> bool:
+        return bool(await self._redis.delete(self._key(key)))
+
+    async def scan(self, prefix: str) -> Dict[str, Any]:
+        keys = [key async for key in self._redis.scan_iter(match=f"{self._key(prefix)}*")]
+        if not keys:
+            return {}
+        values = await self._redis.mget(keys)
+        strip = len(self._key(""))
+        return {key[strip:]: json.loads(value) for key, value in zip(keys, values) if value is not None}
+
+    async def acquire_lock(self, name: str, owner: str, ttl: float) -> bool:
+        # 比较与续期/删除须在同一个脚本内完成，否则锁可能在两步之间过期并被其他 worker 获取
+        return bool(await self._acquire_lock(
+            keys=[self._key(f"lock:{name}")], args=[_dumps(owner), int(ttl * 1000)]
+        ))
+
+    async def release_lock(self, name: str, owner: str) -> None:
+        await self._release_lock(keys=[self._key(f"lock:{name}")], args=[_dumps(owner)])
+
+
+def create_backplane() -> Backplane:
+    """按配置创建协作后端；配置无效时回退到单进程 memory 后端"""
+    config = settings.backplane
+    url = config.url.strip()
+    if not url or url == "memory://":
+        return Backplane()
+    if url.startswith("sqlite:///"):
+        return SqliteBackplane(url[len("sqlite:///"):], config.poll_interval)
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        if aioredis is None:
+            log.error("backplane 配置为 Redis，但未安装 redis 包，回退到单进程模式")
+            return Backplane()
+        return RedisBackplane(url, config.prefix)
+    log.error(f"不支持的 backplane 地址: {url}，回退到单进程模式")
+    return Backplane()
+
+
+# 全局单例
+backplane = create_backplane()
@@ -1,8 +1,12 @@
 """
 备份与恢复管理模块
 支持数据库、封面、配置文件的备份和恢复
+
+数据库：SQLite 使用在线备份 API 复制数据库文件；PostgreSQL 使用 pg_dump 自定义格式转储、pg_restore 恢复
 """
+import asyncio
 import json
+import os
 import shutil
 import zipfile
 from datetime import datetime
@@ -15,8 +19,13 @@ import aiosqlite
 import httpx
 
 from app.config import settings
+from app.database import database_url
 from app.utils.logger import log
 
+# 备份文件中的数据库条目
+SQLITE_ARCNAME = "database/library.db"
+POSTGRES_ARCNAME = "database/library.dump"
+
 
 class BackupMetadata:
     """备份元数据"""
@@ -71,7 +80,9 @@ class BackupManager:
         self.backup_dir = Path(settings.backup.backup_path)
         self.backup_dir.mkdir(parents=True, exist_ok=True)
         
-        self.db_path = Path(settings.database.url.replace("sqlite+aiosqlite:///", ""))
+        self.db_url = database_url()
+        self.db_backend = self.db_url.get_backend_name()
+        self.db_path = Path(self.db_url.database or "") if self.db_backend == "sqlite" else None
         self.covers_dir = Path(settings.directories.covers)
         self.config_dir = Path("config")
     
@@ -247,10 +258,26 @@ class BackupManager:
     
     async def _backup_database(self, zipf: zipfile.ZipFile):
         """备份数据库到ZIP"""
-        if not self.db_path.exists():
+        if self.db_backend == "postgresql":
+            await self._dump_postgres(zipf)
+        elif not self.db_path.exists():
             log.warning(f"数据库文件不存在: {self.db_path}")
             return
-        
+        else:
+            await self._backup_sqlite(zipf)
+
+        # 备份 Alembic 版本信息
+        alembic_dir = Path("alembic")
+        if alembic_dir.exists():
+            versions_dir = alembic_dir / "versions"
+            if versions_dir.exists():
+                for version_file in versions_dir.glob("*.py"):
+                    zipf.write(
+                        version_file,
+                        f"database/alembic/versions/{version_file.name}"
+                    )
+    
+    async def _backup_sqlite(self, zipf: zipfile.ZipFile):
         # 使用 SQLite 备份 API（安全的在线备份）
         backup_db_path = self.backup_dir / "temp_backup.db"
         
@@ -262,24 +289,56 @@ class BackupManager:
                     await source.backup(backup)
             
             # 添加到ZIP
-            zipf.write(backup_db_path, "database/library.db")
+            zipf.write(backup_db_path, SQLITE_ARCNAME)
             log.info("数据库备份完成")
             
         finally:
             # 清理临时文件
             if backup_db_path.exists():
                 backup_db_path.unlink()
-        
-        # 备份 Alembic 版本信息
-        alembic_dir = Path("alembic")
-        if alembic_dir.exists():
-            versions_dir = alembic_dir / "versions"
-            if versions_dir.exists():
-                for version_file in versions_dir.glob("*.py"):
-                    zipf.write(
-                        version_file,
-                        f"database/alembic/versions/{version_file.name}"
-                    )
+
+    def _pg_env(self) -> Dict[str, str]:
+        """pg_dump / pg_restore 的连接参数（经环境变量传递，密码不出现在命令行中）"""
+        env = dict(os.environ)
+        for key, value in (
+            ("PGHOST", self.db_url.host),
+            ("PGPORT", self.db_url.port),
+            ("PGUSER", self.db_url.username),
+            ("PGPASSWORD", self.db_url.password),
+            ("PGDATABASE", self.db_url.database),
+        ):
+            if value:
+                env[key] = str(value)
+        return env
+
+    async def _run_pg_tool(self, *args: str) -> None:
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *args,
+                env=self._pg_env(),
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE,
+            )
+        except FileNotFoundError:
+            raise RuntimeError(f"未找到 {args[0]}，请安装 PostgreSQL 客户端或在备份配置中指定路径")
+        _, stderr = await process.communicate()
+        if process.returncode != 0:
+            raise RuntimeError(f"{args[0]} 执行失败: {stderr.decode(errors='replace').strip()}")
+
+    async def _dump_postgres(self, zipf: zipfile.ZipFile):
+        """pg_dump 自定义格式转储（在线一致性快照）"""
+        dump_path = self.backup_dir / "temp_backup.dump"
+        try:
+            await self._run_pg_tool(
+                settings.backup.pg_dump_path,
+                "--format=custom", "--no-owner", "--no-privileges",
+                f"--file={dump_path}",
+            )
+            zipf.write(dump_path, POSTGRES_ARCNAME)
+            log.info("数据库备份完成 (pg_dump)")
+        finally:
+            if dump_path.exists():
+                dump_path.unlink()
     
     def _backup_covers(self, zipf: zipfile.ZipFile):
         """备份封面到ZIP"""
@@ -489,10 +548,19 @@ class BackupManager:
     
     async def _restore_database(self, zipf: zipfile.ZipFile):
         """从ZIP恢复数据库"""
+        names = zipf.namelist()
+        if self.db_backend == "postgresql":
+            if POSTGRES_ARCNAME not in names:
+                raise ValueError("备份中没有 PostgreSQL 数据库转储（SQLite 备份无法直接恢复到 PostgreSQL）")
+            await self._restore_postgres(zipf)
+            return
+        if SQLITE_ARCNAME not in names:
+            raise ValueError("备份中没有 SQLite 数据库文件（PostgreSQL 备份无法直接恢复到 SQLite）")
+
         try:
             # 提取数据库文件
             temp_db = self.backup_dir / "temp_restore.db"
-            with zipf.open("database/library.db") as source:
+            with zipf.open(SQLITE_ARCNAME) as source:
                 with open(temp_db, 'wb') as target:
                     shutil.copyfileobj(source, target)
             
@@ -504,18 +572,51 @@ class BackupManager:
                 raise ValueError(f"恢复的数据库文件无效: {e}")
             
             # 替换当前数据库（需要确保应用已停止或使用文件锁）
+            # 先关闭连接池并把 WAL 合并回主文件，否则旧的 -wal/-shm 会被应用到新数据库上
+            from app.database import dispose_engines
+            await dispose_engines()
             if self.db_path.exists():
+                async with aiosqlite.connect(str(self.db_path)) as conn:
+                    await conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
                 backup_current = self.db_path.with_suffix('.db.old')
                 shutil.copy2(self.db_path, backup_current)
                 log.info(f"已备份当前数据库到: {backup_current}")
             
             shutil.move(str(temp_db), str(self.db_path))
+            for suffix in ("-wal", "-shm"):
+                Path(f"{self.db_path}{suffix}").unlink(missing_ok=True)
             log.info("数据库恢复完成")
             
         except Exception as e:
             log.error(f"恢复数据库失败: {e}")
             raise
     
+    async def _restore_postgres(self, zipf: zipfile.ZipFile):
+        """pg_restore 在单个事务中删除并重建全部对象，失败时数据库保持不变"""
+        from app.database import dispose_engines
+
+        dump_path = self.backup_dir / "temp_restore.dump"
+        try:
+            with zipf.open(POSTGRES_ARCNAME) as source:
+                with open(dump_path, 'wb') as target:
+                    shutil.copyfileobj(source, target)
+
+            # 先归还连接池中的连接，避免恢复时与应用会话互相等待表锁
+            await dispose_engines()
+            await self._run_pg_tool(
+                settings.backup.pg_restore_path,
+                "--clean", "--if-exists", "--no-owner", "--no-privileges", "--single-transaction",
+                f"--dbname={self.db_url.database}",
+                str(dump_path),
+            )
+            log.info("数据库恢复完成 (pg_restore)")
+        except Exception as e:
+            log.error(f"恢复数据库失败: {e}")
+            raise
+        finally:
+            if dump_path.exists():
+                dump_path.unlink()
+    
     def _restore_covers(self, zipf: zipfile.ZipFile):
         """从ZIP恢复封面"""
         # 清空现有封面（可选）
@@ -0,0 +1,116 @@
+"""
+书目变更通知
+监听 ORM 会话：事务中新增/修改/删除了书籍、版本、标签、作者、书库或分组时，在提交后通知已注册的回调，
+供进程内的派生缓存（列表总数、分面统计、搜索建议索引等）失效或增量更新。
+直接执行的原生 SQL 不会触发通知，相关缓存需自带 TTL 兜底。
+变更同时经 backplane 转发给其他 worker，使各进程的派生缓存一起失效
+"""
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Set
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import get_history
+
+from app.core.backplane import backplane
+from app.models import Author, Book, BookGroup, BookTag, BookTranslation, BookVersion, Library, Tag
+from app.utils.logger import log
+
+CATALOG_MODELS = (Book, BookVersion, BookTag, BookTranslation, Tag, Author, Library, BookGroup)
+
+_SESSION_KEY = "catalog_change"
+
+
+@dataclass
+class CatalogChange:
+    """一次提交中的书目变更"""
+    # 涉及的书籍 ID（仅标签/作者/书库变更时可能为空）
+    book_ids: Set[int] = field(default_factory=set)
+    # 发生变更的表名
+    tables: Set[str] = field(default_factory=set)
+    # 改名或删除的作者 ID（仅修改作品数等统计列、新增作者时不计入）
+    renamed_author_ids: Set[int] = field(default_factory=set)
+    # 删除的书库 ID
+    deleted_library_ids: Set[int] = field(default_factory=set)
+    # 变更范围未知（手动通知全部可能变更），派生数据需全量重建
+    full: bool = False
+
+
+CatalogListener = Callable[[CatalogChange], None]
+
+_listeners: List[CatalogListener] = []
+
+
+def on_catalog_commit(listener: CatalogListener) -> CatalogListener:
+    """注册书目变更回调（可作为装饰器使用）"""
+    _listeners.append(listener)
+    return listener
+
+
+def notify_catalog_changed(change: Optional[CatalogChange] = None, broadcast: bool = True) -> None:
+    """通知书目变更；原生 SQL 批量修改后可手动调用（不传参数表示全部可能变更）"""
+    changed = change or CatalogChange(tables={model.__tablename__ for model in CATALOG_MODELS}, full=True)
+    for listener in _listeners:
+        try:
+            listener(changed)
+        except Exception as e:
+            log.error(f"书目变更回调执行失败: {e}")
+    if broadcast:
+        backplane.publish("catalog", {
+            "book_ids": sorted(changed.book_ids),
+            "tables": sorted(changed.tables),
+            "renamed_author_ids": sorted(changed.renamed_author_ids),
+            "deleted_library_ids": sorted(changed.deleted_library_ids),
+            "full": changed.full,
+        })
+
+
+@backplane.subscribe_to("catalog")
+def _on_remote_change(data: dict) -> None:
+    notify_catalog_changed(
+        CatalogChange(
+            book_ids=set(data["book_ids"]),
+            tables=set(data["tables"]),
+            renamed_author_ids=set(data.get("renamed_author_ids", [])),
+            deleted_library_ids=set(data.get("deleted_library_ids", [])),
+            full=data.get("full", False),
+        ),
+        broadcast=False,
+    )
+
+
+def _book_id_of(obj) -> Optional[int]:
+    if isinstance(obj, Book):
+        return obj.id
+    return getattr(obj, "book_id", None)
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_catalog_changes(session: Session, flush_context) -> None:
+    change = None
+    deleted = session.deleted
+    for obj in (*session.new, *session.dirty, *deleted):
+        if isinstance(obj, CATALOG_MODELS):
+            if change is None:
+                change = session.info.setdefault(_SESSION_KEY, CatalogChange())
+            change.tables.add(obj.__tablename__)
+            book_id = _book_id_of(obj)
+            if book_id is not None:
+                change.book_ids.add(book_id)
+            # after_flush 中属性历史尚未重置，可区分改名与统计列更新
+            if isinstance(obj, Author) and (obj in deleted or get_history(obj, "name").deleted):
+                change.renamed_author_ids.add(obj.id)
+            elif isinstance(obj, Library) and obj in deleted:
+                change.deleted_library_ids.add(obj.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _notify_catalog_changes(session: Session) -> None:
+    change = session.info.pop(_SESSION_KEY, None)
+    if change is not None:
+        notify_catalog_changed(change)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_catalog_changes(session: Session) -> None:
+    session.info.pop(_SESSION_KEY, None)
@@ -0,0 +1,278 @@
+"""
+漫画页面处理
+按设备尺寸缩放/转码漫画页面，带磁盘 LRU 缓存与后台预取
+"""
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import multiprocessing
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from app.config import settings
+from app.core.metadata.comic_parser import ComicParser
+from app.utils.disk_cache import DiskLRUCache
+from app.utils.logger import log
+
+
+COMIC_CACHE_DIR = Path(settings.directories.data) / "cache" / "comic"
+
+# 输出格式 -> (PIL 格式名, 扩展名, MIME)
+OUTPUT_FORMATS = {
+    "webp": ("WEBP", ".webp", "image/webp"),
+    "jpeg": ("JPEG", ".jpg", "image/jpeg"),
+    "png": ("PNG", ".png", "image/png"),
+}
+
+MIME_TYPES = {
+    ".jpg": "image/jpeg",
+    ".jpeg": "image/jpeg",
+    ".png": "image/png",
+    ".webp": "image/webp",
+    ".gif": "image/gif",
+    ".bmp": "image/bmp",
+}
+
+# 页面列表内存缓存条目上限
+IMAGE_LIST_CACHE_SIZE = 64
+
+
+def guess_mime_type(filename: str) -> str:
+    """根据扩展名推断图片 MIME 类型"""
+    return MIME_TYPES.get(Path(filename).suffix.lower(), "image/jpeg")
+
+
+def normalize_format(image_format: Optional[str]) -> Optional[str]:
+    """规范化输出格式，original/空值返回 None"""
+    if not image_format:
+        return None
+    image_format = image_format.lower()
+    if image_format == "jpg":
+        image_format = "jpeg"
+    if image_format == "original":
+        return None
+    return image_format if image_format in OUTPUT_FORMATS else None
+
+
+def transcode_image(data: bytes, width: Optional[int], quality: int, output_format: str) -> bytes:
+    """
+    缩放并转码图片（在进程池中执行）
+
+    Args:
+        data: 原始图片数据
+        width: 目标宽度，None 或大于原图宽度时不放大
+        quality: 压缩质量
+        output_format: webp/jpeg/png
+
+    Returns:
+        转码后的图片数据
+    """
+    from PIL import Image
+
+    pil_format = OUTPUT_FORMATS[output_format][0]
+
+    with Image.open(BytesIO(data)) as img:
+        # JPEG 源可在解码阶段直接降采样，减少大图解码开销
+        if width and img.format == "JPEG" and img.width > width:
+            img.draft("RGB", (width, max(1, img.height * width // img.width)))
+
+        img.load()
+        if getattr(img, "is_animated", False):
+            img.seek(0)
+
+        if width and img.width > width:
+            height = max(1, round(img.height * width / img.width))
+            img = img.resize((width, height), Image.LANCZOS)
+
+        if output_format == "jpeg":
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+        elif img.mode not in ("RGB", "RGBA", "L", "LA"):
+            img = img.convert("RGBA" if "A" in img.mode or img.mode == "P" else "RGB")
+
+        output = BytesIO()
+        if output_format == "jpeg":
+            img.save(output, pil_format, quality=quality, optimize=True, progressive=True)
+        elif output_format == "webp":
+            img.save(output, pil_format, quality=quality, method=4)
+        else:
+            img.save(output, pil_format, optimize=True)
+        return output.getvalue()
+
+
+class ComicPageService:
+    """漫画页面服务：页面列表、缩放转码、缓存与预取"""
+
+    def __init__(self):
+        self.cache = DiskLRUCache(COMIC_CACHE_DIR, settings.comic.cache_max_size)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        self._image_lists: "OrderedDict[str, List[Dict]]" = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._prefetch_tasks: Set[asyncio.Task] = set()
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=max(1, settings.comic.workers),
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+            return self._executor
+
+    def shutdown(self) -> None:
+        """关闭进程池并取消未完成的预取"""
+        for task in list(self._prefetch_tasks):
+            task.cancel()
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    @staticmethod
+    def _file_signature(file_path: Path) -> str:
+        stat = file_path.stat()
+        return f"{file_path}_{stat.st_size}_{stat.st_mtime}"
+
+    async def get_image_list(self, file_path: Path) -> List[Dict]:
+        """获取页面列表（按文件签名缓存在内存中）"""
+        signature = self._file_signature(file_path)
+        images = self._image_lists.get(signature)
+        if images is not None:
+            self._image_lists.move_to_end(signature)
+            return images
+
+        loop = asyncio.get_running_loop()
+        images = await loop.run_in_executor(None, ComicParser.get_image_list, file_path)
+        if images:
+            self._image_lists[signature] = images
+            while len(self._image_lists) > IMAGE_LIST_CACHE_SIZE:
+                self._image_lists.popitem(last=False)
+        return images
+
+    async def read_original(self, file_path: Path, filename: str) -> Optional[bytes]:
+        """读取原始页面数据（线程池中执行，避免阻塞事件循环）"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, ComicParser.get_image_data, file_path, filename)
+
+    def _cache_name(
+        self,
+        file_path: Path,
+        filename: str,
+        width: Optional[int],
+        quality: int,
+        output_format: str
+    ) -> str:
+        key = f"{self._file_signature(file_path)}_{filename}_{width or 0}_{quality}_{output_format}"
+        return hashlib.md5(key.encode()).hexdigest() + OUTPUT_FORMATS[output_format][1]
+
+    async def render_page(
+        self,
+        file_path: Path,
+        filename: str,
+        width: Optional[int],
+        quality: int,
+        output_format: str
+    ) -> Optional[Path]:
+        """
+        获取缩放/转码后的页面文件路径
+        同一页面的并发请求（含预取）共享一次转码
+        """
+        name = self._cache_name(file_path, filename, width, quality, output_format)
+        cached = self.cache.get(name)
+        if cached:
+            return cached
+
+        pending = self._inflight.get(name)
+        if pending is not None:
+            return await asyncio.shield(pending)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._inflight[name] = future
+        try:
+            result = await self._render_uncached(file_path, filename, width, quality, output_format, name)
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # 避免无人等待时出现 "exception was never retrieved"
+            future.exception()
+            raise
+        finally:
+            self._inflight.pop(name, None)
+
+    async def _render_uncached(
+        self,
+        file_path: Path,
+        filename: str,
+        width: Optional[int],
+        quality: int,
+        output_format: str,
+        name: str
+    ) -> Optional[Path]:
+        data = await self.read_original(file_path, filename)
+        if data is None:
+            return None
+
+        loop = asyncio.get_running_loop()
+        try:
+            output = await loop.run_in_executor(
+                self._get_executor(), transcode_image, data, width, quality, output_format
+            )
+        except Exception as e:
+            log.warning(f"漫画页面转码失败: {file_path.name}/{filename}, 错误: {e}")
+            return None
+
+        return await loop.run_in_executor(None, self.cache.put, name, output)
+
+    def schedule_prefetch(
+        self,
+        file_path: Path,
+        images: List[Dict],
+        index: int,
+        width: Optional[int],
+        quality: int,
+        output_format: str
+    ) -> None:
+        """后台预取后续页面"""
+        count = settings.comic.prefetch_pages
+        if count <= 0:
+            return
+        filenames = [image["filename"] for image in images[index + 1:index + 1 + count]]
+        if not filenames:
+            return
+
+        task = asyncio.create_task(
+            self._prefetch(file_path, filenames, width, quality, output_format)
+        )
+        self._prefetch_tasks.add(task)
+        task.add_done_callback(self._prefetch_tasks.discard)
+
+    async def _prefetch(
+        self,
+        file_path: Path,
+        filenames: List[str],
+        width: Optional[int],
+        quality: int,
+        output_format: str
+    ) -> None:
+        for filename in filenames:
+            try:
+                await self.render_page(file_path, filename, width, quality, output_format)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log.debug(f"漫画页面预取失败: {file_path.name}/{filename}, 错误: {e}")
+
+
+# 全局单例
+comic_page_service = ComicPageService()
@@ -1,5 +1,9 @@
 """
 Ebook conversion helper based on calibre ebook-convert
+
+Job state lives in CONVERT_JOB_DIR, so every worker process can look up a job.
+The cache_key -> job_id index is kept there too and updated under a file lock,
+so concurrent requests from different workers share a single conversion.
 """
 from __future__ import annotations
 
@@ -13,11 +17,17 @@ import time
 import uuid
 from hashlib import md5
 from pathlib import Path
-from typing import Dict, Optional
+from contextlib import contextmanager
+from typing import Optional
 
 from app.config import settings
 from app.utils.logger import log
 
+try:
+    import fcntl
+except ImportError:  # Windows: index updates are only serialized within the process
+    fcntl = None
+
 
 CONVERT_CACHE_DIR = Path(settings.directories.data) / "cache" / "converted"
 CONVERT_JOB_DIR = Path(settings.directories.data) / "cache" / "convert_jobs"
@@ -29,7 +39,10 @@ SUPPORTED_TARGET_FORMATS = {"epub", "mobi", "azw3"}
 SUPPORTED_INPUT_FORMATS = {".epub", ".mobi", ".azw3"}
 
 _JOB_LOCK = threading.Lock()
-_JOB_INDEX: Dict[str, str] = {}
+_JOB_INDEX_LOCK_FILE = ".index.lock"
+
+# A "running" job not updated for this long is treated as abandoned (worker died)
+STALE_JOB_SECONDS = CONVERT_TIMEOUT_SECONDS + 60
 
 
 def is_conversion_supported(input_format: str, target_format: str) -> bool:
@@ -80,6 +93,46 @@ def get_conversion_status(job_id: str) -> Optional[dict]:
         return None
 
 
+@contextmanager
+def _job_index_lock():
+    """Serialize index updates across threads and, on POSIX, across worker processes"""
+    with _JOB_LOCK:
+        if fcntl is None:
+            yield
+            return
+        with open(CONVERT_JOB_DIR / _JOB_INDEX_LOCK_FILE, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def _read_job_index(cache_key: str) -> Optional[str]:
+    try:
+        return (CONVERT_JOB_DIR / f"{cache_key}.index").read_text(encoding="utf-8").strip() or None
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        log.warning(f"Failed to read conversion job index: {cache_key}, error: {e}")
+        return None
+
+
+def _write_job_index(cache_key: str, job_id: str) -> None:
+    try:
+        (CONVERT_JOB_DIR / f"{cache_key}.index").write_text(job_id, encoding="utf-8")
+    except Exception as e:
+        log.warning(f"Failed to write conversion job index: {cache_key}, error: {e}")
+
+
+def _is_job_running(status: Optional[dict]) -> bool:
+    return (
+        bool(status)
+        and status.get("status") == "running"
+        and time.time() - status.get("updated_at", 0) < STALE_JOB_SECONDS
+    )
+
+
 def request_conversion(file_path: Path, target_format: str, force: bool = False) -> dict:
     _ensure_dirs()
     target_format = target_format.lower().lstrip(".")
@@ -103,11 +156,11 @@ def request_conversion(file_path: Path, target_format: str, force: bool = False)
             "message": "previous conversion failed",
         }
 
-    with _JOB_LOCK:
-        existing_job_id = _JOB_INDEX.get(cache_key)
+    with _job_index_lock():
+        existing_job_id = _read_job_index(cache_key)
         if existing_job_id:
             existing_status = get_conversion_status(existing_job_id)
-            if existing_status and existing_status.get("status") == "running":
+            if _is_job_running(existing_status):
                 return {
                     "status": "running",
                     "job_id": existing_job_id,
@@ -115,18 +168,17 @@ def request_conversion(file_path: Path, target_format: str, force: bool = False)
                 }
 
         job_id = uuid.uuid4().hex
-        _JOB_INDEX[cache_key] = job_id
-
-    job_state = {
-        "job_id": job_id,
-        "status": "running",
-        "progress": 0,
-        "message": "conversion started",
-        "target_format": target_format,
-        "output_path": str(output_path),
-        "updated_at": int(time.time()),
-    }
-    _write_job(job_id, job_state)
+        job_state = {
+            "job_id": job_id,
+            "status": "running",
+            "progress": 0,
+            "message": "conversion started",
+            "target_format": target_format,
+            "output_path": str(output_path),
+            "updated_at": int(time.time()),
+        }
+        _write_job(job_id, job_state)
+        _write_job_index(cache_key, job_id)
 
     thread = threading.Thread(
         target=_run_conversion_job,
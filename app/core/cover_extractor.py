@@ -0,0 +1,442 @@
+"""
+批量封面提取任务
+按批次流式读取缺少封面的书籍，在进程池中提取 EPUB/MOBI/漫画/PDF 封面，
+无内嵌封面时生成默认封面，结果批量回写数据库并通过 WebSocket 推送进度。
+任务进度持久化到磁盘，服务重启后可从上次位置继续。
+"""
+from __future__ import annotations
+
+import asyncio
+import json
+import multiprocessing
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from io import BytesIO
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select, update
+
+from app.config import settings
+from app.core.websocket import manager
+from app.database import AsyncSessionLocal
+from app.models import Author, Book, BookVersion
+from app.utils.cover_manager import cover_manager
+from app.utils.logger import log
+
+
+COVER_JOB_STATE_PATH = Path(settings.directories.data) / "cache" / "cover_extract_job.json"
+
+COMIC_COVER_FORMATS = {"zip", "cbz", "rar", "cbr", "7z", "cb7"}
+PDF_RENDER_TIMEOUT_SECONDS = 30
+
+
+def _save_cover_image(image_data: bytes, save_path: Path) -> bool:
+    """按封面配置缩放并保存为 JPEG"""
+    from PIL import Image
+
+    try:
+        with Image.open(BytesIO(image_data)) as img:
+            img = img.convert("RGB")
+            img.thumbnail(
+                (settings.cover.max_width, settings.cover.max_height),
+                Image.Resampling.LANCZOS
+            )
+            save_path.parent.mkdir(parents=True, exist_ok=True)
+            img.save(save_path, "JPEG", quality=settings.cover.quality)
+        return True
+    except Exception as e:
+        log.warning(f"保存封面失败: {save_path}, 错误: {e}")
+        return False
+
+
+def _extract_comic_cover(file_path: Path) -> Optional[bytes]:
+    from app.core.metadata.comic_parser import ComicParser
+
+    images = ComicParser.get_image_list(file_path)
+    if not images:
+        return None
+    return ComicParser.get_image_data(file_path, images[0]["filename"])
+
+
+def _extract_pdf_cover(file_path: Path) -> Optional[bytes]:
+    """渲染 PDF 首页，优先使用 PyMuPDF，其次 poppler 的 pdftoppm"""
+    try:
+        import fitz  # PyMuPDF（可选依赖）
+
+        with fitz.open(str(file_path)) as doc:
+            if doc.page_count == 0:
+                return None
+            pixmap = doc.load_page(0).get_pixmap(dpi=110)
+            return pixmap.tobytes("png")
+    except ImportError:
+        pass
+    except Exception as e:
+        log.debug(f"PyMuPDF 渲染 PDF 封面失败: {file_path.name}, 错误: {e}")
+        return None
+
+    if not shutil.which("pdftoppm"):
+        return None
+
+    with tempfile.TemporaryDirectory(dir=settings.directories.temp) as tempdir:
+        output_prefix = Path(tempdir) / "cover"
+        try:
+            subprocess.run(
+                ["pdftoppm", "-f", "1", "-l", "1", "-r", "110", "-png", "-singlefile",
+                 str(file_path), str(output_prefix)],
+                check=True,
+                capture_output=True,
+                timeout=PDF_RENDER_TIMEOUT_SECONDS,
+            )
+        except Exception as e:
+            log.debug(f"pdftoppm 渲染 PDF 封面失败: {file_path.name}, 错误: {e}")
+            return None
+        output_path = output_prefix.with_suffix(".png")
+        return output_path.read_bytes() if output_path.exists() else None
+
+
+def extract_cover_for_book(
+    book_id: int,
+    title: str,
+    author: Optional[str],
+    candidates: List[Tuple[str, str, str]]
+) -> Tuple[int, Optional[str], str]:
+    """提取封面并生成各尺寸派生图（在进程池中执行）"""
+    result = _extract_cover(book_id, title, author, candidates)
+    if result[1]:
+        cover_manager.generate_derivatives(Path(result[1]))
+    return result
+
+
+def _extract_cover(
+    book_id: int,
+    title: str,
+    author: Optional[str],
+    candidates: List[Tuple[str, str, str]]
+) -> Tuple[int, Optional[str], str]:
+    """
+    为单本书提取封面
+
+    Args:
+        book_id: 书籍ID
+        title: 书名（生成默认封面用）
+        author: 作者
+        candidates: 候选版本 [(file_path, file_format, file_hash)]，主版本在前
+
+    Returns:
+        (book_id, 封面路径, 来源) 来源为 embedded/default/missing
+    """
+    from app.core.metadata.epub_parser import EpubParser
+    from app.core.metadata.mobi_parser import MobiParser
+
+    cover_dir = Path(settings.directories.covers)
+    existing = [(Path(path), fmt.lower().lstrip("."), file_hash)
+                for path, fmt, file_hash in candidates if Path(path).exists()]
+    if not existing:
+        return book_id, None, "missing"
+
+    for file_path, file_format, file_hash in existing:
+        try:
+            if file_format == "epub":
+                cover_path = EpubParser().parse(file_path).get("cover")
+                if cover_path:
+                    return book_id, cover_path, "embedded"
+            elif file_format in ("mobi", "azw3"):
+                cover_path = MobiParser().parse(file_path).get("cover")
+                if cover_path:
+                    return book_id, cover_path, "embedded"
+            elif file_format in COMIC_COVER_FORMATS or file_format == "pdf":
+                if file_format == "pdf":
+                    image_data = _extract_pdf_cover(file_path)
+                else:
+                    image_data = _extract_comic_cover(file_path)
+                save_path = cover_dir / f"{file_hash}.jpg"
+                if image_data and _save_cover_image(image_data, save_path):
+                    return book_id, str(save_path), "embedded"
+        except Exception as e:
+            log.warning(f"提取封面失败: {file_path}, 错误: {e}")
+
+    # 没有内嵌封面，生成默认封面
+    _, _, file_hash = existing[0]
+    save_path = cover_dir / f"{file_hash}.jpg"
+    image_data = cover_manager.generate_default_cover(
+        title or existing[0][0].stem,
+        author,
+        style=settings.cover.default_style
+    )
+    if _save_cover_image(image_data, save_path):
+        return book_id, str(save_path), "default"
+    return book_id, None, "missing"
+
+
+class CoverExtractionJob:
+    """批量封面提取任务（全局单例，同一时间只运行一个任务）"""
+
+    def __init__(self):
+        self._task: Optional[asyncio.Task] = None
+        self._cancel_requested = False
+        self._state: dict = self._load_state() or self._empty_state()
+
+    @staticmethod
+    def _empty_state() -> dict:
+        return {
+            "status": "idle",
+            "library_id": None,
+            "last_book_id": 0,
+            "total": 0,
+            "processed": 0,
+            "extracted": 0,
+            "generated": 0,
+            "missing": 0,
+            "errors": 0,
+            "started_at": None,
+            "completed_at": None,
+            "updated_at": None,
+        }
+
+    @staticmethod
+    def _load_state() -> Optional[dict]:
+        if not COVER_JOB_STATE_PATH.exists():
+            return None
+        try:
+            with open(COVER_JOB_STATE_PATH, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            # 进程退出时仍在运行的任务标记为中断，等待恢复
+            if state.get("status") == "running":
+                state["status"] = "interrupted"
+            return state
+        except Exception as e:
+            log.warning(f"读取封面提取任务状态失败: {e}")
+            return None
+
+    def _save_state(self) -> None:
+        self._state["updated_at"] = int(time.time())
+        try:
+            COVER_JOB_STATE_PATH.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = COVER_JOB_STATE_PATH.with_suffix(".json.tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._state, f, ensure_ascii=False)
+            tmp_path.replace(COVER_JOB_STATE_PATH)
+        except Exception as e:
+            log.warning(f"写入封面提取任务状态失败: {e}")
+
+    @property
+    def is_running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def get_status(self) -> dict:
+        return dict(self._state)
+
+    async def start(self, library_id: Optional[int] = None, resume: bool = False) -> dict:
+        """
+        启动任务
+
+        Args:
+            library_id: 仅处理指定书库，None 表示全部
+            resume: 从上次中断的位置继续（沿用上次的书库范围和计数）
+        """
+        if self.is_running:
+            raise ValueError("封面提取任务正在运行")
+
+        if resume and self._state.get("status") in ("interrupted", "cancelled", "failed"):
+            library_id = self._state.get("library_id")
+        else:
+            self._state = self._empty_state()
+            self._state["library_id"] = library_id
+            self._state["total"] = await self._count_pending(library_id)
+
+        self._state["status"] = "running"
+        self._state["started_at"] = self._state.get("started_at") or datetime.utcnow().isoformat()
+        self._state["completed_at"] = None
+        self._cancel_requested = False
+        self._save_state()
+
+        self._task = asyncio.create_task(self._run())
+        log.info(
+            f"封面提取任务已启动: library_id={library_id}, "
+            f"待处理={self._state['total']}, 起始ID={self._state['last_book_id']}"
+        )
+        return self.get_status()
+
+    def cancel(self) -> bool:
+        if not self.is_running:
+            return False
+        self._cancel_requested = True
+        return True
+
+    @staticmethod
+    def _pending_query(library_id: Optional[int]):
+        query = select(Book.id).where(Book.cover_path.is_(None))
+        if library_id:
+            query = query.where(Book.library_id == library_id)
+        return query
+
+    async def _count_pending(self, library_id: Optional[int]) -> int:
+        from sqlalchemy import func
+
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(
+                select(func.count()).select_from(self._pending_query(library_id).subquery())
+            )
+            return result.scalar() or 0
+
+    async def _fetch_batch(self, db, library_id: Optional[int], after_id: int, limit: int) -> List[dict]:
+        """按 ID 游标读取一批缺少封面的书籍及其候选版本"""
+        query = (
+            select(Book.id, Book.title, Author.name)
+            .outerjoin(Author, Book.author_id == Author.id)
+            .where(Book.cover_path.is_(None))
+            .where(Book.id > after_id)
+            .order_by(Book.id)
+            .limit(limit)
+        )
+        if library_id:
+            query = query.where(Book.library_id == library_id)
+        rows = (await db.execute(query)).all()
+        if not rows:
+            return []
+
+        book_ids = [row[0] for row in rows]
+        version_rows = (await db.execute(
+            select(
+                BookVersion.book_id,
+                BookVersion.file_path,
+                BookVersion.file_format,
+                BookVersion.file_hash,
+                BookVersion.is_primary,
+            ).where(BookVersion.book_id.in_(book_ids))
+        )).all()
+
+        versions: Dict[int, List[tuple]] = {}
+        for book_id, file_path, file_format, file_hash, is_primary in version_rows:
+            versions.setdefault(book_id, []).append((not is_primary, file_path, file_format, file_hash))
+
+        batch = []
+        for book_id, title, author_name in rows:
+            candidates = [
+                (file_path, file_format, file_hash)
+                for _, file_path, file_format, file_hash in sorted(versions.get(book_id, []))
+            ]
+            batch.append({"id": book_id, "title": title, "author": author_name, "candidates": candidates})
+        return batch
+
+    async def _run(self) -> None:
+        state = self._state
+        library_id = state.get("library_id")
+        batch_size = max(1, settings.cover.extract_batch_size)
+        io_limit = asyncio.Semaphore(max(1, settings.cover.extract_max_concurrent_io))
+        loop = asyncio.get_running_loop()
+        executor = ProcessPoolExecutor(
+            max_workers=max(1, settings.cover.extract_workers),
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+
+        async def process_one(item: dict) -> Tuple[int, Optional[str], str]:
+            async with io_limit:
+                try:
+                    return await loop.run_in_executor(
+                        executor,
+                        extract_cover_for_book,
+                        item["id"], item["title"], item["author"], item["candidates"]
+                    )
+                except Exception as e:
+                    log.warning(f"封面提取进程失败: book_id={item['id']}, 错误: {e}")
+                    return item["id"], None, "error"
+
+        try:
+            await self._broadcast_progress()
+            while not self._cancel_requested:
+                async with AsyncSessionLocal() as db:
+                    batch = await self._fetch_batch(db, library_id, state["last_book_id"], batch_size)
+                    if not batch:
+                        break
+
+                    results = await asyncio.gather(*(process_one(item) for item in batch))
+
+                    updates = [
+                        {"id": book_id, "cover_path": cover_path}
+                        for book_id, cover_path, _ in results if cover_path
+                    ]
+                    if updates:
+                        # 按主键批量 UPDATE，一次提交
+                        await db.execute(update(Book), updates)
+                        await db.commit()
+                        for item in updates:
+                            cover_manager.invalidate_cover(item["id"])
+
+                for _, _, source in results:
+                    if source == "embedded":
+                        state["extracted"] += 1
+                    elif source == "default":
+                        state["generated"] += 1
+                    elif source == "missing":
+                        state["missing"] += 1
+                    else:
+                        state["errors"] += 1
+                state["processed"] += len(batch)
+                state["last_book_id"] = batch[-1]["id"]
+                self._save_state()
+                await self._broadcast_progress()
+
+            state["status"] = "cancelled" if self._cancel_requested else "completed"
+            log.info(
+                f"封面提取任务{'已取消' if self._cancel_requested else '完成'}: "
+                f"处理={state['processed']}, 提取={state['extracted']}, "
+                f"默认={state['generated']}, 缺失={state['missing']}, 错误={state['errors']}"
+            )
+        except asyncio.CancelledError:
+            state["status"] = "interrupted"
+            raise
+        except Exception as e:
+            log.error(f"封面提取任务失败: {e}", exc_info=True)
+            state["status"] = "failed"
+            state["error"] = str(e)[:500]
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+            state["completed_at"] = datetime.utcnow().isoformat()
+            self._save_state()
+            try:
+                await self._broadcast_progress()
+            except Exception:
+                pass
+
+    async def _broadcast_progress(self) -> None:
+        state = self._state
+        total = state.get("total") or 0
+        await manager.broadcast({
+            "type": "cover_extract_progress",
+            "status": state["status"],
+            "library_id": state.get("library_id"),
+            "progress": min(100, int(state["processed"] / total * 100)) if total else 100,
+            "total": total,
+            "processed": state["processed"],
+            "extracted": state["extracted"],
+            "generated": state["generated"],
+            "missing": state["missing"],
+            "errors": state["errors"],
+        })
+
+    async def shutdown(self) -> None:
+        """应用关闭时停止任务，保留进度以便恢复"""
+        if self.is_running:
+            self._task.cancel()
+            try:
+                await self._task
+            except (asyncio.CancelledError, Exception):
+                pass
+
+
+# 全局单例
+_job: Optional[CoverExtractionJob] = None
+
+
+def get_cover_extraction_job() -> CoverExtractionJob:
+    """获取封面提取任务单例"""
+    global _job
+    if _job is None:
+        _job = CoverExtractionJob()
+    return _job
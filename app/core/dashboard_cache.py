@@ -0,0 +1,122 @@
+"""
+首页 Dashboard 缓存
+书库摘要、各书库最新书籍与统计按可访问书库集合缓存（访问权限相同的用户共享），书目变更提交后清空；
+继续阅读与收藏按用户缓存，该用户的阅读进度或收藏变更提交后失效（经 backplane 同步到其他 worker）
+"""
+import time
+from typing import Any, Dict, Optional, Set, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app.core.backplane import backplane
+from app.core.catalog_events import on_catalog_commit
+from app.models import Favorite, ReadingProgress
+
+CATALOG_TTL = 300
+USER_TTL = 120
+
+_SESSION_KEY = "dashboard_changed_user_ids"
+
+
+class DashboardCache:
+    """Dashboard 分段缓存（进程内，带 TTL）"""
+
+    def __init__(self, catalog_ttl: int = CATALOG_TTL, user_ttl: int = USER_TTL):
+        self.catalog_ttl = catalog_ttl
+        self.user_ttl = user_ttl
+        self._catalog: Dict[Tuple[int, ...], Tuple[float, Any]] = {}
+        self._user: Dict[int, Tuple[float, Tuple[int, ...], Any]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get_catalog(self, library_ids: Tuple[int, ...]) -> Optional[Any]:
+        entry = self._catalog.get(library_ids)
+        if entry is not None and entry[0] > time.monotonic():
+            self.hits += 1
+            return entry[1]
+        self._catalog.pop(library_ids, None)
+        self.misses += 1
+        return None
+
+    def put_catalog(self, library_ids: Tuple[int, ...], value: Any) -> None:
+        self._catalog[library_ids] = (time.monotonic() + self.catalog_ttl, value)
+
+    def get_user(self, user_id: int, library_ids: Tuple[int, ...]) -> Optional[Any]:
+        entry = self._user.get(user_id)
+        if entry is not None and entry[0] > time.monotonic() and entry[1] == library_ids:
+            self.hits += 1
+            return entry[2]
+        self._user.pop(user_id, None)
+        self.misses += 1
+        return None
+
+    def put_user(self, user_id: int, library_ids: Tuple[int, ...], value: Any) -> None:
+        self._user[user_id] = (time.monotonic() + self.user_ttl, library_ids, value)
+
+    def invalidate_catalog(self) -> None:
+        self.invalidations += 1
+        self._catalog.clear()
+
+    def invalidate_user(self, user_id: Optional[int] = None) -> None:
+        """失效指定用户的个人数据；user_id 为空时全部清空"""
+        self.invalidations += 1
+        if user_id is None:
+            self._user.clear()
+        else:
+            self._user.pop(user_id, None)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "catalog_entries": len(self._catalog),
+            "user_entries": len(self._user),
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / total * 100, 2) if total else 0,
+        }
+
+
+# 全局单例
+dashboard_cache = DashboardCache()
+
+
+@on_catalog_commit
+def _invalidate_catalog(change) -> None:
+    dashboard_cache.invalidate_catalog()
+    # 继续阅读列表包含书名等书目信息
+    if change.tables & {"books", "libraries", "authors"}:
+        dashboard_cache.invalidate_user()
+
+
+@event.listens_for(Session, "after_flush")
+def _collect_user_changes(session: Session, flush_context) -> None:
+    changed: Optional[Set[int]] = None
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, (ReadingProgress, Favorite)) and obj.user_id is not None:
+            if changed is None:
+                changed = session.info.setdefault(_SESSION_KEY, set())
+            changed.add(obj.user_id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_users(session: Session) -> None:
+    user_ids = session.info.pop(_SESSION_KEY, None)
+    if not user_ids:
+        return
+    for user_id in user_ids:
+        dashboard_cache.invalidate_user(user_id)
+    backplane.publish("dashboard.users", {"user_ids": sorted(user_ids)})
+
+
+@backplane.subscribe_to("dashboard.users")
+def _on_remote_user_changes(data: dict) -> None:
+    for user_id in data["user_ids"]:
+        dashboard_cache.invalidate_user(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_user_changes(session: Session) -> None:
+    session.info.pop(_SESSION_KEY, None)
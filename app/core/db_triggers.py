@@ -0,0 +1,72 @@
+"""
+数据库触发器
+SQLite 与 PostgreSQL 共用同一份触发器定义（触发时机、条件与语句体）：
+SQLite 直接创建 CREATE TRIGGER ... BEGIN ... END；
+PostgreSQL 为每个触发器创建同名 PL/pgSQL 函数，再由 FOR EACH ROW 触发器调用。
+
+语句体中两种数据库语法不同的表达式通过 is_distinct / utc_day 生成
+"""
+from typing import Iterable, Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+# 支持触发器维护冗余数据的数据库
+TRIGGER_DIALECTS = ("sqlite", "postgresql")
+
+
+def supports_triggers(conn: Connection) -> bool:
+    return conn.dialect.name in TRIGGER_DIALECTS
+
+
+def is_distinct(left: str, right: str, dialect: str) -> str:
+    """NULL 安全的不等比较"""
+    if dialect == "postgresql":
+        return f"{left} IS DISTINCT FROM {right}"
+    return f"{left} IS NOT {right}"
+
+
+def utc_day(expr: str, dialect: str) -> str:
+    """时间列的日期字符串（YYYY-MM-DD）"""
+    if dialect == "postgresql":
+        return f"to_char({expr}, 'YYYY-MM-DD')"
+    return f"date({expr})"
+
+
+def _table(event: str) -> str:
+    return event.rsplit(" ON ", 1)[1].split()[0]
+
+
+def count_triggers(conn: Connection, names: Iterable[str]) -> int:
+    """已存在的触发器数量"""
+    names_sql = ", ".join(f"'{name}'" for name in names)
+    if conn.dialect.name == "postgresql":
+        sql = f"SELECT count(*) FROM pg_trigger WHERE NOT tgisinternal AND tgname IN ({names_sql})"
+    else:
+        sql = f"SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name IN ({names_sql})"
+    return conn.execute(text(sql)).scalar() or 0
+
+
+def replace_trigger(conn: Connection, name: str, event: str, body: str, when: Optional[str] = None) -> None:
+    """
+    重建触发器
+
+    Args:
+        event: 触发时机，如 "AFTER UPDATE OF title ON books"
+        body: 以分号结尾的语句（可多条），可引用 NEW / OLD
+        when: 触发条件，可引用 NEW / OLD
+    """
+    if conn.dialect.name == "postgresql":
+        conn.execute(text(
+            f"CREATE OR REPLACE FUNCTION {name}() RETURNS trigger LANGUAGE plpgsql AS $$\n"
+            f"BEGIN\n{body}RETURN NULL;\nEND\n$$"
+        ))
+        conn.execute(text(f"DROP TRIGGER IF EXISTS {name} ON {_table(event)}"))
+        condition = f" WHEN ({when})" if when else ""
+        conn.execute(text(f"CREATE TRIGGER {name} {event} FOR EACH ROW{condition} EXECUTE FUNCTION {name}()"))
+        return
+
+    conn.execute(text(f"DROP TRIGGER IF EXISTS {name}"))
+    condition = f" WHEN {when}" if when else ""
+    conn.execute(text(f"CREATE TRIGGER {name} {event}{condition}\nBEGIN\n{body}END"))
+
@@ -0,0 +1,230 @@
+"""
+书籍列表分面统计
+在当前筛选条件下一次查询统计格式、标签、作者、内容分级与文件大小区间的书籍数，
+结果按（访问上下文, 筛选条件）缓存，书目变更提交后失效
+"""
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import String, and_, case, cast, func, literal, select, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.catalog_events import on_catalog_commit
+from app.models import Author, Book, BookTag, BookVersion, Tag
+
+# 缓存时间（秒）；原生 SQL 修改不会触发失效，由 TTL 兜底
+FACET_CACHE_TTL = 300
+FACET_CACHE_MAX_ENTRIES = 1000
+
+# 作者分面最多返回的条目数
+FACET_AUTHOR_LIMIT = 50
+
+MB = 1024 * 1024
+
+# 文件大小区间：(键, 下限, 上限)，上限不含；与 min_size/max_size 参数对应
+SIZE_BUCKETS: Tuple[Tuple[str, int, Optional[int]], ...] = (
+    ("lt_1m", 0, 1 * MB),
+    ("1m_10m", 1 * MB, 10 * MB),
+    ("10m_50m", 10 * MB, 50 * MB),
+    ("50m_100m", 50 * MB, 100 * MB),
+    ("gte_100m", 100 * MB, None),
+)
+
+
+def filter_hash(filter_key: Sequence[Any]) -> str:
+    """筛选条件摘要（参数需已规范化，顺序固定）"""
+    return hashlib.sha1(repr(tuple(filter_key)).encode("utf-8")).hexdigest()
+
+
+class FacetCache:
+    """分面统计缓存（进程内，带 TTL）"""
+
+    def __init__(self, ttl: int = FACET_CACHE_TTL, max_entries: int = FACET_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[float, dict]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, key: Hashable) -> Optional[dict]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, facets = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return facets
+            self._entries.pop(key, None)
+        self.misses += 1
+        return None
+
+    def put(self, key: Hashable, facets: dict) -> None:
+        if self.ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, facets)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self) -> None:
+        self.invalidations += 1
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / total * 100, 2) if total else 0,
+        }
+
+
+def _size_bucket_expression(column):
+    whens = []
+    for key, _, upper in SIZE_BUCKETS:
+        if upper is not None:
+            whens.append((column < upper, key))
+    return case(*whens, else_=SIZE_BUCKETS[-1][0])
+
+
+async def compute_facets(db: AsyncSession, filters: List[Any]) -> dict:
+    """
+    计算当前筛选条件下的分面统计
+
+    先以 CTE 得到命中书籍，再用一条 UNION ALL 语句完成各维度分组计数
+
+    Args:
+        filters: Book 查询条件（含访问权限条件）
+
+    Returns:
+        {"total", "formats", "tags", "authors", "age_ratings", "sizes"}
+    """
+    matched = (
+        select(Book.id, Book.author_id, Book.age_rating, Book.file_size)
+        .where(and_(*filters))
+        .cte("matched")
+    )
+
+    # 格式与筛选一致：书籍任一版本为该格式即计入，统一去掉前导点并转小写
+    version_format = func.lower(func.ltrim(BookVersion.file_format, "."))
+    format_counts = (
+        select(
+            literal("format").label("facet"),
+            cast(version_format, String).label("facet_key"),
+            func.count(func.distinct(BookVersion.book_id)).label("book_count"),
+        )
+        .where(BookVersion.book_id.in_(select(matched.c.id)))
+        .group_by(version_format)
+    )
+    tag_counts = (
+        select(
+            literal("tag").label("facet"),
+            cast(BookTag.tag_id, String).label("facet_key"),
+            func.count(BookTag.book_id).label("book_count"),
+        )
+        .where(BookTag.book_id.in_(select(matched.c.id)))
+        .group_by(BookTag.tag_id)
+    )
+    author_counts = (
+        select(
+            literal("author").label("facet"),
+            cast(matched.c.author_id, String).label("facet_key"),
+            func.count().label("book_count"),
+        )
+        .where(matched.c.author_id.isnot(None))
+        .group_by(matched.c.author_id)
+    )
+    rating_key = func.lower(func.coalesce(matched.c.age_rating, "general"))
+    rating_counts = (
+        select(
+            literal("rating").label("facet"),
+            cast(rating_key, String).label("facet_key"),
+            func.count().label("book_count"),
+        )
+        .group_by(rating_key)
+    )
+    size_key = _size_bucket_expression(matched.c.file_size)
+    size_counts = (
+        select(
+            literal("size").label("facet"),
+            cast(size_key, String).label("facet_key"),
+            func.count().label("book_count"),
+        )
+        .group_by(size_key)
+    )
+
+    result = await db.execute(
+        union_all(format_counts, tag_counts, author_counts, rating_counts, size_counts)
+    )
+
+    grouped: Dict[str, Dict[str, int]] = {
+        "format": {}, "tag": {}, "author": {}, "rating": {}, "size": {}
+    }
+    for facet, key, count in result.all():
+        grouped[facet][key] = count
+
+    total = sum(grouped["rating"].values())
+
+    tag_counts_by_id = {int(key): count for key, count in grouped["tag"].items()}
+    tags = []
+    if tag_counts_by_id:
+        tag_rows = await db.execute(
+            select(Tag.id, Tag.name, Tag.type).where(Tag.id.in_(list(tag_counts_by_id)))
+        )
+        tags = [
+            {"id": row.id, "name": row.name, "type": row.type, "count": tag_counts_by_id[row.id]}
+            for row in tag_rows
+        ]
+        tags.sort(key=lambda item: (-item["count"], item["name"]))
+
+    author_counts_by_id = sorted(
+        ((int(key), count) for key, count in grouped["author"].items()),
+        key=lambda item: -item[1],
+    )[:FACET_AUTHOR_LIMIT]
+    authors = []
+    if author_counts_by_id:
+        counts = dict(author_counts_by_id)
+        author_rows = await db.execute(select(Author.id, Author.name).where(Author.id.in_(list(counts))))
+        authors = [
+            {"id": row.id, "name": row.name, "count": counts[row.id]}
+            for row in author_rows
+        ]
+        authors.sort(key=lambda item: (-item["count"], item["name"]))
+
+    return {
+        "total": total,
+        "formats": [
+            {"format": key, "count": count}
+            for key, count in sorted(grouped["format"].items(), key=lambda item: -item[1])
+        ],
+        "tags": tags,
+        "authors": authors,
+        "age_ratings": [
+            {"age_rating": key, "count": count}
+            for key, count in sorted(grouped["rating"].items(), key=lambda item: -item[1])
+        ],
+        "sizes": [
+            {
+                "bucket": key,
+                "min_size": lower,
+                "max_size": upper - 1 if upper is not None else None,
+                "count": grouped["size"].get(key, 0),
+            }
+            for key, lower, upper in SIZE_BUCKETS
+        ],
+    }
+
+
+# 全局单例
+facet_cache = FacetCache()
+
+
+@on_catalog_commit
+def _invalidate_facets(change) -> None:
+    facet_cache.invalidate()
@@ -0,0 +1,304 @@
+"""
+阅读心跳合并写入
+心跳只在内存中保留每个会话最新的时长、进度与位置，按固定间隔在一个事务中批量写入
+reading_sessions / reading_progress（并计入阅读统计汇总），避免大量并发心跳争抢 SQLite 写锁。
+
+- 结束会话时取出该会话未写入的心跳，与结束请求在同一事务中写入
+- 写入失败时条目放回缓冲区，下次重试；应用关闭时做最后一次写入
+- 写入经单写入者队列（app.core.write_queue）执行，与其他小型写操作合并提交
+- 可选在写入后定期执行 WAL PASSIVE checkpoint，控制 WAL 文件增长
+"""
+import asyncio
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import select, text, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.config import settings
+from app.core.reading_stats import fold_session
+from app.models import ReadingProgress, ReadingSession
+from app.utils.logger import log
+
+# 会话归属缓存上限（session_id -> (user_id, book_id)）
+SESSION_OWNER_CACHE_SIZE = 10000
+
+
+@dataclass
+class PendingHeartbeat:
+    """一个会话尚未写入的最新心跳"""
+    session_id: int
+    user_id: int
+    book_id: int
+    duration_seconds: int
+    progress: Optional[float] = None
+    position: Optional[str] = None
+    # 客户端显式保存进度时携带（与 POST /progress 一致：进度按原值覆盖而非取较大值）
+    finished: Optional[bool] = None
+    received_at: datetime = field(default_factory=lambda: datetime.now(timezone.utc))
+
+    def merge(self, newer: "PendingHeartbeat") -> None:
+        """合并更新的心跳：时长与时间取新值，进度/位置仅在新心跳携带时覆盖"""
+        self.duration_seconds = newer.duration_seconds
+        if newer.progress is not None:
+            self.progress = newer.progress
+        if newer.position is not None:
+            self.position = newer.position
+        if newer.finished is not None:
+            self.finished = newer.finished
+        self.received_at = newer.received_at
+
+
+async def apply_heartbeats(db: AsyncSession, entries: List[PendingHeartbeat]) -> None:
+    """写入一批心跳（会话时长与进度、阅读统计汇总、总体阅读进度），由调用方提交"""
+    if not entries:
+        return
+
+    result = await db.execute(
+        select(ReadingSession).where(ReadingSession.id.in_([entry.session_id for entry in entries]))
+    )
+    sessions = {session.id: session for session in result.scalars().all()}
+
+    progress_keys = {
+        (entry.user_id, entry.book_id) for entry in entries
+        if entry.progress is not None or entry.position is not None
+    }
+    progresses: Dict[Tuple[int, int], ReadingProgress] = {}
+    if progress_keys:
+        result = await db.execute(
+            select(ReadingProgress).where(
+                tuple_(ReadingProgress.user_id, ReadingProgress.book_id).in_(list(progress_keys))
+            )
+        )
+        progresses = {(item.user_id, item.book_id): item for item in result.scalars().all()}
+
+    for entry in entries:
+        session = sessions.get(entry.session_id)
+        # 会话已结束时，迟到的心跳不再覆盖结束时写入的数据
+        if session is None or session.end_time is not None:
+            continue
+
+        session.duration_seconds = max(session.duration_seconds or 0, entry.duration_seconds)
+        if entry.progress is not None:
+            session.progress = entry.progress
+        await fold_session(db, session)
+
+        if entry.progress is None and entry.position is None:
+            continue
+        key = (entry.user_id, entry.book_id)
+        reading_progress = progresses.get(key)
+        if reading_progress:
+            if entry.progress is not None:
+                if entry.finished is None:
+                    reading_progress.progress = max(reading_progress.progress, entry.progress)
+                else:
+                    reading_progress.progress = entry.progress
+            if entry.position is not None:
+                reading_progress.position = entry.position
+            if entry.finished is not None:
+                reading_progress.finished = entry.finished
+            reading_progress.last_read_at = entry.received_at
+        else:
+            reading_progress = ReadingProgress(
+                user_id=entry.user_id,
+                book_id=entry.book_id,
+                progress=entry.progress or 0.0,
+                position=entry.position,
+                finished=bool(entry.finished),
+                last_read_at=entry.received_at
+            )
+            db.add(reading_progress)
+            progresses[key] = reading_progress
+
+
+async def merged_progress(db: AsyncSession, entry: PendingHeartbeat) -> dict:
+    """
+    心跳写入后的总体阅读进度（用于 progress_update 广播）
+
+    缓冲区中的心跳可能只带位置、进度低于已保存的最大值，或尚未写入；
+    按 apply_heartbeats 的规则与已保存的进度合并，没有值的字段不返回
+    """
+    result = await db.execute(
+        select(ReadingProgress.progress, ReadingProgress.position).where(
+            ReadingProgress.user_id == entry.user_id,
+            ReadingProgress.book_id == entry.book_id,
+        )
+    )
+    stored = result.first()
+    progress = stored.progress if stored else None
+    position = stored.position if stored else None
+    if entry.progress is not None:
+        if progress is None or entry.finished is not None:
+            progress = entry.progress
+        else:
+            progress = max(progress, entry.progress)
+    if entry.position is not None:
+        position = entry.position
+
+    merged = {}
+    if progress is not None:
+        merged["progress"] = progress
+    if position is not None:
+        merged["position"] = position
+    return merged
+
+
+class HeartbeatBuffer:
+    """阅读心跳合并写入缓冲区"""
+
+    def __init__(self):
+        self._pending: Dict[int, PendingHeartbeat] = {}
+        self._owners: "OrderedDict[int, Tuple[int, int]]" = OrderedDict()
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+        self._last_checkpoint = time.monotonic()
+        self.received = 0
+        self.flushes = 0
+        self.written = 0
+        self.failures = 0
+
+    @property
+    def enabled(self) -> bool:
+        """是否合并写入（间隔为 0 时每次心跳直接写库）"""
+        return settings.database.heartbeat_flush_interval > 0
+
+    def start(self) -> None:
+        """启动后台定时写入"""
+        if self.enabled and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """停止后台任务并写入剩余心跳（应用关闭时调用）"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        written = await self.flush()
+        if written:
+            log.info(f"关闭前写入阅读心跳 {written} 条")
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.database.heartbeat_flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                log.error(f"阅读心跳写入任务异常: {e}")
+
+    # ===== 会话归属 =====
+
+    def remember_session(self, session_id: int, user_id: int, book_id: int) -> None:
+        self._owners[session_id] = (user_id, book_id)
+        self._owners.move_to_end(session_id)
+        while len(self._owners) > SESSION_OWNER_CACHE_SIZE:
+            self._owners.popitem(last=False)
+
+    def lookup_session(self, session_id: int) -> Optional[Tuple[int, int]]:
+        """仅从缓存获取会话的 (user_id, book_id)，未命中返回 None"""
+        owner = self._owners.get(session_id)
+        if owner is not None:
+            self._owners.move_to_end(session_id)
+        return owner
+
+    async def resolve_session(self, db: AsyncSession, session_id: int) -> Optional[Tuple[int, int]]:
+        """获取会话的 (user_id, book_id)，优先使用缓存，心跳无需每次查询会话"""
+        owner = self.lookup_session(session_id)
+        if owner is not None:
+            return owner
+        result = await db.execute(
+            select(ReadingSession.user_id, ReadingSession.book_id, ReadingSession.end_time)
+            .where(ReadingSession.id == session_id)
+        )
+        row = result.one_or_none()
+        if row is None:
+            return None
+        owner = (row.user_id, row.book_id)
+        if row.end_time is None:
+            self.remember_session(session_id, *owner)
+        return owner
+
+    # ===== 心跳 =====
+
+    def submit(self, entry: PendingHeartbeat) -> PendingHeartbeat:
+        """记录心跳，返回该会话合并后的待写入条目"""
+        self.received += 1
+        pending = self._pending.get(entry.session_id)
+        if pending is None:
+            self._pending[entry.session_id] = entry
+            return entry
+        pending.merge(entry)
+        return pending
+
+    def take(self, session_id: int) -> Optional[PendingHeartbeat]:
+        """取出会话未写入的心跳（结束会话时调用），并不再缓存其归属"""
+        self._owners.pop(session_id, None)
+        return self._pending.pop(session_id, None)
+
+    async def flush(self) -> int:
+        """将缓冲区中的心跳在一个事务中写入，返回写入条数；失败时放回缓冲区"""
+        from app.core.write_queue import write_queue
+
+        async with self._lock:
+            if not self._pending:
+                return 0
+            entries = list(self._pending.values())
+            self._pending = {}
+            try:
+                await write_queue.submit(lambda db: apply_heartbeats(db, entries))
+            except Exception as e:
+                self.failures += 1
+                self._requeue(entries)
+                log.warning(f"阅读心跳写入失败，{len(entries)} 条将在下次重试: {e}")
+                return 0
+
+            self.flushes += 1
+            self.written += len(entries)
+            await self._maybe_checkpoint()
+            return len(entries)
+
+    def _requeue(self, entries: List[PendingHeartbeat]) -> None:
+        for entry in entries:
+            newer = self._pending.get(entry.session_id)
+            if newer is None:
+                self._pending[entry.session_id] = entry
+            else:
+                # 写入期间又收到新心跳：以新心跳为准，缺失的进度/位置沿用旧值
+                entry.merge(newer)
+                self._pending[entry.session_id] = entry
+
+    async def _maybe_checkpoint(self) -> None:
+        interval = settings.database.heartbeat_wal_checkpoint_interval
+        if interval <= 0 or time.monotonic() - self._last_checkpoint < interval:
+            return
+        self._last_checkpoint = time.monotonic()
+
+        from app.database import engine
+
+        if engine.dialect.name != "sqlite":
+            return
+        try:
+            async with engine.connect() as conn:
+                await conn.execute(text("PRAGMA wal_checkpoint(PASSIVE)"))
+        except Exception as e:
+            log.warning(f"WAL checkpoint 失败: {e}")
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "pending": len(self._pending),
+            "received": self.received,
+            "flushes": self.flushes,
+            "written": self.written,
+            "coalesced": max(self.received - self.written - len(self._pending), 0),
+            "failures": self.failures,
+        }
+
+
+# 全局单例
+heartbeat_buffer = HeartbeatBuffer()
@@ -0,0 +1,360 @@
+"""
+书库统计物化汇总
+library_stats 每个书库一行，保存书籍数、作者数、书籍组数、版本数、有封面书籍数、全部/主版本文件大小；
+library_stat_authors / library_stat_groups 作为去重计数的引用计数，library_stat_formats 保存各格式版本数，
+library_stat_daily 保存每日新增书籍数。
+
+由触发器（SQLite / PostgreSQL）在书籍、版本增删改时增量维护，扫描器批量写入、删除与合并无需额外调用；
+触发器无法覆盖的情况（如关闭外键时的级联、手工改库）由定时全量校正修正
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Sequence, Tuple
+
+from sqlalchemy import func, select, text, true
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.db_triggers import (
+    count_triggers, is_distinct, replace_trigger, supports_triggers, utc_day
+)
+from app.models import (
+    LibraryStats, LibraryStatsAuthor, LibraryStatsDaily, LibraryStatsFormat, LibraryStatsGroup
+)
+from app.utils.logger import log
+
+# library_stats 中的计数列
+STAT_COLUMNS = (
+    "book_count", "author_count", "group_count", "version_count",
+    "cover_count", "total_size", "primary_size",
+)
+
+# 去重计数的引用计数表：表名 -> (键列, library_stats 中的计数列)
+_REFCOUNT_TABLES = {
+    "library_stat_authors": ("author_id", "author_count"),
+    "library_stat_groups": ("group_id", "group_count"),
+}
+
+
+def _book_add(row: str, dialect: str) -> str:
+    """书籍计入统计"""
+    sql = (
+        f"INSERT INTO library_stats (library_id) VALUES ({row}.library_id) ON CONFLICT (library_id) DO NOTHING;\n"
+        f"UPDATE library_stats SET book_count = book_count + 1, "
+        f"primary_size = primary_size + {row}.file_size, "
+        f"cover_count = cover_count + (CASE WHEN {row}.cover_path IS NOT NULL THEN 1 ELSE 0 END) "
+        f"WHERE library_id = {row}.library_id;\n"
+    )
+    for table, (key, _) in _REFCOUNT_TABLES.items():
+        sql += (
+            f"INSERT INTO {table} (library_id, {key}, book_count) "
+            f"SELECT {row}.library_id, {row}.{key}, 1 WHERE {row}.{key} IS NOT NULL "
+            f"ON CONFLICT (library_id, {key}) DO UPDATE SET book_count = {table}.book_count + 1;\n"
+        )
+    sql += (
+        f"INSERT INTO library_stat_daily (library_id, day, book_count) "
+        f"SELECT {row}.library_id, {utc_day(f'{row}.added_at', dialect)}, 1 WHERE {row}.added_at IS NOT NULL "
+        f"ON CONFLICT (library_id, day) DO UPDATE SET book_count = library_stat_daily.book_count + 1;\n"
+    )
+    return sql
+
+
+def _book_remove(row: str, dialect: str) -> str:
+    """书籍移出统计"""
+    sql = (
+        f"UPDATE library_stats SET book_count = book_count - 1, "
+        f"primary_size = primary_size - {row}.file_size, "
+        f"cover_count = cover_count - (CASE WHEN {row}.cover_path IS NOT NULL THEN 1 ELSE 0 END) "
+        f"WHERE library_id = {row}.library_id;\n"
+    )
+    for table, (key, _) in _REFCOUNT_TABLES.items():
+        match = f"library_id = {row}.library_id AND {key} = {row}.{key}"
+        sql += (
+            f"UPDATE {table} SET book_count = book_count - 1 WHERE {match};\n"
+            f"DELETE FROM {table} WHERE {match} AND book_count <= 0;\n"
+        )
+    match = f"library_id = {row}.library_id AND day = {utc_day(f'{row}.added_at', dialect)}"
+    sql += (
+        f"UPDATE library_stat_daily SET book_count = book_count - 1 WHERE {match};\n"
+        f"DELETE FROM library_stat_daily WHERE {match} AND book_count <= 0;\n"
+    )
+    return sql
+
+
+def _version_library(row: str) -> str:
+    return f"(SELECT library_id FROM books WHERE id = {row}.book_id)"
+
+
+def _version_add(row: str) -> str:
+    """版本计入所属书籍的书库统计"""
+    return (
+        f"UPDATE library_stats SET version_count = version_count + 1, "
+        f"total_size = total_size + {row}.file_size "
+        f"WHERE library_id = {_version_library(row)};\n"
+        f"INSERT INTO library_stat_formats (library_id, file_format, version_count) "
+        f"SELECT b.library_id, {row}.file_format, 1 FROM books b WHERE b.id = {row}.book_id "
+        f"ON CONFLICT (library_id, file_format) DO UPDATE SET "
+        f"version_count = library_stat_formats.version_count + 1;\n"
+    )
+
+
+def _version_remove(row: str) -> str:
+    """版本移出所属书籍的书库统计"""
+    match = f"library_id = {_version_library(row)} AND file_format = {row}.file_format"
+    return (
+        f"UPDATE library_stats SET version_count = version_count - 1, "
+        f"total_size = total_size - {row}.file_size "
+        f"WHERE library_id = {_version_library(row)};\n"
+        f"UPDATE library_stat_formats SET version_count = version_count - 1 WHERE {match};\n"
+        f"DELETE FROM library_stat_formats WHERE {match} AND version_count <= 0;\n"
+    )
+
+
+# 书籍换书库时，其全部版本的统计随之迁移
+_MOVE_VERSIONS = (
+    "INSERT INTO library_stats (library_id) VALUES (NEW.library_id) ON CONFLICT (library_id) DO NOTHING;\n"
+    "UPDATE library_stats SET "
+    "version_count = version_count - (SELECT count(*) FROM book_versions WHERE book_id = NEW.id), "
+    "total_size = total_size - (SELECT coalesce(sum(file_size), 0) FROM book_versions WHERE book_id = NEW.id) "
+    "WHERE library_id = OLD.library_id;\n"
+    "UPDATE library_stats SET "
+    "version_count = version_count + (SELECT count(*) FROM book_versions WHERE book_id = NEW.id), "
+    "total_size = total_size + (SELECT coalesce(sum(file_size), 0) FROM book_versions WHERE book_id = NEW.id) "
+    "WHERE library_id = NEW.library_id;\n"
+    "UPDATE library_stat_formats SET version_count = version_count - ("
+    "SELECT count(*) FROM book_versions v WHERE v.book_id = NEW.id "
+    "AND v.file_format = library_stat_formats.file_format) "
+    "WHERE library_id = OLD.library_id;\n"
+    "DELETE FROM library_stat_formats WHERE library_id = OLD.library_id AND version_count <= 0;\n"
+    "INSERT INTO library_stat_formats (library_id, file_format, version_count) "
+    "SELECT NEW.library_id, file_format, count(*) FROM book_versions WHERE book_id = NEW.id "
+    "GROUP BY file_format "
+    "ON CONFLICT (library_id, file_format) DO UPDATE SET "
+    "version_count = library_stat_formats.version_count + excluded.version_count;\n"
+)
+
+
+def _triggers(dialect: str) -> Dict[str, Tuple[str, Optional[str], str]]:
+    """触发器名 -> (触发时机, 触发条件, 触发器体)"""
+    def changed(*columns: str) -> str:
+        return " OR ".join(is_distinct(f"OLD.{column}", f"NEW.{column}", dialect) for column in columns)
+
+    book_changed = (
+        changed("library_id", "author_id", "group_id")
+        + " OR (OLD.cover_path IS NULL) <> (NEW.cover_path IS NULL) OR "
+        + is_distinct(utc_day("OLD.added_at", dialect), utc_day("NEW.added_at", dialect), dialect)
+        + " OR " + changed("file_size")
+    )
+    triggers = {
+        "library_stats_book_insert": ("AFTER INSERT ON books", None, _book_add("NEW", dialect)),
+        "library_stats_book_delete": ("AFTER DELETE ON books", None, _book_remove("OLD", dialect)),
+        "library_stats_book_update": (
+            "AFTER UPDATE OF library_id, author_id, group_id, cover_path, added_at, file_size ON books",
+            book_changed,
+            _book_remove("OLD", dialect) + _book_add("NEW", dialect),
+        ),
+        "library_stats_book_move": (
+            "AFTER UPDATE OF library_id ON books", changed("library_id"), _MOVE_VERSIONS,
+        ),
+        "library_stats_version_insert": ("AFTER INSERT ON book_versions", None, _version_add("NEW")),
+        "library_stats_version_delete": ("AFTER DELETE ON book_versions", None, _version_remove("OLD")),
+        "library_stats_version_update": (
+            "AFTER UPDATE OF book_id, file_size, file_format ON book_versions",
+            changed("book_id", "file_size", "file_format"),
+            _version_remove("OLD") + _version_add("NEW"),
+        ),
+        "library_stats_library_delete": (
+            "AFTER DELETE ON libraries",
+            None,
+            "".join(
+                f"DELETE FROM {table} WHERE library_id = OLD.id;\n"
+                for table in ("library_stat_authors", "library_stat_groups", "library_stat_formats",
+                              "library_stat_daily", "library_stats")
+            ),
+        ),
+    }
+    for table, (_, column) in _REFCOUNT_TABLES.items():
+        triggers[f"{table}_insert"] = (
+            f"AFTER INSERT ON {table}",
+            None,
+            f"UPDATE library_stats SET {column} = {column} + 1 WHERE library_id = NEW.library_id;\n",
+        )
+        triggers[f"{table}_delete"] = (
+            f"AFTER DELETE ON {table}",
+            None,
+            f"UPDATE library_stats SET {column} = {column} - 1 WHERE library_id = OLD.library_id;\n",
+        )
+    return triggers
+
+
+def install_library_stats_triggers(conn: Connection) -> bool:
+    """
+    创建书库统计维护触发器（同步连接，可通过 run_sync 调用）
+    首次创建时全量计算一次已有数据
+
+    Returns:
+        是否已安装（不支持的数据库返回 False）
+    """
+    if not supports_triggers(conn):
+        return False
+
+    triggers = _triggers(conn.dialect.name)
+    existing = count_triggers(conn, triggers)
+
+    # 触发器每次启动重建，保证定义与代码一致
+    for name, (event, when, body) in triggers.items():
+        replace_trigger(conn, name, event, body, when)
+
+    if existing < len(triggers):
+        result = reconcile_library_stats(conn)
+        log.info(f"书库统计已初始化，书库 {result['libraries']} 个")
+    return True
+
+
+def _reconcile_sql(dialect: str) -> Tuple[str, ...]:
+    """全量重算语句（按顺序执行；引用计数表先于 library_stats 写入，其触发器对已清空的统计行无影响）"""
+    day = utc_day("added_at", dialect)
+    return (
+        "DELETE FROM library_stat_authors",
+        "DELETE FROM library_stat_groups",
+        "DELETE FROM library_stat_formats",
+        "DELETE FROM library_stat_daily",
+        "DELETE FROM library_stats",
+        "INSERT INTO library_stat_authors (library_id, author_id, book_count) "
+        "SELECT library_id, author_id, count(*) FROM books WHERE author_id IS NOT NULL "
+        "GROUP BY library_id, author_id",
+        "INSERT INTO library_stat_groups (library_id, group_id, book_count) "
+        "SELECT library_id, group_id, count(*) FROM books WHERE group_id IS NOT NULL "
+        "GROUP BY library_id, group_id",
+        "INSERT INTO library_stat_formats (library_id, file_format, version_count) "
+        "SELECT b.library_id, v.file_format, count(*) FROM book_versions v JOIN books b ON b.id = v.book_id "
+        "GROUP BY b.library_id, v.file_format",
+        "INSERT INTO library_stat_daily (library_id, day, book_count) "
+        f"SELECT library_id, {day}, count(*) FROM books WHERE added_at IS NOT NULL "
+        f"GROUP BY library_id, {day}",
+        "INSERT INTO library_stats (library_id, book_count, author_count, group_count, version_count, "
+        "cover_count, total_size, primary_size, reconciled_at) "
+        "SELECT l.id, coalesce(b.book_count, 0), coalesce(b.author_count, 0), coalesce(b.group_count, 0), "
+        "coalesce(v.version_count, 0), coalesce(b.cover_count, 0), coalesce(v.total_size, 0), "
+        "coalesce(b.primary_size, 0), :now "
+        "FROM libraries l "
+        "LEFT JOIN (SELECT library_id, count(*) AS book_count, count(DISTINCT author_id) AS author_count, "
+        "count(DISTINCT group_id) AS group_count, count(cover_path) AS cover_count, "
+        "sum(file_size) AS primary_size FROM books GROUP BY library_id) b ON b.library_id = l.id "
+        "LEFT JOIN (SELECT b.library_id, count(*) AS version_count, sum(v.file_size) AS total_size "
+        "FROM book_versions v JOIN books b ON b.id = v.book_id GROUP BY b.library_id) v ON v.library_id = l.id",
+    )
+
+
+def _snapshot(conn: Connection) -> Dict[int, tuple]:
+    rows = conn.execute(
+        text(f"SELECT library_id, {', '.join(STAT_COLUMNS)} FROM library_stats")
+    ).all()
+    return {row[0]: tuple(row[1:]) for row in rows}
+
+
+def reconcile_library_stats(conn: Connection) -> dict:
+    """
+    全量重算书库统计（同步连接，可通过 run_sync 调用），并记录与增量维护结果的偏差
+
+    Returns:
+        {"libraries": 书库数, "drifted": 统计有偏差的书库 ID 列表}
+    """
+    before = _snapshot(conn)
+    for sql in _reconcile_sql(conn.dialect.name):
+        conn.execute(text(sql), {"now": datetime.utcnow()})
+    after = _snapshot(conn)
+
+    drifted = sorted(
+        library_id for library_id in before.keys() | after.keys()
+        if before.get(library_id) != after.get(library_id)
+    )
+    if before and drifted:
+        log.warning(f"书库统计校正：{len(drifted)} 个书库存在偏差，已修正: {drifted}")
+    return {"libraries": len(after), "drifted": drifted}
+
+
+async def run_reconciliation() -> dict:
+    """定时任务入口：在独立事务中全量校正书库统计"""
+    from app.database import engine
+
+    async with engine.begin() as conn:
+        if not supports_triggers(conn):
+            return {"libraries": 0, "drifted": []}
+        return await conn.run_sync(reconcile_library_stats)
+
+
+@dataclass
+class LibraryStatsSummary:
+    """一个或多个书库的统计汇总"""
+    book_count: int = 0
+    author_count: int = 0
+    group_count: int = 0
+    version_count: int = 0
+    cover_count: int = 0
+    total_size: int = 0
+    primary_size: int = 0
+    # 最近 N 天新增书籍数（未请求时为 0）
+    recent_books: int = 0
+    reconciled_at: Optional[datetime] = None
+
+
+async def summarize_libraries(
+    db: AsyncSession,
+    library_ids: Optional[Sequence[int]] = None,
+    recent_days: Optional[int] = None,
+) -> LibraryStatsSummary:
+    """
+    汇总书库统计（一次查询）
+
+    单个书库直接读取统计行；多个书库时作者数与书籍组数按引用计数表去重，
+    同一作者/书籍组出现在多个书库中只计一次
+
+    Args:
+        library_ids: 书库 ID 列表，None 表示全部书库
+        recent_days: 同时统计最近 N 天（按 UTC 日期，含当天）新增的书籍数
+    """
+    if library_ids is not None and not library_ids:
+        return LibraryStatsSummary()
+
+    def scoped(model):
+        return model.library_id.in_(library_ids) if library_ids is not None else true()
+
+    columns = [func.coalesce(func.sum(getattr(LibraryStats, name)), 0) for name in STAT_COLUMNS]
+    if library_ids is None or len(library_ids) > 1:
+        columns[STAT_COLUMNS.index("author_count")] = (
+            select(func.count(func.distinct(LibraryStatsAuthor.author_id)))
+            .where(scoped(LibraryStatsAuthor))
+            .scalar_subquery()
+        )
+        columns[STAT_COLUMNS.index("group_count")] = (
+            select(func.count(func.distinct(LibraryStatsGroup.group_id)))
+            .where(scoped(LibraryStatsGroup))
+            .scalar_subquery()
+        )
+    columns.append(func.min(LibraryStats.reconciled_at))
+    if recent_days:
+        since = (datetime.utcnow() - timedelta(days=recent_days - 1)).strftime("%Y-%m-%d")
+        columns.append(
+            select(func.coalesce(func.sum(LibraryStatsDaily.book_count), 0))
+            .where(scoped(LibraryStatsDaily), LibraryStatsDaily.day >= since)
+            .scalar_subquery()
+        )
+
+    result = await db.execute(select(*columns).where(scoped(LibraryStats)))
+    row = result.one()
+    values = dict(zip(STAT_COLUMNS, (int(value or 0) for value in row[:len(STAT_COLUMNS)])))
+    return LibraryStatsSummary(
+        **values,
+        reconciled_at=row[len(STAT_COLUMNS)],
+        recent_books=int(row[len(STAT_COLUMNS) + 1] or 0) if recent_days else 0,
+    )
+
+
+async def get_format_counts(db: AsyncSession, library_id: int) -> Dict[str, int]:
+    """书库内各格式的版本数"""
+    result = await db.execute(
+        select(LibraryStatsFormat.file_format, LibraryStatsFormat.version_count)
+        .where(LibraryStatsFormat.library_id == library_id)
+    )
+    return {file_format: count for file_format, count in result.all()}
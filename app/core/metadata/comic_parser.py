@@ -1,73 +1,136 @@
 """
 漫画/压缩包解析器
-支持 ZIP/CBZ 格式的漫画文件解析
+支持 ZIP/CBZ、RAR/CBR、7Z/CB7 格式的漫画文件解析
+
+RAR/7Z 不支持像 ZIP 那样直接随机读取成员，这里首次打开时建立成员索引
+（页面顺序、成员位置、是否固实）并持久化，之后按需解压单页；
+固实压缩包一次解压连续多页，解出的页面写入有界磁盘缓存。
 """
-import zipfile
+import hashlib
+import io
+import json
 import re
+import shutil
+import tempfile
+import threading
+import zipfile
+from collections import OrderedDict
 from pathlib import Path
 from typing import List, Dict, Optional, IO
 
+import py7zr
+import rarfile
+
+from app.config import settings
+from app.utils.disk_cache import DiskLRUCache
+from app.utils.logger import log
+
+
+ARCHIVE_INDEX_DIR = Path(settings.directories.data) / "cache" / "comic_index"
+ARCHIVE_PAGE_CACHE_DIR = Path(settings.directories.data) / "cache" / "comic_pages"
+
+# 索引结构版本，结构变化时递增使旧索引失效
+ARCHIVE_INDEX_VERSION = 1
+# 内存中保留的索引数量
+ARCHIVE_INDEX_MEMORY_SIZE = 64
+
+
 class ComicParser:
     """漫画文件解析器"""
-    
+
     # 支持的图片扩展名
     IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.webp', '.gif', '.bmp'}
-    
+
+    _index_memo: "OrderedDict[str, dict]" = OrderedDict()
+    _archive_locks: Dict[str, threading.Lock] = {}
+    _state_lock = threading.Lock()
+    _page_cache: Optional[DiskLRUCache] = None
+
     @staticmethod
     def _natural_sort_key(s: str) -> List:
         """自然排序键生成"""
         return [int(text) if text.isdigit() else text.lower()
                 for text in re.split(r'(\d+)', s)]
 
+    @classmethod
+    def _is_image_member(cls, filename: str) -> bool:
+        """是否为需要展示的图片成员（忽略隐藏文件和 macOS 元数据）"""
+        if filename.startswith('.') or '__MACOSX' in filename:
+            return False
+        return Path(filename).suffix.lower() in cls.IMAGE_EXTENSIONS
+
+    @staticmethod
+    def detect_archive_type(file_path: Path) -> Optional[str]:
+        """
+        根据文件内容识别压缩包类型
+
+        Returns:
+            'zip' / 'rar' / '7z'，无法识别返回 None
+        """
+        try:
+            if zipfile.is_zipfile(file_path):
+                return 'zip'
+            if rarfile.is_rarfile(str(file_path)):
+                return 'rar'
+            if py7zr.is_7zfile(file_path):
+                return '7z'
+        except Exception as e:
+            log.debug(f"识别压缩包类型失败: {file_path}, 错误: {e}")
+        return None
+
     @classmethod
     def get_image_list(cls, file_path: Path) -> List[Dict[str, str]]:
         """
         获取压缩包内的图片列表
-        
+
         Args:
             file_path: 文件路径
-            
+
         Returns:
             List[Dict]: 图片信息列表，包含 filename 和 size
         """
         if not file_path.exists():
             return []
-            
+
         images = []
         try:
-            if zipfile.is_zipfile(file_path):
+            archive_type = cls.detect_archive_type(file_path)
+            if archive_type == 'zip':
                 with zipfile.ZipFile(file_path, 'r') as zf:
                     for info in zf.infolist():
                         # 忽略目录和隐藏文件
-                        if info.is_dir() or info.filename.startswith('.') or '__MACOSX' in info.filename:
+                        if info.is_dir() or not cls._is_image_member(info.filename):
                             continue
-                            
-                        # 检查扩展名
-                        ext = Path(info.filename).suffix.lower()
-                        if ext in cls.IMAGE_EXTENSIONS:
-                            images.append({
-                                "filename": info.filename,
-                                "size": info.file_size
-                            })
-                            
+                        images.append({
+                            "filename": info.filename,
+                            "size": info.file_size
+                        })
+            elif archive_type in ('rar', '7z'):
+                index = cls._get_archive_index(file_path, archive_type)
+                # 索引内已按自然顺序排列
+                return [
+                    {"filename": page["filename"], "size": page["size"]}
+                    for page in index["pages"]
+                ]
+
             # 自然排序
             images.sort(key=lambda x: cls._natural_sort_key(x['filename']))
             return images
-            
+
         except Exception as e:
             # 记录错误但不抛出，返回空列表
-            print(f"解析漫画文件失败: {e}")
+            log.error(f"解析漫画文件失败: {file_path}, 错误: {e}")
             return []
 
     @classmethod
     def get_image_stream(cls, file_path: Path, filename: str) -> Optional[IO[bytes]]:
         """
         获取单张图片的字节流
-        
+
         Args:
             file_path: 压缩包路径
             filename: 图片文件名（包含路径）
-            
+
         Returns:
             IO[bytes]: 图片字节流，如果未找到或出错则返回 None
         """
@@ -86,12 +149,14 @@ class ComicParser:
                 # 如果我们返回 zf.open() 的结果，zf 关闭后流可能不可用。
                 # 更好的方式可能是读取内容到 BytesIO，或者让调用者管理 ZipFile。
                 # 为了简单起见，这里我们读取到内存 BytesIO，因为单张图片通常不大。
-                
+
+            # RAR/7Z 无法流式随机读取，读取到内存
+            data = cls.get_image_data(file_path, filename)
+            return io.BytesIO(data) if data is not None else None
+
         except Exception as e:
-            print(f"读取图片流失败: {e}")
+            log.error(f"读取图片流失败: {e}")
             return None
-            
-        return None
 
     @classmethod
     def get_image_data(cls, file_path: Path, filename: str) -> Optional[bytes]:
@@ -99,10 +164,232 @@ class ComicParser:
         获取单张图片的二进制数据
         """
         try:
-            if zipfile.is_zipfile(file_path):
+            archive_type = cls.detect_archive_type(file_path)
+            if archive_type == 'zip':
                 with zipfile.ZipFile(file_path, 'r') as zf:
                     return zf.read(filename)
+            if archive_type in ('rar', '7z'):
+                return cls._read_archive_page(file_path, archive_type, filename)
         except Exception as e:
-            print(f"读取图片数据失败: {e}")
+            log.error(f"读取图片数据失败: {file_path}/{filename}, 错误: {e}")
             return None
         return None
+
+    # ===== RAR/7Z 成员索引 =====
+
+    @staticmethod
+    def _file_signature(file_path: Path) -> str:
+        stat = file_path.stat()
+        return f"{file_path}_{stat.st_size}_{stat.st_mtime}"
+
+    @classmethod
+    def _get_archive_lock(cls, signature: str) -> threading.Lock:
+        with cls._state_lock:
+            lock = cls._archive_locks.get(signature)
+            if lock is None:
+                lock = threading.Lock()
+                cls._archive_locks[signature] = lock
+            return lock
+
+    @classmethod
+    def _get_page_cache(cls) -> DiskLRUCache:
+        with cls._state_lock:
+            if cls._page_cache is None:
+                cls._page_cache = DiskLRUCache(
+                    ARCHIVE_PAGE_CACHE_DIR,
+                    settings.comic.archive_cache_max_size
+                )
+            return cls._page_cache
+
+    @classmethod
+    def _get_archive_index(cls, file_path: Path, archive_type: str) -> dict:
+        """
+        获取 RAR/7Z 成员索引（内存 -> 磁盘 -> 重建）
+
+        索引结构:
+            {
+                "version": 1, "type": "rar", "solid": true,
+                "pages": [{"filename", "size", "compress_size", "position", "block", "offset"}]
+            }
+        pages 按阅读顺序排列，position 为成员在压缩包中的存储顺序
+        """
+        signature = cls._file_signature(file_path)
+
+        with cls._state_lock:
+            index = cls._index_memo.get(signature)
+            if index is not None:
+                cls._index_memo.move_to_end(signature)
+                return index
+
+        index_path = ARCHIVE_INDEX_DIR / (hashlib.md5(signature.encode()).hexdigest() + ".json")
+        index = None
+        if index_path.exists():
+            try:
+                with open(index_path, 'r', encoding='utf-8') as f:
+                    index = json.load(f)
+                if index.get("version") != ARCHIVE_INDEX_VERSION:
+                    index = None
+            except Exception as e:
+                log.warning(f"读取漫画索引失败，将重建: {file_path.name}, 错误: {e}")
+                index = None
+
+        if index is None:
+            if archive_type == 'rar':
+                index = cls._build_rar_index(file_path)
+            else:
+                index = cls._build_7z_index(file_path)
+            index["pages"].sort(key=lambda x: cls._natural_sort_key(x['filename']))
+            try:
+                ARCHIVE_INDEX_DIR.mkdir(parents=True, exist_ok=True)
+                tmp_path = index_path.with_suffix(".json.tmp")
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(index, f, ensure_ascii=False)
+                tmp_path.replace(index_path)
+            except Exception as e:
+                log.warning(f"写入漫画索引失败: {file_path.name}, 错误: {e}")
+            log.info(
+                f"建立漫画索引: {file_path.name}, 类型={archive_type}, "
+                f"页数={len(index['pages'])}, 固实={index['solid']}"
+            )
+
+        with cls._state_lock:
+            cls._index_memo[signature] = index
+            while len(cls._index_memo) > ARCHIVE_INDEX_MEMORY_SIZE:
+                cls._index_memo.popitem(last=False)
+        return index
+
+    @classmethod
+    def _build_rar_index(cls, file_path: Path) -> dict:
+        pages = []
+        with rarfile.RarFile(str(file_path), 'r') as rf:
+            solid = bool(rf.is_solid())
+            for position, info in enumerate(rf.infolist()):
+                if info.is_dir() or not cls._is_image_member(info.filename):
+                    continue
+                if info.needs_password():
+                    continue
+                pages.append({
+                    "filename": info.filename,
+                    "size": info.file_size,
+                    "compress_size": info.compress_size,
+                    "position": position,
+                    # RAR 的固实流贯穿整个压缩包
+                    "block": 0 if solid else position,
+                    "offset": getattr(info, "header_offset", None),
+                })
+        return {"version": ARCHIVE_INDEX_VERSION, "type": "rar", "solid": solid, "pages": pages}
+
+    @classmethod
+    def _build_7z_index(cls, file_path: Path) -> dict:
+        pages = []
+        with py7zr.SevenZipFile(file_path, 'r') as zf:
+            if zf.needs_password():
+                return {"version": ARCHIVE_INDEX_VERSION, "type": "7z", "solid": False, "pages": []}
+            solid = bool(getattr(zf.archiveinfo(), "solid", False))
+
+            # 成员所在的压缩块（folder），同一块内的成员需顺序解压
+            blocks: Dict[str, int] = {}
+            folder_ids: Dict[int, int] = {}
+            try:
+                for entry in zf.files:
+                    folder = getattr(entry, "folder", None)
+                    if folder is not None:
+                        blocks[entry.filename] = folder_ids.setdefault(id(folder), len(folder_ids))
+            except Exception:
+                blocks = {}
+
+            for position, entry in enumerate(zf.list()):
+                if entry.is_directory or not cls._is_image_member(entry.filename):
+                    continue
+                pages.append({
+                    "filename": entry.filename,
+                    "size": entry.uncompressed,
+                    "compress_size": entry.compressed,
+                    "position": position,
+                    "block": blocks.get(entry.filename, 0 if solid else position),
+                    "offset": None,
+                })
+        return {"version": ARCHIVE_INDEX_VERSION, "type": "7z", "solid": solid, "pages": pages}
+
+    @staticmethod
+    def _page_cache_name(signature: str, filename: str) -> str:
+        digest = hashlib.md5(f"{signature}\0{filename}".encode()).hexdigest()
+        return digest + Path(filename).suffix.lower()
+
+    @classmethod
+    def _read_archive_page(cls, file_path: Path, archive_type: str, filename: str) -> Optional[bytes]:
+        """
+        按需读取 RAR/7Z 中的单页
+
+        非固实压缩包只解压目标成员；固实压缩包解压到目标页时前面的数据已经解过，
+        因此顺带解出同一块内后续几页一并缓存，避免翻页时重复从头解压。
+        """
+        signature = cls._file_signature(file_path)
+        cache = cls._get_page_cache()
+        cache_name = cls._page_cache_name(signature, filename)
+
+        cached = cache.get(cache_name)
+        if cached:
+            return cached.read_bytes()
+
+        index = cls._get_archive_index(file_path, archive_type)
+        pages = index["pages"]
+        position = next((i for i, page in enumerate(pages) if page["filename"] == filename), None)
+        if position is None:
+            return None
+
+        with cls._get_archive_lock(signature):
+            # 等锁期间可能已被其他请求解出
+            cached = cache.get(cache_name)
+            if cached:
+                return cached.read_bytes()
+
+            target = pages[position]
+            batch = [target]
+            if index.get("solid"):
+                for page in pages[position + 1:position + max(1, settings.comic.solid_batch_pages)]:
+                    if page.get("block") != target.get("block"):
+                        continue
+                    if cache.get(cls._page_cache_name(signature, page["filename"])) is None:
+                        batch.append(page)
+            batch.sort(key=lambda x: x["position"])
+
+            names = [page["filename"] for page in batch]
+            extracted = cls._extract_members(file_path, archive_type, names)
+            for name, data in extracted.items():
+                try:
+                    cache.put(cls._page_cache_name(signature, name), data)
+                except Exception as e:
+                    log.warning(f"写入漫画页面缓存失败: {name}, 错误: {e}")
+
+        return extracted.get(filename)
+
+    @classmethod
+    def _extract_members(cls, file_path: Path, archive_type: str, names: List[str]) -> Dict[str, bytes]:
+        """一次性解压指定成员，返回 {成员名: 数据}"""
+        if archive_type == 'rar' and len(names) == 1:
+            with rarfile.RarFile(str(file_path), 'r') as rf:
+                return {names[0]: rf.read(names[0])}
+
+        temp_root = Path(settings.directories.temp)
+        temp_root.mkdir(parents=True, exist_ok=True)
+        temp_dir = Path(tempfile.mkdtemp(prefix="comic_", dir=temp_root))
+        try:
+            if archive_type == 'rar':
+                # 单次 unrar 调用解出多页，固实流只需解压一遍
+                with rarfile.RarFile(str(file_path), 'r') as rf:
+                    rf.extractall(path=str(temp_dir), members=names)
+            else:
+                with py7zr.SevenZipFile(file_path, 'r') as zf:
+                    zf.extract(path=temp_dir, targets=names)
+
+            result: Dict[str, bytes] = {}
+            for name in names:
+                member_path = (temp_dir / name).resolve()
+                if temp_dir.resolve() not in member_path.parents:
+                    continue
+                if member_path.is_file():
+                    result[name] = member_path.read_bytes()
+            return result
+        finally:
+            shutil.rmtree(temp_dir, ignore_errors=True)
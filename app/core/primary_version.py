@@ -0,0 +1,72 @@
+"""
+主版本冗余字段维护
+books.file_size / file_format / file_hash 冗余保存主版本（无主版本时取最早的版本）的文件信息，
+使列表排序与筛选无需联结 book_versions；由触发器（SQLite / PostgreSQL）在版本增删、设为主版本时同步
+"""
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+from app.core.db_triggers import count_triggers, replace_trigger, supports_triggers
+from app.utils.logger import log
+
+
+# 冗余列 -> (版本表列, 无版本时的取值)
+PRIMARY_COLUMNS = {
+    "file_size": ("file_size", "0"),
+    "file_format": ("file_format", "''"),
+    "file_hash": ("file_hash", "NULL"),
+}
+
+
+def _assignments(book_ref: str) -> str:
+    parts = []
+    for column, (source, empty) in PRIMARY_COLUMNS.items():
+        subquery = (
+            f"SELECT v.{source} FROM book_versions v WHERE v.book_id = {book_ref} "
+            f"ORDER BY v.is_primary DESC, v.id LIMIT 1"
+        )
+        parts.append(f"{column} = COALESCE(({subquery}), {empty})")
+    return ", ".join(parts)
+
+
+# 全量同步语句（迁移回填与首次安装触发器时使用）
+SYNC_ALL_SQL = f"UPDATE books SET {_assignments('books.id')}"
+
+# 触发器名 -> (触发时机, 需要刷新的书籍 ID)
+_TRIGGERS = {
+    "book_primary_version_insert": ("AFTER INSERT ON book_versions", "NEW.book_id"),
+    "book_primary_version_update": (
+        "AFTER UPDATE OF book_id, is_primary, file_size, file_format, file_hash ON book_versions",
+        "OLD.book_id, NEW.book_id",
+    ),
+    "book_primary_version_delete": ("AFTER DELETE ON book_versions", "OLD.book_id"),
+}
+
+
+def install_primary_version_triggers(conn: Connection) -> bool:
+    """
+    创建主版本同步触发器（同步连接，可通过 run_sync 调用）
+    首次创建时全量同步一次已有数据
+
+    Returns:
+        是否已安装（不支持的数据库返回 False）
+    """
+    if not supports_triggers(conn):
+        return False
+
+    existing = count_triggers(conn, _TRIGGERS)
+
+    # 触发器每次启动重建，保证定义与代码一致
+    for name, (event, book_ids) in _TRIGGERS.items():
+        body = f"UPDATE books SET {_assignments('books.id')} WHERE id IN ({book_ids});\n"
+        replace_trigger(conn, name, event, body)
+
+    if existing < len(_TRIGGERS):
+        count = sync_primary_version_columns(conn)
+        log.info(f"主版本冗余字段已同步，书籍 {count} 本")
+    return True
+
+
+def sync_primary_version_columns(conn: Connection) -> int:
+    """从 book_versions 全量重算冗余字段，返回更新的书籍数"""
+    return conn.execute(text(SYNC_ALL_SQL)).rowcount or 0
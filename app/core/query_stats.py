@@ -0,0 +1,371 @@
+"""
+请求级 SQL 统计
+通过 SQLAlchemy 引擎事件记录每个 HTTP 请求执行的语句数、数据库耗时，并按语句指纹（参数、字面量与 IN 列表归一化后的 SQL）
+归并重复语句。同一指纹在一个请求中执行次数达到阈值时视为疑似 N+1：记录警告日志，并在 Server-Timing 响应头中标出。
+
+- 按路由模板（如 GET /api/books/{book_id}）累计数据库耗时与语句数的分桶直方图，可导出为 Prometheus 文本格式
+- 每个路由保留累计耗时最高的若干条语句及其最慢一次执行的参数，管理员接口据此查看执行计划
+- 统计保存在进程内，多 worker 部署时各进程分别统计
+- 经单写入者队列执行的写操作在队列任务中运行，不计入发起请求
+"""
+import re
+import time
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession
+from starlette.datastructures import MutableHeaders
+
+from app.config import settings
+from app.utils.logger import log
+
+# 直方图分桶上界：请求内数据库耗时（毫秒）与语句数
+DB_TIME_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+# 每个路由保留的语句数
+STATEMENTS_PER_ROUTE = 20
+# 可查看执行计划的语句类型
+EXPLAINABLE = ("SELECT", "WITH", "INSERT", "UPDATE", "DELETE")
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_PLACEHOLDER_LIST = re.compile(r"\(\s*(?:\?|\$\?|%s)(?:\s*,\s*(?:\?|\$\?|%s))*\s*\)")
+_SPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(statement: str) -> str:
+    """语句指纹：字符串与数字字面量替换为 ?，占位符列表折叠为 (...)，空白归一"""
+    statement = _STRING.sub("?", statement)
+    statement = _NUMBER.sub("?", statement)
+    statement = _PLACEHOLDER_LIST.sub("(...)", statement)
+    return _SPACE.sub(" ", statement).strip()
+
+
+def _bucket(value: float, bounds: Tuple[float, ...]) -> int:
+    for index, bound in enumerate(bounds):
+        if value <= bound:
+            return index
+    return len(bounds)
+
+
+@dataclass
+class StatementStats:
+    """一个语句指纹的累计统计"""
+    count: int = 0
+    total_ms: float = 0.0
+    max_ms: float = 0.0
+    # 最慢一次执行的原始语句与参数（用于查看执行计划）
+    statement: str = ""
+    parameters: Any = None
+
+    def add(self, count: int, total_ms: float, max_ms: float, statement: str, parameters: Any) -> None:
+        self.count += count
+        self.total_ms += total_ms
+        if max_ms >= self.max_ms:
+            self.max_ms = max_ms
+            self.statement = statement
+            self.parameters = parameters
+
+
+class RequestQueries:
+    """单个请求执行的语句"""
+
+    __slots__ = ("count", "duration_ms", "statements", "active")
+
+    def __init__(self):
+        self.count = 0
+        self.duration_ms = 0.0
+        # 指纹 -> StatementStats
+        self.statements: Dict[str, StatementStats] = {}
+        # 请求结束后，请求中创建的后台任务继续执行的语句不再计入
+        self.active = True
+
+    def record(self, statement: str, parameters: Any, elapsed_ms: float) -> None:
+        self.count += 1
+        self.duration_ms += elapsed_ms
+        key = fingerprint(statement)
+        stats = self.statements.get(key)
+        if stats is None:
+            stats = self.statements[key] = StatementStats()
+        stats.add(1, elapsed_ms, elapsed_ms, statement, parameters)
+
+    def repeated(self) -> List[Tuple[str, StatementStats]]:
+        """疑似 N+1 的语句（执行次数达到阈值），按次数降序"""
+        threshold = settings.database.n_plus_one_threshold
+        if threshold <= 0:
+            return []
+        items = [(key, stats) for key, stats in self.statements.items() if stats.count >= threshold]
+        return sorted(items, key=lambda item: item[1].count, reverse=True)
+
+    def server_timing(self) -> str:
+        value = f'db;dur={self.duration_ms:.2f};desc="{self.count} queries"'
+        repeated = self.repeated()
+        if repeated:
+            value += f', n-plus-one;desc="{len(repeated)} repeated, max {repeated[0][1].count}x"'
+        return value
+
+
+@dataclass
+class RouteStats:
+    """一个路由的累计统计"""
+    requests: int = 0
+    queries: int = 0
+    db_time_ms: float = 0.0
+    max_queries: int = 0
+    max_db_time_ms: float = 0.0
+    n_plus_one: int = 0
+    db_time_hist: List[int] = field(default_factory=lambda: [0] * (len(DB_TIME_BUCKETS) + 1))
+    query_hist: List[int] = field(default_factory=lambda: [0] * (len(QUERY_COUNT_BUCKETS) + 1))
+    statements: Dict[str, StatementStats] = field(default_factory=dict)
+
+    def add(self, current: RequestQueries, flagged: bool) -> None:
+        self.requests += 1
+        self.queries += current.count
+        self.db_time_ms += current.duration_ms
+        self.max_queries = max(self.max_queries, current.count)
+        self.max_db_time_ms = max(self.max_db_time_ms, current.duration_ms)
+        self.n_plus_one += int(flagged)
+        self.db_time_hist[_bucket(current.duration_ms, DB_TIME_BUCKETS)] += 1
+        self.query_hist[_bucket(current.count, QUERY_COUNT_BUCKETS)] += 1
+
+        for key, request_stats in current.statements.items():
+            stats = self.statements.get(key)
+            if stats is None:
+                stats = self.statements[key] = StatementStats()
+            stats.add(
+                request_stats.count, request_stats.total_ms, request_stats.max_ms,
+                request_stats.statement, request_stats.parameters,
+            )
+        # 超出上限一倍时才裁剪，避免每个请求都排序
+        if len(self.statements) > STATEMENTS_PER_ROUTE * 2:
+            kept = sorted(self.statements.items(), key=lambda item: item[1].total_ms, reverse=True)
+            self.statements = dict(kept[:STATEMENTS_PER_ROUTE])
+
+    def slowest(self, limit: int) -> List[Tuple[str, StatementStats]]:
+        return sorted(self.statements.items(), key=lambda item: item[1].max_ms, reverse=True)[:limit]
+
+    def summary(self) -> dict:
+        return {
+            "requests": self.requests,
+            "queries": self.queries,
+            "avg_queries": round(self.queries / self.requests, 1) if self.requests else 0.0,
+            "max_queries": self.max_queries,
+            "db_time_ms": round(self.db_time_ms, 2),
+            "avg_db_time_ms": round(self.db_time_ms / self.requests, 2) if self.requests else 0.0,
+            "max_db_time_ms": round(self.max_db_time_ms, 2),
+            "n_plus_one": self.n_plus_one,
+            "db_time_histogram": _histogram(DB_TIME_BUCKETS, self.db_time_hist),
+            "query_histogram": _histogram(QUERY_COUNT_BUCKETS, self.query_hist),
+        }
+
+
+def _histogram(bounds: Tuple[float, ...], counts: List[int]) -> Dict[str, int]:
+    labels = [str(bound) for bound in bounds] + ["+Inf"]
+    return dict(zip(labels, counts))
+
+
+_current: ContextVar[Optional[RequestQueries]] = ContextVar("query_stats_request", default=None)
+
+
+class QueryStats:
+    """请求级 SQL 统计"""
+
+    def __init__(self):
+        self.routes: Dict[str, RouteStats] = {}
+        self.requests = 0
+        self.n_plus_one = 0
+        self._instrumented = set()
+
+    def instrument(self, *engines: AsyncEngine) -> None:
+        """在引擎上注册语句计时事件（同一引擎只注册一次）"""
+        for engine in engines:
+            sync_engine = engine.sync_engine
+            if id(sync_engine) in self._instrumented:
+                continue
+            self._instrumented.add(id(sync_engine))
+            event.listen(sync_engine, "before_cursor_execute", _before_cursor_execute)
+            event.listen(sync_engine, "after_cursor_execute", _after_cursor_execute)
+
+    def begin(self):
+        """开始统计当前请求，返回 (统计对象, 上下文令牌)"""
+        current = RequestQueries()
+        return current, _current.set(current)
+
+    def finish(self, route: str, current: RequestQueries, token) -> None:
+        """结束当前请求的统计并计入路由"""
+        _current.reset(token)
+        current.active = False
+
+        repeated = current.repeated()
+        self.requests += 1
+        if repeated:
+            self.n_plus_one += 1
+            key, stats = repeated[0]
+            log.warning(
+                f"疑似 N+1 查询: {route} 共执行 {current.count} 条语句，"
+                f"同一语句重复 {stats.count} 次（{stats.total_ms:.1f}ms）: {key[:300]}"
+            )
+
+        route_stats = self.routes.get(route)
+        if route_stats is None:
+            route_stats = self.routes[route] = RouteStats()
+        route_stats.add(current, bool(repeated))
+
+    def worst_routes(self, limit: int = 10, sort: str = "db_time") -> List[Tuple[str, RouteStats]]:
+        """按累计数据库耗时 / 平均语句数 / N+1 次数排序的路由"""
+        keys = {
+            "db_time": lambda stats: stats.db_time_ms,
+            "queries": lambda stats: stats.queries / stats.requests if stats.requests else 0,
+            "n_plus_one": lambda stats: (stats.n_plus_one, stats.db_time_ms),
+        }
+        ranked = sorted(self.routes.items(), key=lambda item: keys[sort](item[1]), reverse=True)
+        return ranked[:limit]
+
+    def reset(self) -> None:
+        self.routes.clear()
+        self.requests = 0
+        self.n_plus_one = 0
+
+    def stats(self) -> dict:
+        return {
+            "enabled": bool(self._instrumented),
+            "routes": len(self.routes),
+            "requests": self.requests,
+            "n_plus_one": self.n_plus_one,
+        }
+
+    def prometheus(self) -> str:
+        """以 Prometheus 文本格式导出各路由的直方图"""
+        lines = [
+            "# HELP sooklib_request_db_seconds Database time per HTTP request.",
+            "# TYPE sooklib_request_db_seconds histogram",
+        ]
+        for route, stats in sorted(self.routes.items()):
+            lines += _prometheus_histogram(
+                "sooklib_request_db_seconds", route,
+                [bound / 1000 for bound in DB_TIME_BUCKETS], stats.db_time_hist, stats.db_time_ms / 1000, stats.requests,
+            )
+        lines += [
+            "# HELP sooklib_request_queries SQL statements per HTTP request.",
+            "# TYPE sooklib_request_queries histogram",
+        ]
+        for route, stats in sorted(self.routes.items()):
+            lines += _prometheus_histogram(
+                "sooklib_request_queries", route,
+                QUERY_COUNT_BUCKETS, stats.query_hist, stats.queries, stats.requests,
+            )
+        lines += [
+            "# HELP sooklib_request_n_plus_one_total HTTP requests with a repeated statement at or above the N+1 threshold.",
+            "# TYPE sooklib_request_n_plus_one_total counter",
+        ]
+        for route, stats in sorted(self.routes.items()):
+            lines.append(f"sooklib_request_n_plus_one_total{{{_route_label(route)}}} {stats.n_plus_one}")
+        return "\n".join(lines) + "\n"
+
+
+def _route_label(route: str) -> str:
+    method, _, path = route.partition(" ")
+    path = path.replace("\\", "\\\\").replace('"', '\\"')
+    return f'method="{method}",route="{path}"'
+
+
+def _prometheus_histogram(name: str, route: str, bounds, counts: List[int], total: float, requests: int) -> List[str]:
+    label = _route_label(route)
+    lines = []
+    cumulative = 0
+    for bound, count in zip(list(bounds) + ["+Inf"], counts):
+        cumulative += count
+        lines.append(f'{name}_bucket{{{label},le="{bound}"}} {cumulative}')
+    lines.append(f"{name}_sum{{{label}}} {total}")
+    lines.append(f"{name}_count{{{label}}} {requests}")
+    return lines
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    current = _current.get()
+    if current is not None and current.active:
+        context._query_stats_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, "_query_stats_started", None)
+    if started is None:
+        return
+    current = _current.get()
+    if current is not None and current.active:
+        # executemany 只保留第一组参数用于查看执行计划
+        sample = parameters[0] if executemany and parameters else parameters
+        current.record(statement, sample, (time.perf_counter() - started) * 1000)
+
+
+async def explain(db: AsyncSession, statement: str, parameters: Any) -> List[str]:
+    """
+    查看语句的执行计划（不执行语句本身）
+
+    SQLite 使用 EXPLAIN QUERY PLAN，PostgreSQL 使用 EXPLAIN
+    """
+    if not statement.lstrip().upper().startswith(EXPLAINABLE):
+        return []
+    conn = await db.connection()
+    dialect = conn.dialect.name
+    if dialect == "sqlite":
+        result = await conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters or ())
+        # 行格式: (id, parent, notused, detail)，按 parent 缩进还原树形结构
+        depth = {0: -1}
+        lines = []
+        for row in result.all():
+            depth[row[0]] = depth.get(row[1], -1) + 1
+            lines.append("  " * depth[row[0]] + row[-1])
+        return lines
+    if dialect == "postgresql":
+        result = await conn.exec_driver_sql(f"EXPLAIN {statement}", parameters or ())
+        return [row[0] for row in result.all()]
+    return []
+
+
+class QueryStatsMiddleware:
+    """统计每个 HTTP 请求的 SQL 并写入 Server-Timing 响应头（ASGI 中间件）"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        current, token = query_stats.begin()
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).append("Server-Timing", current.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            query_stats.finish(_route_name(scope), current, token)
+
+
+def _route_name(scope) -> str:
+    """请求方法 + 路由模板"""
+    route = scope.get("route")
+    path_format = getattr(route, "path_format", None)
+    if path_format is None:
+        return f"{scope['method']} (unmatched)"
+    # 通过 include_router 挂载的路由可能只保留相对路径，从实际请求路径中补回前缀
+    try:
+        rendered = path_format.format(**scope.get("path_params", {}))
+    except (KeyError, IndexError, ValueError):
+        rendered = ""
+    path = scope["path"]
+    prefix = path[:len(path) - len(rendered)] if rendered and path.endswith(rendered) else ""
+    return f"{scope['method']} {prefix}{route.path}"
+
+
+# 全局单例
+query_stats = QueryStats()
@@ -0,0 +1,286 @@
+"""
+阅读统计汇总
+按用户维护每日、每日分小时与各书籍的阅读时长/会话数汇总，统计接口读取汇总表而不扫描全部阅读会话。
+
+- 心跳与结束会话时把会话新增的时长（duration_seconds - counted_seconds）累加到汇总表，与会话更新同一事务
+- 尚未计入的部分（刚开始的会话、未经接口写入的会话）作为实时增量在查询时从 reading_sessions 补上，
+  按 counted_seconds 与 duration_seconds 是否一致挑选（部分索引），与会话开始于哪一天无关
+- 夜间压缩把遗留的未计入会话全部计入，并删除超过保留期的小时汇总
+
+会话整体计入其开始时间（UTC）所在的日期与小时，与原先按 start_time 分组的口径一致
+"""
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import case, delete, func, literal_column, or_, select, union_all, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.models import ReadingSession, ReadingStatsBook, ReadingStatsDaily, ReadingStatsHourly, User
+from app.utils.logger import log
+
+# 小时汇总保留天数（不小于统计接口的最大查询范围 365 天）
+HOURLY_RETENTION_DAYS = 400
+
+# 夜间压缩每批处理的会话数
+COMPACT_BATCH_SIZE = 500
+
+
+def _utc_naive(value: datetime) -> datetime:
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def _day_key(value: datetime) -> str:
+    return value.strftime("%Y-%m-%d")
+
+
+def _upsert(db: AsyncSession, table, keys: dict, increments: dict, latest: Optional[dict] = None):
+    """累加型 upsert：冲突时 increments 中的列与已有值相加，latest 中的列取较晚的值"""
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    latest = latest or {}
+    stmt = insert(table).values(**keys, **increments, **latest)
+    set_ = {column: table.c[column] + stmt.excluded[column] for column in increments}
+    for column in latest:
+        current, incoming = table.c[column], stmt.excluded[column]
+        set_[column] = case((or_(current.is_(None), incoming > current), incoming), else_=current)
+    return stmt.on_conflict_do_update(index_elements=list(keys), set_=set_)
+
+
+async def fold_session(db: AsyncSession, session: ReadingSession) -> bool:
+    """
+    把会话尚未计入的时长累加到汇总表（不提交，随调用方事务提交）
+
+    以 counted_seconds 作为乐观锁，心跳与夜间压缩并发处理同一会话时只有一方生效
+
+    Returns:
+        是否有新增计入
+    """
+    await db.flush()
+    row = (await db.execute(
+        select(
+            ReadingSession.user_id,
+            ReadingSession.book_id,
+            ReadingSession.start_time,
+            ReadingSession.duration_seconds,
+            ReadingSession.counted_seconds,
+        ).where(ReadingSession.id == session.id)
+    )).one_or_none()
+    if row is None or row.start_time is None:
+        return False
+
+    duration = row.duration_seconds or 0
+    pending = duration - (row.counted_seconds or 0)
+    new_sessions = 1 if row.counted_seconds is None else 0
+    if not pending and not new_sessions:
+        return False
+
+    result = await db.execute(
+        update(ReadingSession)
+        .where(
+            ReadingSession.id == session.id,
+            ReadingSession.counted_seconds.is_not_distinct_from(row.counted_seconds),
+        )
+        .values(counted_seconds=duration)
+        .execution_options(synchronize_session=False)
+    )
+    if result.rowcount != 1:
+        return False
+    set_committed_value(session, "counted_seconds", duration)
+
+    start = _utc_naive(row.start_time)
+    day = _day_key(start)
+    increments = {"duration_seconds": pending, "session_count": new_sessions}
+    await db.execute(_upsert(
+        db, ReadingStatsDaily.__table__, {"user_id": row.user_id, "day": day}, increments
+    ))
+    await db.execute(_upsert(
+        db, ReadingStatsHourly.__table__,
+        {"user_id": row.user_id, "day": day, "hour": start.hour}, increments
+    ))
+    await db.execute(_upsert(
+        db, ReadingStatsBook.__table__,
+        {"user_id": row.user_id, "book_id": row.book_id}, increments, {"last_read_at": start}
+    ))
+    return True
+
+
+def _is_pending():
+    """会话尚有时长未计入汇总（与部分索引 ix_reading_sessions_pending 的条件一致，常量不能用绑定参数）"""
+    return or_(
+        ReadingSession.counted_seconds.is_(None),
+        ReadingSession.counted_seconds != func.coalesce(ReadingSession.duration_seconds, literal_column("0")),
+    )
+
+
+def _pending_sessions(user_id: int):
+    """
+    尚未计入汇总的会话部分
+
+    跨日的会话（昨天开始、今天仍在心跳）、未经接口写入的会话都在其中，直到被心跳或夜间压缩计入
+    """
+    return (
+        select(
+            ReadingSession.book_id.label("book_id"),
+            ReadingSession.start_time.label("start_time"),
+            (func.coalesce(ReadingSession.duration_seconds, 0)
+             - func.coalesce(ReadingSession.counted_seconds, 0)).label("duration_seconds"),
+            case((ReadingSession.counted_seconds.is_(None), 1), else_=0).label("session_count"),
+        )
+        .where(ReadingSession.user_id == user_id, _is_pending())
+    )
+
+
+async def _live_rows(db: AsyncSession, user_id: int) -> List[Tuple[datetime, int, int]]:
+    """实时增量：[(开始时间, 时长, 会话数)]"""
+    pending = _pending_sessions(user_id).subquery()
+    result = await db.execute(
+        select(pending.c.start_time, pending.c.duration_seconds, pending.c.session_count)
+    )
+    return [(_utc_naive(start), duration or 0, count or 0) for start, duration, count in result.all()]
+
+
+def book_totals(user_id: int):
+    """
+    用户各书籍累计阅读（汇总表 + 实时增量）子查询
+    列：book_id, duration_seconds, session_count, last_read_at
+    """
+    rollup = select(
+        ReadingStatsBook.book_id.label("book_id"),
+        ReadingStatsBook.duration_seconds.label("duration_seconds"),
+        ReadingStatsBook.session_count.label("session_count"),
+        ReadingStatsBook.last_read_at.label("last_read_at"),
+    ).where(ReadingStatsBook.user_id == user_id)
+
+    pending = _pending_sessions(user_id).subquery()
+    live = select(
+        pending.c.book_id,
+        func.sum(pending.c.duration_seconds),
+        func.sum(pending.c.session_count),
+        func.max(pending.c.start_time),
+    ).group_by(pending.c.book_id)
+
+    combined = union_all(rollup, live).subquery()
+    return (
+        select(
+            combined.c.book_id,
+            func.sum(combined.c.duration_seconds).label("duration_seconds"),
+            func.sum(combined.c.session_count).label("session_count"),
+            func.max(combined.c.last_read_at).label("last_read_at"),
+        )
+        .group_by(combined.c.book_id)
+        .subquery("book_totals")
+    )
+
+
+@dataclass
+class ReadingTotals:
+    """用户累计阅读"""
+    duration_seconds: int = 0
+    session_count: int = 0
+    book_count: int = 0
+
+
+async def reading_totals(db: AsyncSession, user_id: int) -> ReadingTotals:
+    """用户累计阅读时长、会话数与读过的书籍数（按书籍汇总行计算，与会话数量无关）"""
+    totals = book_totals(user_id)
+    row = (await db.execute(
+        select(
+            func.coalesce(func.sum(totals.c.duration_seconds), 0),
+            func.coalesce(func.sum(totals.c.session_count), 0),
+            func.count(totals.c.book_id),
+        )
+    )).one()
+    return ReadingTotals(int(row[0] or 0), int(row[1] or 0), int(row[2] or 0))
+
+
+async def daily_totals(db: AsyncSession, user_id: int, since: datetime) -> Dict[str, Tuple[int, int]]:
+    """since 所在日期起每日的 (时长, 会话数)，含实时增量"""
+    since_day = _day_key(_utc_naive(since))
+    result = await db.execute(
+        select(ReadingStatsDaily.day, ReadingStatsDaily.duration_seconds, ReadingStatsDaily.session_count)
+        .where(ReadingStatsDaily.user_id == user_id, ReadingStatsDaily.day >= since_day)
+    )
+    totals = {day: (duration, count) for day, duration, count in result.all()}
+    for start, duration, count in await _live_rows(db, user_id):
+        day = _day_key(start)
+        if day >= since_day:
+            current = totals.get(day, (0, 0))
+            totals[day] = (current[0] + duration, current[1] + count)
+    return totals
+
+
+async def hourly_totals(db: AsyncSession, user_id: int, since: datetime) -> Dict[int, Tuple[int, int]]:
+    """since 所在日期起各小时（0-23）的 (时长, 会话数)，含实时增量"""
+    since_day = _day_key(_utc_naive(since))
+    result = await db.execute(
+        select(
+            ReadingStatsHourly.hour,
+            func.sum(ReadingStatsHourly.duration_seconds),
+            func.sum(ReadingStatsHourly.session_count),
+        )
+        .where(ReadingStatsHourly.user_id == user_id, ReadingStatsHourly.day >= since_day)
+        .group_by(ReadingStatsHourly.hour)
+    )
+    totals = {hour: (int(duration or 0), int(count or 0)) for hour, duration, count in result.all()}
+    for start, duration, count in await _live_rows(db, user_id):
+        if _day_key(start) >= since_day:
+            current = totals.get(start.hour, (0, 0))
+            totals[start.hour] = (current[0] + duration, current[1] + count)
+    return totals
+
+
+async def compact_reading_stats(db: AsyncSession) -> dict:
+    """
+    夜间压缩：计入所有遗留的未计入会话，删除过期的小时汇总与已删除用户的汇总
+
+    Returns:
+        {"folded": 计入的会话数, "pruned_hourly": 删除的小时汇总行数}
+    """
+    folded = 0
+    last_id = 0
+    while True:
+        result = await db.execute(
+            select(ReadingSession)
+            .where(
+                ReadingSession.id > last_id,
+                _is_pending(),
+            )
+            .order_by(ReadingSession.id)
+            .limit(COMPACT_BATCH_SIZE)
+        )
+        sessions = result.scalars().all()
+        if not sessions:
+            break
+        for session in sessions:
+            if await fold_session(db, session):
+                folded += 1
+        last_id = sessions[-1].id
+        await db.commit()
+
+    cutoff = _day_key(datetime.utcnow() - timedelta(days=HOURLY_RETENTION_DAYS))
+    pruned = await db.execute(delete(ReadingStatsHourly).where(ReadingStatsHourly.day < cutoff))
+    for model in (ReadingStatsDaily, ReadingStatsHourly, ReadingStatsBook):
+        await db.execute(delete(model).where(~model.user_id.in_(select(User.id))))
+    await db.commit()
+    return {"folded": folded, "pruned_hourly": pruned.rowcount or 0}
+
+
+async def run_compaction() -> dict:
+    """定时任务入口"""
+    from app.database import AsyncSessionLocal
+
+    async with AsyncSessionLocal() as db:
+        result = await compact_reading_stats(db)
+    if result["folded"] or result["pruned_hourly"]:
+        log.info(
+            f"阅读统计压缩完成：计入会话 {result['folded']} 个，"
+            f"删除过期小时汇总 {result['pruned_hourly']} 行"
+        )
+    return result
@@ -1,6 +1,7 @@
 """
 定时任务调度器模块
-使用 APScheduler 实现自动备份等定时任务
+使用 APScheduler 实现自动备份、统计校正与压缩等定时任务。
+多 worker 时调度器只在主节点运行，其他 worker 上的计划变更经 backplane 同步到各进程
 """
 from datetime import datetime
 from typing import Optional, Dict, Any
@@ -9,6 +10,7 @@ from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from apscheduler.triggers.cron import CronTrigger
 
 from app.config import settings
+from app.core.backplane import backplane
 from app.core.backup import backup_manager
 from app.utils.logger import log
 
@@ -40,6 +42,8 @@ class BackupScheduler:
         else:
             log.info("自动备份未启用")
         
+        self._add_maintenance_jobs()
+        
         self.scheduler.start()
         log.info("定时任务调度器已启动")
     
@@ -72,6 +76,35 @@ class BackupScheduler:
             log.error(f"添加备份任务失败: {e}")
             raise
     
+    def _add_maintenance_jobs(self):
+        """添加数据维护任务（书库统计校正、阅读统计压缩），计划为空或无效时跳过"""
+        from app.core.library_stats import run_reconciliation
+        from app.core.reading_stats import run_compaction
+        
+        jobs = (
+            ("library_stats_reconcile", "书库统计校正", run_reconciliation,
+             settings.database.stats_reconcile_schedule),
+            ("reading_stats_compact", "阅读统计压缩", run_compaction,
+             settings.database.reading_stats_compact_schedule),
+        )
+        for job_id, name, func, schedule in jobs:
+            if not schedule:
+                continue
+            try:
+                self.scheduler.add_job(
+                    func,
+                    trigger=CronTrigger.from_crontab(schedule, timezone="Asia/Shanghai"),
+                    id=job_id,
+                    name=name,
+                    replace_existing=True,
+                    max_instances=1,
+                    coalesce=True,
+                    misfire_grace_time=3600
+                )
+                log.info(f"{name}任务已添加，计划: {schedule}")
+            except Exception as e:
+                log.error(f"添加{name}任务失败: {e}")
+    
     async def _auto_backup_task(self):
         """自动备份任务执行函数"""
         self.last_run = datetime.now()
@@ -103,15 +136,23 @@ class BackupScheduler:
             
             # 不抛出异常，避免影响调度器继续运行
     
-    async def enable_auto_backup(self, schedule: Optional[str] = None):
+    def _ensure_available(self) -> None:
+        """单进程模式下调度器必须已启动；多 worker 时由主节点执行，本进程只同步配置"""
+        if self.scheduler is None and backplane.name == "memory":
+            raise RuntimeError("调度器未启动")
+    
+    def _broadcast(self, command: str, **kwargs) -> None:
+        backplane.publish("scheduler.command", {"command": command, "kwargs": kwargs})
+    
+    async def enable_auto_backup(self, schedule: Optional[str] = None, broadcast: bool = True):
         """
         启用自动备份
         
         Args:
             schedule: 可选的新 Cron 表达式
+            broadcast: 是否同步到其他 worker
         """
-        if self.scheduler is None:
-            raise RuntimeError("调度器未启动")
+        self._ensure_available()
         
         # 更新配置（这里只更新运行时配置，不修改文件）
         if schedule:
@@ -119,27 +160,31 @@ class BackupScheduler:
         
         settings.backup.auto_backup_enabled = True
         
-        # 移除现有任务（如果存在）
-        if self.backup_job:
-            self.scheduler.remove_job("auto_backup")
-        
-        # 添加新任务
-        await self._add_backup_job()
+        if self.scheduler is not None:
+            # 移除现有任务（如果存在）
+            if self.backup_job:
+                self.scheduler.remove_job("auto_backup")
+            
+            # 添加新任务
+            await self._add_backup_job()
         
+        if broadcast:
+            self._broadcast("enable_auto_backup", schedule=schedule)
         log.info("自动备份已启用")
     
-    async def disable_auto_backup(self):
+    async def disable_auto_backup(self, broadcast: bool = True):
         """禁用自动备份"""
-        if self.scheduler is None:
-            raise RuntimeError("调度器未启动")
+        self._ensure_available()
         
         settings.backup.auto_backup_enabled = False
         
         # 移除任务
-        if self.backup_job:
+        if self.scheduler is not None and self.backup_job:
             self.scheduler.remove_job("auto_backup")
             self.backup_job = None
         
+        if broadcast:
+            self._broadcast("disable_auto_backup")
         log.info("自动备份已禁用")
     
     async def trigger_backup_now(self) -> Dict[str, Any]:
@@ -180,6 +225,18 @@ class BackupScheduler:
             状态信息字典
         """
         if self.scheduler is None:
+            if backplane.name != "memory":
+                # 多 worker：调度器运行在主节点 worker 上，这里只能给出配置
+                return {
+                    "running": True,
+                    "auto_backup_enabled": settings.backup.auto_backup_enabled,
+                    "schedule": settings.backup.auto_backup_schedule,
+                    "last_run": None,
+                    "last_status": None,
+                    "last_error": None,
+                    "next_run": None,
+                    "message": "调度器由主节点 worker 运行"
+                }
             return {
                 "running": False,
                 "auto_backup_enabled": False,
@@ -204,15 +261,15 @@ class BackupScheduler:
         
         return status
     
-    async def update_schedule(self, new_schedule: str):
+    async def update_schedule(self, new_schedule: str, broadcast: bool = True):
         """
         更新 Cron 表达式
         
         Args:
             new_schedule: 新的 Cron 表达式
+            broadcast: 是否同步到其他 worker
         """
-        if self.scheduler is None:
-            raise RuntimeError("调度器未启动")
+        self._ensure_available()
         
         # 验证 Cron 表达式
         try:
@@ -224,11 +281,13 @@ class BackupScheduler:
         settings.backup.auto_backup_schedule = new_schedule
         
         # 如果自动备份已启用，重新添加任务
-        if settings.backup.auto_backup_enabled:
+        if self.scheduler is not None and settings.backup.auto_backup_enabled:
             if self.backup_job:
                 self.scheduler.remove_job("auto_backup")
             await self._add_backup_job()
         
+        if broadcast:
+            self._broadcast("update_schedule", new_schedule=new_schedule)
         log.info(f"备份计划已更新: {new_schedule}")
     
     async def shutdown(self):
@@ -248,3 +307,15 @@ class BackupScheduler:
 
 # 全局实例
 backup_scheduler = BackupScheduler()
+
+
+@backplane.subscribe_to("scheduler.command")
+async def _on_remote_command(data: dict) -> None:
+    handlers = {
+        "enable_auto_backup": backup_scheduler.enable_auto_backup,
+        "disable_auto_backup": backup_scheduler.disable_auto_backup,
+        "update_schedule": backup_scheduler.update_schedule,
+    }
+    handler = handlers.get(data.get("command"))
+    if handler is not None:
+        await handler(**data.get("kwargs", {}), broadcast=False)
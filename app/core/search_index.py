@@ -0,0 +1,395 @@
+"""
+书籍全文检索索引
+覆盖书名、作者、简介、标签与翻译文本，由数据库触发器保持同步：
+
+- SQLite：FTS5 虚拟表（trigram 分词，适合中日韩文本），MATCH 检索并按 bm25 排序
+- PostgreSQL：同名普通表 + pg_trgm GIN 索引，ILIKE 检索并按加权 similarity 排序
+  （数据库需使用 UTF-8 的 LC_CTYPE，如 C.UTF-8 / en_US.UTF-8，否则中文无法使用三元组索引）
+"""
+from __future__ import annotations
+
+import re
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import Float, Integer, text
+from sqlalchemy.engine import Connection
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.db_triggers import replace_trigger
+from app.utils.logger import log
+
+
+FTS_TABLE = "books_fts"
+
+# 索引列及 bm25 权重（顺序与虚拟表定义一致）
+FTS_COLUMNS: Tuple[str, ...] = ("title", "author", "description", "tags", "translations")
+FTS_WEIGHTS: Tuple[float, ...] = (10.0, 6.0, 1.0, 4.0, 3.0)
+
+# trigram 分词器无法用 MATCH 匹配少于 3 个字符的词
+MIN_MATCH_LENGTH = 3
+
+SNIPPET_TOKENS = 16
+
+# 单本书的索引内容
+_DOCUMENT_SELECT = """
+SELECT b.id,
+       b.title,
+       COALESCE(a.name, ''),
+       COALESCE(b.description, ''),
+       COALESCE((SELECT {concat}(t.name, ' ')
+                 FROM book_tags bt JOIN tags t ON t.id = bt.tag_id
+                 WHERE bt.book_id = b.id), ''),
+       COALESCE((SELECT {concat}(COALESCE(tr.title, '') || ' ' || COALESCE(tr.description, ''), ' ')
+                 FROM book_translations tr
+                 WHERE tr.book_id = b.id), '')
+FROM books b
+LEFT JOIN authors a ON a.id = b.author_id
+"""
+
+
+def _document_select(dialect: str) -> str:
+    return _DOCUMENT_SELECT.format(concat="string_agg" if dialect == "postgresql" else "group_concat")
+
+
+_INSERT_PREFIX = f"INSERT INTO {FTS_TABLE}(rowid, {', '.join(FTS_COLUMNS)})"
+
+# 触发器名 -> (触发时机, 需要刷新的书籍条件；None 表示只删除)
+_TRIGGERS: Dict[str, Tuple[str, Optional[str], Optional[str]]] = {
+    "books_fts_book_insert": ("AFTER INSERT ON books", None, "b.id = NEW.id"),
+    "books_fts_book_update": (
+        "AFTER UPDATE OF title, author_id, description ON books", "OLD.id", "b.id = NEW.id"
+    ),
+    "books_fts_book_delete": ("AFTER DELETE ON books", "OLD.id", None),
+    "books_fts_author_update": (
+        "AFTER UPDATE OF name ON authors",
+        "SELECT id FROM books WHERE author_id = NEW.id",
+        "b.author_id = NEW.id",
+    ),
+    "books_fts_tag_insert": ("AFTER INSERT ON book_tags", "NEW.book_id", "b.id = NEW.book_id"),
+    "books_fts_tag_delete": ("AFTER DELETE ON book_tags", "OLD.book_id", "b.id = OLD.book_id"),
+    "books_fts_tag_rename": (
+        "AFTER UPDATE OF name ON tags",
+        "SELECT book_id FROM book_tags WHERE tag_id = NEW.id",
+        "b.id IN (SELECT book_id FROM book_tags WHERE tag_id = NEW.id)",
+    ),
+    "books_fts_translation_insert": (
+        "AFTER INSERT ON book_translations", "NEW.book_id", "b.id = NEW.book_id"
+    ),
+    "books_fts_translation_update": (
+        "AFTER UPDATE ON book_translations",
+        "OLD.book_id, NEW.book_id",
+        "b.id IN (OLD.book_id, NEW.book_id)",
+    ),
+    "books_fts_translation_delete": (
+        "AFTER DELETE ON book_translations", "OLD.book_id", "b.id = OLD.book_id"
+    ),
+}
+
+# 当前进程中索引是否可用及所在数据库（由 install_search_index 设置）
+_available = False
+_dialect = "sqlite"
+
+
+def is_available() -> bool:
+    """全文索引是否可用（不支持的数据库、SQLite 不支持 trigram 或 PostgreSQL 无法启用 pg_trgm 时为 False）"""
+    return _available
+
+
+def _trigger_body(delete_ids: Optional[str], refresh_where: Optional[str], dialect: str) -> str:
+    body = ""
+    if delete_ids:
+        body += f"DELETE FROM {FTS_TABLE} WHERE rowid IN ({delete_ids});\n"
+    if refresh_where:
+        body += f"{_INSERT_PREFIX} {_document_select(dialect)} WHERE {refresh_where};\n"
+    return body
+
+
+def _create_sqlite_index(conn: Connection) -> Optional[bool]:
+    """创建 FTS5 虚拟表，返回是否新建；不支持时返回 None"""
+    exists = conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+        {"name": FTS_TABLE},
+    ).first() is not None
+    if exists:
+        return False
+    try:
+        conn.execute(text(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+            f"{', '.join(FTS_COLUMNS)}, tokenize = 'trigram')"
+        ))
+    except Exception as e:
+        log.warning(f"当前 SQLite 不支持 FTS5 trigram 分词，搜索将回退到 LIKE: {e}")
+        return None
+    return True
+
+
+def _create_postgres_index(conn: Connection) -> Optional[bool]:
+    """启用 pg_trgm 并创建索引表与三元组 GIN 索引，返回是否新建；无法启用扩展时返回 None"""
+    installed = conn.execute(text("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).first() is not None
+    if not installed:
+        try:
+            # 失败时只回滚保存点，不影响同一事务中的建表
+            with conn.begin_nested():
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+        except Exception as e:
+            log.warning(f"无法启用 pg_trgm 扩展（需要数据库管理员权限），搜索将回退到 ILIKE: {e}")
+            return None
+
+    # pg_trgm 只从 LC_CTYPE 认定为字母数字的字符提取三元组：C / POSIX locale 下中日韩文本没有三元组，无法使用索引
+    if not conn.execute(text("SELECT show_trgm('书库') <> '{}'")).scalar():
+        log.warning(
+            "当前数据库的 LC_CTYPE 不支持中日韩字符，pg_trgm 索引对中文搜索无效（结果正确但退化为顺序扫描）；"
+            "请使用 UTF-8 locale 创建数据库，例如 CREATE DATABASE ... LOCALE 'C.UTF-8' TEMPLATE template0"
+        )
+
+    exists = conn.execute(
+        text("SELECT 1 FROM information_schema.tables WHERE table_schema = current_schema() AND table_name = :name"),
+        {"name": FTS_TABLE},
+    ).first() is not None
+    columns = ", ".join(f"{column} TEXT NOT NULL DEFAULT ''" for column in FTS_COLUMNS)
+    conn.execute(text(f"CREATE TABLE IF NOT EXISTS {FTS_TABLE} (rowid INTEGER PRIMARY KEY, {columns})"))
+    for column in FTS_COLUMNS:
+        conn.execute(text(
+            f"CREATE INDEX IF NOT EXISTS {FTS_TABLE}_{column}_trgm "
+            f"ON {FTS_TABLE} USING gin ({column} gin_trgm_ops)"
+        ))
+    return not exists
+
+
+def install_search_index(conn: Connection) -> bool:
+    """
+    创建全文索引表与同步触发器（同步连接，可通过 run_sync 调用）
+    首次创建时会从现有数据构建索引
+
+    Returns:
+        索引是否可用
+    """
+    global _available, _dialect
+
+    _dialect = conn.dialect.name
+    if _dialect == "sqlite":
+        created = _create_sqlite_index(conn)
+    elif _dialect == "postgresql":
+        created = _create_postgres_index(conn)
+    else:
+        created = None
+    if created is None:
+        _available = False
+        return False
+
+    # 触发器每次启动重建，保证定义与代码一致
+    for name, (event, delete_ids, refresh_where) in _TRIGGERS.items():
+        replace_trigger(conn, name, event, _trigger_body(delete_ids, refresh_where, _dialect))
+
+    if created:
+        count = _rebuild(conn)
+        log.info(f"全文索引已创建，索引书籍 {count} 本")
+
+    _available = True
+    return True
+
+
+def _rebuild(conn: Connection) -> int:
+    conn.execute(text(f"DELETE FROM {FTS_TABLE}"))
+    conn.execute(text(f"{_INSERT_PREFIX} {_document_select(conn.dialect.name)}"))
+    if conn.dialect.name == "sqlite":
+        conn.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')"))
+    else:
+        conn.execute(text(f"ANALYZE {FTS_TABLE}"))
+    return conn.execute(text(f"SELECT count(*) FROM {FTS_TABLE}")).scalar() or 0
+
+
+def rebuild_search_index_sync(conn: Connection) -> int:
+    """从业务表全量重建全文索引（同步连接），返回索引的书籍数"""
+    if not install_search_index(conn):
+        return 0
+    return _rebuild(conn)
+
+
+async def rebuild_search_index(db: AsyncSession) -> int:
+    """从业务表全量重建全文索引，返回索引的书籍数"""
+    count = await db.run_sync(lambda session: rebuild_search_index_sync(session.connection()))
+    await db.commit()
+    return count
+
+
+def _split_terms(keyword: str) -> Tuple[List[str], List[str]]:
+    """拆分关键词为可 MATCH 的长词与需 LIKE 的短词"""
+    terms = [term for term in re.split(r"\s+", keyword.strip()) if term]
+    long_terms = [term for term in terms if len(term) >= MIN_MATCH_LENGTH]
+    short_terms = [term for term in terms if len(term) < MIN_MATCH_LENGTH]
+    return long_terms, short_terms
+
+
+def _match_expression(terms: Sequence[str], columns: Sequence[str]) -> str:
+    phrases = " AND ".join('"' + term.replace('"', '""') + '"' for term in terms)
+    if tuple(columns) == FTS_COLUMNS:
+        return phrases
+    return "{" + " ".join(columns) + "} : (" + phrases + ")"
+
+
+def _escape_like(term: str) -> str:
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def search_subquery(keyword: str, columns: Optional[Sequence[str]] = None):
+    """
+    构建全文检索子查询，列为 book_id 与 rank（越小越相关）
+
+    SQLite：长度不少于 3 的词走 FTS MATCH 并按 bm25 排序；
+    更短的词（如两字中文词）在索引表上以 LIKE 过滤，仅全是短词时才退化为扫描索引表。
+    PostgreSQL 见 _postgres_subquery
+
+    Args:
+        keyword: 搜索关键词，空白分隔的多个词取交集
+        columns: 限定检索的列，默认全部列
+
+    Returns:
+        子查询；索引不可用或关键词为空时返回 None，调用方应回退到 LIKE
+    """
+    if not _available:
+        return None
+
+    columns = tuple(columns or FTS_COLUMNS)
+    long_terms, short_terms = _split_terms(keyword)
+    if not long_terms and not short_terms:
+        return None
+    if _dialect == "postgresql":
+        return _postgres_subquery(long_terms + short_terms, columns)
+
+    params: Dict[str, object] = {}
+    conditions = []
+    for i, term in enumerate(short_terms):
+        key = f"fts_like_{i}"
+        params[key] = f"%{_escape_like(term)}%"
+        conditions.append(
+            "(" + " OR ".join(f"{FTS_TABLE}.{column} LIKE :{key} ESCAPE '\\'" for column in columns) + ")"
+        )
+
+    if long_terms:
+        params["fts_match"] = _match_expression(long_terms, columns)
+        weights = ", ".join(str(weight) for weight in FTS_WEIGHTS)
+        rank = f"bm25({FTS_TABLE}, {weights})"
+        conditions.insert(0, f"{FTS_TABLE} MATCH :fts_match")
+    else:
+        # 无法计算 bm25：书名命中的排在前面
+        rank = f"CASE WHEN {FTS_TABLE}.title LIKE :fts_like_0 ESCAPE '\\' THEN 0.0 ELSE 1.0 END"
+
+    sql = f"SELECT rowid AS book_id, {rank} AS rank FROM {FTS_TABLE} WHERE {' AND '.join(conditions)}"
+    return (
+        text(sql)
+        .bindparams(**params)
+        .columns(book_id=Integer, rank=Float)
+        .subquery("fts")
+    )
+
+
+def _postgres_subquery(terms: Sequence[str], columns: Sequence[str]):
+    """
+    PostgreSQL：每个词在任一列 ILIKE 命中（不少于 3 个字符的词可使用三元组索引），
+    按各列与整个关键词的 similarity 加权和排序
+    """
+    params: Dict[str, object] = {"fts_query": " ".join(terms)}
+    conditions = []
+    for i, term in enumerate(terms):
+        key = f"fts_like_{i}"
+        params[key] = f"%{_escape_like(term)}%"
+        conditions.append(
+            "(" + " OR ".join(f"{FTS_TABLE}.{column} ILIKE :{key} ESCAPE '\\'" for column in columns) + ")"
+        )
+    weights = dict(zip(FTS_COLUMNS, FTS_WEIGHTS))
+    rank = "-(" + " + ".join(
+        f"{weights[column]} * similarity({FTS_TABLE}.{column}, :fts_query)" for column in columns
+    ) + ")"
+
+    sql = f"SELECT rowid AS book_id, {rank} AS rank FROM {FTS_TABLE} WHERE {' AND '.join(conditions)}"
+    return (
+        text(sql)
+        .bindparams(**params)
+        .columns(book_id=Integer, rank=Float)
+        .subquery("fts")
+    )
+
+
+def _highlight(value: str, terms: Sequence[str]) -> Optional[str]:
+    """截取首个命中词附近的文本并以 <mark> 包裹命中词（与 FTS5 snippet 输出格式一致）"""
+    pattern = re.compile("|".join(re.escape(term) for term in terms), re.IGNORECASE)
+    match = pattern.search(value)
+    if match is None:
+        return None
+    start = max(match.start() - SNIPPET_TOKENS // 2, 0)
+    end = min(start + SNIPPET_TOKENS * 2, len(value))
+    snippet = pattern.sub(lambda m: f"<mark>{m.group(0)}</mark>", value[start:end])
+    return ("…" if start > 0 else "") + snippet + ("…" if end < len(value) else "")
+
+
+async def get_snippets(
+    db: AsyncSession,
+    keyword: str,
+    book_ids: Sequence[int],
+    columns: Optional[Sequence[str]] = None,
+) -> Dict[int, str]:
+    """
+    获取命中片段（命中词以 <mark> 包裹）
+
+    Returns:
+        book_id -> 片段；仅含短词的关键词无法生成片段，返回空字典
+    """
+    if not _available or not book_ids:
+        return {}
+
+    long_terms, _ = _split_terms(keyword)
+    if not long_terms:
+        return {}
+
+    ids = ", ".join(str(int(book_id)) for book_id in book_ids)
+    columns = tuple(columns or FTS_COLUMNS)
+    if _dialect == "postgresql":
+        result = await db.execute(
+            text(f"SELECT rowid, {', '.join(columns)} FROM {FTS_TABLE} WHERE rowid IN ({ids})")
+        )
+        snippets = {}
+        for row in result.all():
+            for value in row[1:]:
+                snippet = _highlight(value, long_terms)
+                if snippet is not None:
+                    snippets[row[0]] = snippet
+                    break
+        return snippets
+
+    result = await db.execute(
+        text(
+            f"SELECT rowid, snippet({FTS_TABLE}, -1, '<mark>', '</mark>', '…', {SNIPPET_TOKENS}) "
+            f"FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH :fts_match AND rowid IN ({ids})"
+        ),
+        {"fts_match": _match_expression(long_terms, columns)},
+    )
+    return {row[0]: row[1] for row in result.all()}
+
+
+def apply_keyword_search(query, keyword: str, columns: Optional[Sequence[str]] = None):
+    """
+    为 Book 查询附加关键词条件
+
+    索引可用时联结全文检索子查询并按相关度排序，否则回退到书名/作者名 LIKE（不区分大小写）；
+    回退时作者表使用别名联结，传入的查询已联结 Author 时也不会重复联结同一张表
+
+    Returns:
+        (query, ranked) ranked 表示结果已按相关度排序
+    """
+    from sqlalchemy import or_
+    from sqlalchemy.orm import aliased
+
+    from app.models import Author, Book
+
+    fts = search_subquery(keyword, columns)
+    if fts is not None:
+        query = query.join(fts, fts.c.book_id == Book.id).order_by(fts.c.rank)
+        return query, True
+
+    search_term = f"%{keyword}%"
+    author = aliased(Author)
+    query = query.outerjoin(author, Book.author_id == author.id).where(
+        or_(Book.title.ilike(search_term), author.name.ilike(search_term))
+    )
+    return query, False
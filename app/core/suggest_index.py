@@ -0,0 +1,462 @@
+"""
+搜索建议前缀索引
+进程内的有序键数组（bisect 前缀查找），键为规范化的书名、书名分词、作者名以及拼音全拼与首字母；
+每个条目占一个槽位，按书库维护槽位位图，查询时按用户可访问书库的位图过滤，全程不访问数据库。
+启动时从轻量列投影构建，书目提交后增量更新：新增条目先放入小的有序增量数组（查询时一并查找），
+积累到一定数量后在线程中合并进主数组；拼音等键的计算同样在线程中完成，不阻塞事件循环
+"""
+import asyncio
+import re
+import time
+import unicodedata
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy import select
+
+from app.core.catalog_events import CatalogChange, on_catalog_commit
+from app.database import AsyncSessionLocal
+from app.models import Author, Book
+from app.utils.logger import log
+
+try:
+    from pypinyin import Style, lazy_pinyin  # 可选依赖：拼音匹配
+except ImportError:
+    Style = None
+    lazy_pinyin = None
+
+# 每次查询最多检查的候选键数，保证最坏情况下的延迟
+MAX_SCAN_KEYS = 2000
+
+# 增量更新的合并延迟（秒），扫描时逐本提交的变更会合并成一次加载
+REFRESH_DELAY = 0.5
+
+# 墓碑槽位占比超过该值时全量重建
+REBUILD_TOMBSTONE_RATIO = 0.25
+
+# 增量数组的键数超过该值时在线程中合并进主数组
+DELTA_MERGE_KEYS = 4096
+
+BOOK = "book"
+AUTHOR = "author"
+
+_CJK_RE = re.compile(r"[㐀-鿿]")
+_TOKEN_SPLIT_RE = re.compile(r"[^\w]+")
+
+
+def normalize(text: str) -> str:
+    """规范化：全半角统一、大小写折叠、去除空白与标点"""
+    text = unicodedata.normalize("NFKC", text or "").casefold()
+    return "".join(ch for ch in text if ch.isalnum())
+
+
+def index_keys(text: str) -> Set[str]:
+    """生成条目的全部前缀键：全文、分词，含中文时附加拼音全拼与首字母"""
+    keys = set()
+    whole = normalize(text)
+    if whole:
+        keys.add(whole)
+    for token in _TOKEN_SPLIT_RE.split(unicodedata.normalize("NFKC", text or "")):
+        token = normalize(token)
+        if token:
+            keys.add(token)
+    if lazy_pinyin is not None and _CJK_RE.search(text or ""):
+        full = normalize("".join(lazy_pinyin(text, errors="ignore")))
+        initials = normalize("".join(lazy_pinyin(text, style=Style.FIRST_LETTER, errors="ignore")))
+        if full:
+            keys.add(full)
+        if initials:
+            keys.add(initials)
+    return keys
+
+
+def _index_texts(texts: Sequence[str]) -> List[Set[str]]:
+    """批量生成前缀键（在线程中调用）"""
+    return [index_keys(text) for text in texts]
+
+
+def _bitset(
+    slots_by_library: Dict[int, List[int]],
+    size: int,
+    base: Optional[Dict[int, int]] = None,
+) -> Dict[int, int]:
+    """批量构建每个书库的槽位位图（指定 base 时在已有位图上追加）"""
+    bits = dict(base or {})
+    length = (size + 7) // 8
+    for library_id, slots in slots_by_library.items():
+        buffer = bytearray(bits.get(library_id, 0).to_bytes(length, "little"))
+        for slot in slots:
+            buffer[slot >> 3] |= 1 << (slot & 7)
+        bits[library_id] = int.from_bytes(buffer, "little")
+    return bits
+
+
+class _Snapshot:
+    """一次完整构建的索引数据（在线程中构建，完成后整体替换）"""
+
+    def __init__(self):
+        self.keys: List[str] = []
+        self.key_slots: List[int] = []
+        # 增量添加的 (键, 槽位)，有序；合并前查询时与主数组一起查找
+        self.delta: List[Tuple[str, int]] = []
+        # 增量添加的槽位所属书库（尚未写入 library_bits 的部分）
+        self.extra_libraries: Dict[int, Set[int]] = {}
+        # 槽位 -> (类型, ID, 显示文本)
+        self.entries: List[Tuple[str, int, str]] = []
+        self.alive = bytearray()
+        self.book_slots: Dict[int, int] = {}
+        self.author_slots: Dict[int, int] = {}
+        # 书籍/作者所属书库（增量更新时据此判断，避免对整个位图做移位运算）
+        self.book_libraries: Dict[int, int] = {}
+        self.author_libraries: Dict[int, Set[int]] = {}
+        self.library_bits: Dict[int, int] = {}
+        self.tombstones = 0
+
+    @classmethod
+    def build(
+        cls,
+        books: Sequence[Tuple[int, str, int, Optional[int]]],
+        authors: Dict[int, str],
+    ) -> "_Snapshot":
+        snapshot = cls()
+        pairs: List[Tuple[str, int]] = []
+        slots_by_library: Dict[int, List[int]] = {}
+        author_libraries = snapshot.author_libraries
+
+        for book_id, title, library_id, author_id in books:
+            slot = snapshot._new_slot(BOOK, book_id, title)
+            snapshot.book_slots[book_id] = slot
+            snapshot.book_libraries[book_id] = library_id
+            slots_by_library.setdefault(library_id, []).append(slot)
+            pairs.extend((key, slot) for key in index_keys(title))
+            if author_id is not None:
+                author_libraries.setdefault(author_id, set()).add(library_id)
+
+        for author_id, library_ids in author_libraries.items():
+            name = authors.get(author_id)
+            if not name:
+                continue
+            slot = snapshot._new_slot(AUTHOR, author_id, name)
+            snapshot.author_slots[author_id] = slot
+            for library_id in library_ids:
+                slots_by_library.setdefault(library_id, []).append(slot)
+            pairs.extend((key, slot) for key in index_keys(name))
+
+        pairs.sort()
+        snapshot.keys = [key for key, _ in pairs]
+        snapshot.key_slots = [slot for _, slot in pairs]
+        snapshot.library_bits = _bitset(slots_by_library, len(snapshot.entries))
+        return snapshot
+
+    def _new_slot(self, kind: str, entry_id: int, text: str) -> int:
+        self.entries.append((kind, entry_id, text))
+        self.alive.append(1)
+        return len(self.entries) - 1
+
+    def add(self, kind: str, entry_id: int, text: str, keys: Iterable[str], library_ids: Iterable[int]) -> int:
+        """增量添加条目（键追加到增量数组，调用方在一批添加完成后调用 sort_delta）"""
+        slot = self._new_slot(kind, entry_id, text)
+        self.delta.extend((key, slot) for key in keys)
+        self.add_libraries(slot, library_ids)
+        return slot
+
+    def add_libraries(self, slot: int, library_ids: Iterable[int]) -> None:
+        """将槽位加入书库（合并前记录在 extra_libraries 中）"""
+        self.extra_libraries.setdefault(slot, set()).update(library_ids)
+
+    def sort_delta(self) -> None:
+        self.delta.sort()
+
+    def prefix_slots(self, prefix: str) -> Iterator[int]:
+        """依次返回主数组与增量数组中前缀匹配的槽位（各自最多检查 MAX_SCAN_KEYS 个键）"""
+        keys = self.keys
+        position = bisect_left(keys, prefix)
+        end = min(len(keys), position + MAX_SCAN_KEYS)
+        while position < end and keys[position].startswith(prefix):
+            yield self.key_slots[position]
+            position += 1
+
+        delta = self.delta
+        position = bisect_left(delta, (prefix,))
+        end = min(len(delta), position + MAX_SCAN_KEYS)
+        while position < end and delta[position][0].startswith(prefix):
+            yield delta[position][1]
+            position += 1
+
+    def merged(self) -> Tuple[List[str], List[int], Dict[int, int]]:
+        """
+        将增量数组合并进主数组（在线程中调用，不修改当前数据）
+
+        按增量键分段拷贝主数组，每段之间会释放 GIL，合并期间事件循环仍可响应查询
+        """
+        keys: List[str] = []
+        key_slots: List[int] = []
+        start = 0
+        for key, slot in self.delta:
+            position = bisect_right(self.keys, key, start)
+            keys.extend(self.keys[start:position])
+            key_slots.extend(self.key_slots[start:position])
+            keys.append(key)
+            key_slots.append(slot)
+            start = position
+        keys.extend(self.keys[start:])
+        key_slots.extend(self.key_slots[start:])
+
+        slots_by_library: Dict[int, List[int]] = {}
+        for slot, library_ids in self.extra_libraries.items():
+            for library_id in library_ids:
+                slots_by_library.setdefault(library_id, []).append(slot)
+        library_bits = _bitset(slots_by_library, len(self.entries), self.library_bits)
+        return keys, key_slots, library_bits
+
+    def remove(self, slot: int) -> None:
+        """标记槽位失效（键保留到下次重建）"""
+        if self.alive[slot]:
+            self.alive[slot] = 0
+            self.tombstones += 1
+
+
+class SuggestionIndex:
+    """搜索建议前缀索引"""
+
+    def __init__(self):
+        self._snapshot: Optional[_Snapshot] = None
+        self._mask_cache: Dict[Tuple[int, ...], int] = {}
+        self._pending: Set[int] = set()
+        self._pending_full = False
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._building = False
+        self.build_seconds = 0.0
+        self.queries = 0
+
+    @property
+    def ready(self) -> bool:
+        return self._snapshot is not None
+
+    def start(self) -> None:
+        """启动后台构建（应用启动时调用）"""
+        self._schedule(full=True)
+
+    async def rebuild(self) -> None:
+        """从数据库全量重建"""
+        self._building = True
+        started = time.perf_counter()
+        try:
+            async with AsyncSessionLocal() as db:
+                book_rows = (
+                    await db.execute(select(Book.id, Book.title, Book.library_id, Book.author_id))
+                ).all()
+                author_rows = (await db.execute(select(Author.id, Author.name))).all()
+            books = [tuple(row) for row in book_rows]
+            authors = {row[0]: row[1] for row in author_rows}
+            # 拼音转换较耗时，放到线程中执行
+            snapshot = await asyncio.to_thread(_Snapshot.build, books, authors)
+        finally:
+            self._building = False
+
+        self._snapshot = snapshot
+        self._mask_cache.clear()
+        self.build_seconds = time.perf_counter() - started
+        log.info(
+            f"搜索建议索引已构建：{len(snapshot.book_slots)} 本书，{len(snapshot.author_slots)} 位作者，"
+            f"{len(snapshot.keys)} 个键，耗时 {self.build_seconds:.2f}s"
+            + ("" if lazy_pinyin else "（未安装 pypinyin，不支持拼音匹配）")
+        )
+
+    async def refresh_books(self, book_ids: Set[int]) -> None:
+        """增量更新指定书籍（及其作者）"""
+        snapshot = self._snapshot
+        if snapshot is None or not book_ids:
+            return
+
+        async with AsyncSessionLocal() as db:
+            rows = (
+                await db.execute(
+                    select(Book.id, Book.title, Book.library_id, Book.author_id)
+                    .where(Book.id.in_(list(book_ids)))
+                )
+            ).all()
+            author_ids = {row.author_id for row in rows if row.author_id is not None}
+            new_author_ids = author_ids - set(snapshot.author_slots)
+            authors = {}
+            if new_author_ids:
+                author_rows = await db.execute(
+                    select(Author.id, Author.name).where(Author.id.in_(list(new_author_ids)))
+                )
+                authors = {row.id: row.name for row in author_rows}
+
+        # 先确定需要添加的条目，再在线程中计算键，最后一次性应用到索引
+        found = {row.id for row in rows}
+        removed = [snapshot.book_slots[book_id] for book_id in book_ids - found if book_id in snapshot.book_slots]
+        additions: List[Tuple[str, int, str, Set[int]]] = []
+        new_authors: Dict[int, Set[int]] = {}
+        joined_libraries: List[Tuple[int, int]] = []
+        for row in rows:
+            slot = snapshot.book_slots.get(row.id)
+            if slot is not None:
+                _, _, title = snapshot.entries[slot]
+                if title == row.title and snapshot.book_libraries.get(row.id) == row.library_id:
+                    continue
+                removed.append(slot)
+            additions.append((BOOK, row.id, row.title, {row.library_id}))
+
+            if row.author_id is None:
+                continue
+            author_slot = snapshot.author_slots.get(row.author_id)
+            if author_slot is None:
+                if authors.get(row.author_id):
+                    new_authors.setdefault(row.author_id, set()).add(row.library_id)
+            elif row.library_id not in snapshot.author_libraries.get(row.author_id, ()):
+                joined_libraries.append((row.author_id, row.library_id))
+        additions.extend(
+            (AUTHOR, author_id, authors[author_id], library_ids) for author_id, library_ids in new_authors.items()
+        )
+
+        # 拼音转换较耗时，放到线程中执行
+        key_sets = await asyncio.to_thread(_index_texts, [text for _, _, text, _ in additions])
+        if snapshot is not self._snapshot:
+            # 期间完成了全量重建，数据已是最新
+            return
+
+        for book_id in book_ids - found:
+            snapshot.book_slots.pop(book_id, None)
+            snapshot.book_libraries.pop(book_id, None)
+        for slot in removed:
+            snapshot.remove(slot)
+        for (kind, entry_id, text, library_ids), keys in zip(additions, key_sets):
+            slot = snapshot.add(kind, entry_id, text, keys, library_ids)
+            if kind == BOOK:
+                snapshot.book_slots[entry_id] = slot
+                snapshot.book_libraries[entry_id] = next(iter(library_ids))
+            else:
+                snapshot.author_slots[entry_id] = slot
+                snapshot.author_libraries[entry_id] = set(library_ids)
+        for author_id, library_id in joined_libraries:
+            snapshot.add_libraries(snapshot.author_slots[author_id], [library_id])
+            snapshot.author_libraries.setdefault(author_id, set()).add(library_id)
+        snapshot.sort_delta()
+
+        if snapshot.tombstones > len(snapshot.entries) * REBUILD_TOMBSTONE_RATIO:
+            self._schedule(full=True)
+        elif len(snapshot.delta) > DELTA_MERGE_KEYS:
+            await self.merge_delta()
+
+    async def merge_delta(self) -> None:
+        """在线程中将增量数组合并进主数组，完成后替换"""
+        snapshot = self._snapshot
+        if snapshot is None or not (snapshot.delta or snapshot.extra_libraries):
+            return
+        keys, key_slots, library_bits = await asyncio.to_thread(snapshot.merged)
+        if snapshot is not self._snapshot:
+            return
+        # 增量只在 _drain 中串行修改，合并期间不会变化，可直接整体替换
+        snapshot.keys, snapshot.key_slots, snapshot.library_bits = keys, key_slots, library_bits
+        snapshot.delta = []
+        snapshot.extra_libraries = {}
+        self._mask_cache.clear()
+
+    def _schedule(self, book_ids: Optional[Set[int]] = None, full: bool = False) -> None:
+        """合并变更并调度后台更新"""
+        if full:
+            self._pending_full = True
+        if book_ids:
+            self._pending.update(book_ids)
+        if self._refresh_task is not None and not self._refresh_task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # 不在事件循环中（如脚本），下次启动时重建
+            return
+        self._refresh_task = loop.create_task(self._drain())
+
+    async def _drain(self) -> None:
+        while self._pending_full or self._pending:
+            if self.ready:
+                await asyncio.sleep(REFRESH_DELAY)
+            full, self._pending_full = self._pending_full, False
+            book_ids, self._pending = self._pending, set()
+            try:
+                if full or not self.ready:
+                    await self.rebuild()
+                else:
+                    await self.refresh_books(book_ids)
+            except Exception as e:
+                log.error(f"搜索建议索引更新失败: {e}")
+                return
+
+    def _library_mask(self, library_ids: Sequence[int]) -> int:
+        key = tuple(sorted(library_ids))
+        mask = self._mask_cache.get(key)
+        if mask is None:
+            mask = 0
+            for library_id in key:
+                mask |= self._snapshot.library_bits.get(library_id, 0)
+            self._mask_cache[key] = mask
+        return mask
+
+    def suggest(self, query: str, library_ids: Sequence[int], limit: int) -> List[Tuple[str, int, str]]:
+        """
+        前缀匹配搜索建议
+
+        Returns:
+            [(类型, ID, 显示文本)]，书籍在前、作者在后；索引未就绪时返回空列表
+        """
+        snapshot = self._snapshot
+        prefix = normalize(query)
+        if snapshot is None or not prefix or not library_ids:
+            return []
+
+        self.queries += 1
+        mask = self._library_mask(library_ids)
+        seen: Set[int] = set()
+        books: List[Tuple[int, Tuple[str, int, str]]] = []
+        authors: List[Tuple[int, Tuple[str, int, str]]] = []
+
+        library_set = set(library_ids)
+        for slot in snapshot.prefix_slots(prefix):
+            if slot in seen or not snapshot.alive[slot]:
+                continue
+            if not (mask >> slot) & 1 and library_set.isdisjoint(snapshot.extra_libraries.get(slot, ())):
+                continue
+            seen.add(slot)
+            entry = snapshot.entries[slot]
+            # 文本越短越接近完整匹配，排在前面
+            target = books if entry[0] == BOOK else authors
+            target.append((len(entry[2]), entry))
+
+        books.sort(key=lambda item: item[0])
+        authors.sort(key=lambda item: item[0])
+        results = [entry for _, entry in books[:limit]]
+        results.extend(entry for _, entry in authors[:limit - len(results)])
+        return results
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            "ready": snapshot is not None,
+            "building": self._building,
+            "books": len(snapshot.book_slots) if snapshot else 0,
+            "authors": len(snapshot.author_slots) if snapshot else 0,
+            "keys": len(snapshot.keys) + len(snapshot.delta) if snapshot else 0,
+            "delta_keys": len(snapshot.delta) if snapshot else 0,
+            "tombstones": snapshot.tombstones if snapshot else 0,
+            "pinyin": lazy_pinyin is not None,
+            "build_seconds": round(self.build_seconds, 3),
+            "queries": self.queries,
+        }
+
+
+# 全局单例
+suggestion_index = SuggestionIndex()
+
+
+@on_catalog_commit
+def _refresh_suggestions(change: CatalogChange) -> None:
+    if not suggestion_index.ready:
+        return
+    if change.full or change.renamed_author_ids or change.deleted_library_ids:
+        # 作者改名/删除或书库删除：全量重建（新增作者随其书籍增量添加）
+        suggestion_index._schedule(full=True)
+    elif change.tables & {"books", "book_versions"}:
+        suggestion_index._schedule(change.book_ids)
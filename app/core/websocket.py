@@ -1,45 +1,244 @@
-from typing import List, Dict, Any
+"""
+WebSocket 连接管理
+每个连接有独立的有界发送队列与发送任务，广播只入队不等待发送，慢连接不会拖慢其他连接。
+
+- 进度类消息按类型（及书籍/任务）合并：队列中尚未发送的同类消息直接被新消息替换
+- 队列满时丢弃最旧的消息
+- 发送超时的连接视为卡死并关闭；定时向客户端发送 ping，长时间未收到客户端消息的连接被清理
+- 广播同时经 backplane 转发给其他 worker，由持有该用户连接的 worker 投递
+"""
+import asyncio
+import time
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
 from fastapi import WebSocket
 
+from app.core.backplane import backplane
+from app.utils.logger import log
+
+# 每个连接的发送队列上限
+SEND_QUEUE_SIZE = 256
+# 单条消息发送超时（秒），超时视为连接卡死
+SEND_TIMEOUT = 10.0
+# 服务端 ping 间隔（秒）
+PING_INTERVAL = 30.0
+# 超过该时间未收到客户端任何消息（客户端每 30 秒 ping 一次）即清理连接
+IDLE_TIMEOUT = 90.0
+
+# 可合并的消息类型 -> 用于区分同类消息的字段
+COALESCE_KEYS: Dict[str, Tuple[str, ...]] = {
+    "progress_update": ("book_id",),
+    "scan_progress": ("task_id",),
+    "cover_extract_progress": (),
+    "ping": (),
+}
+
+
+def _coalesce_key(message: Any) -> Optional[tuple]:
+    if not isinstance(message, dict):
+        return None
+    message_type = message.get("type")
+    fields = COALESCE_KEYS.get(message_type)
+    if fields is None:
+        return None
+    return (message_type, *(message.get(field) for field in fields))
+
+
+class Connection:
+    """单个 WebSocket 连接及其发送队列"""
+
+    def __init__(
+        self, websocket: WebSocket, user_id: int, manager: "ConnectionManager", token: Optional[str] = None
+    ):
+        self.websocket = websocket
+        self.user_id = user_id
+        # 建立连接时使用的 Token（用于连接期间重新校验）
+        self.token = token
+        self.manager = manager
+        self.queue: Deque[Any] = deque()
+        self._ready = asyncio.Event()
+        self.last_seen = time.monotonic()
+        self.closed = False
+        self.task = asyncio.create_task(self._writer())
+
+    def enqueue(self, message: Any) -> None:
+        """消息入队（dict 以 JSON 发送，str 以文本发送）"""
+        if self.closed:
+            return
+        key = _coalesce_key(message)
+        if key is not None:
+            for index, pending in enumerate(self.queue):
+                if _coalesce_key(pending) == key:
+                    self.queue[index] = message
+                    self.manager.coalesced += 1
+                    return
+        if len(self.queue) >= SEND_QUEUE_SIZE:
+            self.queue.popleft()
+            self.manager.dropped += 1
+        self.queue.append(message)
+        self._ready.set()
+
+    async def _writer(self) -> None:
+        while True:
+            await self._ready.wait()
+            self._ready.clear()
+            while self.queue:
+                message = self.queue.popleft()
+                if isinstance(message, str):
+                    send = self.websocket.send_text(message)
+                else:
+                    send = self.websocket.send_json(message)
+                try:
+                    await asyncio.wait_for(send, timeout=SEND_TIMEOUT)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    log.debug(f"WebSocket 发送失败，关闭连接 (user_id={self.user_id}): {e}")
+                    self.manager.failed += 1
+                    await self.manager.close(self, code=1011)
+                    return
+                self.manager.sent += 1
+
+    def stop(self) -> None:
+        self.closed = True
+        self.queue.clear()
+        if self.task is not asyncio.current_task():
+            self.task.cancel()
+
+
 class ConnectionManager:
     """WebSocket 连接管理器"""
-    
+
     def __init__(self):
-        # 活跃连接映射：user_id -> List[WebSocket]
-        self.active_connections: Dict[int, List[WebSocket]] = {}
-    
-    async def connect(self, websocket: WebSocket, user_id: int):
+        # 活跃连接映射：user_id -> List[Connection]
+        self.active_connections: Dict[int, List[Connection]] = {}
+        self._connections: Dict[WebSocket, Connection] = {}
+        self._reaper: Optional[asyncio.Task] = None
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.failed = 0
+        self.reaped = 0
+
+    def start(self) -> None:
+        """启动 ping 与空闲连接清理任务"""
+        if self._reaper is None:
+            self._reaper = asyncio.create_task(self._run_reaper())
+
+    async def stop(self) -> None:
+        """停止后台任务并关闭所有连接（应用关闭时调用）"""
+        if self._reaper is not None:
+            self._reaper.cancel()
+            try:
+                await self._reaper
+            except asyncio.CancelledError:
+                pass
+            self._reaper = None
+        for connection in list(self._connections.values()):
+            await self.close(connection, code=1001)
+
+    async def connect(self, websocket: WebSocket, user_id: int, token: Optional[str] = None) -> Connection:
         """处理新连接"""
         await websocket.accept()
-        if user_id not in self.active_connections:
-            self.active_connections[user_id] = []
-        self.active_connections[user_id].append(websocket)
-    
+        connection = Connection(websocket, user_id, self, token)
+        self._connections[websocket] = connection
+        self.active_connections.setdefault(user_id, []).append(connection)
+        return connection
+
     def disconnect(self, websocket: WebSocket, user_id: int):
         """处理断开连接"""
-        if user_id in self.active_connections:
-            if websocket in self.active_connections[user_id]:
-                self.active_connections[user_id].remove(websocket)
-            if not self.active_connections[user_id]:
+        connection = self._connections.pop(websocket, None)
+        if connection is None:
+            return
+        connection.stop()
+        connections = self.active_connections.get(user_id)
+        if connections is not None:
+            if connection in connections:
+                connections.remove(connection)
+            if not connections:
                 del self.active_connections[user_id]
-    
-    async def broadcast_to_user(self, user_id: int, message: Dict[str, Any]):
-        """向指定用户的所有连接广播消息"""
-        if user_id in self.active_connections:
-            for connection in self.active_connections[user_id][:]:
-                try:
-                    await connection.send_json(message)
-                except Exception:
-                    self.disconnect(connection, user_id)
+
+    async def close(self, connection: Connection, code: int = 1000) -> None:
+        """主动关闭连接（发送失败、空闲超时或应用关闭）"""
+        self.disconnect(connection.websocket, connection.user_id)
+        try:
+            await asyncio.wait_for(connection.websocket.close(code=code), timeout=SEND_TIMEOUT)
+        except Exception:
+            pass
+
+    def user_connections(self, user_id: Optional[int] = None) -> List[Connection]:
+        """指定用户的连接；user_id 为空时返回全部连接"""
+        if user_id is None:
+            return list(self._connections.values())
+        return list(self.active_connections.get(user_id, ()))
+
+    def touch(self, websocket: WebSocket) -> None:
+        """记录收到客户端消息"""
+        connection = self._connections.get(websocket)
+        if connection is not None:
+            connection.last_seen = time.monotonic()
+
+    def send(self, websocket: WebSocket, message: Any) -> None:
+        """向单个连接发送消息（经发送队列，与广播消息不会并发写同一连接）"""
+        connection = self._connections.get(websocket)
+        if connection is not None:
+            connection.enqueue(message)
+
+    async def broadcast_to_user(self, user_id: int, message: Dict[str, Any], exclude: Optional[WebSocket] = None):
+        """向指定用户的所有连接广播消息（exclude 为发送方连接时不回推给自己）"""
+        self._deliver_to_user(user_id, message, exclude)
+        backplane.publish("ws.user", {"user_id": user_id, "message": message})
 
     async def broadcast(self, message: Dict[str, Any]):
         """广播消息给所有连接（仅用于系统通知）"""
-        for user_id, connections in self.active_connections.items():
-            for connection in connections[:]:
-                try:
-                    await connection.send_json(message)
-                except Exception:
-                    self.disconnect(connection, user_id)
+        self._deliver_all(message)
+        backplane.publish("ws.all", {"message": message})
+
+    def _deliver_to_user(self, user_id: int, message: Dict[str, Any], exclude: Optional[WebSocket] = None) -> None:
+        for connection in self.active_connections.get(user_id, ()):
+            if connection.websocket is not exclude:
+                connection.enqueue(message)
+
+    def _deliver_all(self, message: Dict[str, Any]) -> None:
+        for connection in self._connections.values():
+            connection.enqueue(message)
+
+    async def _run_reaper(self) -> None:
+        while True:
+            await asyncio.sleep(PING_INTERVAL)
+            now = time.monotonic()
+            for connection in list(self._connections.values()):
+                if now - connection.last_seen > IDLE_TIMEOUT:
+                    self.reaped += 1
+                    await self.close(connection, code=1001)
+                else:
+                    connection.enqueue({"type": "ping"})
+
+    def stats(self) -> dict:
+        depths = [len(connection.queue) for connection in self._connections.values()]
+        return {
+            "connections": len(depths),
+            "users": len(self.active_connections),
+            "queued": sum(depths),
+            "max_queue_depth": max(depths, default=0),
+            "sent": self.sent,
+            "dropped": self.dropped,
+            "coalesced": self.coalesced,
+            "failed": self.failed,
+            "reaped": self.reaped,
+        }
 
 # 全局单例
 manager = ConnectionManager()
+
+
+
+@backplane.subscribe_to("ws.user")
+def _on_remote_user_message(data: dict) -> None:
+    manager._deliver_to_user(data["user_id"], data["message"])
+
+
+@backplane.subscribe_to("ws.all")
+def _on_remote_broadcast(data: dict) -> None:
+    manager._deliver_all(data["message"])
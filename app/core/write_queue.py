@@ -0,0 +1,158 @@
+"""
+单写入者队列
+SQLite 同一时刻只允许一个写事务，大量并发的小写事务会互相等待写锁（甚至 database is locked）。
+写操作提交到队列后由一个后台任务串行执行，并把排队中的多个操作合并到同一事务中一次提交。
+
+- 操作形如 async def op(db: AsyncSession) -> T，只修改会话、不自行 commit
+- 合并事务失败时逐个重试，出错的操作单独收到异常，不影响同批其他操作
+- 未启动（PostgreSQL，或脚本、测试中）时直接使用独立会话执行并提交
+- 扫描等大批量写入仍使用自己的会话，依靠 busy_timeout 与队列交替获得写锁
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional, Tuple, TypeVar
+
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker
+
+from app.config import settings
+from app.utils.logger import log
+
+T = TypeVar("T")
+WriteOperation = Callable[[AsyncSession], Awaitable[Any]]
+
+
+class WriteQueue:
+    """单写入者队列"""
+
+    def __init__(self, session_factory: Optional[async_sessionmaker] = None):
+        # 默认使用应用的写会话工厂（基准测试等场景可传入其他引擎的会话工厂）
+        self._session_factory = session_factory
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.submitted = 0
+        self.transactions = 0
+        self.committed = 0
+        self.retried = 0
+        self.failed = 0
+        self.max_batch = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None
+
+    def start(self) -> None:
+        """启动写入任务"""
+        if self._task is None:
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """执行完队列中剩余的写操作后停止（应用关闭时调用）"""
+        if self._task is None:
+            return
+        queue = self._queue
+        await queue.put(None)
+        await self._task
+        self._task = None
+        self._queue = None
+        # 停止信号之后才入队的操作
+        while not queue.empty():
+            item = queue.get_nowait()
+            if item is not None:
+                await self._execute_single(*item)
+
+    async def submit(self, operation: Callable[[AsyncSession], Awaitable[T]]) -> T:
+        """提交写操作并等待其所在事务提交，返回操作的返回值"""
+        self.submitted += 1
+        if self._task is None:
+            return await self._execute_alone(operation)
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((operation, future))
+        return await future
+
+    def _new_session(self) -> AsyncSession:
+        if self._session_factory is None:
+            from app.database import AsyncSessionLocal
+            self._session_factory = AsyncSessionLocal
+        return self._session_factory()
+
+    async def _execute_alone(self, operation: WriteOperation) -> Any:
+        async with self._new_session() as db:
+            result = await operation(db)
+            await db.commit()
+        self.transactions += 1
+        self.committed += 1
+        return result
+
+    async def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            item = await self._queue.get()
+            if item is None:
+                break
+            batch: List[Tuple[WriteOperation, asyncio.Future]] = [item]
+            while len(batch) < settings.database.write_batch_size and not self._queue.empty():
+                item = self._queue.get_nowait()
+                if item is None:
+                    stopping = True
+                    break
+                batch.append(item)
+            # 等待方已取消的操作不再执行
+            batch = [(operation, future) for operation, future in batch if not future.done()]
+            if batch:
+                await self._execute_batch(batch)
+
+    async def _execute_batch(self, batch: List[Tuple[WriteOperation, asyncio.Future]]) -> None:
+        self.max_batch = max(self.max_batch, len(batch))
+        results = []
+        try:
+            async with self._new_session() as db:
+                for operation, _ in batch:
+                    results.append(await operation(db))
+                await db.commit()
+        except Exception as e:
+            if len(batch) > 1:
+                log.debug(f"合并写入失败，逐个重试 {len(batch)} 个操作: {e}")
+                self.retried += len(batch)
+                for operation, future in batch:
+                    await self._execute_single(operation, future)
+            else:
+                self.failed += 1
+                self._set_exception(batch[0][1], e)
+            return
+
+        self.transactions += 1
+        self.committed += len(batch)
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
+
+    async def _execute_single(self, operation: WriteOperation, future: asyncio.Future) -> None:
+        try:
+            result = await self._execute_alone(operation)
+        except Exception as e:
+            self.failed += 1
+            self._set_exception(future, e)
+            return
+        if not future.done():
+            future.set_result(result)
+
+    @staticmethod
+    def _set_exception(future: asyncio.Future, error: Exception) -> None:
+        if not future.done():
+            future.set_exception(error)
+
+    def stats(self) -> dict:
+        return {
+            "running": self.running,
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "submitted": self.submitted,
+            "transactions": self.transactions,
+            "committed": self.committed,
+            "retried": self.retried,
+            "failed": self.failed,
+            "max_batch": self.max_batch,
+        }
+
+
+# 全局单例
+write_queue = WriteQueue()
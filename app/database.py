@@ -1,20 +1,111 @@
 """
 数据库连接和会话管理
+
+SQLite 文件数据库：
+- 每个新连接执行一组调优 PRAGMA（WAL、busy_timeout、页缓存、内存映射等，可在配置中覆盖）
+- 读写分离：只读请求使用独立的只读连接池（query_only），不占用写连接
+- 小型写事务经 app.core.write_queue 的单写入者串行执行并合并提交
+
+PostgreSQL（asyncpg）：
+- 连接池大小、回收时间与预编译语句缓存可在配置中调整
+- 读写共用一个连接池，写事务直接并发执行
 """
-from typing import AsyncGenerator
+from typing import Any, AsyncGenerator, Dict, Optional
 
-from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine, async_sessionmaker
+from sqlalchemy import event
+from sqlalchemy.engine import URL, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine, async_sessionmaker
 from sqlalchemy.orm import declarative_base
 
 from app.config import settings
 
+# SQLite 默认连接参数（PRAGMA <name> = <value>）
+DEFAULT_SQLITE_PRAGMAS: Dict[str, Any] = {
+    "journal_mode": "WAL",  # 读写互不阻塞
+    "synchronous": "NORMAL",  # WAL 模式下仅在 checkpoint 时 fsync
+    "busy_timeout": 10000,  # 写锁被占用时等待（毫秒），而不是立即报 database is locked
+    "cache_size": -65536,  # 页缓存 64MB（负数单位为 KB）
+    "mmap_size": 268435456,  # 内存映射 256MB
+    "temp_store": "MEMORY",
+}
+
+
+def sqlite_pragmas() -> Dict[str, Any]:
+    """默认参数合并配置覆盖项（值为 None 的项不设置）"""
+    pragmas = {**DEFAULT_SQLITE_PRAGMAS, **settings.database.sqlite_pragmas}
+    return {name: value for name, value in pragmas.items() if value is not None}
+
+
+def apply_sqlite_pragmas(engine: AsyncEngine, read_only: bool = False) -> None:
+    """注册连接事件：新连接建立时执行调优 PRAGMA；read_only 时禁止写入"""
+    pragmas = sqlite_pragmas()
+    if read_only:
+        pragmas["query_only"] = "ON"
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name} = {value}")
+        finally:
+            cursor.close()
+
+
+def database_url(url: Optional[str] = None) -> URL:
+    """数据库 URL，默认取配置（postgres:// 与未指定驱动的 postgresql:// 使用 asyncpg）"""
+    url = make_url(url or settings.database.url)
+    if url.drivername in ("postgres", "postgresql"):
+        url = url.set(drivername="postgresql+asyncpg")
+    return url
+
+
+def _is_sqlite_file(url: URL) -> bool:
+    return url.get_backend_name() == "sqlite" and url.database not in (None, "", ":memory:")
+
+
+def _engine_options(url: URL) -> Dict[str, Any]:
+    if url.get_backend_name() != "postgresql":
+        return {}
+    config = settings.database
+    return {
+        "pool_size": config.pool_size,
+        "max_overflow": config.max_overflow,
+        "pool_timeout": config.pool_timeout,
+        "pool_recycle": config.pool_recycle,
+        "pool_pre_ping": True,
+        "connect_args": {
+            # SQLAlchemy 层的预编译语句缓存与 asyncpg 自身的语句缓存
+            "prepared_statement_cache_size": config.statement_cache_size,
+            "statement_cache_size": config.statement_cache_size,
+            "server_settings": {"application_name": "sooklib"},
+        },
+    }
+
+
+_url = database_url()
+
 # 创建异步引擎
 engine = create_async_engine(
-    settings.database.url,
+    _url,
     echo=False,
     future=True,
+    **_engine_options(_url),
 )
 
+# 只读引擎（SQLite 文件数据库使用独立连接池，其他情况与写引擎相同）
+if _is_sqlite_file(_url):
+    apply_sqlite_pragmas(engine)
+    read_engine = create_async_engine(
+        _url,
+        echo=False,
+        future=True,
+        pool_size=settings.database.read_pool_size,
+    )
+    apply_sqlite_pragmas(read_engine, read_only=True)
+else:
+    read_engine = engine
+
 # 创建会话工厂
 AsyncSessionLocal = async_sessionmaker(
     engine,
@@ -22,6 +113,13 @@ AsyncSessionLocal = async_sessionmaker(
     expire_on_commit=False,
 )
 
+# 只读会话工厂
+ReadSessionLocal = async_sessionmaker(
+    read_engine,
+    class_=AsyncSession,
+    expire_on_commit=False,
+)
+
 # 声明基类
 Base = declarative_base()
 
@@ -38,10 +136,36 @@ async def get_db() -> AsyncGenerator[AsyncSession, None]:
             await session.close()
 
 
+async def get_read_db() -> AsyncGenerator[AsyncSession, None]:
+    """
+    获取只读数据库会话（只读连接池，不能写入）
+    用于只查询数据的接口
+    """
+    async with ReadSessionLocal() as session:
+        try:
+            yield session
+        finally:
+            await session.close()
+
+
+async def dispose_engines() -> None:
+    """关闭全部连接（恢复数据库文件前调用）"""
+    await engine.dispose()
+    if read_engine is not engine:
+        await read_engine.dispose()
+
+
 async def init_db():
-    """初始化数据库，创建所有表"""
+    """初始化数据库，创建所有表、全文检索索引、主版本同步与书库统计触发器"""
+    from app.core.library_stats import install_library_stats_triggers
+    from app.core.primary_version import install_primary_version_triggers
+    from app.core.search_index import install_search_index
+
     async with engine.begin() as conn:
         await conn.run_sync(Base.metadata.create_all)
+        await conn.run_sync(install_search_index)
+        await conn.run_sync(install_primary_version_triggers)
+        await conn.run_sync(install_library_stats_triggers)
 
 
 # 别名，保持兼容性
@@ -1,16 +1,32 @@
 """
 数据库模型定义
 """
-from datetime import datetime
+from datetime import datetime, timezone
 from typing import Optional
 
-from sqlalchemy import Boolean, Column, DateTime, Float, ForeignKey, Integer, String, Text, UniqueConstraint
+from sqlalchemy import BigInteger, Boolean, Column, DateTime, Float, ForeignKey, Index, Integer, String, Text, UniqueConstraint, text
+from sqlalchemy.types import TypeDecorator
 from sqlalchemy.orm import relationship
 from sqlalchemy.ext.associationproxy import association_proxy
 
 from app.database import Base
 
 
+class UTCDateTime(TypeDecorator):
+    """
+    无时区的 UTC 时间列
+    写入带时区的时间时先转换为 UTC 再去掉时区：与 SQLite 的存储结果一致，
+    PostgreSQL（asyncpg）的 timestamp 列不接受带时区的值
+    """
+    impl = DateTime
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if isinstance(value, datetime) and value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        return value
+
+
 class User(Base):
     """用户表"""
     __tablename__ = "users"
@@ -19,7 +35,8 @@ class User(Base):
     username = Column(String(50), unique=True, nullable=False, index=True)
     password_hash = Column(String(255), nullable=False)
     is_admin = Column(Boolean, default=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(UTCDateTime, default=datetime.utcnow)
+    token_version = Column(Integer, nullable=False, default=0, server_default="0")  # 修改密码时递增，使已签发的 Token 失效
     
     # Telegram 集成
     telegram_id = Column(String(20), unique=True, nullable=True, index=True)  # Telegram 用户 ID
@@ -50,8 +67,8 @@ class Library(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(100), nullable=False)
     path = Column(String(500), unique=True, nullable=True)  # 改为可空，向后兼容
-    created_at = Column(DateTime, default=datetime.utcnow)
-    last_scan = Column(DateTime, nullable=True)
+    created_at = Column(UTCDateTime, default=datetime.utcnow)
+    last_scan = Column(UTCDateTime, nullable=True)
     
     # 访问控制
     is_public = Column(Boolean, default=False)  # 是否为公共书库（所有用户可见）
@@ -76,7 +93,7 @@ class LibraryPath(Base):
     library_id = Column(Integer, ForeignKey("libraries.id", ondelete="CASCADE"), nullable=False)
     path = Column(String(500), nullable=False)
     enabled = Column(Boolean, default=True)  # 是否启用
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(UTCDateTime, default=datetime.utcnow)
 
     # 关系
     library = relationship("Library", back_populates="paths")
@@ -89,7 +106,7 @@ class LibraryTag(Base):
     id = Column(Integer, primary_key=True, index=True)
     library_id = Column(Integer, ForeignKey("libraries.id", ondelete="CASCADE"), nullable=False)
     tag_id = Column(Integer, ForeignKey("tags.id", ondelete="CASCADE"), nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(UTCDateTime, default=datetime.utcnow)
 
     # 关系
     library = relationship("Library", back_populates="library_tags")
@@ -115,14 +132,65 @@ class ScanTask(Base):
     skipped_books = Column(Integer, default=0)
     error_count = Column(Integer, default=0)
     error_message = Column(Text, nullable=True)
-    started_at = Column(DateTime, nullable=True)
-    completed_at = Column(DateTime, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    started_at = Column(UTCDateTime, nullable=True)
+    completed_at = Column(UTCDateTime, nullable=True)
+    created_at = Column(UTCDateTime, default=datetime.utcnow, index=True)
 
     # 关系
     library = relationship("Library", back_populates="scan_tasks")
 
 
+class LibraryStats(Base):
+    """书库统计（物化汇总，由触发器在书籍/版本增删改时增量维护，定期全量校正，见 app.core.library_stats）"""
+    __tablename__ = "library_stats"
+
+    library_id = Column(Integer, ForeignKey("libraries.id", ondelete="CASCADE"), primary_key=True)
+    book_count = Column(Integer, nullable=False, default=0, server_default="0")
+    author_count = Column(Integer, nullable=False, default=0, server_default="0")  # 不同作者数
+    group_count = Column(Integer, nullable=False, default=0, server_default="0")  # 不同书籍组数
+    version_count = Column(Integer, nullable=False, default=0, server_default="0")
+    cover_count = Column(Integer, nullable=False, default=0, server_default="0")  # 有封面的书籍数
+    total_size = Column(BigInteger, nullable=False, default=0, server_default="0")  # 全部版本文件大小
+    primary_size = Column(BigInteger, nullable=False, default=0, server_default="0")  # 主版本文件大小
+    reconciled_at = Column(UTCDateTime, nullable=True)  # 最近一次全量校正时间
+
+
+class LibraryStatsAuthor(Base):
+    """书库内各作者的书籍数（作者去重计数的引用计数）"""
+    __tablename__ = "library_stat_authors"
+
+    library_id = Column(Integer, primary_key=True)
+    author_id = Column(Integer, primary_key=True)
+    book_count = Column(Integer, nullable=False, default=0)
+
+
+class LibraryStatsGroup(Base):
+    """书库内各书籍组的书籍数（书籍组去重计数的引用计数）"""
+    __tablename__ = "library_stat_groups"
+
+    library_id = Column(Integer, primary_key=True)
+    group_id = Column(Integer, primary_key=True)
+    book_count = Column(Integer, nullable=False, default=0)
+
+
+class LibraryStatsFormat(Base):
+    """书库内各格式的版本数"""
+    __tablename__ = "library_stat_formats"
+
+    library_id = Column(Integer, primary_key=True)
+    file_format = Column(String(20), primary_key=True)
+    version_count = Column(Integer, nullable=False, default=0)
+
+
+class LibraryStatsDaily(Base):
+    """书库每日新增书籍数（按 added_at 的 UTC 日期）"""
+    __tablename__ = "library_stat_daily"
+
+    library_id = Column(Integer, primary_key=True)
+    day = Column(String(10), primary_key=True)  # YYYY-MM-DD
+    book_count = Column(Integer, nullable=False, default=0)
+
+
 class LibraryPermission(Base):
     """用户书库访问权限"""
     __tablename__ = "library_permissions"
@@ -130,7 +198,7 @@ class LibraryPermission(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     library_id = Column(Integer, ForeignKey("libraries.id"), nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(UTCDateTime, default=datetime.utcnow)
 
     # 关系
     user = relationship("User", back_populates="library_permissions")
@@ -172,7 +240,12 @@ class Book(Base):
     age_rating = Column(String(20), default='general')  # 'general', 'teen', 'adult'
     content_warning = Column(Text, nullable=True)  # 内容警告说明
     
-    added_at = Column(DateTime, default=datetime.utcnow, index=True)
+    added_at = Column(UTCDateTime, nullable=False, default=datetime.utcnow, index=True)
+    
+    # 主版本文件信息（冗余字段，由 book_versions 触发器维护，见 app.core.primary_version）
+    file_size = Column(BigInteger, nullable=False, default=0, server_default="0", index=True)
+    file_format = Column(String(20), nullable=False, default="", server_default="", index=True)
+    file_hash = Column(String(64), nullable=True, index=True)
     
     # 书籍组（关联重复书籍）
     group_id = Column(Integer, ForeignKey("book_groups.id", ondelete="SET NULL"), nullable=True, index=True)
@@ -202,8 +275,8 @@ class BookTranslation(Base):
     language = Column(String(10), nullable=False, index=True)  # 例如 zh-CN/en/ja
     title = Column(String(200), nullable=True)
     description = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(UTCDateTime, default=datetime.utcnow)
+    updated_at = Column(UTCDateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     book = relationship("Book", back_populates="translations")
 
@@ -223,7 +296,7 @@ class BookVersion(Base):
     file_path = Column(String(1000), unique=True, nullable=False)
     file_name = Column(String(255), nullable=False)
     file_format = Column(String(20), nullable=False, index=True)
-    file_size = Column(Integer, nullable=False)
+    file_size = Column(BigInteger, nullable=False)
     file_hash = Column(String(64), unique=True, nullable=False, index=True)
     
     # 版本属性
@@ -231,7 +304,7 @@ class BookVersion(Base):
     source = Column(String(100), nullable=True)  # 来源说明
     is_primary = Column(Boolean, default=False)  # 是否为主版本
     
-    added_at = Column(DateTime, default=datetime.utcnow)
+    added_at = Column(UTCDateTime, default=datetime.utcnow)
 
     # 关系
     book = relationship("Book", back_populates="versions")
@@ -245,7 +318,7 @@ class Tag(Base):
     name = Column(String(50), unique=True, nullable=False, index=True)
     type = Column(String(20), nullable=False)  # 'genre', 'age_rating', 'custom'
     description = Column(String(200), nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(UTCDateTime, default=datetime.utcnow)
 
     # 关系
     book_tags = relationship("BookTag", back_populates="tag", cascade="all, delete-orphan")
@@ -259,7 +332,7 @@ class BookTag(Base):
     id = Column(Integer, primary_key=True, index=True)
     book_id = Column(Integer, ForeignKey("books.id"), nullable=False)
     tag_id = Column(Integer, ForeignKey("tags.id"), nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(UTCDateTime, default=datetime.utcnow)
 
     # 关系
     book = relationship("Book", back_populates="book_tags")
@@ -278,7 +351,7 @@ class Favorite(Base):
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     book_id = Column(Integer, ForeignKey("books.id"), nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(UTCDateTime, default=datetime.utcnow)
 
     # 关系
     user = relationship("User", back_populates="favorites")
@@ -299,8 +372,8 @@ class BookReview(Base):
     book_id = Column(Integer, ForeignKey("books.id", ondelete="CASCADE"), nullable=False, index=True)
     rating = Column(Integer, nullable=False)  # 1-5 星
     content = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow, index=True)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(UTCDateTime, default=datetime.utcnow, index=True)
+    updated_at = Column(UTCDateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     # 关系
     user = relationship("User", back_populates="book_reviews")
@@ -319,7 +392,7 @@ class UserBookTag(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     book_id = Column(Integer, ForeignKey("books.id"), nullable=False)
     tag_name = Column(String(50), nullable=False, index=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(UTCDateTime, default=datetime.utcnow)
 
     # 关系
     user = relationship("User", back_populates="user_book_tags")
@@ -336,7 +409,7 @@ class ReadingProgress(Base):
     
     progress = Column(Float, default=0.0)  # 进度百分比 0.0-1.0
     position = Column(Text, nullable=True)  # 具体位置 (cfi for epub, line for txt)
-    last_read_at = Column(DateTime, default=datetime.utcnow)
+    last_read_at = Column(UTCDateTime, default=datetime.utcnow)
     finished = Column(Boolean, default=False)
 
     # 关系
@@ -356,7 +429,7 @@ class BookGroup(Base):
     id = Column(Integer, primary_key=True, index=True)
     name = Column(String(200), nullable=True)  # 组名称（可选，默认使用主书籍标题）
     primary_book_id = Column(Integer, nullable=True)  # 主书籍ID（用于显示封面、标题等）
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(UTCDateTime, default=datetime.utcnow)
 
     # 关系
     books = relationship("Book", back_populates="group", foreign_keys="Book.group_id")
@@ -376,8 +449,8 @@ class Bookmark(Base):
     note = Column(Text, nullable=True)  # 用户备注
     
     # 元数据
-    created_at = Column(DateTime, default=datetime.utcnow, index=True)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(UTCDateTime, default=datetime.utcnow, index=True)
+    updated_at = Column(UTCDateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # 关系
     user = relationship("User", backref="bookmarks")
@@ -407,8 +480,8 @@ class Annotation(Base):
     color = Column(String(20), default='yellow')  # 'yellow', 'green', 'blue', 'red', 'purple'
     
     # 元数据
-    created_at = Column(DateTime, default=datetime.utcnow, index=True)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(UTCDateTime, default=datetime.utcnow, index=True)
+    updated_at = Column(UTCDateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # 关系
     user = relationship("User", backref="annotations")
@@ -421,6 +494,10 @@ class Annotation(Base):
     )
 
 
+# 会话尚有时长未计入阅读统计汇总（与 app.core.reading_stats 的查询条件一致，才能使用部分索引）
+READING_SESSION_PENDING = "counted_seconds IS NULL OR counted_seconds <> coalesce(duration_seconds, 0)"
+
+
 class ReadingSession(Base):
     """阅读会话（用于统计阅读时长）"""
     __tablename__ = "reading_sessions"
@@ -430,9 +507,11 @@ class ReadingSession(Base):
     book_id = Column(Integer, ForeignKey("books.id", ondelete="CASCADE"), nullable=False, index=True)
     
     # 会话时间
-    start_time = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
-    end_time = Column(DateTime, nullable=True)
+    start_time = Column(UTCDateTime, default=datetime.utcnow, nullable=False, index=True)
+    end_time = Column(UTCDateTime, nullable=True)
     duration_seconds = Column(Integer, default=0)  # 阅读时长（秒）
+    # 已计入阅读统计汇总的时长（秒），为空表示会话尚未计入（见 app.core.reading_stats）
+    counted_seconds = Column(Integer, nullable=True)
     
     # 阅读进度
     progress = Column(Float, nullable=True)  # 0.0 - 1.0
@@ -441,12 +520,55 @@ class ReadingSession(Base):
     ip_address = Column(String(45), nullable=True)
     device_info = Column(String(255), nullable=True)
     
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(UTCDateTime, default=datetime.utcnow)
     
     # 关系
     user = relationship("User", backref="reading_sessions")
     book = relationship("Book", backref="reading_sessions")
 
+    __table_args__ = (
+        Index("ix_reading_sessions_user_start", "user_id", "start_time"),
+        # 尚未完全计入阅读统计汇总的会话（部分覆盖索引，通常只有进行中的少量会话）
+        Index(
+            "ix_reading_sessions_pending",
+            "user_id", "book_id", "start_time", "duration_seconds", "counted_seconds",
+            sqlite_where=text(READING_SESSION_PENDING),
+            postgresql_where=text(READING_SESSION_PENDING),
+        ),
+    )
+
+
+class ReadingStatsDaily(Base):
+    """用户每日阅读汇总（按会话开始时间的 UTC 日期）"""
+    __tablename__ = "reading_stats_daily"
+
+    user_id = Column(Integer, primary_key=True)
+    day = Column(String(10), primary_key=True)  # YYYY-MM-DD
+    duration_seconds = Column(Integer, nullable=False, default=0)
+    session_count = Column(Integer, nullable=False, default=0)
+
+
+class ReadingStatsHourly(Base):
+    """用户每日分小时阅读汇总（按会话开始时间，超过保留期的行由夜间压缩删除）"""
+    __tablename__ = "reading_stats_hourly"
+
+    user_id = Column(Integer, primary_key=True)
+    day = Column(String(10), primary_key=True)
+    hour = Column(Integer, primary_key=True)  # 0-23
+    duration_seconds = Column(Integer, nullable=False, default=0)
+    session_count = Column(Integer, nullable=False, default=0)
+
+
+class ReadingStatsBook(Base):
+    """用户各书籍累计阅读汇总"""
+    __tablename__ = "reading_stats_books"
+
+    user_id = Column(Integer, primary_key=True)
+    book_id = Column(Integer, primary_key=True, index=True)
+    duration_seconds = Column(Integer, nullable=False, default=0)
+    session_count = Column(Integer, nullable=False, default=0)
+    last_read_at = Column(UTCDateTime, nullable=True)  # 最近一次会话的开始时间
+
 
 class FilenamePattern(Base):
     """文件名解析规则"""
@@ -476,8 +598,8 @@ class FilenamePattern(Base):
     
     # 创建方式
     created_by = Column(String(20), default='manual')  # manual, auto, ai
-    created_at = Column(DateTime, default=datetime.utcnow, index=True)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(UTCDateTime, default=datetime.utcnow, index=True)
+    updated_at = Column(UTCDateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # 示例
     example_filename = Column(String(500), nullable=True)  # 示例文件名
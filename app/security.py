@@ -2,6 +2,7 @@
 安全认证模块
 处理密码哈希、JWT Token生成和验证
 """
+import asyncio
 from datetime import datetime, timedelta
 from typing import Optional
 
@@ -52,6 +53,11 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     return bcrypt.checkpw(password_bytes, hashed_bytes)
 
 
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """在线程池中验证密码，避免 bcrypt 阻塞事件循环"""
+    return await asyncio.to_thread(verify_password, plain_password, hashed_password)
+
+
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     """
     创建JWT访问令牌
@@ -0,0 +1,230 @@
+"""
+认证用户缓存
+按（用户名, Token 版本）缓存用户列值，认证请求直接返回分离的只读用户快照，跳过用户表查询；
+OPDS Basic Auth 另按（用户名, 密码）的 HMAC 缓存已验证的凭据，跳过 bcrypt。
+失效操作经 backplane 同步到其他 worker
+"""
+import hashlib
+import hmac
+import secrets
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import make_transient_to_detached
+
+from app.config import settings
+from app.core.backplane import backplane
+from app.models import User
+from app.utils.logger import log
+
+# 缓存条目上限（按最近使用淘汰）
+AUTH_USER_CACHE_MAX_ENTRIES = 10000
+
+# 失效回调，参数为 (username, user_id)，两者均为空表示全部失效
+InvalidationListener = Callable[[Optional[str], Optional[int]], Any]
+_invalidation_listeners: List[InvalidationListener] = []
+
+
+def snapshot_user(values: Dict[str, Any]) -> User:
+    """
+    根据列值构建分离状态的用户对象
+
+    快照不属于任何会话：可读取列属性，关系属性不可访问；
+    需要修改用户时应在当前会话中重新加载（见 get_current_user_for_update）
+    """
+    user = User(**values)
+    make_transient_to_detached(user)
+    return user
+
+
+def user_column_values(user: User) -> Dict[str, Any]:
+    """提取用户表全部列值"""
+    return {column.key: getattr(user, column.key) for column in User.__table__.columns}
+
+
+class AuthUserCache:
+    """认证用户缓存（进程内，带 TTL）"""
+
+    def __init__(self, ttl: int, max_entries: int = AUTH_USER_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # username -> (过期时间, token_version, 列值)
+        self._entries: "OrderedDict[str, Tuple[float, int, Dict[str, Any]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def get(self, username: str, token_version: int) -> Optional[User]:
+        """命中时返回新的用户快照；过期或版本不一致视为未命中"""
+        entry = self._entries.get(username)
+        if entry is not None:
+            expires_at, cached_version, values = entry
+            if expires_at > time.monotonic() and cached_version == token_version:
+                self._entries.move_to_end(username)
+                self.hits += 1
+                return snapshot_user(values)
+            self._entries.pop(username, None)
+        self.misses += 1
+        return None
+
+    def put(self, user: User) -> User:
+        """缓存用户并返回其快照"""
+        values = user_column_values(user)
+        if self.ttl > 0:
+            self._entries[user.username] = (
+                time.monotonic() + self.ttl,
+                values.get("token_version") or 0,
+                values,
+            )
+            self._entries.move_to_end(user.username)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return snapshot_user(values)
+
+    def invalidate(self, username: Optional[str] = None) -> None:
+        """失效指定用户名的缓存；username 为空时清空"""
+        self.invalidations += 1
+        if username is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(username, None)
+
+    def invalidate_user_id(self, user_id: int) -> None:
+        """按用户 ID 失效（用户名已变更或未知时使用）"""
+        self.invalidations += 1
+        for username, (_, _, values) in list(self._entries.items()):
+            if values.get("id") == user_id:
+                self._entries.pop(username, None)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / total * 100, 2) if total else 0,
+        }
+
+
+class CredentialCache:
+    """
+    已验证凭据缓存（进程内，带 TTL）
+
+    键为进程随机密钥下（用户名, 密码）的 HMAC-SHA256，内存中不保留明文密码；
+    只缓存验证成功的凭据，失败的尝试每次都走 bcrypt
+    """
+
+    def __init__(self, ttl: int, max_entries: int = AUTH_USER_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._key = secrets.token_bytes(32)
+        # 凭据摘要 -> (过期时间, 列值)
+        self._entries: "OrderedDict[bytes, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    def _digest(self, username: str, password: str) -> bytes:
+        message = username.encode("utf-8") + b"\0" + password.encode("utf-8")
+        return hmac.new(self._key, message, hashlib.sha256).digest()
+
+    def get(self, username: str, password: str) -> Optional[User]:
+        """命中时返回新的用户快照"""
+        digest = self._digest(username, password)
+        entry = self._entries.get(digest)
+        if entry is not None:
+            expires_at, values = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(digest)
+                self.hits += 1
+                return snapshot_user(values)
+            self._entries.pop(digest, None)
+        self.misses += 1
+        return None
+
+    def put(self, username: str, password: str, user: User) -> User:
+        """缓存验证成功的凭据并返回用户快照"""
+        values = user_column_values(user)
+        if self.ttl > 0:
+            digest = self._digest(username, password)
+            self._entries[digest] = (time.monotonic() + self.ttl, values)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return snapshot_user(values)
+
+    def invalidate(self, username: Optional[str] = None) -> None:
+        """失效指定用户名的全部凭据；username 为空时清空"""
+        self.invalidations += 1
+        if username is None:
+            self._entries.clear()
+            return
+        for digest, (_, values) in list(self._entries.items()):
+            if values.get("username") == username:
+                self._entries.pop(digest, None)
+
+    def invalidate_user_id(self, user_id: int) -> None:
+        """按用户 ID 失效（用户名已变更或未知时使用）"""
+        self.invalidations += 1
+        for digest, (_, values) in list(self._entries.items()):
+            if values.get("id") == user_id:
+                self._entries.pop(digest, None)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / total * 100, 2) if total else 0,
+        }
+
+
+# 全局单例
+auth_user_cache = AuthUserCache(settings.security.user_cache_ttl)
+credential_cache = CredentialCache(settings.security.credential_cache_ttl)
+
+
+def on_invalidate(listener: InvalidationListener) -> InvalidationListener:
+    """注册失效回调（如重新校验长连接的 Token）；本进程与其他 worker 发起的失效都会触发"""
+    _invalidation_listeners.append(listener)
+    return listener
+
+
+def _notify_invalidated(username: Optional[str], user_id: Optional[int]) -> None:
+    for listener in _invalidation_listeners:
+        try:
+            listener(username, user_id)
+        except Exception as e:
+            log.error(f"认证缓存失效回调失败: {e}")
+
+
+def invalidate_user(username: Optional[str] = None, broadcast: bool = True) -> None:
+    """用户信息变更后失效其认证缓存与凭据缓存；username 为空时全部清空"""
+    auth_user_cache.invalidate(username)
+    credential_cache.invalidate(username)
+    _notify_invalidated(username, None)
+    if broadcast:
+        backplane.publish("auth.invalidate", {"username": username})
+
+
+def invalidate_user_id(user_id: int, broadcast: bool = True) -> None:
+    """按用户 ID 失效认证缓存与凭据缓存（用户名已变更时使用）"""
+    auth_user_cache.invalidate_user_id(user_id)
+    credential_cache.invalidate_user_id(user_id)
+    _notify_invalidated(None, user_id)
+    if broadcast:
+        backplane.publish("auth.invalidate", {"user_id": user_id})
+
+
+@backplane.subscribe_to("auth.invalidate")
+def _on_remote_invalidate(data: dict) -> None:
+    if data.get("user_id") is not None:
+        invalidate_user_id(data["user_id"], broadcast=False)
+    else:
+        invalidate_user(data.get("username"), broadcast=False)
@@ -2,9 +2,13 @@
 封面管理器
 统一的封面提取、缓存和生成管理
 """
+import asyncio
 import hashlib
+import threading
+import time
+from collections import OrderedDict
 from pathlib import Path
-from typing import Optional, Tuple
+from typing import List, Optional, Tuple
 from io import BytesIO
 
 from PIL import Image, ImageDraw, ImageFont
@@ -40,10 +44,108 @@ class CoverManager:
         ("#ff6e7f", "#bfe9ff"),  # 对比渐变
     ]
     
+    # 派生图尺寸别名 -> 派生尺寸列表（升序）中的下标
+    SIZE_ALIASES = {"small": 0, "thumbnail": 1, "medium": 1, "large": 2}
+    
+    # 派生图格式 -> (PIL 格式名, 扩展名, MIME)
+    DERIVATIVE_FORMATS = {
+        "webp": ("WEBP", "webp", "image/webp"),
+        "jpeg": ("JPEG", "jpg", "image/jpeg"),
+    }
+    
+    # 内容哈希内存缓存条目上限
+    DIGEST_CACHE_SIZE = 100_000
+    
+    # 书籍ID -> 封面路径映射的条目上限，以及"无封面/书籍不存在"结果的缓存时间（秒）
+    COVER_MAP_SIZE = 200_000
+    COVER_MAP_NEGATIVE_TTL = 60
+    
+    # 封面映射查询结果
+    COVER_FOUND = "found"
+    COVER_NONE = "none"
+    BOOK_MISSING = "missing"
+    
     def __init__(self):
         """初始化封面管理器"""
         self.cover_dir = Path(settings.directories.covers)
         self.cover_dir.mkdir(parents=True, exist_ok=True)
+        # 派生图按源封面内容哈希存放，相同封面只保存一份
+        self.derived_dir = self.cover_dir / "derived"
+        self.derivative_sizes: List[int] = sorted(set(settings.cover.derivative_sizes))
+        self._digests: "OrderedDict[str, Tuple[float, int, str]]" = OrderedDict()
+        self._digest_lock = threading.Lock()
+        # book_id -> (状态, 封面路径, 过期时间)，过期时间为 0 表示不过期
+        self._cover_map: "OrderedDict[int, Tuple[str, Optional[str], float]]" = OrderedDict()
+        self.cover_map_hits = 0
+        self.cover_map_misses = 0
+    
+    async def lookup_cover(
+        self,
+        book_id: int,
+        db: Optional[AsyncSession] = None
+    ) -> Tuple[str, Optional[Path]]:
+        """
+        通过内存映射查找书籍封面文件，命中时不访问数据库
+        
+        Args:
+            book_id: 书籍ID
+            db: 未命中时使用的数据库会话，为空则临时创建
+            
+        Returns:
+            (状态, 封面路径) 状态为 found/none/missing
+        """
+        entry = self._cover_map.get(book_id)
+        if entry and (not entry[2] or entry[2] > time.monotonic()):
+            status, path = entry[0], entry[1]
+            if status != self.COVER_FOUND or Path(path).exists():
+                self._cover_map.move_to_end(book_id)
+                self.cover_map_hits += 1
+                return status, Path(path) if path else None
+        
+        self.cover_map_misses += 1
+        if db is None:
+            from app.database import AsyncSessionLocal
+            async with AsyncSessionLocal() as session:
+                result = await session.execute(select(Book.id, Book.cover_path).where(Book.id == book_id))
+                row = result.first()
+        else:
+            result = await db.execute(select(Book.id, Book.cover_path).where(Book.id == book_id))
+            row = result.first()
+        
+        if row is None:
+            status, path = self.BOOK_MISSING, None
+        elif row[1] and Path(row[1]).exists():
+            status, path = self.COVER_FOUND, row[1]
+        else:
+            status, path = self.COVER_NONE, None
+        
+        expires = 0 if status == self.COVER_FOUND else time.monotonic() + self.COVER_MAP_NEGATIVE_TTL
+        self._cover_map[book_id] = (status, path, expires)
+        self._cover_map.move_to_end(book_id)
+        while len(self._cover_map) > self.COVER_MAP_SIZE:
+            self._cover_map.popitem(last=False)
+        return status, Path(path) if path else None
+    
+    def invalidate_cover(self, book_id: Optional[int] = None):
+        """
+        使封面映射失效（封面变更、书籍删除时调用）
+        
+        Args:
+            book_id: 书籍ID，为空时清空全部映射
+        """
+        if book_id is None:
+            self._cover_map.clear()
+        else:
+            self._cover_map.pop(book_id, None)
+    
+    def get_cover_map_stats(self) -> dict:
+        total = self.cover_map_hits + self.cover_map_misses
+        return {
+            "entries": len(self._cover_map),
+            "hits": self.cover_map_hits,
+            "misses": self.cover_map_misses,
+            "hit_rate": round(self.cover_map_hits / total * 100, 2) if total else 0,
+        }
     
     async def get_cover_path(
         self, 
@@ -57,28 +159,23 @@ class CoverManager:
         Args:
             book_id: 书籍ID
             db: 数据库会话
-            size: 尺寸（original/thumbnail）
+            size: 尺寸（original/thumbnail/small/medium/large 或像素宽度）
             
         Returns:
             封面路径，如果不存在返回None
         """
         try:
-            # 查询书籍
-            result = await db.execute(
-                select(Book).where(Book.id == book_id)
-            )
-            book = result.scalar_one_or_none()
-            
-            if not book or not book.cover_path:
-                return None
-            
-            cover_path = Path(book.cover_path)
-            if not cover_path.exists():
+            status, cover_path = await self.lookup_cover(book_id, db)
+            if status != self.COVER_FOUND:
                 return None
             
-            # 如果需要缩略图，生成或返回缩略图路径
-            if size == "thumbnail":
-                return await self._get_thumbnail_path(cover_path)
+            # 如果需要缩略图，返回对应尺寸的 JPEG 派生图
+            if size != "original":
+                width = self.resolve_size(size)
+                if width:
+                    derivative = await self.get_derivative(cover_path, width, "jpeg")
+                    if derivative:
+                        return str(derivative[0])
             
             return str(cover_path)
             
@@ -86,34 +183,119 @@ class CoverManager:
             log.error(f"获取封面路径失败: book_id={book_id}, 错误: {e}")
             return None
     
-    async def _get_thumbnail_path(self, original_path: Path) -> str:
+    def resolve_size(self, size: str) -> Optional[int]:
         """
-        获取或生成缩略图
+        将尺寸参数解析为派生图宽度
         
         Args:
-            original_path: 原始封面路径
+            size: 别名（small/thumbnail/medium/large）或像素宽度
             
         Returns:
-            缩略图路径
+            派生尺寸列表中的宽度；original 或无法解析时返回None
         """
-        try:
-            # 缩略图保存路径
-            thumb_path = original_path.parent / f"thumb_{original_path.name}"
+        if not self.derivative_sizes or size == "original":
+            return None
+        if size in self.SIZE_ALIASES:
+            index = min(self.SIZE_ALIASES[size], len(self.derivative_sizes) - 1)
+            return self.derivative_sizes[index]
+        if size.isdigit():
+            requested = int(size)
+            # 取不小于请求宽度的最小派生尺寸
+            for width in self.derivative_sizes:
+                if width >= requested:
+                    return width
+            return self.derivative_sizes[-1]
+        return None
+    
+    def content_digest(self, cover_path: Path) -> str:
+        """计算封面文件内容哈希（按 mtime/大小缓存）"""
+        stat = cover_path.stat()
+        key = str(cover_path)
+        with self._digest_lock:
+            cached = self._digests.get(key)
+            if cached and cached[0] == stat.st_mtime and cached[1] == stat.st_size:
+                self._digests.move_to_end(key)
+                return cached[2]
+        
+        digest = hashlib.sha256(cover_path.read_bytes()).hexdigest()
+        with self._digest_lock:
+            self._digests[key] = (stat.st_mtime, stat.st_size, digest)
+            while len(self._digests) > self.DIGEST_CACHE_SIZE:
+                self._digests.popitem(last=False)
+        return digest
+    
+    def derivative_path(self, digest: str, width: int, image_format: str) -> Path:
+        """派生图存储路径：derived/<哈希前两位>/<哈希>_<宽度>.<扩展名>"""
+        ext = self.DERIVATIVE_FORMATS[image_format][1]
+        return self.derived_dir / digest[:2] / f"{digest}_{width}.{ext}"
+    
+    def generate_derivatives(self, cover_path: Path) -> Optional[str]:
+        """
+        为封面生成全部尺寸的 WebP/JPEG 派生图（同步，适合在线程/进程池中调用）
+        
+        Args:
+            cover_path: 原始封面路径
             
-            # 如果缩略图已存在，直接返回
-            if thumb_path.exists():
-                return str(thumb_path)
+        Returns:
+            封面内容哈希，失败返回None
+        """
+        try:
+            digest = self.content_digest(cover_path)
+            missing = [
+                (width, image_format)
+                for width in self.derivative_sizes
+                for image_format in self.DERIVATIVE_FORMATS
+                if not self.derivative_path(digest, width, image_format).exists()
+            ]
+            if not missing:
+                return digest
             
-            # 生成缩略图
-            img = Image.open(original_path)
-            img.thumbnail((300, 450), Image.Resampling.LANCZOS)
-            img.save(thumb_path, 'JPEG', quality=85)
+            with Image.open(cover_path) as source:
+                source = source.convert("RGB")
+                for width, image_format in missing:
+                    target = self.derivative_path(digest, width, image_format)
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    
+                    img = source.copy()
+                    # 宽高比约 2:3，高度留足余量，只按宽度约束
+                    img.thumbnail((width, width * 2), Image.Resampling.LANCZOS)
+                    
+                    tmp_path = target.with_name(f"{target.name}.{threading.get_ident()}.tmp")
+                    pil_format = self.DERIVATIVE_FORMATS[image_format][0]
+                    if image_format == "webp":
+                        img.save(tmp_path, pil_format, quality=settings.cover.webp_quality, method=4)
+                    else:
+                        img.save(tmp_path, pil_format, quality=settings.cover.quality, optimize=True, progressive=True)
+                    tmp_path.replace(target)
             
-            return str(thumb_path)
+            return digest
             
         except Exception as e:
-            log.error(f"生成缩略图失败: {original_path}, 错误: {e}")
-            return str(original_path)
+            log.error(f"生成封面派生图失败: {cover_path}, 错误: {e}")
+            return None
+    
+    async def get_derivative(
+        self,
+        cover_path: Path,
+        width: int,
+        image_format: str
+    ) -> Optional[Tuple[Path, str]]:
+        """
+        获取封面派生图，缺失时在线程池中生成（不阻塞事件循环）
+        
+        Returns:
+            (派生图路径, 内容哈希)，失败返回None
+        """
+        digest = await asyncio.to_thread(self.content_digest, cover_path)
+        target = self.derivative_path(digest, width, image_format)
+        if not target.exists():
+            digest = await asyncio.to_thread(self.generate_derivatives, cover_path)
+            if not digest:
+                return None
+            target = self.derivative_path(digest, width, image_format)
+            if not target.exists():
+                return None
+        return target, digest
     
     def generate_default_cover(
         self, 
@@ -492,27 +674,35 @@ class CoverManager:
         try:
             cover_files = list(self.cover_dir.glob("*.jpg"))
             thumb_files = list(self.cover_dir.glob("thumb_*.jpg"))
+            derived_files = [f for f in self.derived_dir.rglob("*") if f.is_file()] if self.derived_dir.exists() else []
             
             total_size = sum(f.stat().st_size for f in cover_files)
             thumb_size = sum(f.stat().st_size for f in thumb_files)
+            derived_size = sum(f.stat().st_size for f in derived_files)
             
             return {
                 "cover_count": len(cover_files),
                 "thumbnail_count": len(thumb_files),
+                "derivative_count": len(derived_files),
                 "total_size": total_size,
                 "thumbnail_size": thumb_size,
+                "derivative_size": derived_size,
                 "total_size_mb": round(total_size / 1024 / 1024, 2),
                 "thumbnail_size_mb": round(thumb_size / 1024 / 1024, 2),
+                "derivative_size_mb": round(derived_size / 1024 / 1024, 2),
             }
         except Exception as e:
             log.error(f"获取缓存统计失败: {e}")
             return {
                 "cover_count": 0,
                 "thumbnail_count": 0,
+                "derivative_count": 0,
                 "total_size": 0,
                 "thumbnail_size": 0,
+                "derivative_size": 0,
                 "total_size_mb": 0,
                 "thumbnail_size_mb": 0,
+                "derivative_size_mb": 0,
             }
 
 
@@ -0,0 +1,117 @@
+"""
+磁盘 LRU 缓存
+按目录内文件总大小淘汰最久未访问的条目
+"""
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Optional
+
+from app.utils.logger import log
+
+
+class DiskLRUCache:
+    """
+    磁盘文件缓存
+    按文件总大小做 LRU 淘汰，命中时刷新文件 mtime 以便重启后恢复访问顺序
+    """
+
+    def __init__(self, cache_dir: Path, max_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._total_bytes = 0
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    def _ensure_loaded(self) -> None:
+        if self._loaded:
+            return
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        files = []
+        for path in self.cache_dir.iterdir():
+            if not path.is_file() or path.name.endswith(".tmp"):
+                continue
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, path.name, stat.st_size))
+        files.sort()
+        for _, name, size in files:
+            self._entries[name] = size
+            self._total_bytes += size
+        self._loaded = True
+        self._evict()
+
+    def get(self, name: str) -> Optional[Path]:
+        """获取缓存文件路径，未命中返回 None"""
+        with self._lock:
+            self._ensure_loaded()
+            if name not in self._entries:
+                return None
+            path = self.cache_dir / name
+            if not path.exists():
+                self._total_bytes -= self._entries.pop(name)
+                return None
+            self._entries.move_to_end(name)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return path
+
+    def put(self, name: str, data: bytes) -> Path:
+        """写入缓存文件并按需淘汰"""
+        path = self.cache_dir / name
+        with self._lock:
+            self._ensure_loaded()
+            tmp_path = path.with_name(f"{name}.{threading.get_ident()}.tmp")
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            tmp_path.replace(path)
+            if name in self._entries:
+                self._total_bytes -= self._entries.pop(name)
+            self._entries[name] = len(data)
+            self._total_bytes += len(data)
+            self._evict(keep=name)
+        return path
+
+    def _evict(self, keep: Optional[str] = None) -> None:
+        while self._total_bytes > self.max_bytes and self._entries:
+            name, size = next(iter(self._entries.items()))
+            if name == keep:
+                break
+            self._entries.popitem(last=False)
+            self._total_bytes -= size
+            try:
+                (self.cache_dir / name).unlink()
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                log.warning(f"删除缓存文件失败: {name}, 错误: {e}")
+
+    def clear(self) -> int:
+        """清空缓存，返回删除的文件数"""
+        with self._lock:
+            self._ensure_loaded()
+            count = 0
+            for name in list(self._entries):
+                try:
+                    (self.cache_dir / name).unlink()
+                    count += 1
+                except OSError:
+                    pass
+            self._entries.clear()
+            self._total_bytes = 0
+            return count
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._ensure_loaded()
+            return {
+                "files": len(self._entries),
+                "size": self._total_bytes,
+                "max_size": self.max_bytes,
+            }
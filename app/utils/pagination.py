@@ -0,0 +1,145 @@
+"""
+键集分页（Keyset Pagination）
+按（排序键, 主键）定位下一页，深分页不再随 OFFSET 线性变慢；
+扫描期间插入新书也不会造成翻页重复或遗漏。游标为不透明的 URL 安全字符串
+"""
+import base64
+import json
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Hashable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, or_
+
+from app.core.catalog_events import on_catalog_commit
+
+CURSOR_VERSION = 1
+
+# 总数缓存默认时间（秒）与条目上限
+COUNT_CACHE_TTL = 60
+COUNT_CACHE_MAX_ENTRIES = 2000
+
+
+class InvalidCursor(ValueError):
+    """游标无法解析或与当前排序方式不匹配"""
+
+
+def _dump_value(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    return value
+
+
+def _load_value(value: Any) -> Any:
+    if isinstance(value, dict) and "dt" in value:
+        return datetime.fromisoformat(value["dt"])
+    return value
+
+
+def encode_cursor(sort: str, values: Sequence[Any]) -> str:
+    """
+    编码游标
+
+    Args:
+        sort: 排序方式，解码时校验一致
+        values: 最后一行的排序键取值（含末尾的主键）
+    """
+    payload = {"v": CURSOR_VERSION, "s": sort, "k": [_dump_value(value) for value in values]}
+    raw = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str, sort: str, key_count: int) -> List[Any]:
+    """
+    解码游标
+
+    Raises:
+        InvalidCursor: 游标格式错误、版本不符或排序方式不一致
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        payload = json.loads(raw.decode("utf-8"))
+        values = [_load_value(value) for value in payload["k"]]
+    except Exception as e:
+        raise InvalidCursor("无效的分页游标") from e
+
+    if payload.get("v") != CURSOR_VERSION or payload.get("s") != sort or len(values) != key_count:
+        raise InvalidCursor("分页游标与当前排序方式不匹配")
+    return values
+
+
+def keyset_condition(keys: Sequence[Tuple[Any, bool]], values: Sequence[Any]):
+    """
+    构建“位于游标之后”的条件
+
+    (k1, k2, ..., id) 按字典序比较，展开为
+    k1 > v1 OR (k1 = v1 AND k2 > v2) OR ...（降序时取 <）
+
+    Args:
+        keys: (列表达式, 是否降序) 列表，最后一个应为唯一键
+        values: 游标中的取值，与 keys 一一对应
+    """
+    clauses = []
+    for i, (column, descending) in enumerate(keys):
+        equal_prefix = [keys[j][0] == values[j] for j in range(i)]
+        after = column < values[i] if descending else column > values[i]
+        clauses.append(and_(*equal_prefix, after))
+    return or_(*clauses)
+
+
+class CountCache:
+    """
+    列表总数缓存（进程内，带 TTL）
+
+    无限滚动翻页时不重复执行 COUNT(*)；TTL 内返回的总数可能略有滞后，仅作近似值
+    """
+
+    def __init__(self, ttl: int = COUNT_CACHE_TTL, max_entries: int = COUNT_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[Hashable, Tuple[float, int]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[int]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires_at, count = entry
+            if expires_at > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return count
+            self._entries.pop(key, None)
+        self.misses += 1
+        return None
+
+    def put(self, key: Hashable, count: int) -> None:
+        if self.ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + self.ttl, count)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total * 100, 2) if total else 0,
+        }
+
+
+# 全局单例
+book_count_cache = CountCache()
+
+
+@on_catalog_commit
+def _invalidate_book_counts(change) -> None:
+    book_count_cache.invalidate()
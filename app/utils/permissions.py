@@ -3,13 +3,185 @@
 提供书库和书籍访问权限验证
 """
 import json
-from typing import Optional
+import time
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Iterable, Optional, Sequence, Tuple, TypeVar
 
-from sqlalchemy import select
+from sqlalchemy import exists, func, or_, select
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import aliased, selectinload
 
-from app.models import Book, Library, LibraryPermission, User
+from app.config import settings
+from app.core.backplane import backplane
+from app.models import Book, BookTag, Library, LibraryPermission, User
+from app.utils.logger import log
+
+# 内容分级层级（数值越大限制越严格）
+RATING_HIERARCHY = {
+    'general': 0,
+    'teen': 1,
+    'adult': 2
+}
+RATING_ORDER = ['general', 'teen', 'adult']
+
+# 批量检查时单条 IN 查询的 ID 数上限（SQLite 绑定参数有上限）
+ACCESS_CHECK_CHUNK_SIZE = 500
+
+# 会话级缓存键（保存在 AsyncSession.info 中，随请求会话释放）
+_SESSION_LIBRARY_IDS_KEY = "accessible_library_ids"
+
+T = TypeVar("T")
+
+
+def get_user_rating_limit(user: User) -> int:
+    """获取用户可访问的最高分级（未知取值视为不限制）"""
+    return RATING_HIERARCHY.get(user.age_rating_limit, 2)
+
+
+@lru_cache(maxsize=1024)
+def _parse_blocked_tags(raw: str) -> tuple[int, ...]:
+    try:
+        blocked_tag_ids = json.loads(raw)
+    except (json.JSONDecodeError, TypeError) as e:
+        log.warning(f"解析用户屏蔽标签失败: {e}")
+        return ()
+    if not isinstance(blocked_tag_ids, list):
+        return ()
+    return tuple(tag_id for tag_id in blocked_tag_ids if isinstance(tag_id, int))
+
+
+def parse_blocked_tag_ids(user: User) -> list[int]:
+    """解析用户屏蔽的标签 ID 列表（按原始 JSON 缓存解析结果）"""
+    if not user.blocked_tags:
+        return []
+    return list(_parse_blocked_tags(user.blocked_tags))
+
+
+@dataclass(frozen=True)
+class AccessContext:
+    """用户访问上下文"""
+    user_id: int
+    is_admin: bool
+    library_ids: Tuple[int, ...]
+    rating_limit: int
+    blocked_tag_ids: Tuple[int, ...]
+
+
+class AccessContextCache:
+    """
+    用户访问上下文缓存（进程内，按用户 ID，带 TTL）
+    
+    书库权限、书库公开状态或用户设置变更时需调用 invalidate（经 backplane 同步到其他 worker）；
+    条目同时记录用户分级/屏蔽标签/管理员状态指纹，指纹不一致时视为未命中
+    """
+    
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self._entries: Dict[int, Tuple[float, tuple, AccessContext]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+    
+    @staticmethod
+    def _fingerprint(user: User) -> tuple:
+        return (bool(user.is_admin), user.age_rating_limit, user.blocked_tags)
+    
+    def get(self, user: User) -> Optional[AccessContext]:
+        entry = self._entries.get(user.id)
+        if entry is not None:
+            expires_at, fingerprint, context = entry
+            if expires_at > time.monotonic() and fingerprint == self._fingerprint(user):
+                self.hits += 1
+                return context
+            self._entries.pop(user.id, None)
+        self.misses += 1
+        return None
+    
+    def put(self, user: User, context: AccessContext) -> None:
+        if self.ttl <= 0:
+            return
+        self._entries[user.id] = (time.monotonic() + self.ttl, self._fingerprint(user), context)
+    
+    def invalidate(self, user_id: Optional[int] = None, broadcast: bool = True) -> None:
+        """失效指定用户的上下文；user_id 为空时失效全部（书库新增/删除/公开状态变更）"""
+        self.invalidations += 1
+        if user_id is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(user_id, None)
+        if broadcast:
+            backplane.publish("access.invalidate", {"user_id": user_id})
+    
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "invalidations": self.invalidations,
+            "hit_rate": round(self.hits / total * 100, 2) if total else 0,
+        }
+
+
+# 全局单例
+access_context_cache = AccessContextCache(settings.rbac.access_cache_ttl)
+
+
+@backplane.subscribe_to("access.invalidate")
+def _on_remote_invalidate(data: dict) -> None:
+    access_context_cache.invalidate(data.get("user_id"), broadcast=False)
+
+
+async def _load_accessible_library_ids(user: User, db: AsyncSession) -> list[int]:
+    # 管理员可访问所有书库
+    if user.is_admin:
+        result = await db.execute(select(Library.id))
+        return [row[0] for row in result.all()]
+    
+    # 获取公共书库
+    public_result = await db.execute(
+        select(Library.id).where(Library.is_public == True)
+    )
+    public_library_ids = [row[0] for row in public_result.all()]
+    
+    # 获取用户被授权的书库
+    permission_result = await db.execute(
+        select(LibraryPermission.library_id)
+        .where(LibraryPermission.user_id == user.id)
+    )
+    permission_library_ids = [row[0] for row in permission_result.all()]
+    
+    # 合并并去重
+    return sorted(set(public_library_ids + permission_library_ids))
+
+
+async def get_access_context(user: User, db: AsyncSession) -> AccessContext:
+    """
+    获取用户访问上下文（可访问书库、分级上限、屏蔽标签），优先读取缓存
+    
+    Args:
+        user: 用户对象
+        db: 数据库会话
+        
+    Returns:
+        AccessContext: 访问上下文
+    """
+    context = access_context_cache.get(user)
+    if context is not None:
+        return context
+    
+    library_ids = await _load_accessible_library_ids(user, db)
+    context = AccessContext(
+        user_id=user.id,
+        is_admin=bool(user.is_admin),
+        library_ids=tuple(library_ids),
+        rating_limit=get_user_rating_limit(user),
+        blocked_tag_ids=tuple(parse_blocked_tag_ids(user)),
+    )
+    access_context_cache.put(user, context)
+    return context
 
 
 async def check_library_access(
@@ -32,24 +204,9 @@ async def check_library_access(
     if user.is_admin:
         return True
     
-    # 检查书库是否存在
-    library = await db.get(Library, library_id)
-    if not library:
-        return False
-    
-    # 检查书库是否为公共书库
-    if library.is_public:
-        return True
-    
-    # 检查用户权限表
-    result = await db.execute(
-        select(LibraryPermission)
-        .where(LibraryPermission.user_id == user.id)
-        .where(LibraryPermission.library_id == library_id)
-    )
-    permission = result.scalar_one_or_none()
-    
-    return permission is not None
+    # 公共书库与被授权书库均在访问上下文中
+    context = await get_access_context(user, db)
+    return library_id in context.library_ids
 
 
 async def check_book_access(
@@ -109,28 +266,17 @@ async def check_content_rating(
         return True
     
     # 检查年龄分级
-    rating_hierarchy = {
-        'general': 0,
-        'teen': 1,
-        'adult': 2
-    }
-    
-    user_limit = rating_hierarchy.get(user.age_rating_limit, 2)
-    book_rating = rating_hierarchy.get(book.age_rating, 0)
+    user_limit = get_user_rating_limit(user)
+    book_rating = RATING_HIERARCHY.get((book.age_rating or '').lower(), 0)
     
     if book_rating > user_limit:
         return False
     
     # 检查被屏蔽的标签
-    if user.blocked_tags:
-        try:
-            blocked_tag_ids = json.loads(user.blocked_tags)
-            if blocked_tag_ids and book.book_tags:
-                book_tag_ids = [bt.tag_id for bt in book.book_tags]
-                if any(tag_id in blocked_tag_ids for tag_id in book_tag_ids):
-                    return False
-        except (json.JSONDecodeError, TypeError):
-            pass
+    blocked_tag_ids = parse_blocked_tag_ids(user)
+    if blocked_tag_ids and book.book_tags:
+        if any(bt.tag_id in blocked_tag_ids for bt in book.book_tags):
+            return False
     
     return True
 
@@ -149,28 +295,130 @@ async def get_accessible_library_ids(
     Returns:
         list[int]: 可访问的书库 ID 列表
     """
-    # 管理员可访问所有书库
+    context = await get_access_context(user, db)
+    return list(context.library_ids)
+
+
+def build_book_access_filters(
+    user: User,
+    library_ids: Iterable[int]
+) -> list:
+    """
+    构建书籍访问权限的 SQL 条件（与 check_book_access 语义一致）
+    
+    包含书库范围、年龄分级与屏蔽标签（NOT EXISTS），可直接用于 where()，
+    使分页与计数在数据库中完成
+    
+    Args:
+        user: 用户对象
+        library_ids: 用户可访问的书库 ID 列表
+        
+    Returns:
+        list: SQLAlchemy 条件列表
+    """
+    filters = [Book.library_id.in_(list(library_ids))]
+    
+    # 管理员无内容限制
     if user.is_admin:
-        result = await db.execute(select(Library.id))
-        return [row[0] for row in result.all()]
+        return filters
     
-    # 获取公共书库
-    public_result = await db.execute(
-        select(Library.id).where(Library.is_public == True)
-    )
-    public_library_ids = [row[0] for row in public_result.all()]
+    user_limit = get_user_rating_limit(user)
+    if user_limit < len(RATING_ORDER) - 1:
+        # 空值与未知分级按 general 处理
+        filters.append(
+            or_(
+                Book.age_rating.is_(None),
+                func.lower(Book.age_rating).in_(RATING_ORDER[:user_limit + 1]),
+                ~func.lower(Book.age_rating).in_(RATING_ORDER)
+            )
+        )
     
-    # 获取用户被授权的书库
-    permission_result = await db.execute(
-        select(LibraryPermission.library_id)
-        .where(LibraryPermission.user_id == user.id)
-    )
-    permission_library_ids = [row[0] for row in permission_result.all()]
+    blocked_tag_ids = parse_blocked_tag_ids(user)
+    if blocked_tag_ids:
+        # 使用别名，避免外层查询联结 book_tags 时被自动关联
+        blocked_tag = aliased(BookTag)
+        filters.append(
+            ~exists(
+                select(blocked_tag.id)
+                .where(blocked_tag.book_id == Book.id)
+                .where(blocked_tag.tag_id.in_(blocked_tag_ids))
+            )
+        )
     
-    # 合并并去重
-    all_library_ids = list(set(public_library_ids + permission_library_ids))
+    return filters
+
+
+async def get_book_access_filters(
+    user: User,
+    db: AsyncSession,
+    library_id: Optional[int] = None
+) -> Optional[list]:
+    """
+    获取用户的书籍访问 SQL 条件
     
-    return all_library_ids
+    Args:
+        user: 用户对象
+        db: 数据库会话
+        library_id: 可选，限定到单个书库
+        
+    Returns:
+        Optional[list]: 条件列表；无可访问书库（或无权访问指定书库）时返回 None
+    """
+    library_ids = await get_accessible_library_ids(user, db)
+    if library_id is not None:
+        library_ids = [library_id] if library_id in library_ids else []
+    if not library_ids:
+        return None
+    return build_book_access_filters(user, library_ids)
+
+
+async def _get_session_library_ids(user: User, db: AsyncSession) -> list[int]:
+    """获取可访问书库 ID，在同一数据库会话（即同一请求）内只查询一次"""
+    memo = db.info.setdefault(_SESSION_LIBRARY_IDS_KEY, {})
+    library_ids = memo.get(user.id)
+    if library_ids is None:
+        library_ids = await get_accessible_library_ids(user, db)
+        memo[user.id] = library_ids
+    return library_ids
+
+
+async def get_accessible_book_ids(
+    user: User,
+    book_ids: Iterable[int],
+    db: AsyncSession
+) -> set[int]:
+    """
+    批量检查书籍访问权限
+    
+    与逐本调用 check_book_access 结果一致，但查询数固定：
+    可访问书库在会话内只查询一次，书籍按每 ACCESS_CHECK_CHUNK_SIZE 个一条查询过滤
+    
+    Args:
+        user: 用户对象
+        book_ids: 要检查的书籍 ID
+        db: 数据库会话
+        
+    Returns:
+        set[int]: 用户有权访问的书籍 ID 集合
+    """
+    unique_ids = sorted({book_id for book_id in book_ids if book_id is not None})
+    if not unique_ids:
+        return set()
+    
+    library_ids = await _get_session_library_ids(user, db)
+    if not library_ids:
+        return set()
+    
+    filters = build_book_access_filters(user, library_ids)
+    accessible: set[int] = set()
+    for start in range(0, len(unique_ids), ACCESS_CHECK_CHUNK_SIZE):
+        chunk = unique_ids[start:start + ACCESS_CHECK_CHUNK_SIZE]
+        result = await db.execute(
+            select(Book.id).where(Book.id.in_(chunk), *filters)
+        )
+        accessible.update(row[0] for row in result.all())
+    
+    return accessible
 
 
 async def filter_books_by_access(
@@ -179,7 +427,7 @@ async def filter_books_by_access(
     db: AsyncSession
 ) -> list[int]:
     """
-    过滤出用户有权访问的书籍 ID 列表
+    过滤出用户有权访问的书籍 ID 列表（保持原顺序）
     
     Args:
         user: 用户对象
@@ -189,10 +437,31 @@ async def filter_books_by_access(
     Returns:
         list[int]: 用户有权访问的书籍 ID 列表
     """
-    accessible_ids = []
-    
-    for book_id in book_ids:
-        if await check_book_access(user, book_id, db):
-            accessible_ids.append(book_id)
+    accessible = await get_accessible_book_ids(user, book_ids, db)
+    return [book_id for book_id in book_ids if book_id in accessible]
+
+
+async def filter_accessible_items(
+    user: User,
+    items: Sequence[T],
+    db: AsyncSession,
+    book_id_of=lambda item: item.id
+) -> list[T]:
+    """
+    过滤出用户有权访问的对象（书籍、收藏、阅读进度等），保持原顺序
     
-    return accessible_ids
+    Args:
+        user: 用户对象
+        items: 待过滤对象
+        db: 数据库会话
+        book_id_of: 从对象中取书籍 ID 的函数，默认取 item.id；返回 None 的对象会被过滤掉
+        
+    Returns:
+        list: 用户有权访问的对象
+    """
+    book_ids = [book_id_of(item) for item in items]
+    accessible = await get_accessible_book_ids(user, book_ids, db)
+    return [
+        item for item, book_id in zip(items, book_ids)
+        if book_id is not None and book_id in accessible
+    ]
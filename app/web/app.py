@@ -11,13 +11,47 @@ from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
 from app.config import settings
-from app.database import init_database
+from app.database import engine, init_database, read_engine
+from app.core.backplane import backplane
+from app.core.background_scanner import get_background_scanner
 from app.core.scheduler import backup_scheduler
+from app.core.comic_pages import comic_page_service
+from app.core.cover_extractor import get_cover_extraction_job
+from app.core.heartbeat_buffer import heartbeat_buffer
+from app.core.query_stats import QueryStatsMiddleware, query_stats
+from app.core.suggest_index import suggestion_index
+from app.core.websocket import manager as ws_manager
+from app.core.write_queue import write_queue
 from app.bot.bot import telegram_bot
 from app.utils.i18n import parse_accept_language, resolve_message_key, translate_message
 from app.utils.logger import log
 
 
+async def start_leader_services():
+    """启动全局单实例服务（当选主节点时调用）"""
+    # 启动定时备份调度器
+    await backup_scheduler.start()
+    log.info("定时备份调度器已启动")
+    
+    # 启动 Telegram Bot
+    try:
+        await telegram_bot.start()
+        if telegram_bot.is_running:
+            log.info("Telegram Bot 已启动")
+    except Exception as e:
+        log.warning(f"Telegram Bot 启动失败，已跳过: {e}")
+
+
+async def stop_leader_services():
+    """停止全局单实例服务（失去主节点身份或应用关闭时调用）"""
+    # 关闭 Telegram Bot
+    await telegram_bot.stop()
+    
+    # 关闭调度器
+    await backup_scheduler.shutdown()
+    log.info("定时备份调度器已关闭")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """应用生命周期管理"""
@@ -31,29 +65,48 @@ async def lifespan(app: FastAPI):
     await init_database()
     log.info("数据库初始化完成")
     
-    # 启动定时备份调度器
-    await backup_scheduler.start()
-    log.info("定时备份调度器已启动")
+    # 启动多进程协作后端（多 worker 间的广播与共享状态）
+    await backplane.start()
     
-    # 启动 Telegram Bot
-    try:
-        await telegram_bot.start()
-        if telegram_bot.is_running:
-            log.info("Telegram Bot 已启动")
-    except Exception as e:
-        log.warning(f"Telegram Bot 启动失败，已跳过: {e}")
+    # 后台构建搜索建议索引（构建完成前建议接口回退到数据库查询）
+    suggestion_index.start()
+    
+    # 启动单写入者队列（仅 SQLite；PostgreSQL 写事务直接并发执行）与阅读心跳合并写入
+    if engine.dialect.name == "sqlite":
+        write_queue.start()
+    heartbeat_buffer.start()
+    
+    # 启动 WebSocket ping 与空闲连接清理
+    ws_manager.start()
+    
+    # 定时任务与 Telegram Bot 全局只运行一份，由主节点 worker 负责（单进程时即本进程）
+    await backplane.start_leader(start_leader_services, stop_leader_services)
     
     yield
     
     # 关闭时
     log.info("应用关闭中...")
     
-    # 关闭 Telegram Bot
-    await telegram_bot.stop()
+    # 写入缓冲区中剩余的阅读心跳，再执行完写入队列中剩余的操作
+    await heartbeat_buffer.stop()
+    await write_queue.stop()
     
-    # 关闭调度器
-    await backup_scheduler.shutdown()
-    log.info("定时备份调度器已关闭")
+    # 关闭 WebSocket 连接
+    await ws_manager.stop()
+    
+    # 关闭 Telegram Bot 与调度器
+    if backplane.is_leader:
+        await stop_leader_services()
+    await backplane.stop()
+    
+    # 关闭漫画页面转码进程池
+    comic_page_service.shutdown()
+    
+    # 停止批量封面提取（保留进度，下次可恢复）
+    await get_cover_extraction_job().shutdown()
+    
+    # 等待扫描时提交的封面派生图生成完成
+    await get_background_scanner().shutdown()
     
     log.info("应用已关闭")
 
@@ -66,6 +119,11 @@ app = FastAPI(
     lifespan=lifespan,
 )
 
+# 按请求统计 SQL 语句数与耗时（Server-Timing 响应头、N+1 检测）
+if settings.database.query_stats_enabled:
+    query_stats.instrument(engine, read_engine)
+    app.add_middleware(QueryStatsMiddleware)
+
 
 @app.exception_handler(HTTPException)
 async def http_exception_handler(request: Request, exc: HTTPException):
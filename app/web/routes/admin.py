@@ -10,21 +10,23 @@ from datetime import datetime
 from collections import deque
 
 from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, UploadFile, File, Header, Query
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, PlainTextResponse
 from pydantic import BaseModel
 from sqlalchemy import select, func
 from sqlalchemy.ext.asyncio import AsyncSession
 import yaml
 
-from app.database import get_db
+from app.database import get_db, get_read_db
 from app.models import FilenamePattern, Library, LibraryPermission, LibraryTag, Book, User, BookTag, Tag, BookVersion, Author
 from app.config import settings
 from app.core.ai import ai_config, get_ai_service
 from app.core.metadata.txt_parser import TxtParser
-from app.web.routes.auth import get_current_user
-from app.security import hash_password, decode_access_token
+from app.web.routes.auth import get_current_user, resolve_token_user
+from app.security import hash_password
 from app.utils.filename_analyzer import FilenameAnalyzer
 from app.utils.logger import log
+from app.utils.auth_cache import auth_user_cache, credential_cache, invalidate_user, invalidate_user_id
+from app.utils.permissions import access_context_cache
 from app.core.backup import backup_manager
 
 router = APIRouter()
@@ -386,6 +388,9 @@ async def update_user(
     
     await db.commit()
     await db.refresh(user)
+    # 用户名可能已变更，按 ID 失效
+    invalidate_user_id(user.id)
+    access_context_cache.invalidate(user.id)
     
     # 统计书库权限数量
     perm_count = await db.execute(
@@ -431,6 +436,8 @@ async def delete_user(
     username = user.username
     await db.delete(user)
     await db.commit()
+    invalidate_user(username)
+    access_context_cache.invalidate(user_id)
     
     log.info(f"管理员 {current_user.username} 删除了用户: {username}")
     
@@ -456,7 +463,9 @@ async def reset_user_password(
         raise HTTPException(status_code=404, detail="用户不存在")
     
     user.password_hash = hash_password(password_data.new_password)
+    user.token_version = (user.token_version or 0) + 1
     await db.commit()
+    invalidate_user(user.username)
     
     log.info(f"管理员 {current_user.username} 重置了用户 {user.username} 的密码")
     
@@ -554,6 +563,7 @@ async def update_user_library_access(
             db.add(perm)
     
     await db.commit()
+    access_context_cache.invalidate(user_id)
     
     log.info(
         f"管理员 {current_user.username} 更新了用户 {user.username} 的书库权限: "
@@ -814,6 +824,7 @@ async def toggle_library_public(
     
     library.is_public = is_public
     await db.commit()
+    access_context_cache.invalidate()
     
     log.info(
         f"管理员 {current_user.username} 将书库 {library.name} "
@@ -1366,8 +1377,11 @@ async def refresh_book_cover(
         
         # 更新数据库
         if cover_path:
+            from app.utils.cover_manager import cover_manager
+            
             book.cover_path = cover_path
             await db.commit()
+            cover_manager.invalidate_cover(book.id)
             
             log.info(f"管理员 {current_user.username} 重新提取了书籍 {book.title} 的封面")
             return {"message": "封面已更新", "cover_path": cover_path}
@@ -1384,38 +1398,164 @@ async def refresh_book_cover(
 @router.post("/admin/covers/batch-extract")
 async def batch_extract_covers(
     library_id: Optional[int] = None,
-    background_tasks: BackgroundTasks = None,
+    resume: bool = Query(False, description="从上次中断的位置继续"),
     current_user: User = Depends(admin_required),
-    db: AsyncSession = Depends(get_db)
 ):
     """
     批量提取缺失的封面（管理员）
-    可选择指定书库，否则处理所有书籍
+    可选择指定书库，否则处理所有书籍；任务在后台运行，进度通过 WebSocket 推送
     """
-    # 查询没有封面的书籍
-    query = select(Book).where(Book.cover_path.is_(None))
-    
-    if library_id:
-        query = query.where(Book.library_id == library_id)
-    
-    result = await db.execute(query)
-    books = result.scalars().all()
-    
-    if not books:
-        return {"message": "没有需要提取封面的书籍", "count": 0}
-    
-    # 这里应该使用后台任务处理，暂时返回统计
-    count = len(books)
-    
-    log.info(f"管理员 {current_user.username} 触发了批量封面提取，共 {count} 本书")
-    
+    from app.core.cover_extractor import get_cover_extraction_job
+
+    job = get_cover_extraction_job()
+    try:
+        status = await job.start(library_id=library_id, resume=resume)
+    except ValueError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    if status["total"] == 0 and not resume:
+        return {"message": "没有需要提取封面的书籍", "count": 0, "status": status}
+
+    log.info(f"管理员 {current_user.username} 触发了批量封面提取，共 {status['total']} 本书")
+
     return {
-        "message": f"已加入队列，将处理 {count} 本书",
-        "count": count,
-        "note": "批量提取功能需要后台任务支持，当前仅返回统计"
+        "message": f"已加入队列，将处理 {status['total']} 本书",
+        "count": status["total"],
+        "status": status
     }
 
 
+@router.get("/admin/covers/batch-extract/status")
+async def get_batch_extract_status(
+    current_user: User = Depends(admin_required),
+):
+    """获取批量封面提取任务状态（管理员）"""
+    from app.core.cover_extractor import get_cover_extraction_job
+
+    job = get_cover_extraction_job()
+    return {"running": job.is_running, **job.get_status()}
+
+
+@router.post("/admin/covers/batch-extract/cancel")
+async def cancel_batch_extract(
+    current_user: User = Depends(admin_required),
+):
+    """取消批量封面提取任务（管理员），已处理的进度会保留，可稍后恢复"""
+    from app.core.cover_extractor import get_cover_extraction_job
+
+    if not get_cover_extraction_job().cancel():
+        raise HTTPException(status_code=400, detail="没有正在运行的封面提取任务")
+
+    log.info(f"管理员 {current_user.username} 取消了批量封面提取")
+    return {"message": "已请求取消，当前批次完成后停止"}
+
+
+@router.post("/admin/search/rebuild-index")
+async def rebuild_search_index_endpoint(
+    current_user: User = Depends(admin_required),
+    db: AsyncSession = Depends(get_db)
+):
+    """全量重建书籍全文检索索引（管理员）"""
+    from app.core.search_index import is_available, rebuild_search_index
+
+    if not is_available():
+        raise HTTPException(status_code=400, detail="当前数据库不支持全文索引")
+
+    count = await rebuild_search_index(db)
+    log.info(f"管理员 {current_user.username} 重建了全文检索索引，共 {count} 本书")
+    return {"message": "全文索引重建完成", "count": count}
+
+
+@router.get("/admin/cache/stats")
+async def get_cache_stats(
+    current_user: User = Depends(admin_required),
+):
+    """获取进程内缓存命中率统计（管理员）"""
+    from app.core.backplane import backplane
+    from app.core.dashboard_cache import dashboard_cache
+    from app.core.facets import facet_cache
+    from app.core.heartbeat_buffer import heartbeat_buffer
+    from app.core.suggest_index import suggestion_index
+    from app.core.websocket import manager as ws_manager
+    from app.core.write_queue import write_queue
+    from app.utils.cover_manager import cover_manager
+    from app.utils.pagination import book_count_cache
+
+    return {
+        "auth_user": auth_user_cache.stats(),
+        "opds_credentials": credential_cache.stats(),
+        "access_context": access_context_cache.stats(),
+        "cover_map": cover_manager.get_cover_map_stats(),
+        "book_counts": book_count_cache.stats(),
+        "facets": facet_cache.stats(),
+        "suggestions": suggestion_index.stats(),
+        "dashboard": dashboard_cache.stats(),
+        "heartbeats": heartbeat_buffer.stats(),
+        "websocket": ws_manager.stats(),
+        "backplane": backplane.stats(),
+        "write_queue": write_queue.stats(),
+    }
+
+
+@router.get("/admin/queries")
+async def get_query_stats(
+    limit: int = Query(10, ge=1, le=100),
+    sort: str = Query("db_time", pattern="^(db_time|queries|n_plus_one)$"),
+    explain: bool = Query(True, description="附带最慢语句的执行计划"),
+    statements: int = Query(3, ge=1, le=20, description="每个路由列出的最慢语句数"),
+    current_user: User = Depends(admin_required),
+    db: AsyncSession = Depends(get_read_db),
+):
+    """按请求 SQL 统计列出最差的路由及其最慢语句（管理员，当前进程）"""
+    from app.core.query_stats import explain as explain_statement, query_stats
+
+    routes = []
+    for route, stats in query_stats.worst_routes(limit, sort):
+        slowest = []
+        for key, statement in stats.slowest(statements):
+            item = {
+                "fingerprint": key,
+                "count": statement.count,
+                "avg_ms": round(statement.total_ms / statement.count, 2),
+                "max_ms": round(statement.max_ms, 2),
+                "total_ms": round(statement.total_ms, 2),
+            }
+            if explain:
+                try:
+                    item["plan"] = await explain_statement(db, statement.statement, statement.parameters)
+                except Exception as e:
+                    item["plan_error"] = str(e)
+            slowest.append(item)
+        routes.append({"route": route, **stats.summary(), "slowest_statements": slowest})
+
+    return {
+        **query_stats.stats(),
+        "n_plus_one_threshold": settings.database.n_plus_one_threshold,
+        "routes": routes,
+    }
+
+
+@router.get("/admin/queries/metrics", response_class=PlainTextResponse)
+async def get_query_metrics(
+    current_user: User = Depends(admin_required),
+):
+    """各路由数据库耗时与语句数直方图（Prometheus 文本格式，管理员，当前进程）"""
+    from app.core.query_stats import query_stats
+
+    return PlainTextResponse(query_stats.prometheus(), media_type="text/plain; version=0.0.4")
+
+
+@router.delete("/admin/queries")
+async def reset_query_stats(
+    current_user: User = Depends(admin_required),
+):
+    """清空请求 SQL 统计（管理员，当前进程）"""
+    from app.core.query_stats import query_stats
+
+    query_stats.reset()
+    return {"message": "请求 SQL 统计已清空"}
+
+
 @router.get("/admin/covers/stats")
 async def get_cover_stats(
     current_user: User = Depends(admin_required),
@@ -1424,24 +1564,17 @@ async def get_cover_stats(
     """
     获取封面缓存统计（管理员）
     """
+    from app.core.library_stats import summarize_libraries
     from app.utils.cover_manager import cover_manager
     
     # 获取缓存统计
     cache_stats = await cover_manager.get_cache_stats()
     
-    # 数据库统计
-    result = await db.execute(select(func.count(Book.id)))
-    total_books = result.scalar()
-    
-    result = await db.execute(
-        select(func.count(Book.id)).where(Book.cover_path.isnot(None))
-    )
-    books_with_cover = result.scalar()
-    
-    result = await db.execute(
-        select(func.count(Book.id)).where(Book.cover_path.is_(None))
-    )
-    books_without_cover = result.scalar()
+    # 数据库统计（读取书库物化统计）
+    summary = await summarize_libraries(db)
+    total_books = summary.book_count
+    books_with_cover = summary.cover_count
+    books_without_cover = total_books - books_with_cover
     
     return {
         "database": {
@@ -1450,7 +1583,8 @@ async def get_cover_stats(
             "books_without_cover": books_without_cover,
             "coverage_rate": round(books_with_cover / total_books * 100, 2) if total_books > 0 else 0
         },
-        "cache": cache_stats
+        "cache": cache_stats,
+        "cover_map": cover_manager.get_cover_map_stats()
     }
 
 
@@ -1606,13 +1740,8 @@ async def download_backup(
     if not token:
         raise HTTPException(status_code=401, detail="Not authenticated")
 
-    user = None
     try:
-        payload = decode_access_token(token)
-        username = payload.get("sub") if payload else None
-        if username:
-            result = await db.execute(select(User).where(User.username == username))
-            user = result.scalar_one_or_none()
+        user = await resolve_token_user(token, db)
     except Exception:
         user = None
             
@@ -1729,6 +1858,9 @@ async def restore_backup(
             includes=request.includes,
             create_snapshot=request.create_snapshot
         )
+        # 数据库已被替换，缓存的用户与访问上下文全部失效
+        invalidate_user()
+        access_context_cache.invalidate()
         
         log.warning(
             f"管理员 {current_user.username} 恢复了备份: {request.backup_id}, "
@@ -7,7 +7,7 @@ import asyncio
 import uuid
 from pathlib import Path
 from dataclasses import asdict
-from typing import List, Optional, Dict
+from typing import List, Optional
 import re
 from datetime import datetime
 
@@ -17,6 +17,7 @@ from sqlalchemy import select, and_
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload, selectinload
 
+from app.core.backplane import backplane
 from app.database import get_db
 from app.models import Book, Library, FilenamePattern, Tag, User
 from app.web.routes.auth import get_current_admin, get_current_user
@@ -32,10 +33,34 @@ from app.core.ai.config import ai_config
 
 router = APIRouter()
 
-# ===== 内存任务存储 =====
-# 注意：生产环境建议使用 Redis 或数据库
-# 结构: task_id -> TaskInfo
-analysis_tasks: Dict[str, dict] = {}
+# ===== 任务存储 =====
+# 任务状态保存在 backplane 中（多 worker 时任一进程均可查询）
+ANALYSIS_TASK_PREFIX = "ai:analysis_task:"
+# 任务记录保留时间（秒）
+ANALYSIS_TASK_TTL = 7 * 24 * 3600
+
+
+async def load_analysis_task(task_id: str) -> Optional[dict]:
+    return await backplane.get(f"{ANALYSIS_TASK_PREFIX}{task_id}")
+
+
+async def save_analysis_task(task: dict) -> None:
+    await backplane.set(f"{ANALYSIS_TASK_PREFIX}{task['id']}", task, ttl=ANALYSIS_TASK_TTL)
+
+
+async def update_analysis_task(task_id: str, **fields) -> bool:
+    """
+    更新任务的部分字段（比较后写入，避免覆盖其他 worker 的修改）
+
+    任务已被删除或取消时不写入并返回 False，调用方应停止处理
+    """
+    key = f"{ANALYSIS_TASK_PREFIX}{task_id}"
+    while True:
+        current = await backplane.get(key)
+        if current is None or current.get("status") == "cancelled":
+            return False
+        if await backplane.compare_and_set(key, current, {**current, **fields}, ttl=ANALYSIS_TASK_TTL):
+            return True
 
 # ===== Pydantic 模型 =====
 
@@ -93,12 +118,8 @@ async def process_batch_analysis(
     model: Optional[str]
 ):
     """处理批量分析后台任务 - 每次发送最多200条文件名给AI"""
-    task = analysis_tasks.get(task_id)
-    if not task:
+    if not await update_analysis_task(task_id, status="running", started_at=datetime.now().isoformat()):
         return
-
-    task["status"] = "running"
-    task["started_at"] = datetime.now()
     
     results = []
     
@@ -110,9 +131,11 @@ async def process_batch_analysis(
         batch_count = (total + BATCH_SIZE - 1) // BATCH_SIZE
         
         for batch_idx in range(batch_count):
-            # 检查任务是否被取消
-            if task.get("status") == "cancelled":
-                break
+            # 检查任务是否被取消或删除（可能由其他 worker 处理的请求完成）
+            current = await load_analysis_task(task_id)
+            if current is None or current.get("status") == "cancelled":
+                log.info(f"任务 {task_id} 已取消或删除，停止分析")
+                return
             
             # 计算当前批次的范围
             start_idx = batch_idx * BATCH_SIZE
@@ -238,27 +261,33 @@ async def process_batch_analysis(
                     })
             
             # 更新进度
-            task["processed"] = end_idx
-            task["progress"] = (end_idx / total) * 100
-            task["results"] = results
-            task["current_batch"] = batch_idx + 1
-            task["total_batches"] = batch_count
+            progress = (end_idx / total) * 100
+            if not await update_analysis_task(
+                task_id,
+                processed=end_idx,
+                progress=progress,
+                results=results,
+                current_batch=batch_idx + 1,
+                total_batches=batch_count,
+            ):
+                log.info(f"任务 {task_id} 已取消或删除，停止分析")
+                return
             
-            log.info(f"任务 {task_id}: 完成批次 {batch_idx + 1}/{batch_count}, 进度: {task['progress']:.1f}%")
+            log.info(f"任务 {task_id}: 完成批次 {batch_idx + 1}/{batch_count}, 进度: {progress:.1f}%")
             
             # 批次之间稍微延时，避免速率限制
             if batch_idx < batch_count - 1:
                 await asyncio.sleep(1)
             
-        task["status"] = "completed"
-        task["completed_at"] = datetime.now()
+        if not await update_analysis_task(task_id, status="completed", completed_at=datetime.now().isoformat()):
+            return
         log.info(f"任务 {task_id}: 全部完成，共 {len(results)} 个结果")
         
     except Exception as e:
         log.error(f"批量分析任务失败: {task_id}, 错误: {e}")
-        task["status"] = "failed"
-        task["error"] = str(e)
-        task["completed_at"] = datetime.now()
+        await update_analysis_task(
+            task_id, status="failed", error=str(e), completed_at=datetime.now().isoformat()
+        )
 
 # ===== 路由处理 =====
 
@@ -281,7 +310,7 @@ async def analyze_filenames_batch(
     
     task_id = str(uuid.uuid4())
     
-    analysis_tasks[task_id] = {
+    await save_analysis_task({
         "id": task_id,
         "status": "pending",
         "filenames": request.filenames,
@@ -289,10 +318,10 @@ async def analyze_filenames_batch(
         "processed": 0,
         "progress": 0.0,
         "results": [],
-        "created_at": datetime.now(),
+        "created_at": datetime.now().isoformat(),
         "provider": request.provider,
         "model": request.model
-    }
+    })
     
     # 启动后台任务
     background_tasks.add_task(
@@ -315,7 +344,7 @@ async def get_task_status(
     current_user: User = Depends(get_current_admin)
 ):
     """获取任务状态"""
-    task = analysis_tasks.get(task_id)
+    task = await load_analysis_task(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="任务不存在")
         
@@ -338,7 +367,7 @@ async def list_tasks(
     current_user: User = Depends(get_current_admin)
 ):
     """获取任务列表"""
-    tasks = list(analysis_tasks.values())
+    tasks = list((await backplane.scan(ANALYSIS_TASK_PREFIX)).values())
     
     # 排序：最新的在前
     tasks.sort(key=lambda x: x["created_at"], reverse=True)
@@ -372,8 +401,7 @@ async def delete_task(
     current_user: User = Depends(get_current_admin)
 ):
     """删除任务记录"""
-    if task_id in analysis_tasks:
-        del analysis_tasks[task_id]
+    if await backplane.delete(f"{ANALYSIS_TASK_PREFIX}{task_id}"):
         return {"status": "success"}
     raise HTTPException(status_code=404, detail="任务不存在")
 
@@ -22,7 +22,7 @@ from app.models import (
     Author,
     BookVersion,
 )
-from app.utils.permissions import check_book_access, get_accessible_library_ids
+from app.utils.permissions import build_book_access_filters, filter_accessible_items, get_accessible_library_ids
 from app.web.routes.auth import get_current_user
 from app.core.ai.config import ai_config
 from app.core.ai.service import get_ai_service
@@ -137,29 +137,22 @@ async def _filter_accessible_books(
     books: Iterable[Book],
     db: AsyncSession,
 ) -> List[Book]:
-    accessible: List[Book] = []
-    for book in books:
-        if await check_book_access(current_user, book.id, db):
-            accessible.append(book)
-    return accessible
+    return await filter_accessible_items(current_user, list(books), db)
 
 
-async def _build_list_from_books(
+def _build_list_from_books(
     title: str,
     books: Iterable[Book],
-    current_user: User,
-    db: AsyncSession,
     limit: int,
     description: Optional[str] = None,
     score_fn: Optional[Any] = None,
 ) -> ReadingList:
+    # books 须已按用户访问权限过滤
     limit = _clamp(limit, 5, 50)
     items: List[ReadingListBook] = []
     for book in books:
         if len(items) >= limit:
             break
-        if not await check_book_access(current_user, book.id, db):
-            continue
         score = score_fn(book) if score_fn else 0.0
         items.append(_book_to_item(book, score))
 
@@ -292,6 +285,7 @@ async def get_recommendations(
 
     if library_id and library_id in accessible_library_ids:
         accessible_library_ids = [library_id]
+    access_filters = build_book_access_filters(current_user, accessible_library_ids)
 
     favorite_result = await db.execute(
         select(Favorite.book_id).where(Favorite.user_id == current_user.id)
@@ -308,7 +302,7 @@ async def get_recommendations(
     if not seed_book_ids:
         query = (
             select(Book)
-            .where(Book.library_id.in_(accessible_library_ids))
+            .where(*access_filters)
             .options(joinedload(Book.author), joinedload(Book.versions))
             .order_by(Book.added_at.desc())
             .limit(limit)
@@ -317,8 +311,6 @@ async def get_recommendations(
         books = result.unique().scalars().all()
         response_items = []
         for book in books:
-            if not await check_book_access(current_user, book.id, db):
-                continue
             primary = _get_primary_version(book)
             response_items.append(
                 RecommendationItem(
@@ -345,7 +337,7 @@ async def get_recommendations(
 
     query = (
         select(Book)
-        .where(Book.library_id.in_(accessible_library_ids))
+        .where(*access_filters)
         .options(
             joinedload(Book.author),
             joinedload(Book.book_tags).joinedload(BookTag.tag),
@@ -372,8 +364,6 @@ async def get_recommendations(
 
     recommendations: List[RecommendationItem] = []
     for book in candidate_books:
-        if not await check_book_access(current_user, book.id, db):
-            continue
         primary = _get_primary_version(book)
         book_tag_ids = {bt.tag_id for bt in book.book_tags}
         tag_score = len(book_tag_ids & tag_ids)
@@ -465,7 +455,7 @@ async def chat_search(
         joinedload(Book.book_tags).joinedload(BookTag.tag),
         joinedload(Book.versions),
     )
-    query = query.where(Book.library_id.in_(accessible_library_ids))
+    query = query.where(*build_book_access_filters(current_user, accessible_library_ids))
 
     if keywords:
         search_term = f"%{keywords}%"
@@ -500,12 +490,7 @@ async def chat_search(
 
     query = query.order_by(Book.added_at.desc()).limit(request.limit * 3)
     result = await db.execute(query)
-    all_books = result.unique().scalars().all()
-
-    filtered_books = []
-    for book in all_books:
-        if await check_book_access(current_user, book.id, db):
-            filtered_books.append(book)
+    filtered_books = result.unique().scalars().all()
 
     response_books = []
     for book in filtered_books[: request.limit]:
@@ -584,7 +569,7 @@ async def generate_reading_lists(
 
     query = (
         select(Book)
-        .where(Book.library_id.in_(accessible_library_ids))
+        .where(*build_book_access_filters(current_user, accessible_library_ids))
         .options(
             joinedload(Book.author),
             joinedload(Book.book_tags).joinedload(BookTag.tag),
@@ -627,24 +612,20 @@ async def generate_reading_lists(
 
     if theme_keyword and themed_candidates:
         lists.append(
-            await _build_list_from_books(
+            _build_list_from_books(
                 title=f"主题精选：{request.theme}",
                 description="根据你的主题关键词筛选",
                 books=themed_candidates,
-                current_user=current_user,
-                db=db,
                 limit=limit,
             )
         )
 
     if preferred_tag_names or preferred_author_ids:
         lists.append(
-            await _build_list_from_books(
+            _build_list_from_books(
                 title="你的偏好推荐",
                 description="根据收藏与阅读偏好生成",
                 books=candidates,
-                current_user=current_user,
-                db=db,
                 limit=limit,
                 score_fn=lambda book: _score_book_by_preferences(
                     book, preferred_tag_names, preferred_author_ids
@@ -653,12 +634,10 @@ async def generate_reading_lists(
         )
 
     lists.append(
-        await _build_list_from_books(
+        _build_list_from_books(
             title="最新入库",
             description="最近新增的书籍",
             books=candidates,
-            current_user=current_user,
-            db=db,
             limit=limit,
         )
     )
@@ -10,11 +10,12 @@ from typing import List, Optional
 
 from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from pydantic import BaseModel, Field
-from sqlalchemy import func, select, and_, or_, exists, cast, Date
+from sqlalchemy import func, select, and_, or_, cast, Date
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import joinedload, selectinload
 
 from app.core.scanner import Scanner
+from app.core.search_index import apply_keyword_search, get_snippets, search_subquery
 from app.core.conversion.ebook_convert import (
     get_cached_conversion_path,
     get_conversion_status,
@@ -22,15 +23,31 @@ from app.core.conversion.ebook_convert import (
     request_conversion
 )
 from app.core.kindle_mailer import send_to_kindle
+from app.core.heartbeat_buffer import PendingHeartbeat, apply_heartbeats, heartbeat_buffer, merged_progress
 from app.core.kindle_settings import load_kindle_settings
+from app.core.reading_stats import book_totals, daily_totals, fold_session, hourly_totals, reading_totals
 from app.core.websocket import manager
-from app.database import get_db
+from app.core.write_queue import write_queue
+from app.database import get_db, get_read_db
 from app.models import Author, Book, BookReview, BookTag, BookVersion, Library, ReadingProgress, ReadingSession, Tag, User
 from app.web.routes.auth import get_current_admin, get_current_user
 from app.web.routes.settings import load_settings
 from app.web.routes.dependencies import get_accessible_book, get_accessible_library
 from app.utils.logger import log
-from app.utils.permissions import check_book_access, get_accessible_library_ids
+from app.utils.permissions import (
+    access_context_cache,
+    build_book_access_filters,
+    check_book_access,
+    get_access_context,
+    get_accessible_library_ids,
+)
+from app.utils.pagination import (
+    InvalidCursor,
+    book_count_cache,
+    decode_cursor,
+    encode_cursor,
+    keyset_condition,
+)
 
 router = APIRouter()
 
@@ -237,6 +254,8 @@ async def create_library(
     
     await db.commit()
     await db.refresh(library)
+    # 管理员的可访问书库包含新书库
+    access_context_cache.invalidate()
     
     log.info(f"创建书库: {library.name}, 路径: {library_data.path}")
     return library
@@ -299,49 +318,25 @@ async def get_library_stats(
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """获取书库统计信息"""
-    from sqlalchemy import func
-    from app.models import BookVersion
-    
-    # 书籍总数
-    book_count = await db.execute(
-        select(func.count(Book.id)).where(Book.library_id == library_id)
-    )
-    total_books = book_count.scalar()
-    
-    # 作者数量
-    author_count = await db.execute(
-        select(func.count(func.distinct(Book.author_id)))
-        .where(Book.library_id == library_id)
-        .where(Book.author_id.isnot(None))
-    )
-    total_authors = author_count.scalar()
+    """获取书库统计信息（读取物化统计，见 app.core.library_stats）"""
+    from app.core.library_stats import get_format_counts, summarize_libraries
     
-    # 总文件大小
-    total_size = await db.execute(
-        select(func.sum(BookVersion.file_size))
-        .join(Book)
-        .where(Book.library_id == library_id)
-    )
-    total_file_size = total_size.scalar() or 0
-    
-    # 格式分布
-    format_stats = await db.execute(
-        select(BookVersion.file_format, func.count(BookVersion.id))
-        .join(Book)
-        .where(Book.library_id == library_id)
-        .group_by(BookVersion.file_format)
-    )
-    formats = {row[0]: row[1] for row in format_stats}
+    summary = await summarize_libraries(db, [library_id])
+    formats = await get_format_counts(db, library_id)
     
     return {
         "library_id": library_id,
         "library_name": library.name,
-        "total_books": total_books,
-        "total_authors": total_authors,
-        "total_file_size": total_file_size,
+        "total_books": summary.book_count,
+        "total_authors": summary.author_count,
+        "total_groups": summary.group_count,
+        "total_versions": summary.version_count,
+        "books_with_cover": summary.cover_count,
+        "total_file_size": summary.total_size,
+        "primary_file_size": summary.primary_size,
         "format_distribution": formats,
         "last_scan": library.last_scan.isoformat() if library.last_scan else None,
+        "stats_reconciled_at": summary.reconciled_at.isoformat() if summary.reconciled_at else None,
     }
 
 
@@ -371,8 +366,12 @@ async def delete_library(
     current_user: User = Depends(get_current_admin)
 ):
     """删除书库（需要管理员权限）"""
+    from app.utils.cover_manager import cover_manager
+    
     await db.delete(library)
     await db.commit()
+    cover_manager.invalidate_cover()
+    access_context_cache.invalidate()
     
     log.info(f"删除书库: {library.name}")
     return {"status": "success"}
@@ -380,56 +379,76 @@ async def delete_library(
 
 # ===== 书籍管理 =====
 
-@router.get("/books")
-async def list_books(
-    page: int = Query(1, ge=1),
-    limit: int = Query(50, ge=1, le=100),
+# 排序方式 -> (排序键, 是否降序)；主键 Book.id 作为末尾的唯一键
+BOOK_SORT_KEYS = {
+    "added_at_desc": ("added_at", True),
+    "added_at_asc": ("added_at", False),
+    "title_asc": ("title", False),
+    "title_desc": ("title", True),
+    "size_desc": ("size", True),
+    "size_asc": ("size", False),
+    "format_asc": ("format", False),
+    "format_desc": ("format", True),
+    "rating_asc": ("rating", False),
+    "rating_desc": ("rating", True),
+}
+
+
+def _book_sort_keys(sort_key: str) -> list:
+    """返回键集分页使用的 (列表达式, 是否降序) 列表"""
+    name, descending = BOOK_SORT_KEYS[sort_key]
+    if name == "added_at":
+        column = Book.added_at
+    elif name == "title":
+        column = Book.title
+    elif name == "size":
+        column = Book.file_size
+    elif name == "format":
+        column = Book.file_format
+    else:
+        column = func.coalesce(Book.age_rating, "")
+    return [(column.label("sort_key"), descending), (Book.id.label("sort_id"), descending)]
+
+
+def _empty_book_page(page: int, limit: int) -> dict:
+    return {
+        "books": [],
+        "total": 0,
+        "page": page,
+        "limit": limit,
+        "total_pages": 0,
+        "next_cursor": None,
+        "has_more": False,
+    }
+
+
+async def _build_book_list_filters(
+    current_user: User,
+    db: AsyncSession,
     author_id: Optional[int] = None,
-    author_ids: Optional[str] = Query(None, description="按作者筛选（逗号分隔的作者ID）"),
+    author_ids: Optional[str] = None,
     library_id: Optional[int] = None,
-    formats: Optional[str] = Query(None, description="按格式筛选（逗号分隔，如'txt,epub'）"),
-    tag_ids: Optional[str] = Query(None, description="按标签筛选（逗号分隔的标签ID）"),
-    age_ratings: Optional[str] = Query(None, description="按内容分级筛选（逗号分隔，如'general,teen'）"),
-    min_size: Optional[int] = Query(None, ge=0, description="最小文件大小（字节）"),
-    max_size: Optional[int] = Query(None, ge=0, description="最大文件大小（字节）"),
-    added_from: Optional[date] = Query(None, description="添加时间起始（YYYY-MM-DD）"),
-    added_to: Optional[date] = Query(None, description="添加时间结束（YYYY-MM-DD）"),
-    sort: Optional[str] = Query("added_at_desc", description="排序方式：added_at_desc, added_at_asc, title_asc, title_desc, size_desc, size_asc, format_asc, format_desc, rating_asc, rating_desc"),
-    db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
-):
+    formats: Optional[str] = None,
+    tag_ids: Optional[str] = None,
+    age_ratings: Optional[str] = None,
+    min_size: Optional[int] = None,
+    max_size: Optional[int] = None,
+    added_from: Optional[date] = None,
+    added_to: Optional[date] = None,
+) -> Optional[list]:
     """
-    获取用户有权访问的书籍列表，返回分页数据和总数
-    支持筛选：
-    - author_id: 按作者ID筛选
-    - author_ids: 按作者ID筛选（逗号分隔）
-    - library_id: 按书库ID筛选
-    - formats: 按格式筛选，多个格式用逗号分隔（如'txt,epub,mobi'）
-    - tag_ids: 按标签筛选，多个标签ID用逗号分隔（如'1,2,3'）
-    - age_ratings: 按内容分级筛选
-    - min_size/max_size: 按文件大小筛选（字节）
-    - added_from/added_to: 按添加日期筛选
-    支持排序：
-    - added_at_desc/asc: 按添加时间排序
-    - title_asc/desc: 按书名排序
-    - size_desc/asc: 按文件大小排序
-    - format_asc/desc: 按格式排序
-    - rating_asc/desc: 按分级排序
+    构建书籍列表的筛选条件（含访问权限），供列表与分面统计共用
+
+    Returns:
+        Book 查询条件列表；用户无可访问书库或请求的书库不可访问时返回 None
     """
-    # 获取用户可访问的书库ID列表
     accessible_library_ids = await get_accessible_library_ids(current_user, db)
     
     if not accessible_library_ids:
-        return {
-            "books": [],
-            "total": 0,
-            "page": page,
-            "limit": limit,
-            "total_pages": 0
-        }
+        return None
     
-    # 构建基础过滤条件，只包含可访问书库的书籍
-    filters = [Book.library_id.in_(accessible_library_ids)]
+    # 构建基础过滤条件：可访问书库、用户内容分级与屏蔽标签
+    filters = build_book_access_filters(current_user, accessible_library_ids)
     
     if author_id:
         filters.append(Book.author_id == author_id)
@@ -445,13 +464,7 @@ async def list_books(
     if library_id:
         # 确保请求的书库在可访问列表中
         if library_id not in accessible_library_ids:
-            return {
-                "books": [],
-                "total": 0,
-                "page": page,
-                "limit": limit,
-                "total_pages": 0
-            }
+            return None
         filters.append(Book.library_id == library_id)
 
     if age_ratings:
@@ -467,8 +480,6 @@ async def list_books(
     
     # 按格式筛选
     if formats:
-        from app.models import BookVersion
-        from sqlalchemy import or_
         format_list = [f.strip().lower().lstrip('.') for f in formats.split(',') if f.strip()]
         if format_list:
             # 处理带点和不带点的格式（如 txt 和 .txt）
@@ -510,169 +521,126 @@ async def list_books(
         except Exception as e:
             log.error(f"标签筛选查询错误: {e}")
 
-    # 用户内容分级与屏蔽标签过滤（仅非管理员）
-    if not current_user.is_admin:
-        rating_hierarchy = {
-            'general': 0,
-            'teen': 1,
-            'adult': 2
-        }
-        rating_order = ['general', 'teen', 'adult']
-        user_limit = rating_hierarchy.get(current_user.age_rating_limit, 2)
-        allowed_ratings = rating_order[:user_limit + 1]
-        known_ratings = rating_order
-        filters.append(
-            or_(
-                Book.age_rating.is_(None),
-                func.lower(Book.age_rating).in_(allowed_ratings),
-                ~func.lower(Book.age_rating).in_(known_ratings)
-            )
-        )
+    # 按文件大小筛选（主版本）
+    if min_size is not None:
+        filters.append(Book.file_size >= min_size)
+    if max_size is not None:
+        filters.append(Book.file_size <= max_size)
 
-        if current_user.blocked_tags:
-            try:
-                blocked_tag_ids = json.loads(current_user.blocked_tags)
-                if blocked_tag_ids:
-                    blocked_exists = exists(
-                        select(BookTag.id)
-                        .where(BookTag.book_id == Book.id)
-                        .where(BookTag.tag_id.in_(blocked_tag_ids))
-                    )
-                    filters.append(~blocked_exists)
-            except (json.JSONDecodeError, TypeError) as e:
-                log.warning(f"解析用户屏蔽标签失败: {e}")
+    return filters
 
-    # 构建查询，只加载当前页所需数据
-    query = select(Book).options(
-        selectinload(Book.author),
-        selectinload(Book.versions)
+
+@router.get("/books")
+async def list_books(
+    page: int = Query(1, ge=1),
+    limit: int = Query(50, ge=1, le=100),
+    cursor: Optional[str] = Query(None, description="分页游标（上一页返回的 next_cursor），提供时忽略 page"),
+    include_total: bool = Query(True, description="是否返回总数（无限滚动翻页时可关闭）"),
+    author_id: Optional[int] = None,
+    author_ids: Optional[str] = Query(None, description="按作者筛选（逗号分隔的作者ID）"),
+    library_id: Optional[int] = None,
+    formats: Optional[str] = Query(None, description="按格式筛选（逗号分隔，如'txt,epub'）"),
+    tag_ids: Optional[str] = Query(None, description="按标签筛选（逗号分隔的标签ID）"),
+    age_ratings: Optional[str] = Query(None, description="按内容分级筛选（逗号分隔，如'general,teen'）"),
+    min_size: Optional[int] = Query(None, ge=0, description="最小文件大小（字节）"),
+    max_size: Optional[int] = Query(None, ge=0, description="最大文件大小（字节）"),
+    added_from: Optional[date] = Query(None, description="添加时间起始（YYYY-MM-DD）"),
+    added_to: Optional[date] = Query(None, description="添加时间结束（YYYY-MM-DD）"),
+    sort: Optional[str] = Query("added_at_desc", description="排序方式：added_at_desc, added_at_asc, title_asc, title_desc, size_desc, size_asc, format_asc, format_desc, rating_asc, rating_desc"),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    获取用户有权访问的书籍列表，返回分页数据和总数
+    分页：
+    - 键集分页：传入上一页返回的 next_cursor，深分页性能稳定
+    - 页码分页：仅传 page（兼容旧客户端）
+    - include_total=false 时不计算总数；总数会短时间缓存，为近似值
+    支持筛选：
+    - author_id: 按作者ID筛选
+    - author_ids: 按作者ID筛选（逗号分隔）
+    - library_id: 按书库ID筛选
+    - formats: 按格式筛选，多个格式用逗号分隔（如'txt,epub,mobi'）
+    - tag_ids: 按标签筛选，多个标签ID用逗号分隔（如'1,2,3'）
+    - age_ratings: 按内容分级筛选
+    - min_size/max_size: 按文件大小筛选（字节）
+    - added_from/added_to: 按添加日期筛选
+    支持排序：
+    - added_at_desc/asc: 按添加时间排序
+    - title_asc/desc: 按书名排序
+    - size_desc/asc: 按文件大小排序
+    - format_asc/desc: 按格式排序
+    - rating_asc/desc: 按分级排序
+    """
+    filters = await _build_book_list_filters(
+        current_user, db, author_id, author_ids, library_id, formats, tag_ids,
+        age_ratings, min_size, max_size, added_from, added_to,
+    )
+    if filters is None:
+        return _empty_book_page(page, limit)
+
+    sort_key = (sort or "added_at_desc").lower()
+    if sort_key not in BOOK_SORT_KEYS:
+        sort_key = "added_at_desc"
+    keys = _book_sort_keys(sort_key)
+
+    query = select(Book, *[column for column, _ in keys]).options(
+        selectinload(Book.author)
     ).where(and_(*filters))
 
-    # 应用排序（DB 内排序优先）
-    # 对于需要 BookVersion 的排序（size, format），仍在内存中处理
-    db_sort_applied = False
-    if sort:
-        sort_lower = sort.lower()
-        if sort_lower == "added_at_desc":
-            query = query.order_by(Book.added_at.desc())
-            db_sort_applied = True
-        elif sort_lower == "added_at_asc":
-            query = query.order_by(Book.added_at.asc())
-            db_sort_applied = True
-        elif sort_lower == "title_asc":
-            query = query.order_by(Book.title.asc())
-            db_sort_applied = True
-        elif sort_lower == "title_desc":
-            query = query.order_by(Book.title.desc())
-            db_sort_applied = True
-        elif sort_lower == "rating_asc":
-            query = query.order_by(Book.age_rating.asc())
-            db_sort_applied = True
-        elif sort_lower == "rating_desc":
-            query = query.order_by(Book.age_rating.desc())
-            db_sort_applied = True
-        # size_asc/desc 和 format_asc/desc 需要在获取数据后排序
-    
-    if not db_sort_applied:
-        query = query.order_by(Book.added_at.desc())
-
-    # 当排序/筛选需要内存处理时，退回全量加载
-    requires_memory_sort = sort and sort.lower() in ("size_desc", "size_asc", "format_asc", "format_desc")
-    requires_memory_size_filter = min_size is not None or max_size is not None
-
-    if not requires_memory_sort and not requires_memory_size_filter:
-        # 只计算当前页数据，提高大库性能
-        count_query = select(func.count()).select_from(
-            select(Book.id).where(and_(*filters)).subquery()
-        )
-        count_result = await db.execute(count_query)
-        total_count = int(count_result.scalar() or 0)
+    # 有游标时按键集定位，否则兼容旧的页码（OFFSET）分页
+    if cursor:
+        try:
+            cursor_values = decode_cursor(cursor, sort_key, len(keys))
+        except InvalidCursor as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        query = query.where(keyset_condition(keys, cursor_values))
+    else:
+        query = query.offset((page - 1) * limit)
 
-        if total_count == 0:
-            return {
-                "books": [],
-                "total": 0,
-                "page": page,
-                "limit": limit,
-                "total_pages": 0
-            }
+    query = query.order_by(
+        *[column.desc() if descending else column.asc() for column, descending in keys]
+    )
 
+    # 多取一行判断是否还有下一页
+    result = await db.execute(query.limit(limit + 1))
+    rows = result.all()
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor(sort_key, list(rows[-1][1:])) if has_more else None
+
+    # 总数可选；短时间内复用缓存值，翻页时不重复 COUNT
+    total_count = None
+    total_pages = None
+    if include_total:
+        # 按访问上下文（可访问书库、分级上限、屏蔽标签）区分：权限变更后不会命中旧的总数
+        context = await get_access_context(current_user, db)
+        count_key = (
+            context.is_admin, context.library_ids, context.rating_limit, context.blocked_tag_ids,
+            author_id, author_ids, library_id, formats, tag_ids, age_ratings,
+            min_size, max_size, added_from, added_to,
+        )
+        total_count = book_count_cache.get(count_key)
+        if total_count is None:
+            count_result = await db.execute(
+                select(func.count()).select_from(
+                    select(Book.id).where(and_(*filters)).subquery()
+                )
+            )
+            total_count = int(count_result.scalar() or 0)
+            book_count_cache.put(count_key, total_count)
         total_pages = (total_count + limit - 1) // limit
-        start_idx = (page - 1) * limit
 
-        result = await db.execute(query.offset(start_idx).limit(limit))
-        paginated_books = result.scalars().all()
-        filtered_books = paginated_books
-    else:
-        # 需要内存排序/筛选时，加载全部匹配结果
-        result = await db.execute(query)
-        filtered_books = result.scalars().all()
-    
-    # 内存中排序（对于需要 BookVersion 的排序）
-    if sort:
-        sort_lower = sort.lower()
-        
-        def get_primary_version(book):
-            """获取书籍的主版本"""
-            if book.versions:
-                primary = next((v for v in book.versions if v.is_primary), None)
-                if not primary:
-                    primary = book.versions[0] if book.versions else None
-                return primary
-            return None
-        
-        if sort_lower == "size_desc":
-            filtered_books.sort(key=lambda b: (get_primary_version(b).file_size if get_primary_version(b) else 0), reverse=True)
-        elif sort_lower == "size_asc":
-            filtered_books.sort(key=lambda b: (get_primary_version(b).file_size if get_primary_version(b) else 0))
-        elif sort_lower == "format_asc":
-            filtered_books.sort(key=lambda b: (get_primary_version(b).file_format if get_primary_version(b) else ""))
-        elif sort_lower == "format_desc":
-            filtered_books.sort(key=lambda b: (get_primary_version(b).file_format if get_primary_version(b) else ""), reverse=True)
-    
-    # 按文件大小过滤（主版本）
-    if min_size is not None or max_size is not None:
-        def in_size_range(book):
-            primary_version = None
-            if book.versions:
-                primary_version = next((v for v in book.versions if v.is_primary), None)
-                if not primary_version:
-                    primary_version = book.versions[0] if book.versions else None
-            size = primary_version.file_size if primary_version else 0
-            if min_size is not None and size < min_size:
-                return False
-            if max_size is not None and size > max_size:
-                return False
-            return True
-
-        filtered_books = [book for book in filtered_books if in_size_range(book)]
-
-    # 计算总数和分页（内存路径）
-    if requires_memory_sort or requires_memory_size_filter:
-        total_count = len(filtered_books)
-        total_pages = (total_count + limit - 1) // limit if total_count > 0 else 0
-        start_idx = (page - 1) * limit
-        end_idx = start_idx + limit
-        paginated_books = filtered_books[start_idx:end_idx]
-    else:
-        paginated_books = filtered_books
-    
     # 手动构建响应
     books_data = []
-    for book in paginated_books:
-        # 获取主版本或第一个版本
-        primary_version = None
-        if book.versions:
-            primary_version = next((v for v in book.versions if v.is_primary), None)
-            if not primary_version:
-                primary_version = book.versions[0] if book.versions else None
-        
+    for row in rows:
+        book = row[0]
         books_data.append({
             "id": book.id,
             "title": book.title,
             "author_name": book.author.name if book.author else None,
-            "file_format": primary_version.file_format if primary_version else "unknown",
-            "file_size": primary_version.file_size if primary_version else 0,
+            "file_format": book.file_format or "unknown",
+            "file_size": book.file_size or 0,
             "added_at": book.added_at.isoformat(),
         })
     
@@ -681,10 +649,61 @@ async def list_books(
         "total": total_count,
         "page": page,
         "limit": limit,
-        "total_pages": total_pages
+        "total_pages": total_pages,
+        "next_cursor": next_cursor,
+        "has_more": has_more,
     }
 
 
+@router.get("/books/facets")
+async def get_book_facets(
+    author_id: Optional[int] = None,
+    author_ids: Optional[str] = Query(None, description="按作者筛选（逗号分隔的作者ID）"),
+    library_id: Optional[int] = None,
+    formats: Optional[str] = Query(None, description="按格式筛选（逗号分隔，如'txt,epub'）"),
+    tag_ids: Optional[str] = Query(None, description="按标签筛选（逗号分隔的标签ID）"),
+    age_ratings: Optional[str] = Query(None, description="按内容分级筛选（逗号分隔，如'general,teen'）"),
+    min_size: Optional[int] = Query(None, ge=0, description="最小文件大小（字节）"),
+    max_size: Optional[int] = Query(None, ge=0, description="最大文件大小（字节）"),
+    added_from: Optional[date] = Query(None, description="添加时间起始（YYYY-MM-DD）"),
+    added_to: Optional[date] = Query(None, description="添加时间结束（YYYY-MM-DD）"),
+    db: AsyncSession = Depends(get_read_db),
+    current_user: User = Depends(get_current_user)
+):
+    """
+    获取当前筛选条件下的分面统计（格式、标签、作者、内容分级、文件大小区间）
+    筛选参数与 /books 一致；访问权限相同的用户共享缓存，书目变更后失效
+    """
+    from app.core.facets import compute_facets, facet_cache, filter_hash
+    from app.utils.permissions import get_access_context
+
+    filters = await _build_book_list_filters(
+        current_user, db, author_id, author_ids, library_id, formats, tag_ids,
+        age_ratings, min_size, max_size, added_from, added_to,
+    )
+    if filters is None:
+        return {
+            "total": 0, "formats": [], "tags": [], "authors": [], "age_ratings": [], "sizes": [],
+        }
+
+    context = await get_access_context(current_user, db)
+    cache_key = (
+        context.is_admin,
+        context.library_ids,
+        context.rating_limit,
+        context.blocked_tag_ids,
+        filter_hash((
+            author_id, author_ids, library_id, formats, tag_ids, age_ratings,
+            min_size, max_size, added_from, added_to,
+        )),
+    )
+    facets = facet_cache.get(cache_key)
+    if facets is None:
+        facets = await compute_facets(db, filters)
+        facet_cache.put(cache_key, facets)
+    return facets
+
+
 @router.get("/books/{book_id}")
 async def get_book(
     book_id: int,
@@ -1318,38 +1337,38 @@ async def update_progress(
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """更新阅读进度（需要有书籍访问权限）"""
+    """更新阅读进度（需要有书籍访问权限，写入经单写入者队列合并提交）"""
     from datetime import datetime, timezone
     
-    # 查找现有进度
-    result = await db.execute(
-        select(ReadingProgress)
-        .where(ReadingProgress.user_id == current_user.id)
-        .where(ReadingProgress.book_id == book_id)
-    )
-    progress = result.scalar_one_or_none()
-    
     now = datetime.now(timezone.utc)  # 使用带时区的UTC时间
-    
-    if progress:
-        # 更新现有进度
-        progress.progress = progress_data.progress
-        progress.position = progress_data.position
-        progress.finished = progress_data.finished
-        progress.last_read_at = now
-    else:
-        # 创建新进度
-        progress = ReadingProgress(
-            user_id=current_user.id,
-            book_id=book_id,
-            progress=progress_data.progress,
-            position=progress_data.position,
-            finished=progress_data.finished,
-            last_read_at=now,
+
+    async def save_progress(session: AsyncSession) -> None:
+        # 查找现有进度
+        result = await session.execute(
+            select(ReadingProgress)
+            .where(ReadingProgress.user_id == current_user.id)
+            .where(ReadingProgress.book_id == book_id)
         )
-        db.add(progress)
-    
-    await db.commit()
+        progress = result.scalar_one_or_none()
+        
+        if progress:
+            # 更新现有进度
+            progress.progress = progress_data.progress
+            progress.position = progress_data.position
+            progress.finished = progress_data.finished
+            progress.last_read_at = now
+        else:
+            # 创建新进度
+            session.add(ReadingProgress(
+                user_id=current_user.id,
+                book_id=book_id,
+                progress=progress_data.progress,
+                position=progress_data.position,
+                finished=progress_data.finished,
+                last_read_at=now,
+            ))
+
+    await write_queue.submit(save_progress)
 
     # 广播进度更新
     await manager.broadcast_to_user(current_user.id, {
@@ -1369,13 +1388,16 @@ async def update_progress(
 async def search_suggestions(
     q: str = Query(..., min_length=1, description="搜索关键词"),
     limit: int = Query(10, ge=1, le=20),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """
     获取搜索建议
-    返回匹配的书名和作者名
+    返回匹配的书名和作者名（支持拼音全拼与首字母）
+    前缀索引就绪时直接在内存中匹配，否则回退到数据库查询
     """
+    from app.core.suggest_index import suggestion_index
+
     if not q.strip():
         return []
         
@@ -1385,17 +1407,24 @@ async def search_suggestions(
     if not accessible_library_ids:
         return []
     
+    if suggestion_index.ready:
+        return [
+            SearchSuggestion(text=text, type=kind, id=entry_id)
+            for kind, entry_id, text in suggestion_index.suggest(q, accessible_library_ids, limit)
+        ]
+    
     search_term = f"%{q}%"
     suggestions = []
     
-    # 1. 搜索匹配的书籍
+    # 1. 搜索匹配的书籍（书名及译名，优先走全文索引）
     # 只查询可访问书库中的书籍
-    book_stmt = select(Book.id, Book.title).where(
-        and_(
-            Book.library_id.in_(accessible_library_ids),
-            Book.title.like(search_term)
-        )
-    ).limit(limit)
+    book_stmt = select(Book.id, Book.title).where(Book.library_id.in_(accessible_library_ids))
+    title_fts = search_subquery(q, columns=("title", "translations"))
+    if title_fts is not None:
+        book_stmt = book_stmt.join(title_fts, title_fts.c.book_id == Book.id).order_by(title_fts.c.rank)
+    else:
+        book_stmt = book_stmt.where(Book.title.ilike(search_term))
+    book_stmt = book_stmt.limit(limit)
     
     book_result = await db.execute(book_stmt)
     for row in book_result:
@@ -1411,13 +1440,19 @@ async def search_suggestions(
         
         # 搜索作者（需要确保作者至少有一本书在用户可访问的书库中）
         # 这里为了性能简化查询，只查作者名匹配，不严格检查每本书的权限
-        # 但通常作者存在就意味着有书。为了更严谨，可以关联 Book 表检查 library_id
         author_stmt = select(Author.id, Author.name).join(Book).where(
-            and_(
-                Book.library_id.in_(accessible_library_ids),
-                Author.name.like(search_term)
+            Book.library_id.in_(accessible_library_ids)
+        )
+        author_fts = search_subquery(q, columns=("author",))
+        if author_fts is not None:
+            author_stmt = (
+                author_stmt.join(author_fts, author_fts.c.book_id == Book.id)
+                .group_by(Author.id, Author.name)
+                .order_by(func.min(author_fts.c.rank))
             )
-        ).distinct().limit(remaining)
+        else:
+            author_stmt = author_stmt.where(Author.name.ilike(search_term)).distinct()
+        author_stmt = author_stmt.limit(remaining)
         
         author_result = await db.execute(author_stmt)
         for row in author_result:
@@ -1438,7 +1473,7 @@ async def search_books(
     author_id: Optional[int] = Query(None, description="按作者筛选"),
     formats: Optional[str] = Query(None, description="按格式筛选（逗号分隔，如'txt,epub'）"),
     library_id: Optional[int] = Query(None, description="按书库筛选"),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """
@@ -1473,38 +1508,33 @@ async def search_books(
             "total_pages": 0
         }
     
-    # 构建搜索查询
-    from sqlalchemy import or_
-    query = select(Book).options(
-        joinedload(Book.author),
-        joinedload(Book.book_tags),
-        joinedload(Book.versions)
+    # 构建搜索查询（权限、分级与屏蔽标签均在 SQL 中过滤）
+    query = select(Book).where(
+        and_(*build_book_access_filters(current_user, accessible_library_ids))
     )
-    query = query.where(Book.library_id.in_(accessible_library_ids))
-    
-    # 关键词搜索（书名或作者名）
-    if q.strip():
-        search_term = f"%{q}%"
-        query = query.outerjoin(Author, Book.author_id == Author.id)
-        query = query.where(
-            or_(
-                Book.title.like(search_term),
-                Author.name.like(search_term)
-            )
-        )
-    else:
-        # 即使没有搜索词，也需要 join Author 表以便后续使用
-        query = query.outerjoin(Author, Book.author_id == Author.id)
+    
+    # 关键词搜索（书名、作者、简介、标签、译名；索引不可用时回退到书名或作者名）
+    keyword = q.strip()
+    ranked = False
+    if keyword:
+        query, ranked = apply_keyword_search(query, keyword)
     
     # 按作者筛选
     if author_id:
         query = query.where(Book.author_id == author_id)
     
-    # 按格式筛选
+    # 按格式筛选（兼容带点与不带点的存储格式）
     if formats:
-        format_list = [f.strip().lower() for f in formats.split(',') if f.strip()]
+        format_list = [f.strip().lower().lstrip('.') for f in formats.split(',') if f.strip()]
         if format_list:
-            query = query.where(Book.file_format.in_(format_list))
+            format_values = format_list + [f".{fmt}" for fmt in format_list]
+            query = query.where(
+                Book.id.in_(
+                    select(BookVersion.book_id).where(
+                        func.lower(BookVersion.file_format).in_(format_values)
+                    )
+                )
+            )
     
     # 按书库筛选
     if library_id:
@@ -1527,23 +1557,24 @@ async def search_books(
                 }
             }
     
-    query = query.order_by(Book.title)
-    
-    result = await db.execute(query)
-    all_books = result.unique().scalars().all()
+    # 在数据库中计数
+    count_result = await db.execute(
+        select(func.count()).select_from(query.order_by(None).subquery())
+    )
+    total_books = int(count_result.scalar() or 0)
+    total_pages = (total_books + limit - 1) // limit if total_books > 0 else 0
     
-    # 应用内容分级过滤
-    filtered_books = []
-    for book in all_books:
-        if await check_book_access(current_user, book.id, db):
-            filtered_books.append(book)
+    # 有相关度时按相关度排序，书名作为次序；只加载当前页
+    query = query.order_by(Book.title).options(
+        selectinload(Book.author),
+        selectinload(Book.versions)
+    )
+    result = await db.execute(query.offset((page - 1) * limit).limit(limit))
+    paginated_books = result.scalars().all()
     
-    # 计算分页
-    total_books = len(filtered_books)
-    total_pages = (total_books + limit - 1) // limit if total_books > 0 else 0
-    start_idx = (page - 1) * limit
-    end_idx = start_idx + limit
-    paginated_books = filtered_books[start_idx:end_idx]
+    snippets = {}
+    if ranked:
+        snippets = await get_snippets(db, keyword, [book.id for book in paginated_books])
     
     # 构建响应
     response_books = []
@@ -1562,6 +1593,7 @@ async def search_books(
             "file_format": primary_version.file_format if primary_version else "unknown",
             "file_size": primary_version.file_size if primary_version else 0,
             "added_at": book.added_at.isoformat(),
+            "snippet": snippets.get(book.id),
         })
     
     return {
@@ -1597,28 +1629,14 @@ async def get_stats(
             "total_libraries": 0,
         }
     
-    # 统计可访问书库中的书籍数量
-    book_count = await db.execute(
-        select(func.count(Book.id))
-        .where(Book.library_id.in_(accessible_library_ids))
-    )
-    total_books = book_count.scalar()
+    from app.core.library_stats import summarize_libraries
     
-    # 统计可访问书库中的作者数量
-    author_count = await db.execute(
-        select(func.count(func.distinct(Book.author_id)))
-        .where(Book.library_id.in_(accessible_library_ids))
-        .where(Book.author_id.isnot(None))
-    )
-    total_authors = author_count.scalar()
-    
-    # 统计可访问的书库数量
-    total_libraries = len(accessible_library_ids)
+    summary = await summarize_libraries(db, accessible_library_ids)
     
     return {
-        "total_books": total_books,
-        "total_authors": total_authors,
-        "total_libraries": total_libraries,
+        "total_books": summary.book_count,
+        "total_authors": summary.author_count,
+        "total_libraries": len(accessible_library_ids),
     }
 
 
@@ -1656,6 +1674,7 @@ async def start_reading_session(
     db.add(session)
     await db.commit()
     await db.refresh(session)
+    heartbeat_buffer.remember_session(session.id, current_user.id, session.book_id)
     
     return {"session_id": session.id, "status": "started"}
 
@@ -1666,63 +1685,40 @@ async def heartbeat_reading_session(
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """阅读心跳更新"""
-    from app.models import ReadingSession, ReadingProgress
-    
-    # 获取会话
-    result = await db.execute(
-        select(ReadingSession).where(ReadingSession.id == data.session_id)
-    )
-    session = result.scalar_one_or_none()
-    
-    if not session:
+    """
+    阅读心跳更新
+
+    心跳先合并到内存缓冲区，每隔几秒在一个事务中批量写入（见 app.core.heartbeat_buffer）；
+    会话归属有缓存，常规心跳不访问数据库
+    """
+    owner = await heartbeat_buffer.resolve_session(db, data.session_id)
+    if owner is None:
         raise HTTPException(status_code=404, detail="会话不存在")
-        
-    if session.user_id != current_user.id:
-        raise HTTPException(status_code=403, detail="无权访问此会话")
     
-    # 更新会话信息
-    session.duration_seconds = data.duration_seconds
-    if data.progress is not None:
-        session.progress = data.progress
+    user_id, book_id = owner
+    if user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="无权访问此会话")
     
-    # 同时更新总体阅读进度
-    if data.progress is not None or data.position is not None:
-        progress_result = await db.execute(
-            select(ReadingProgress)
-            .where(ReadingProgress.user_id == current_user.id)
-            .where(ReadingProgress.book_id == session.book_id)
-        )
-        reading_progress = progress_result.scalar_one_or_none()
-        
-        now = datetime.now(timezone.utc)
-        
-        if reading_progress:
-            if data.progress is not None:
-                reading_progress.progress = max(reading_progress.progress, data.progress)
-            if data.position is not None:
-                reading_progress.position = data.position
-            reading_progress.last_read_at = now
-        else:
-            reading_progress = ReadingProgress(
-                user_id=current_user.id,
-                book_id=session.book_id,
-                progress=data.progress or 0.0,
-                position=data.position,
-                last_read_at=now
-            )
-            db.add(reading_progress)
-            
-    await db.commit()
-
-    # 广播进度更新
+    entry = heartbeat_buffer.submit(PendingHeartbeat(
+        session_id=data.session_id,
+        user_id=user_id,
+        book_id=book_id,
+        duration_seconds=data.duration_seconds,
+        progress=data.progress,
+        position=data.position,
+    ))
+    if not heartbeat_buffer.enabled:
+        pending = [heartbeat_buffer.take(data.session_id)]
+        await write_queue.submit(lambda session: apply_heartbeats(session, pending))
+        heartbeat_buffer.remember_session(data.session_id, user_id, book_id)
+
+    # 广播进度更新（与已保存的进度合并，避免只带位置或较低进度的心跳回退其他设备）
     if data.progress is not None or data.position is not None:
         await manager.broadcast_to_user(current_user.id, {
             "type": "progress_update",
-            "book_id": session.book_id,
-            "progress": reading_progress.progress,
-            "position": reading_progress.position,
-            "timestamp": now.isoformat()
+            "book_id": book_id,
+            **await merged_progress(db, entry),
+            "timestamp": entry.received_at.isoformat()
         })
     
     return {"status": "updated"}
@@ -1734,38 +1730,50 @@ async def end_reading_session(
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
 ):
-    """结束阅读会话"""
+    """结束阅读会话（写入经单写入者队列，与心跳批量写入串行执行）"""
     from app.models import ReadingSession, ReadingProgress
     
-    # 获取会话
-    result = await db.execute(
-        select(ReadingSession).where(ReadingSession.id == data.session_id)
-    )
-    session = result.scalar_one_or_none()
-    
-    if not session:
+    owner = await heartbeat_buffer.resolve_session(db, data.session_id)
+    if owner is None:
         raise HTTPException(status_code=404, detail="会话不存在")
-        
-    if session.user_id != current_user.id:
+    
+    user_id, book_id = owner
+    if user_id != current_user.id:
         raise HTTPException(status_code=403, detail="无权访问此会话")
     
-    # 更新会话信息
-    session.end_time = datetime.now(timezone.utc)
-    session.duration_seconds = data.duration_seconds
-    if data.progress is not None:
-        session.progress = data.progress
+    # 合并缓冲区中尚未写入的心跳（结束请求未携带的进度/位置沿用最后一次心跳）
+    pending = heartbeat_buffer.take(data.session_id)
+    if pending is not None:
+        if data.progress is None:
+            data.progress = pending.progress
+        if data.position is None:
+            data.position = pending.position
+    
+    now = datetime.now(timezone.utc)
+    
+    async def end_session(write_db: AsyncSession) -> Optional[ReadingProgress]:
+        # 在队列中重新读取会话：之前排队的心跳写入已提交，结束后迟到的心跳不再覆盖
+        session = await write_db.get(ReadingSession, data.session_id)
+        if session is None:
+            return None
         
-    # 同时更新总体阅读进度
-    if data.progress is not None or data.position is not None:
-        progress_result = await db.execute(
+        # 更新会话信息
+        session.end_time = now
+        session.duration_seconds = data.duration_seconds
+        if data.progress is not None:
+            session.progress = data.progress
+        await fold_session(write_db, session)
+        
+        # 同时更新总体阅读进度
+        if data.progress is None and data.position is None:
+            return None
+        progress_result = await write_db.execute(
             select(ReadingProgress)
-            .where(ReadingProgress.user_id == current_user.id)
-            .where(ReadingProgress.book_id == session.book_id)
+            .where(ReadingProgress.user_id == user_id)
+            .where(ReadingProgress.book_id == book_id)
         )
         reading_progress = progress_result.scalar_one_or_none()
         
-        now = datetime.now(timezone.utc)
-        
         if reading_progress:
             if data.progress is not None:
                 reading_progress.progress = max(reading_progress.progress, data.progress)
@@ -1774,21 +1782,22 @@ async def end_reading_session(
             reading_progress.last_read_at = now
         else:
             reading_progress = ReadingProgress(
-                user_id=current_user.id,
-                book_id=session.book_id,
+                user_id=user_id,
+                book_id=book_id,
                 progress=data.progress or 0.0,
                 position=data.position,
                 last_read_at=now
             )
-            db.add(reading_progress)
+            write_db.add(reading_progress)
+        return reading_progress
     
-    await db.commit()
+    reading_progress = await write_queue.submit(end_session)
 
     # 广播进度更新
-    if data.progress is not None or data.position is not None:
+    if reading_progress is not None:
         await manager.broadcast_to_user(current_user.id, {
             "type": "progress_update",
-            "book_id": session.book_id,
+            "book_id": book_id,
             "progress": reading_progress.progress,
             "position": reading_progress.position,
             "timestamp": now.isoformat()
@@ -1799,30 +1808,12 @@ async def end_reading_session(
 
 @router.get("/stats/reading/overview")
 async def get_reading_stats_overview(
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
-    """获取阅读统计概览"""
-    # 总阅读时长（秒）
-    total_duration_result = await db.execute(
-        select(func.sum(ReadingSession.duration_seconds))
-        .where(ReadingSession.user_id == current_user.id)
-    )
-    total_duration_seconds = total_duration_result.scalar() or 0
-    
-    # 总阅读会话数
-    session_count_result = await db.execute(
-        select(func.count(ReadingSession.id))
-        .where(ReadingSession.user_id == current_user.id)
-    )
-    total_sessions = session_count_result.scalar() or 0
-    
-    # 阅读过的书籍数量（有阅读会话记录）
-    books_read_result = await db.execute(
-        select(func.count(func.distinct(ReadingSession.book_id)))
-        .where(ReadingSession.user_id == current_user.id)
-    )
-    books_read = books_read_result.scalar() or 0
+    """获取阅读统计概览（读取阅读统计汇总与今日实时增量）"""
+    totals = await reading_totals(db, current_user.id)
+    total_duration_seconds = totals.duration_seconds
     
     # 已完成阅读的书籍数量
     finished_books_result = await db.execute(
@@ -1832,51 +1823,30 @@ async def get_reading_stats_overview(
     )
     finished_books = finished_books_result.scalar() or 0
     
-    # 今日阅读时长
-    today_start = datetime.now(timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
-    today_duration_result = await db.execute(
-        select(func.sum(ReadingSession.duration_seconds))
-        .where(ReadingSession.user_id == current_user.id)
-        .where(ReadingSession.start_time >= today_start)
-    )
-    today_duration = today_duration_result.scalar() or 0
-    
-    # 本周阅读时长（从周一开始）
+    # 今日、本周（从周一开始）、本月与过去30天的阅读时长，一次读取所需的每日汇总
     today = datetime.now(timezone.utc).date()
     week_start = today - timedelta(days=today.weekday())
-    week_start_dt = datetime.combine(week_start, datetime.min.time()).replace(tzinfo=timezone.utc)
-    week_duration_result = await db.execute(
-        select(func.sum(ReadingSession.duration_seconds))
-        .where(ReadingSession.user_id == current_user.id)
-        .where(ReadingSession.start_time >= week_start_dt)
-    )
-    week_duration = week_duration_result.scalar() or 0
-    
-    # 本月阅读时长
     month_start = today.replace(day=1)
-    month_start_dt = datetime.combine(month_start, datetime.min.time()).replace(tzinfo=timezone.utc)
-    month_duration_result = await db.execute(
-        select(func.sum(ReadingSession.duration_seconds))
-        .where(ReadingSession.user_id == current_user.id)
-        .where(ReadingSession.start_time >= month_start_dt)
-    )
-    month_duration = month_duration_result.scalar() or 0
+    thirty_days_ago = today - timedelta(days=30)
+    earliest = min(week_start, month_start, thirty_days_ago)
+    daily = await daily_totals(db, current_user.id, datetime.combine(earliest, datetime.min.time()))
+    
+    def duration_since(start: date) -> int:
+        start_key = start.isoformat()
+        return sum(duration for day, (duration, _) in daily.items() if day >= start_key)
+    
+    today_duration = duration_since(today)
+    week_duration = duration_since(week_start)
+    month_duration = duration_since(month_start)
     
     # 平均每日阅读时长（过去30天）
-    thirty_days_ago = datetime.now(timezone.utc) - timedelta(days=30)
-    avg_daily_result = await db.execute(
-        select(func.sum(ReadingSession.duration_seconds))
-        .where(ReadingSession.user_id == current_user.id)
-        .where(ReadingSession.start_time >= thirty_days_ago)
-    )
-    last_30_days_total = avg_daily_result.scalar() or 0
-    avg_daily_seconds = last_30_days_total / 30
+    avg_daily_seconds = duration_since(thirty_days_ago) / 30
     
     return {
         "total_duration_seconds": total_duration_seconds,
         "total_duration_formatted": _format_duration(total_duration_seconds),
-        "total_sessions": total_sessions,
-        "books_read": books_read,
+        "total_sessions": totals.session_count,
+        "books_read": totals.book_count,
         "finished_books": finished_books,
         "today_duration_seconds": today_duration,
         "today_duration_formatted": _format_duration(today_duration),
@@ -1892,62 +1862,32 @@ async def get_reading_stats_overview(
 @router.get("/stats/reading/daily")
 async def get_daily_reading_stats(
     days: int = Query(30, ge=1, le=365, description="统计天数"),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """获取每日阅读时长统计"""
     start_date = datetime.now(timezone.utc) - timedelta(days=days)
-    
-    # 按日期分组统计阅读时长
-    # 使用 SQLite 的 date() 函数提取日期
-    result = await db.execute(
-        select(
-            func.date(ReadingSession.start_time).label('date'),
-            func.sum(ReadingSession.duration_seconds).label('duration'),
-            func.count(ReadingSession.id).label('sessions')
-        )
-        .where(ReadingSession.user_id == current_user.id)
-        .where(ReadingSession.start_time >= start_date)
-        .group_by(func.date(ReadingSession.start_time))
-        .order_by(func.date(ReadingSession.start_time))
-    )
-    
-    daily_stats = []
-    for row in result:
-        daily_stats.append({
-            "date": row.date,
-            "duration_seconds": row.duration or 0,
-            "duration_formatted": _format_duration(row.duration or 0),
-            "sessions": row.sessions or 0
-        })
+    daily = await daily_totals(db, current_user.id, start_date)
     
     # 补充没有阅读记录的日期
     full_daily_stats = []
     current_date = start_date.date()
     end_date = datetime.now(timezone.utc).date()
-    existing_dates = {row["date"] for row in daily_stats}
-    
     while current_date <= end_date:
         date_str = current_date.isoformat()
-        if date_str in existing_dates:
-            # 找到对应的记录
-            for row in daily_stats:
-                if row["date"] == date_str:
-                    full_daily_stats.append(row)
-                    break
-        else:
-            full_daily_stats.append({
-                "date": date_str,
-                "duration_seconds": 0,
-                "duration_formatted": "0分钟",
-                "sessions": 0
-            })
+        duration, sessions = daily.get(date_str, (0, 0))
+        full_daily_stats.append({
+            "date": date_str,
+            "duration_seconds": duration,
+            "duration_formatted": _format_duration(duration),
+            "sessions": sessions
+        })
         current_date += timedelta(days=1)
     
     return {
         "days": days,
         "start_date": start_date.date().isoformat(),
-        "end_date": datetime.now(timezone.utc).date().isoformat(),
+        "end_date": end_date.isoformat(),
         "daily_stats": full_daily_stats
     }
 
@@ -1955,35 +1895,17 @@ async def get_daily_reading_stats(
 @router.get("/stats/reading/hourly")
 async def get_hourly_reading_distribution(
     days: int = Query(30, ge=1, le=365, description="统计天数"),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """获取每小时阅读分布（阅读习惯分析）"""
     start_date = datetime.now(timezone.utc) - timedelta(days=days)
+    totals = await hourly_totals(db, current_user.id, start_date)
     
-    # 按小时分组统计
-    # 使用 strftime 提取小时
-    result = await db.execute(
-        select(
-            func.strftime('%H', ReadingSession.start_time).label('hour'),
-            func.sum(ReadingSession.duration_seconds).label('duration'),
-            func.count(ReadingSession.id).label('sessions')
-        )
-        .where(ReadingSession.user_id == current_user.id)
-        .where(ReadingSession.start_time >= start_date)
-        .group_by(func.strftime('%H', ReadingSession.start_time))
-        .order_by(func.strftime('%H', ReadingSession.start_time))
-    )
-    
-    hourly_data = {str(i).zfill(2): {"duration_seconds": 0, "sessions": 0} for i in range(24)}
-    
-    for row in result:
-        hour = row.hour
-        if hour:
-            hourly_data[hour] = {
-                "duration_seconds": row.duration or 0,
-                "sessions": row.sessions or 0
-            }
+    hourly_data = {}
+    for hour in range(24):
+        duration, sessions = totals.get(hour, (0, 0))
+        hourly_data[str(hour).zfill(2)] = {"duration_seconds": duration, "sessions": sessions}
     
     # 转换为列表格式
     hourly_stats = []
@@ -2007,55 +1929,40 @@ async def get_hourly_reading_distribution(
 @router.get("/stats/reading/books")
 async def get_book_reading_stats(
     limit: int = Query(20, ge=1, le=100, description="返回数量"),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """获取各书籍阅读时长统计"""
     settings = load_settings()
     if not settings.get("rankings_enabled", True):
         raise HTTPException(status_code=403, detail="排行榜功能已关闭")
-    # 按书籍分组统计阅读时长
+    # 按书籍汇总的阅读时长，连同书籍与阅读进度一次查询
+    totals = book_totals(current_user.id)
     result = await db.execute(
-        select(
-            ReadingSession.book_id,
-            func.sum(ReadingSession.duration_seconds).label('total_duration'),
-            func.count(ReadingSession.id).label('session_count'),
-            func.max(ReadingSession.start_time).label('last_read')
+        select(Book, totals.c.duration_seconds, totals.c.session_count, totals.c.last_read_at, ReadingProgress)
+        .join(totals, totals.c.book_id == Book.id)
+        .outerjoin(
+            ReadingProgress,
+            and_(ReadingProgress.book_id == Book.id, ReadingProgress.user_id == current_user.id)
         )
-        .where(ReadingSession.user_id == current_user.id)
-        .group_by(ReadingSession.book_id)
-        .order_by(func.sum(ReadingSession.duration_seconds).desc())
+        .options(joinedload(Book.author))
+        .order_by(totals.c.duration_seconds.desc())
         .limit(limit)
     )
     
     book_stats = []
-    for row in result:
-        # 获取书籍信息
-        book_result = await db.execute(
-            select(Book).options(joinedload(Book.author)).where(Book.id == row.book_id)
-        )
-        book = book_result.scalar_one_or_none()
-        
-        if book:
-            # 获取阅读进度
-            progress_result = await db.execute(
-                select(ReadingProgress)
-                .where(ReadingProgress.user_id == current_user.id)
-                .where(ReadingProgress.book_id == row.book_id)
-            )
-            progress = progress_result.scalar_one_or_none()
-            
-            book_stats.append({
-                "book_id": row.book_id,
-                "title": book.title,
-                "author_name": book.author.name if book.author else None,
-                "total_duration_seconds": row.total_duration or 0,
-                "total_duration_formatted": _format_duration(row.total_duration or 0),
-                "session_count": row.session_count or 0,
-                "last_read": row.last_read.isoformat() if row.last_read else None,
-                "progress": progress.progress if progress else 0,
-                "finished": progress.finished if progress else False
-            })
+    for book, total_duration, session_count, last_read, progress in result.all():
+        book_stats.append({
+            "book_id": book.id,
+            "title": book.title,
+            "author_name": book.author.name if book.author else None,
+            "total_duration_seconds": total_duration or 0,
+            "total_duration_formatted": _format_duration(total_duration or 0),
+            "session_count": session_count or 0,
+            "last_read": last_read.isoformat() if last_read else None,
+            "progress": progress.progress if progress else 0,
+            "finished": progress.finished if progress else False
+        })
     
     return {
         "limit": limit,
@@ -2066,7 +1973,7 @@ async def get_book_reading_stats(
 @router.get("/stats/reading/authors")
 async def get_author_reading_stats(
     limit: int = Query(20, ge=1, le=100, description="返回数量"),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """获取作者阅读时长排行"""
@@ -2074,20 +1981,21 @@ async def get_author_reading_stats(
     if not settings.get("rankings_enabled", True):
         raise HTTPException(status_code=403, detail="排行榜功能已关闭")
 
+    totals = book_totals(current_user.id)
     result = await db.execute(
         select(
             Book.author_id.label("author_id"),
             Author.name.label("author_name"),
-            func.sum(ReadingSession.duration_seconds).label("total_duration"),
-            func.count(ReadingSession.id).label("session_count"),
-            func.count(func.distinct(ReadingSession.book_id)).label("book_count"),
-            func.max(ReadingSession.start_time).label("last_read"),
+            func.sum(totals.c.duration_seconds).label("total_duration"),
+            func.sum(totals.c.session_count).label("session_count"),
+            func.count(totals.c.book_id).label("book_count"),
+            func.max(totals.c.last_read_at).label("last_read"),
         )
-        .join(Book, Book.id == ReadingSession.book_id)
+        .select_from(totals)
+        .join(Book, Book.id == totals.c.book_id)
         .outerjoin(Author, Author.id == Book.author_id)
-        .where(ReadingSession.user_id == current_user.id)
         .group_by(Book.author_id, Author.name)
-        .order_by(func.sum(ReadingSession.duration_seconds).desc())
+        .order_by(func.sum(totals.c.duration_seconds).desc())
         .limit(limit)
     )
 
@@ -2112,7 +2020,7 @@ async def get_author_reading_stats(
 @router.get("/stats/reading/libraries")
 async def get_library_reading_stats(
     limit: int = Query(20, ge=1, le=100, description="返回数量"),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """获取书库阅读时长排行"""
@@ -2120,20 +2028,21 @@ async def get_library_reading_stats(
     if not settings.get("rankings_enabled", True):
         raise HTTPException(status_code=403, detail="排行榜功能已关闭")
 
+    totals = book_totals(current_user.id)
     result = await db.execute(
         select(
             Book.library_id.label("library_id"),
             Library.name.label("library_name"),
-            func.sum(ReadingSession.duration_seconds).label("total_duration"),
-            func.count(ReadingSession.id).label("session_count"),
-            func.count(func.distinct(ReadingSession.book_id)).label("book_count"),
-            func.max(ReadingSession.start_time).label("last_read"),
+            func.sum(totals.c.duration_seconds).label("total_duration"),
+            func.sum(totals.c.session_count).label("session_count"),
+            func.count(totals.c.book_id).label("book_count"),
+            func.max(totals.c.last_read_at).label("last_read"),
         )
-        .join(Book, Book.id == ReadingSession.book_id)
+        .select_from(totals)
+        .join(Book, Book.id == totals.c.book_id)
         .join(Library, Library.id == Book.library_id)
-        .where(ReadingSession.user_id == current_user.id)
         .group_by(Book.library_id, Library.name)
-        .order_by(func.sum(ReadingSession.duration_seconds).desc())
+        .order_by(func.sum(totals.c.duration_seconds).desc())
         .limit(limit)
     )
 
@@ -2158,7 +2067,7 @@ async def get_library_reading_stats(
 @router.get("/stats/reading/formats")
 async def get_format_reading_stats(
     limit: int = Query(20, ge=1, le=100, description="返回数量"),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """获取格式阅读时长排行（以主版本格式为准）"""
@@ -2166,25 +2075,20 @@ async def get_format_reading_stats(
     if not settings.get("rankings_enabled", True):
         raise HTTPException(status_code=403, detail="排行榜功能已关闭")
 
+    # 主版本格式取书籍上的冗余字段（无主版本时为最早的版本），空字符串表示没有版本
+    totals = book_totals(current_user.id)
     result = await db.execute(
         select(
-            BookVersion.file_format.label("file_format"),
-            func.sum(ReadingSession.duration_seconds).label("total_duration"),
-            func.count(ReadingSession.id).label("session_count"),
-            func.count(func.distinct(ReadingSession.book_id)).label("book_count"),
-            func.max(ReadingSession.start_time).label("last_read"),
-        )
-        .join(Book, Book.id == ReadingSession.book_id)
-        .outerjoin(
-            BookVersion,
-            and_(
-                BookVersion.book_id == Book.id,
-                BookVersion.is_primary == True
-            )
+            Book.file_format.label("file_format"),
+            func.sum(totals.c.duration_seconds).label("total_duration"),
+            func.sum(totals.c.session_count).label("session_count"),
+            func.count(totals.c.book_id).label("book_count"),
+            func.max(totals.c.last_read_at).label("last_read"),
         )
-        .where(ReadingSession.user_id == current_user.id)
-        .group_by(BookVersion.file_format)
-        .order_by(func.sum(ReadingSession.duration_seconds).desc())
+        .select_from(totals)
+        .join(Book, Book.id == totals.c.book_id)
+        .group_by(Book.file_format)
+        .order_by(func.sum(totals.c.duration_seconds).desc())
         .limit(limit)
     )
 
@@ -2208,7 +2112,7 @@ async def get_format_reading_stats(
 @router.get("/stats/reading/tags")
 async def get_tag_reading_stats(
     limit: int = Query(20, ge=1, le=100, description="返回数量"),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """获取标签阅读时长排行"""
@@ -2216,22 +2120,22 @@ async def get_tag_reading_stats(
     if not settings.get("rankings_enabled", True):
         raise HTTPException(status_code=403, detail="排行榜功能已关闭")
 
+    totals = book_totals(current_user.id)
     result = await db.execute(
         select(
             Tag.id.label("tag_id"),
             Tag.name.label("tag_name"),
             Tag.type.label("tag_type"),
-            func.sum(ReadingSession.duration_seconds).label("total_duration"),
-            func.count(ReadingSession.id).label("session_count"),
-            func.count(func.distinct(ReadingSession.book_id)).label("book_count"),
-            func.max(ReadingSession.start_time).label("last_read"),
+            func.sum(totals.c.duration_seconds).label("total_duration"),
+            func.sum(totals.c.session_count).label("session_count"),
+            func.count(totals.c.book_id).label("book_count"),
+            func.max(totals.c.last_read_at).label("last_read"),
         )
-        .join(Book, Book.id == ReadingSession.book_id)
-        .join(BookTag, BookTag.book_id == Book.id)
+        .select_from(totals)
+        .join(BookTag, BookTag.book_id == totals.c.book_id)
         .join(Tag, Tag.id == BookTag.tag_id)
-        .where(ReadingSession.user_id == current_user.id)
         .group_by(Tag.id, Tag.name, Tag.type)
-        .order_by(func.sum(ReadingSession.duration_seconds).desc())
+        .order_by(func.sum(totals.c.duration_seconds).desc())
         .limit(limit)
     )
 
@@ -2257,7 +2161,7 @@ async def get_tag_reading_stats(
 @router.get("/stats/reading/recent-sessions")
 async def get_recent_reading_sessions(
     limit: int = Query(20, ge=1, le=100, description="返回数量"),
-    db: AsyncSession = Depends(get_db),
+    db: AsyncSession = Depends(get_read_db),
     current_user: User = Depends(get_current_user)
 ):
     """获取最近的阅读会话记录"""
@@ -16,6 +16,7 @@ from sqlalchemy.ext.asyncio import AsyncSession
 from app.database import get_db
 from app.models import User
 from app.security import create_access_token, decode_access_token, verify_password, hash_password
+from app.utils.auth_cache import auth_user_cache
 from app.utils.logger import log
 from app.config import settings
 
@@ -68,27 +69,35 @@ class UserResponse(BaseModel):
         from_attributes = True
 
 
-async def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: AsyncSession = Depends(get_db)
-) -> User:
+def issue_access_token(user: User) -> str:
+    """为用户签发访问令牌（携带 Token 版本，修改密码后旧令牌失效）"""
+    return create_access_token(data={"sub": user.username, "ver": user.token_version or 0})
+
+
+async def resolve_token_user(token: Optional[str], db: AsyncSession) -> Optional[User]:
     """
-    获取当前登录用户
-    依赖注入，用于保护需要认证的路由
+    解析 JWT 并返回对应用户的只读快照
+    
+    优先读取认证用户缓存；Token 版本与用户当前版本不一致时视为无效
+    
+    Returns:
+        分离状态的用户快照，Token 无效或用户不存在时返回 None
     """
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="无法验证凭据",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
+    if not token:
+        return None
     
     payload = decode_access_token(token)
     if payload is None:
-        raise credentials_exception
+        return None
+    
+    username = payload.get("sub")
+    if not username:
+        return None
+    token_version = payload.get("ver", 0)
     
-    username: str = payload.get("sub")
-    if username is None:
-        raise credentials_exception
+    user = auth_user_cache.get(username, token_version)
+    if user is not None:
+        return user
     
     # 从数据库获取用户
     result = await db.execute(
@@ -96,12 +105,51 @@ async def get_current_user(
     )
     user = result.scalar_one_or_none()
     
+    if user is None or (user.token_version or 0) != token_version:
+        return None
+    
+    return auth_user_cache.put(user)
+
+
+async def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_db)
+) -> User:
+    """
+    获取当前登录用户
+    依赖注入，用于保护需要认证的路由
+    
+    返回分离的只读快照（不在会话中），需要修改用户时使用 get_current_user_for_update
+    """
+    user = await resolve_token_user(token, db)
     if user is None:
-        raise credentials_exception
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="无法验证凭据",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
     
     return user
 
 
+async def get_current_user_for_update(
+    current_user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db)
+) -> User:
+    """
+    获取当前登录用户（会话内对象，可修改后提交）
+    提交后应调用 invalidate_user 使缓存失效
+    """
+    user = await db.get(User, current_user.id)
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="无法验证凭据",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return user
+
+
 async def get_current_admin(
     current_user: User = Depends(get_current_user)
 ) -> User:
@@ -141,7 +189,7 @@ async def login(
         )
     
     # 创建访问令牌
-    access_token = create_access_token(data={"sub": user.username})
+    access_token = issue_access_token(user)
     
     log.info(f"用户登录: {user.username}")
     
@@ -190,7 +238,7 @@ async def login_json(
         )
     
     # 创建访问令牌
-    access_token = create_access_token(data={"sub": user.username})
+    access_token = issue_access_token(user)
     
     log.info(f"用户登录: {user.username}")
     
@@ -243,7 +291,7 @@ async def register_user(
     await db.commit()
     await db.refresh(user)
 
-    access_token = create_access_token(data={"sub": user.username})
+    access_token = issue_access_token(user)
     log.info(f"新用户注册: {user.username}")
 
     return {
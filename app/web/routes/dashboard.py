@@ -2,17 +2,19 @@
 Dashboard API - Emby 风格首页数据接口
 """
 from datetime import datetime, timedelta
-from typing import List, Optional
+from typing import Dict, List, Optional, Sequence
 
 from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
-from sqlalchemy import func, select, desc
+from sqlalchemy import desc, func, or_, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import selectinload
 
+from app.core.dashboard_cache import dashboard_cache
+from app.core.library_stats import summarize_libraries
 from app.database import get_db
 from app.models import (
-    User, Book, BookVersion, BookGroup, Library, LibraryPermission, 
+    User, Book, BookGroup, Library, LibraryPermission, 
     ReadingProgress, Author, Favorite
 )
 from app.web.routes.dependencies import get_current_user
@@ -20,7 +22,7 @@ from app.web.routes.dependencies import get_current_user
 router = APIRouter(prefix="/api", tags=["dashboard"])
 
 LATEST_PER_LIBRARY = 20
-LATEST_FETCH_MULTIPLIER = 4
+CONTINUE_READING_LIMIT = 20
 
 
 # ============= 响应模型 =============
@@ -124,55 +126,94 @@ async def get_user_accessible_libraries(db: AsyncSession, user: User) -> List[Li
     return list(all_libraries.values())
 
 
-def filter_books_by_group(books: List[Book]) -> List[Book]:
+def latest_books_subquery(library_ids: List[int], per_library: int):
     """
-    过滤书籍列表，去除同组重复书籍
-    - 如果书籍有 group_id，只保留组内的主书籍（primary_book_id）
-    - 如果书籍没有 group_id，正常保留
+    各书库最新书籍（同组书籍去重）的窗口函数子查询，列为 id、library_id、lib_rank
+
+    - 组指定了主书籍时只保留主书籍
+    - 组未指定主书籍时保留组内最新的一本
+    - 每个书库按添加时间倒序取前 per_library 本
     """
-    seen_groups = set()
-    filtered = []
-    
-    for book in books:
-        if book.group_id:
-            # 书籍属于某个组
-            if book.group_id in seen_groups:
-                continue  # 跳过已处理的组
-            seen_groups.add(book.group_id)
-            
-            # 检查是否为主书籍
-            if book.group and book.group.primary_book_id:
-                # 只有主书籍才加入结果
-                if book.id == book.group.primary_book_id:
-                    filtered.append(book)
-                # 不是主书籍，但是第一个遇到的该组书籍，暂时加入
-                # （以防 primary_book_id 不在当前列表中）
-                elif book.id == book.group_id:
-                    pass  # 跳过，等待主书籍
-                else:
-                    # 组存在但此书不是主书籍，跳过
-                    continue
-            else:
-                # 组没有指定主书籍，使用第一个遇到的
-                filtered.append(book)
-        else:
-            # 没有组，直接加入
-            filtered.append(book)
-    
-    return filtered
+    group_rank = func.row_number().over(
+        partition_by=(Book.library_id, func.coalesce(Book.group_id, -Book.id)),
+        order_by=(Book.added_at.desc(), Book.id.desc()),
+    )
+    candidates = (
+        select(Book.id, Book.library_id, Book.added_at, group_rank.label("group_rank"))
+        .outerjoin(BookGroup, BookGroup.id == Book.group_id)
+        .where(
+            Book.library_id.in_(library_ids),
+            or_(
+                Book.group_id.is_(None),
+                BookGroup.primary_book_id.is_(None),
+                Book.id == BookGroup.primary_book_id,
+            ),
+        )
+        .subquery()
+    )
+    library_rank = func.row_number().over(
+        partition_by=candidates.c.library_id,
+        order_by=(candidates.c.added_at.desc(), candidates.c.id.desc()),
+    )
+    ranked = (
+        select(candidates.c.id, candidates.c.library_id, library_rank.label("lib_rank"))
+        .where(candidates.c.group_rank == 1)
+        .subquery()
+    )
+    return select(ranked).where(ranked.c.lib_rank <= per_library).subquery()
+
+
+async def load_latest_books(db: AsyncSession, library_ids: List[int], per_library: int) -> Dict[int, List[Book]]:
+    """一次查询获取各书库的最新书籍，返回 library_id -> 书籍列表"""
+    latest = latest_books_subquery(library_ids, per_library)
+    result = await db.execute(
+        select(Book)
+        .options(selectinload(Book.author))
+        .join(latest, latest.c.id == Book.id)
+        .order_by(latest.c.library_id, latest.c.lib_rank)
+    )
+    books_by_library: Dict[int, List[Book]] = {}
+    for book in result.scalars().all():
+        books_by_library.setdefault(book.library_id, []).append(book)
+    return books_by_library
+
+
+async def build_library_summaries(db: AsyncSession, libraries: List[Library]) -> List[LibrarySummary]:
+    """一次查询获取各书库的书籍数与最新一本书（作为封面）"""
+    if not libraries:
+        return []
+    ranked = (
+        select(
+            Book.library_id,
+            Book.id,
+            func.row_number().over(
+                partition_by=Book.library_id,
+                order_by=(Book.added_at.desc(), Book.id.desc()),
+            ).label("rank"),
+            func.count().over(partition_by=Book.library_id).label("book_count"),
+        )
+        .where(Book.library_id.in_([library.id for library in libraries]))
+        .subquery()
+    )
+    result = await db.execute(
+        select(ranked.c.library_id, ranked.c.id, ranked.c.book_count).where(ranked.c.rank == 1)
+    )
+    latest = {row.library_id: (row.id, row.book_count) for row in result.all()}
+
+    summaries = []
+    for library in libraries:
+        latest_book_id, book_count = latest.get(library.id, (None, 0))
+        summaries.append(LibrarySummary(
+            id=library.id,
+            name=library.name,
+            book_count=book_count,
+            cover_url=f"/books/{latest_book_id}/cover" if latest_book_id else None
+        ))
+    return summaries
 
 
 def book_to_summary(book: Book, base_url: str = "") -> BookSummary:
     """转换书籍为摘要格式"""
-    # 获取主版本的格式
-    file_format = None
-    if hasattr(book, 'versions') and book.versions:
-        primary_version = next((v for v in book.versions if v.is_primary), None)
-        if not primary_version:
-            primary_version = book.versions[0] if book.versions else None
-        if primary_version:
-            file_format = primary_version.file_format
-    
     # 判断是否为新书（7天内添加）
     is_new = False
     if book.added_at:
@@ -185,10 +226,108 @@ def book_to_summary(book: Book, base_url: str = "") -> BookSummary:
         cover_url=f"{base_url}/books/{book.id}/cover",
         is_new=is_new,
         added_at=book.added_at,
-        file_format=file_format
+        file_format=book.file_format or None
     )
 
 
+async def load_continue_reading(
+    db: AsyncSession, user_id: int, library_ids: Sequence[int], limit: int
+) -> List[ContinueReadingItem]:
+    """获取继续阅读列表（有进度但未完成的书籍，仅限可访问书库）"""
+    if not library_ids:
+        return []
+    result = await db.execute(
+        select(ReadingProgress, Book, Author.name, Library.name)
+        .join(Book, ReadingProgress.book_id == Book.id)
+        .join(Library, Book.library_id == Library.id)
+        .outerjoin(Author, Book.author_id == Author.id)
+        .where(
+            ReadingProgress.user_id == user_id,
+            ReadingProgress.finished == False,
+            ReadingProgress.progress > 0,
+            Book.library_id.in_(library_ids)
+        )
+        .order_by(desc(ReadingProgress.last_read_at))
+        .limit(limit)
+    )
+    return [
+        ContinueReadingItem(
+            id=book.id,
+            title=book.title,
+            author_name=author_name,
+            cover_url=f"/books/{book.id}/cover",
+            progress=progress.progress,
+            last_read_at=progress.last_read_at,
+            library_id=book.library_id,
+            library_name=library_name
+        )
+        for progress, book, author_name, library_name in result.all()
+    ]
+
+
+async def build_catalog_section(db: AsyncSession, libraries: List[Library]) -> dict:
+    """Dashboard 书目部分：书库摘要、各书库最新书籍与统计（统计读取物化汇总，共 3 次查询）"""
+    library_ids = [library.id for library in libraries]
+
+    libraries_summary = await build_library_summaries(db, libraries)
+
+    books_by_library = await load_latest_books(db, library_ids, LATEST_PER_LIBRARY)
+    latest_by_library = [
+        LibraryLatest(
+            library_id=library.id,
+            library_name=library.name,
+            books=[book_to_summary(book) for book in books_by_library[library.id]]
+        )
+        for library in libraries
+        if books_by_library.get(library.id)
+    ]
+
+    summary = await summarize_libraries(db, library_ids, recent_days=7)
+
+    return {
+        "libraries": libraries_summary,
+        "latest_by_library": latest_by_library,
+        "stats": DashboardStats(
+            total_books=summary.book_count,
+            total_libraries=len(libraries),
+            total_authors=summary.author_count,
+            total_groups=summary.group_count,
+            new_books_7d=summary.recent_books,
+            total_size=summary.primary_size,
+        ),
+    }
+
+
+async def build_user_section(db: AsyncSession, user_id: int, library_ids: Sequence[int]) -> dict:
+    """Dashboard 个人部分：继续阅读列表、继续阅读数与收藏数（共 2 次查询）"""
+    continue_reading = await load_continue_reading(db, user_id, library_ids, CONTINUE_READING_LIMIT)
+
+    continue_reading_count = (
+        select(func.count(ReadingProgress.id))
+        .join(Book, ReadingProgress.book_id == Book.id)
+        .where(
+            ReadingProgress.user_id == user_id,
+            ReadingProgress.finished == False,
+            ReadingProgress.progress > 0,
+            Book.library_id.in_(library_ids)
+        )
+        .scalar_subquery()
+    )
+    favorites_count = (
+        select(func.count(Favorite.id))
+        .where(Favorite.user_id == user_id)
+        .scalar_subquery()
+    )
+    result = await db.execute(select(continue_reading_count, favorites_count))
+    count, favorites = result.one()
+
+    return {
+        "continue_reading": continue_reading,
+        "continue_reading_count": count or 0,
+        "favorites": favorites or 0,
+    }
+
+
 # ============= API 端点 =============
 
 @router.get("/dashboard", response_model=DashboardResponse)
@@ -208,7 +347,7 @@ async def get_dashboard(
     
     # 1. 获取用户可访问的书库
     accessible_libraries = await get_user_accessible_libraries(db, current_user)
-    library_ids = [lib.id for lib in accessible_libraries]
+    library_ids = tuple(sorted(lib.id for lib in accessible_libraries))
 
     # 0. 如果没有可访问书库，直接返回空数据
     if not library_ids:
@@ -217,160 +356,31 @@ async def get_dashboard(
             libraries=[],
             latest_by_library=[],
             favorites_count=0,
-            stats=DashboardStats(
-                total_books=0,
-                total_libraries=0,
-                total_authors=0,
-                total_groups=0,
-                continue_reading=0,
-                favorites=0,
-                new_books_7d=0,
-                total_size=0,
-            )
-        )
-    
-    # 2. 构建书库摘要列表（包含书籍数量）
-    libraries_summary = []
-    for library in accessible_libraries:
-        # 获取书籍数量
-        result = await db.execute(
-            select(func.count(Book.id)).where(Book.library_id == library.id)
-        )
-        book_count = result.scalar() or 0
-        
-        # 获取最新一本书作为封面
-        result = await db.execute(
-            select(Book).where(Book.library_id == library.id)
-            .order_by(desc(Book.added_at)).limit(1)
+            stats=DashboardStats()
         )
-        latest_book = result.scalar_one_or_none()
-        
-        cover_url = f"/books/{latest_book.id}/cover" if latest_book else None
-        
-        libraries_summary.append(LibrarySummary(
-            id=library.id,
-            name=library.name,
-            book_count=book_count,
-            cover_url=cover_url
-        ))
-    
-    # 3. 获取继续阅读列表（有进度但未完成的书籍）
-    continue_reading = []
-    result = await db.execute(
-        select(ReadingProgress).options(
-            selectinload(ReadingProgress.book).selectinload(Book.library),
-            selectinload(ReadingProgress.book).selectinload(Book.author)
-        ).where(
-            ReadingProgress.user_id == current_user.id,
-            ReadingProgress.finished == False,
-            ReadingProgress.progress > 0
-        ).order_by(desc(ReadingProgress.last_read_at)).limit(20)
-    )
-    reading_progress_list = result.scalars().all()
-    
-    for progress in reading_progress_list:
-        book = progress.book
-        if book and book.library_id in library_ids:
-            continue_reading.append(ContinueReadingItem(
-                id=book.id,
-                title=book.title,
-                author_name=book.author.name if book.author else None,
-                cover_url=f"/books/{book.id}/cover",
-                progress=progress.progress,
-                last_read_at=progress.last_read_at,
-                library_id=book.library_id,
-                library_name=book.library.name
-            ))
-    
-    # 4. 获取每个书库的最新书籍（去除同组重复）
-    latest_by_library = []
-    for library in accessible_libraries:
-        # 多查询一些书籍以便过滤后仍有足够数量
-        result = await db.execute(
-            select(Book).options(
-                selectinload(Book.author),
-                selectinload(Book.versions),
-                selectinload(Book.group)  # 加载组信息
-            ).where(Book.library_id == library.id)
-            .order_by(desc(Book.added_at)).limit(LATEST_PER_LIBRARY * LATEST_FETCH_MULTIPLIER)
-        )
-        all_books = list(result.scalars().all())
-        
-        # 过滤同组重复书籍
-        filtered_books = filter_books_by_group(all_books)[:LATEST_PER_LIBRARY]
-        
-        if filtered_books:
-            latest_by_library.append(LibraryLatest(
-                library_id=library.id,
-                library_name=library.name,
-                books=[book_to_summary(book) for book in filtered_books]
-            ))
-    
-    # 5. 获取收藏数量
-    result = await db.execute(
-        select(func.count(Favorite.id)).where(Favorite.user_id == current_user.id)
-    )
-    favorites_count = result.scalar() or 0
 
-    # 6. 统计信息（仅统计可访问书库）
-    total_books_result = await db.execute(
-        select(func.count(Book.id)).where(Book.library_id.in_(library_ids))
-    )
-    total_books = total_books_result.scalar() or 0
+    # 2. 书目部分：书库摘要、各书库最新书籍与统计（访问权限相同的用户共享缓存）
+    catalog = dashboard_cache.get_catalog(library_ids)
+    if catalog is None:
+        catalog = await build_catalog_section(db, accessible_libraries)
+        dashboard_cache.put_catalog(library_ids, catalog)
 
-    total_authors_result = await db.execute(
-        select(func.count(func.distinct(Book.author_id)))
-        .where(Book.library_id.in_(library_ids), Book.author_id.isnot(None))
-    )
-    total_authors = total_authors_result.scalar() or 0
+    # 3. 个人部分：继续阅读、收藏数（按用户缓存）
+    personal = dashboard_cache.get_user(current_user.id, library_ids)
+    if personal is None:
+        personal = await build_user_section(db, current_user.id, library_ids)
+        dashboard_cache.put_user(current_user.id, library_ids, personal)
 
-    total_groups_result = await db.execute(
-        select(func.count(func.distinct(Book.group_id)))
-        .where(Book.library_id.in_(library_ids), Book.group_id.isnot(None))
-    )
-    total_groups = total_groups_result.scalar() or 0
-
-    recent_threshold = datetime.utcnow() - timedelta(days=7)
-    new_books_result = await db.execute(
-        select(func.count(Book.id))
-        .where(Book.library_id.in_(library_ids), Book.added_at >= recent_threshold)
-    )
-    new_books_7d = new_books_result.scalar() or 0
-
-    total_size_result = await db.execute(
-        select(func.coalesce(func.sum(BookVersion.file_size), 0))
-        .join(Book, BookVersion.book_id == Book.id)
-        .where(Book.library_id.in_(library_ids), BookVersion.is_primary == True)
-    )
-    total_size = total_size_result.scalar() or 0
-
-    continue_reading_count_result = await db.execute(
-        select(func.count(ReadingProgress.id))
-        .join(Book, ReadingProgress.book_id == Book.id)
-        .where(
-            ReadingProgress.user_id == current_user.id,
-            ReadingProgress.finished == False,
-            ReadingProgress.progress > 0,
-            Book.library_id.in_(library_ids)
-        )
-    )
-    continue_reading_count = continue_reading_count_result.scalar() or 0
-    
+    stats: DashboardStats = catalog["stats"]
     return DashboardResponse(
-        continue_reading=continue_reading,
-        libraries=libraries_summary,
-        latest_by_library=latest_by_library,
-        favorites_count=favorites_count,
-        stats=DashboardStats(
-            total_books=total_books,
-            total_libraries=len(accessible_libraries),
-            total_authors=total_authors,
-            total_groups=total_groups,
-            continue_reading=continue_reading_count,
-            favorites=favorites_count,
-            new_books_7d=new_books_7d,
-            total_size=total_size,
-        )
+        continue_reading=personal["continue_reading"],
+        libraries=catalog["libraries"],
+        latest_by_library=catalog["latest_by_library"],
+        favorites_count=personal["favorites"],
+        stats=stats.model_copy(update={
+            "continue_reading": personal["continue_reading_count"],
+            "favorites": personal["favorites"],
+        })
     )
 
 
@@ -384,35 +394,7 @@ async def get_continue_reading(
     
     accessible_libraries = await get_user_accessible_libraries(db, current_user)
     library_ids = [lib.id for lib in accessible_libraries]
-    
-    result = await db.execute(
-        select(ReadingProgress).options(
-            selectinload(ReadingProgress.book).selectinload(Book.library),
-            selectinload(ReadingProgress.book).selectinload(Book.author)
-        ).where(
-            ReadingProgress.user_id == current_user.id,
-            ReadingProgress.finished == False,
-            ReadingProgress.progress > 0
-        ).order_by(desc(ReadingProgress.last_read_at)).limit(limit)
-    )
-    reading_progress_list = result.scalars().all()
-    
-    items = []
-    for progress in reading_progress_list:
-        book = progress.book
-        if book and book.library_id in library_ids:
-            items.append(ContinueReadingItem(
-                id=book.id,
-                title=book.title,
-                author_name=book.author.name if book.author else None,
-                cover_url=f"/books/{book.id}/cover",
-                progress=progress.progress,
-                last_read_at=progress.last_read_at,
-                library_id=book.library_id,
-                library_name=book.library.name
-            ))
-    
-    return items
+    return await load_continue_reading(db, current_user.id, library_ids, limit)
 
 
 @router.get("/libraries", response_model=List[LibrarySummary])
@@ -423,32 +405,7 @@ async def get_libraries(
     """获取用户可访问的书库列表"""
     
     accessible_libraries = await get_user_accessible_libraries(db, current_user)
-    
-    result = []
-    for library in accessible_libraries:
-        # 获取书籍数量
-        count_result = await db.execute(
-            select(func.count(Book.id)).where(Book.library_id == library.id)
-        )
-        book_count = count_result.scalar() or 0
-        
-        # 获取最新一本书作为封面
-        book_result = await db.execute(
-            select(Book).where(Book.library_id == library.id)
-            .order_by(desc(Book.added_at)).limit(1)
-        )
-        latest_book = book_result.scalar_one_or_none()
-        
-        cover_url = f"/books/{latest_book.id}/cover" if latest_book else None
-        
-        result.append(LibrarySummary(
-            id=library.id,
-            name=library.name,
-            book_count=book_count,
-            cover_url=cover_url
-        ))
-    
-    return result
+    return await build_library_summaries(db, accessible_libraries)
 
 
 @router.get("/libraries/{library_id}/latest", response_model=LibraryLatest)
@@ -474,23 +431,10 @@ async def get_library_latest(
     if not library:
         raise HTTPException(status_code=404, detail="书库不存在")
     
-    # 多查询一些以便过滤后有足够数量
-    fetch_limit = limit * 3 if limit < 50 else limit + 50
-    result = await db.execute(
-        select(Book).options(
-            selectinload(Book.author),
-            selectinload(Book.versions),
-            selectinload(Book.group)
-        ).where(Book.library_id == library_id)
-        .order_by(desc(Book.added_at)).limit(fetch_limit)
-    )
-    all_books = list(result.scalars().all())
-    
-    # 过滤同组重复书籍
-    filtered_books = filter_books_by_group(all_books)[:limit]
+    books_by_library = await load_latest_books(db, [library_id], limit)
     
     return LibraryLatest(
         library_id=library.id,
         library_name=library.name,
-        books=[book_to_summary(book) for book in filtered_books]
+        books=[book_to_summary(book) for book in books_by_library.get(library_id, [])]
     )
@@ -12,13 +12,15 @@ from urllib.parse import quote
 from fastapi import APIRouter, Depends, Query, Request, Response, HTTPException, Header
 from fastapi.responses import FileResponse
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
-from sqlalchemy import func, or_, select
+from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy.orm import joinedload
+from sqlalchemy.orm import joinedload, selectinload
 
+from app.core.search_index import apply_keyword_search
 from app.database import get_db
 from app.models import Author, Book, Library, User
-from app.security import verify_password
+from app.security import verify_password_async
+from app.utils.auth_cache import credential_cache
 from app.utils.logger import log
 from app.utils.opds_builder import (
     build_opds_acquisition_feed,
@@ -29,7 +31,11 @@ from app.utils.opds_builder import (
     build_opds_root,
     build_opds_search_descriptor,
 )
-from app.utils.permissions import check_book_access, check_content_rating, get_accessible_library_ids
+from app.utils.permissions import (
+    build_book_access_filters,
+    check_book_access,
+    get_accessible_library_ids,
+)
 
 router = APIRouter()
 security = HTTPBasic(auto_error=False)
@@ -57,11 +63,7 @@ async def get_opds_user_optional(
             username, password = parsed
 
     if username and password is not None:
-        result = await db.execute(select(User).where(User.username == username))
-        user = result.scalar_one_or_none()
-
-        if user and verify_password(password, user.password_hash):
-            return user
+        return await _authenticate_basic(username, password, db)
     
     return None
 
@@ -84,10 +86,8 @@ async def get_opds_user(
             username, password = parsed
 
     if username and password is not None:
-        result = await db.execute(select(User).where(User.username == username))
-        user = result.scalar_one_or_none()
-
-        if user and verify_password(password, user.password_hash):
+        user = await _authenticate_basic(username, password, db)
+        if user:
             return user
     
     # 没有认证或认证失败，返回 401 要求认证
@@ -98,6 +98,25 @@ async def get_opds_user(
     )
 
 
+async def _authenticate_basic(username: str, password: str, db: AsyncSession) -> Optional[User]:
+    """
+    验证 Basic Auth 凭据
+
+    阅读器每个请求都会携带凭据，已验证的凭据在短时间内直接命中缓存；
+    未命中时在线程池中执行 bcrypt，避免阻塞事件循环
+    """
+    user = credential_cache.get(username, password)
+    if user is not None:
+        return user
+
+    result = await db.execute(select(User).where(User.username == username))
+    user = result.scalar_one_or_none()
+
+    if user and await verify_password_async(password, user.password_hash):
+        return credential_cache.put(username, password, user)
+    return None
+
+
 def _parse_basic_auth(request: Request) -> Optional[tuple[str, str]]:
     auth_header = request.headers.get("Authorization") or ""
     if not auth_header.lower().startswith("basic "):
@@ -124,6 +143,27 @@ def get_base_url(request: Request) -> str:
     return f"{request.url.scheme}://{request.url.netloc}"
 
 
+async def _fetch_book_page(
+    db: AsyncSession,
+    query,
+    page: int,
+    limit: int
+) -> tuple[list[Book], int]:
+    """在数据库中计数并只加载当前页书籍，返回 (书籍列表, 总页数)"""
+    count_result = await db.execute(
+        select(func.count()).select_from(query.order_by(None).subquery())
+    )
+    total_books = int(count_result.scalar() or 0)
+    total_pages = math.ceil(total_books / limit) if total_books > 0 else 1
+
+    result = await db.execute(
+        query.options(selectinload(Book.author), selectinload(Book.versions))
+        .offset((page - 1) * limit)
+        .limit(limit)
+    )
+    return list(result.scalars().all()), total_pages
+
+
 async def resolve_download_context(
     book_id: int,
     db: AsyncSession,
@@ -250,41 +290,11 @@ async def opds_recent_books(
         )
         return Response(content=xml, media_type="application/atom+xml;profile=opds-catalog;kind=acquisition")
     
-    # 查询可访问书库中的书籍
-    query = select(Book).options(
-        joinedload(Book.author),
-        joinedload(Book.book_tags),
-        joinedload(Book.versions),
-    )
-    query = query.where(Book.library_id.in_(accessible_library_ids))
+    # 查询可访问书库中的书籍（权限与内容分级在 SQL 中过滤）
+    query = select(Book).where(*build_book_access_filters(current_user, accessible_library_ids))
     query = query.order_by(Book.added_at.desc())
 
-    if current_user.is_admin:
-        count_result = await db.execute(
-            select(func.count(Book.id)).where(Book.library_id.in_(accessible_library_ids))
-        )
-        total_books = count_result.scalar() or 0
-        total_pages = math.ceil(total_books / limit) if total_books > 0 else 1
-        offset = (page - 1) * limit
-        result = await db.execute(query.offset(offset).limit(limit))
-        paginated_books = result.unique().scalars().all()
-    else:
-        # 获取所有符合条件的书籍
-        result = await db.execute(query)
-        all_books = result.unique().scalars().all()
-
-        # 应用内容分级过滤（避免逐本 DB 查询）
-        filtered_books = []
-        for book in all_books:
-            if await check_content_rating(current_user, book, db):
-                filtered_books.append(book)
-
-        # 计算分页
-        total_books = len(filtered_books)
-        total_pages = math.ceil(total_books / limit) if total_books > 0 else 1
-        start_idx = (page - 1) * limit
-        end_idx = start_idx + limit
-        paginated_books = filtered_books[start_idx:end_idx]
+    paginated_books, total_pages = await _fetch_book_page(db, query, page, limit)
     
     # 构建 Feed
     self_link = f"{base_url}/opds/recent?page={page}&limit={limit}"
@@ -409,31 +419,12 @@ async def opds_author_books(
         )
         return Response(content=xml, media_type="application/atom+xml;profile=opds-catalog;kind=acquisition")
     
-    # 查询作者的书籍（限定在可访问书库中）
-    query = select(Book).options(
-        joinedload(Book.author),
-        joinedload(Book.book_tags),
-        joinedload(Book.versions),
-    )
+    # 查询作者的书籍（权限与内容分级在 SQL 中过滤）
+    query = select(Book).where(*build_book_access_filters(current_user, accessible_library_ids))
     query = query.where(Book.author_id == author_id)
-    query = query.where(Book.library_id.in_(accessible_library_ids))
     query = query.order_by(Book.title)
     
-    result = await db.execute(query)
-    all_books = result.unique().scalars().all()
-    
-    # 应用内容分级过滤
-    filtered_books = []
-    for book in all_books:
-        if await check_book_access(current_user, book.id, db):
-            filtered_books.append(book)
-    
-    # 计算分页
-    total_books = len(filtered_books)
-    total_pages = math.ceil(total_books / limit) if total_books > 0 else 1
-    start_idx = (page - 1) * limit
-    end_idx = start_idx + limit
-    paginated_books = filtered_books[start_idx:end_idx]
+    paginated_books, total_pages = await _fetch_book_page(db, query, page, limit)
     
     # 构建 Feed
     self_link = f"{base_url}/opds/author/{author_id}?page={page}&limit={limit}"
@@ -496,40 +487,14 @@ async def opds_search(
         )
         return Response(content=xml, media_type="application/atom+xml;profile=opds-catalog;kind=acquisition")
     
-    # 构建搜索查询
-    search_term = f"%{q}%"
-    query = select(Book).options(
-        joinedload(Book.author),
-        joinedload(Book.book_tags),
-        joinedload(Book.versions),
-    )
-    query = query.where(Book.library_id.in_(accessible_library_ids))
-    
-    # 搜索书名或作者名
-    query = query.outerjoin(Author, Book.author_id == Author.id)
-    query = query.where(
-        or_(
-            Book.title.like(search_term),
-            Author.name.like(search_term)
-        )
-    )
-    query = query.order_by(Book.title)
+    # 构建搜索查询（权限与内容分级在 SQL 中过滤）
+    query = select(Book).where(*build_book_access_filters(current_user, accessible_library_ids))
     
-    result = await db.execute(query)
-    all_books = result.unique().scalars().all()
+    # 全文检索（按相关度排序），索引不可用时回退到书名或作者名
+    query, _ = apply_keyword_search(query, q.strip())
+    query = query.order_by(Book.title)
     
-    # 应用内容分级过滤
-    filtered_books = []
-    for book in all_books:
-        if await check_book_access(current_user, book.id, db):
-            filtered_books.append(book)
-    
-    # 计算分页
-    total_books = len(filtered_books)
-    total_pages = math.ceil(total_books / limit) if total_books > 0 else 1
-    start_idx = (page - 1) * limit
-    end_idx = start_idx + limit
-    paginated_books = filtered_books[start_idx:end_idx]
+    paginated_books, total_pages = await _fetch_book_page(db, query, page, limit)
     
     # 构建 Feed
     self_link = _build_search_self_link(base_url, q, page, limit)
@@ -628,26 +593,10 @@ async def opds_library_books(
         )
         return Response(content=xml, media_type="application/atom+xml;profile=opds-catalog;kind=acquisition")
 
-    query = select(Book).options(
-        joinedload(Book.author),
-        joinedload(Book.book_tags),
-        joinedload(Book.versions),
-    )
-    query = query.where(Book.library_id == library_id).order_by(Book.added_at.desc())
-
-    result = await db.execute(query)
-    all_books = result.unique().scalars().all()
-
-    filtered_books = []
-    for book in all_books:
-        if await check_book_access(current_user, book.id, db):
-            filtered_books.append(book)
+    query = select(Book).where(*build_book_access_filters(current_user, [library_id]))
+    query = query.order_by(Book.added_at.desc())
 
-    total_books = len(filtered_books)
-    total_pages = math.ceil(total_books / limit) if total_books > 0 else 1
-    start_idx = (page - 1) * limit
-    end_idx = start_idx + limit
-    paginated_books = filtered_books[start_idx:end_idx]
+    paginated_books, total_pages = await _fetch_book_page(db, query, page, limit)
 
     self_link = f"{base_url}/opds/library/{library_id}?page={page}&limit={limit}"
     xml = build_opds_acquisition_feed(
@@ -13,6 +13,7 @@ from app.database import get_db
 from app.models import Library, LibraryPermission, User
 from app.web.routes.auth import get_current_admin, get_current_user
 from app.utils.logger import log
+from app.utils.permissions import access_context_cache
 
 router = APIRouter()
 
@@ -107,6 +108,7 @@ async def grant_library_access(
     db.add(permission)
     await db.commit()
     await db.refresh(permission)
+    access_context_cache.invalidate(permission.user_id)
     
     log.info(f"管理员 {admin.username} 为用户 {user.username} 授予书库 {library.name} 的访问权限")
     
@@ -150,6 +152,7 @@ async def revoke_library_access(
     
     await db.delete(permission)
     await db.commit()
+    access_context_cache.invalidate(permission.user_id)
     
     log.info(f"管理员 {admin.username} 撤销了用户 {user.username if user else permission.user_id} 对书库 {library.name if library else permission.library_id} 的访问权限")
     
@@ -190,6 +193,7 @@ async def revoke_user_library_access(
     
     await db.delete(permission)
     await db.commit()
+    access_context_cache.invalidate(user_id)
     
     log.info(f"管理员 {admin.username} 撤销了用户 {user_id} 对书库 {library_id} 的访问权限")
     
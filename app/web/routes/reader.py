@@ -19,13 +19,11 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database import get_db
 from app.models import Book, User, BookVersion
-from app.web.routes.auth import get_current_user
+from app.web.routes.auth import get_current_user, resolve_token_user
 from app.web.routes.dependencies import get_accessible_book
-from app.security import decode_access_token
 from app.utils.permissions import check_book_access
 from app.utils.logger import log
 from app.config import settings
-from app.core.metadata.comic_parser import ComicParser
 from app.core.metadata.txt_parser import TxtParser
 from app.core.metadata.mobi_parser import MobiParser, extract_text_in_subprocess
 from app.core.conversion.ebook_convert import (
@@ -35,6 +33,7 @@ from app.core.conversion.ebook_convert import (
     is_conversion_supported
 )
 from io import BytesIO
+from email.utils import formatdate, parsedate_to_datetime
 import hashlib
 
 router = APIRouter()
@@ -62,6 +61,9 @@ MOBI_EXTRACT_TIMEOUT_SECONDS = 30
 MOBI_EXTRACT_MEMORY_LIMIT_MB = 512
 MOBI_TEXT_LENGTH_LIMIT = 5_000_000
 
+# 支持在线阅读的漫画格式（RAR/7Z 通过成员索引按需解压单页）
+COMIC_FORMATS = {'zip', 'cbz', 'rar', 'cbr', '7z', 'cb7'}
+
 # TXT 缓存目录
 TXT_CACHE_DIR = Path(settings.directories.data) / "cache" / "txt"
 
@@ -90,6 +92,18 @@ async def get_book_toc(
     file_path = Path(version.file_path)
     file_format = version.file_format.lower()
     
+    if file_format.lstrip('.') in COMIC_FORMATS:
+        from app.core.comic_pages import comic_page_service
+        images = await comic_page_service.get_image_list(file_path)
+        if not images:
+            # 压缩包中没有图片（或无法解析）属于文件本身的问题，不是服务端错误
+            raise HTTPException(status_code=400, detail="漫画文件中没有可读取的图片页面")
+        return {
+            "format": "comic",
+            "images": images,
+            "totalImages": len(images)
+        }
+
     if file_format not in ['txt', '.txt']:
         raise HTTPException(status_code=400, detail="仅支持TXT在线阅读，请下载原文件")
 
@@ -1090,6 +1104,14 @@ async def get_converted_book(
 async def get_comic_page(
     book_id: int,
     index: int,
+    width: Optional[int] = Query(None, ge=64, le=4096, description="目标宽度（像素），不会放大原图"),
+    quality: Optional[int] = Query(None, ge=1, le=100, description="压缩质量（1-100）"),
+    image_format: Optional[str] = Query(
+        None,
+        alias="format",
+        pattern="^(original|webp|jpeg|jpg|png)$",
+        description="输出格式：original/webp/jpeg/png"
+    ),
     book: Book = Depends(get_accessible_book),
     db: AsyncSession = Depends(get_db),
     current_user: User = Depends(get_current_user)
@@ -1099,43 +1121,57 @@ async def get_comic_page(
     
     Args:
         index: 图片索引（从0开始，对应 TOC 返回的 images 列表索引）
+        width/quality/format: 指定任一参数时返回缩放/转码后的图片（带磁盘缓存），
+            并在后台预取后续页面；均未指定时返回原图
     """
-    from sqlalchemy.orm import selectinload
+    from app.core.comic_pages import comic_page_service, guess_mime_type, normalize_format, OUTPUT_FORMATS
     
     await db.refresh(book, ['versions'])
     
     version = await _get_valid_version(book)
     file_path = Path(version.file_path)
     file_format = version.file_format.lower()
-    if file_format not in ['zip', '.zip', 'cbz', '.cbz']:
+    if file_format.lstrip('.') not in COMIC_FORMATS:
         raise HTTPException(status_code=400, detail="不是漫画文件")
 
     # 获取图片列表
-    images = ComicParser.get_image_list(file_path)
+    images = await comic_page_service.get_image_list(file_path)
     
     if index < 0 or index >= len(images):
         raise HTTPException(status_code=404, detail="页面索引超出范围")
         
     image_info = images[index]
     filename = image_info['filename']
-    
+    cache_headers = {"Cache-Control": "private, max-age=86400"}
+
+    output_format = normalize_format(image_format)
+    if output_format is None and (width or quality):
+        # 只指定尺寸/质量时默认输出 WebP
+        output_format = "webp"
+
+    if output_format:
+        quality = quality or settings.comic.default_quality
+        page_path = await comic_page_service.render_page(
+            file_path, filename, width, quality, output_format
+        )
+        if page_path:
+            comic_page_service.schedule_prefetch(
+                file_path, images, index, width, quality, output_format
+            )
+            return FileResponse(
+                page_path,
+                media_type=OUTPUT_FORMATS[output_format][2],
+                headers=cache_headers
+            )
+        log.warning(f"漫画页面转码失败，回退原图: book={book_id}, index={index}")
+
     # 获取图片数据
-    image_data = ComicParser.get_image_data(file_path, filename)
+    image_data = await comic_page_service.read_original(file_path, filename)
     
     if image_data is None:
         raise HTTPException(status_code=500, detail="读取图片失败")
         
-    # 确定 MIME type
-    ext = Path(filename).suffix.lower()
-    mime_type = "image/jpeg"
-    if ext == '.png':
-        mime_type = "image/png"
-    elif ext == '.webp':
-        mime_type = "image/webp"
-    elif ext == '.gif':
-        mime_type = "image/gif"
-        
-    return Response(content=image_data, media_type=mime_type)
+    return Response(content=image_data, media_type=guess_mime_type(filename), headers=cache_headers)
 
 
 async def _read_txt_content(file_path: Path, page: int = 0) -> dict:
@@ -1252,7 +1288,6 @@ async def download_book(
     2. URL 参数 ?token=xxx (用于浏览器直接下载)
     """
     from sqlalchemy.orm import selectinload
-    from app.security import decode_access_token
     from app.utils.permissions import check_book_access
     from app.models import BookVersion
     
@@ -1260,23 +1295,14 @@ async def download_book(
     if not token:
         raise HTTPException(status_code=401, detail="需要认证，请在 URL 中添加 ?token=xxx")
     
-    # 验证 token
+    # 验证 token 并获取用户
     try:
-        payload = decode_access_token(token)
-        username = payload.get("sub")
-        if not username:
-            raise HTTPException(status_code=401, detail="无效的 token")
+        current_user = await resolve_token_user(token, db)
     except Exception as e:
         raise HTTPException(status_code=401, detail=f"Token 验证失败: {str(e)}")
     
-    # 获取用户
-    result = await db.execute(
-        select(User).where(User.username == username)
-    )
-    current_user = result.scalar_one_or_none()
-    
     if not current_user:
-        raise HTTPException(status_code=401, detail="用户不存在")
+        raise HTTPException(status_code=401, detail="无效的 token 或用户不存在")
     
     # 获取书籍（带版本）
     result = await db.execute(
@@ -1401,44 +1427,125 @@ async def search_in_book(
 
 @router.get("/books/{book_id}/cover")
 async def get_book_cover(
+    request: Request,
     book_id: int,
-    size: str = Query("original", pattern="^(original|thumbnail)$"),
-    db: AsyncSession = Depends(get_db)
+    size: str = Query("original", pattern=r"^(original|thumbnail|small|medium|large|\d{2,4})$"),
+    accept: Optional[str] = Header(None)
 ):
     """
     获取书籍封面
     公开访问（封面不是敏感数据）
     
     参数:
-    - size: original(原图) 或 thumbnail(缩略图)
+    - size: original(原图)、thumbnail/small/medium/large 或像素宽度（取最接近的派生尺寸）
+    
+    非原图尺寸返回预生成的派生图，按 Accept 头协商 WebP/JPEG；
+    Content-Location 指向按内容哈希寻址、可永久缓存的地址
+    
+    封面路径通过内存映射查找，命中时不访问数据库；支持 ETag/Last-Modified 条件请求
     
     注意：如果书籍没有封面，返回404，由前端处理fallback显示
     """
     from app.utils.cover_manager import cover_manager
-    from sqlalchemy.orm import selectinload
     
-    # 获取书籍
-    result = await db.execute(
-        select(Book).options(selectinload(Book.author)).where(Book.id == book_id)
-    )
-    book = result.scalar_one_or_none()
-    
-    if not book:
+    status, cover_path = await cover_manager.lookup_cover(book_id)
+    if status == cover_manager.BOOK_MISSING:
         raise HTTPException(status_code=404, detail="书籍不存在")
     
     # 如果有封面路径，返回封面
-    if book.cover_path:
-        cover_path = await cover_manager.get_cover_path(book.id, db, size)
-        if cover_path and Path(cover_path).exists():
-            return FileResponse(
+    if cover_path:
+        width = cover_manager.resolve_size(size)
+        if width:
+            image_format = "webp" if "image/webp" in (accept or "") else "jpeg"
+            derivative = await cover_manager.get_derivative(cover_path, width, image_format)
+            if derivative:
+                derivative_path, digest = derivative
+                ext = cover_manager.DERIVATIVE_FORMATS[image_format][1]
+                return _conditional_file_response(
+                    request,
+                    derivative_path,
+                    media_type=cover_manager.DERIVATIVE_FORMATS[image_format][2],
+                    etag=f'"{digest[:32]}-{width}-{ext}"',
+                    headers={
+                        "Cache-Control": "public, max-age=3600",
+                        "Vary": "Accept",
+                        "Content-Location": f"/api/covers/{digest}/{width}.{ext}",
+                    }
+                )
+        try:
+            return _conditional_file_response(
+                request,
                 cover_path,
-                media_type="image/jpeg"
+                media_type="image/jpeg",
+                headers={"Cache-Control": "public, max-age=3600"}
             )
+        except FileNotFoundError:
+            cover_manager.invalidate_cover(book_id)
     
     # 没有封面时返回404，让前端显示fallback UI
     raise HTTPException(status_code=404, detail="该书籍没有封面")
 
 
+@router.get("/covers/{digest}/{variant}")
+async def get_cover_derivative(request: Request, digest: str, variant: str):
+    """
+    按内容哈希获取封面派生图
+    地址随封面内容变化，可永久缓存
+    """
+    from app.utils.cover_manager import cover_manager
+    
+    if not re.fullmatch(r"[0-9a-f]{64}", digest) or not re.fullmatch(r"\d{2,4}\.(webp|jpg)", variant):
+        raise HTTPException(status_code=404, detail="封面不存在")
+    
+    width_str, ext = variant.split(".", 1)
+    image_format = "webp" if ext == "webp" else "jpeg"
+    derivative_path = cover_manager.derivative_path(digest, int(width_str), image_format)
+    if not derivative_path.exists():
+        raise HTTPException(status_code=404, detail="封面不存在")
+    
+    return _conditional_file_response(
+        request,
+        derivative_path,
+        media_type=cover_manager.DERIVATIVE_FORMATS[image_format][2],
+        etag=f'"{digest[:32]}-{width_str}-{ext}"',
+        headers={"Cache-Control": "public, max-age=31536000, immutable"}
+    )
+
+
+def _conditional_file_response(
+    request: Request,
+    file_path: Path,
+    media_type: str,
+    etag: Optional[str] = None,
+    headers: Optional[dict] = None
+) -> Response:
+    """
+    返回文件响应，处理 If-None-Match / If-Modified-Since 条件请求
+    未指定 etag 时按文件 mtime 和大小生成
+    """
+    stat = file_path.stat()
+    if etag is None:
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+    response_headers = dict(headers or {})
+    response_headers["ETag"] = etag
+    response_headers["Last-Modified"] = formatdate(stat.st_mtime, usegmt=True)
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match:
+        candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if etag in candidates or "*" in candidates:
+            return Response(status_code=304, headers=response_headers)
+    elif request.headers.get("if-modified-since"):
+        try:
+            since = parsedate_to_datetime(request.headers["if-modified-since"]).timestamp()
+            if int(stat.st_mtime) <= since:
+                return Response(status_code=304, headers=response_headers)
+        except (TypeError, ValueError):
+            pass
+
+    return FileResponse(file_path, media_type=media_type, headers=response_headers, stat_result=stat)
+
+
 def _parse_chapters(content: str) -> list:
     """
     解析TXT内容中的章节
@@ -1817,18 +1924,7 @@ async def _get_user_from_token(
         detail="无法验证凭据",
         headers={"WWW-Authenticate": "Bearer"},
     )
-    payload = decode_access_token(token)
-    if payload is None:
-        raise credentials_exception
-
-    username: str = payload.get("sub")
-    if not username:
-        raise credentials_exception
-
-    result = await db.execute(
-        select(User).where(User.username == username)
-    )
-    user = result.scalar_one_or_none()
+    user = await resolve_token_user(token, db)
     if not user:
         raise credentials_exception
 
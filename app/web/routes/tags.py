@@ -12,9 +12,11 @@ from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.database import get_db
 from app.models import Book, BookTag, Tag, User
-from app.web.routes.auth import get_current_admin, get_current_user
+from app.web.routes.auth import get_current_admin, get_current_user, get_current_user_for_update
 from app.web.routes.dependencies import get_accessible_book
 from app.utils.logger import log
+from app.utils.auth_cache import invalidate_user
+from app.utils.permissions import access_context_cache
 
 router = APIRouter()
 
@@ -736,7 +738,7 @@ async def get_blocked_tags(
 async def update_blocked_tags(
     blocked_data: BlockedTagsUpdate,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user_for_update)
 ):
     """
     更新当前用户的屏蔽标签列表
@@ -766,6 +768,8 @@ async def update_blocked_tags(
     # 更新用户的屏蔽标签
     current_user.blocked_tags = json.dumps(blocked_data.blocked_tag_ids)
     await db.commit()
+    invalidate_user(current_user.username)
+    access_context_cache.invalidate(current_user.id)
     
     log.info(f"用户 {current_user.username} 更新了屏蔽标签列表")
     
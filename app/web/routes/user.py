@@ -15,9 +15,11 @@ from sqlalchemy.orm import joinedload
 
 from app.database import get_db
 from app.models import Book, Favorite, User, UserBookTag
-from app.web.routes.auth import get_current_user
+from app.web.routes.auth import get_current_user, get_current_user_for_update, issue_access_token
 from app.web.routes.dependencies import get_accessible_book
 from app.utils.logger import log
+from app.utils.auth_cache import invalidate_user
+from app.utils.permissions import access_context_cache
 from app.bot.handlers import generate_bind_code, cleanup_expired_codes
 from app.config import settings
 from app.web.routes.settings import load_telegram_settings
@@ -525,7 +527,7 @@ async def get_user_settings(
 async def update_user_settings(
     settings_data: UserSettingsUpdate,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user_for_update)
 ):
     """
     更新用户设置
@@ -593,6 +595,8 @@ async def update_user_settings(
             current_user.avatar_url = url
     
     await db.commit()
+    invalidate_user(current_user.username)
+    access_context_cache.invalidate(current_user.id)
     
     log.info(f"用户 {current_user.username} 更新了设置")
     
@@ -608,7 +612,7 @@ async def update_user_settings(
 async def upload_avatar(
     file: UploadFile = File(...),
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user_for_update)
 ):
     """
     上传用户头像
@@ -655,6 +659,7 @@ async def upload_avatar(
 
     current_user.avatar_url = f"/api/user/avatar/{filename}"
     await db.commit()
+    invalidate_user(current_user.username)
 
     log.info(f"用户 {current_user.username} 更新了头像")
 
@@ -680,7 +685,7 @@ async def get_avatar(filename: str):
 async def change_password(
     password_data: PasswordChangeRequest,
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user_for_update)
 ):
     """
     修改当前用户密码
@@ -717,12 +722,20 @@ async def change_password(
             detail="新密码不能与当前密码相同"
         )
 
+    # 递增 Token 版本使其他会话的旧 Token 失效，并为当前会话签发新 Token
     current_user.password_hash = hash_password(password_data.new_password)
+    current_user.token_version = (current_user.token_version or 0) + 1
     await db.commit()
+    invalidate_user(current_user.username)
 
     log.info(f"用户 {current_user.username} 修改了密码")
 
-    return {"status": "success", "message": "密码已更新"}
+    return {
+        "status": "success",
+        "message": "密码已更新",
+        "access_token": issue_access_token(current_user),
+        "token_type": "bearer",
+    }
 
 
 # ===== Telegram 绑定管理 =====
@@ -801,7 +814,7 @@ async def get_telegram_binding_status(
 @router.delete("/telegram/unbind")
 async def unbind_telegram(
     db: AsyncSession = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: User = Depends(get_current_user_for_update)
 ):
     """
     解除 Telegram 绑定
@@ -822,6 +835,7 @@ async def unbind_telegram(
     telegram_id = current_user.telegram_id
     current_user.telegram_id = None
     await db.commit()
+    invalidate_user(current_user.username)
     
     log.info(f"用户 {current_user.username} 解除了 Telegram 绑定 (ID: {telegram_id})")
     
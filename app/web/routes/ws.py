@@ -1,14 +1,134 @@
+import asyncio
+import json
+import time
+from typing import Optional, Set
+
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query, Depends
+from pydantic import BaseModel, ValidationError
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.core.websocket import manager
-from app.database import get_db
+from app.core.heartbeat_buffer import PendingHeartbeat, apply_heartbeats, heartbeat_buffer, merged_progress
+from app.core.websocket import PING_INTERVAL, Connection, manager
+from app.core.write_queue import write_queue
+from app.database import ReadSessionLocal, get_db
 from app.security import decode_access_token
-from app.models import User
-from sqlalchemy import select
+from app.web.routes.auth import resolve_token_user
+from app.utils.auth_cache import on_invalidate
 from app.utils.logger import log
 
 router = APIRouter()
 
+# Token 失效（密码修改、用户删除等）时的关闭码，客户端收到后应重新登录
+AUTH_EXPIRED_CLOSE_CODE = 4401
+
+# 进行中的重新校验任务（保留引用，避免被回收）
+_revalidate_tasks: Set[asyncio.Task] = set()
+
+
+class ProgressMessage(BaseModel):
+    """
+    客户端上报的阅读进度（与 HTTP 心跳字段一致）
+
+    {"type": "progress", "seq": 1, "session_id": 1, "duration_seconds": 60, "progress": 0.5, "position": "3:120"}
+
+    携带 finished 时视为显式保存进度（同 POST /progress），进度按原值写入
+    """
+    seq: Optional[int] = None
+    session_id: int
+    duration_seconds: int
+    progress: Optional[float] = None
+    position: Optional[str] = None
+    finished: Optional[bool] = None
+
+
+async def handle_progress(websocket: WebSocket, user_id: int, payload: dict) -> dict:
+    """
+    处理一条进度消息：合并到心跳缓冲区，并推送给该用户的其他设备
+
+    连接建立时已完成认证，会话归属命中缓存时不访问数据库
+
+    Returns:
+        回复给发送方的 progress_ack 或 error 消息
+    """
+    try:
+        message = ProgressMessage.model_validate(payload)
+    except ValidationError:
+        return {"type": "error", "seq": payload.get("seq"), "detail": "消息格式错误"}
+
+    owner = heartbeat_buffer.lookup_session(message.session_id)
+    if owner is None:
+        async with ReadSessionLocal() as db:
+            owner = await heartbeat_buffer.resolve_session(db, message.session_id)
+    if owner is None:
+        return {"type": "error", "seq": message.seq, "detail": "会话不存在"}
+    if owner[0] != user_id:
+        return {"type": "error", "seq": message.seq, "detail": "无权访问此会话"}
+
+    entry = heartbeat_buffer.submit(PendingHeartbeat(
+        session_id=message.session_id,
+        user_id=user_id,
+        book_id=owner[1],
+        duration_seconds=message.duration_seconds,
+        progress=message.progress,
+        position=message.position,
+        finished=message.finished,
+    ))
+    if not heartbeat_buffer.enabled:
+        pending = [heartbeat_buffer.take(message.session_id)]
+        await write_queue.submit(lambda db: apply_heartbeats(db, pending))
+        heartbeat_buffer.remember_session(message.session_id, user_id, owner[1])
+
+    if message.progress is not None or message.position is not None:
+        async with ReadSessionLocal() as db:
+            merged = await merged_progress(db, entry)
+        await manager.broadcast_to_user(user_id, {
+            "type": "progress_update",
+            "book_id": owner[1],
+            **merged,
+            "timestamp": entry.received_at.isoformat()
+        }, exclude=websocket)
+
+    return {"type": "progress_ack", "seq": message.seq}
+
+
+async def is_authorized(connection: Connection) -> bool:
+    """连接的 Token 是否仍然有效且属于同一用户"""
+    async with ReadSessionLocal() as db:
+        user = await resolve_token_user(connection.token, db)
+    return user is not None and user.id == connection.user_id
+
+
+async def revalidate_connections(username: Optional[str] = None, user_id: Optional[int] = None) -> None:
+    """重新校验连接的 Token，已失效的连接以 4401 关闭；参数均为空时校验全部连接"""
+    for connection in manager.user_connections(user_id):
+        if connection.closed:
+            continue
+        if username is not None:
+            payload = decode_access_token(connection.token) if connection.token else None
+            if payload is not None and payload.get("sub") != username:
+                continue
+        try:
+            authorized = await is_authorized(connection)
+        except Exception as e:
+            log.error(f"WebSocket 重新认证失败: {e}")
+            continue
+        if not authorized:
+            log.info(f"WebSocket Token 已失效，关闭连接 (user_id={connection.user_id})")
+            await manager.close(connection, code=AUTH_EXPIRED_CLOSE_CODE)
+
+
+@on_invalidate
+def _on_auth_invalidate(username: Optional[str], user_id: Optional[int]) -> None:
+    """用户认证信息变更（含其他 worker 发起的变更）后立即重新校验其连接"""
+    if not manager.user_connections(user_id):
+        return
+    try:
+        task = asyncio.get_running_loop().create_task(revalidate_connections(username, user_id))
+    except RuntimeError:
+        return
+    _revalidate_tasks.add(task)
+    task.add_done_callback(_revalidate_tasks.discard)
+
+
 @router.websocket("/ws")
 async def websocket_endpoint(
     websocket: WebSocket,
@@ -18,29 +138,45 @@ async def websocket_endpoint(
     user = None
     if token:
         try:
-            payload = decode_access_token(token)
-            username = payload.get("sub")
-            if username:
-                result = await db.execute(select(User).where(User.username == username))
-                user = result.scalar_one_or_none()
+            user = await resolve_token_user(token, db)
         except Exception as e:
             log.error(f"WebSocket 认证失败: {e}")
             pass
-    
+        finally:
+            # 认证后立即归还数据库连接，避免长连接期间一直占用（并阻塞 WAL checkpoint）
+            await db.close()
+
     if not user:
         await websocket.close(code=1008)
         return
 
-    await manager.connect(websocket, user.id)
+    connection = await manager.connect(websocket, user.id, token)
+    # 失效通知覆盖密码修改与用户删除；此外每个 ping 周期重新校验一次，覆盖 Token 过期
+    last_auth_check = time.monotonic()
     try:
         while True:
-            # 保持连接活跃，并可以接收客户端消息（如果有的话）
-            # 目前主要用于服务器向客户端推送消息
             data = await websocket.receive_text()
-            # 可以在这里处理客户端发送的消息，如果需要
-            # 例如：接收心跳以保持连接
+            manager.touch(websocket)
+            # 保持连接活跃
             if data == "ping":
-                await websocket.send_text("pong")
+                if time.monotonic() - last_auth_check >= PING_INTERVAL:
+                    last_auth_check = time.monotonic()
+                    if not await is_authorized(connection):
+                        log.info(f"WebSocket Token 已失效，关闭连接 (user_id={user.id})")
+                        await manager.close(connection, code=AUTH_EXPIRED_CLOSE_CODE)
+                        return
+                manager.send(websocket, "pong")
+                continue
+
+            try:
+                payload = json.loads(data)
+            except ValueError:
+                continue
+            if not isinstance(payload, dict):
+                continue
+
+            if payload.get("type") == "progress":
+                manager.send(websocket, await handle_progress(websocket, user.id, payload))
     except WebSocketDisconnect:
         manager.disconnect(websocket, user.id)
     except Exception as e:
@@ -124,7 +124,7 @@ export default function BookCard({ book, loading = false, onClick, titleNode, au
         ) : (
           <Box
             component="img"
-            src={`/api${book.cover_url}`}
+            src={`/api${book.cover_url}?size=medium`}
             alt={book.title}
             loading="lazy"
             sx={{
@@ -105,7 +105,7 @@ export default function ContinueReadingCard({ item, loading = false }: ContinueR
         ) : (
           <Box
             component="img"
-            src={`/api${item.cover_url}`}
+            src={`/api${item.cover_url}?size=medium`}
             alt={item.title}
             loading="lazy"
             sx={{
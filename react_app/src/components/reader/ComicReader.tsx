@@ -22,6 +22,13 @@ export default function ComicReader({ bookId, images, currentPage, onPageLoad, w
   const [imageUrl, setImageUrl] = useState<string | null>(null);
   const imageCache = useState<Map<number, string>>(new Map())[0];
 
+  // 按设备宽度请求服务端缩放后的 WebP 页面（宽度取整到 200px 档位以提高缓存命中）
+  const getPageParams = () => {
+    const viewport = (width || window.innerWidth) * scale * (window.devicePixelRatio || 1);
+    const targetWidth = Math.min(4000, Math.max(400, Math.ceil(viewport / 200) * 200));
+    return { width: targetWidth, format: 'webp' };
+  };
+
   // 加载指定页面的图片
   const loadImage = async (index: number): Promise<string | null> => {
     if (index < 0 || index >= images.length) return null;
@@ -33,6 +40,7 @@ export default function ComicReader({ bookId, images, currentPage, onPageLoad, w
 
     try {
       const response = await api.get(`/api/books/${bookId}/comic/page/${index}`, {
+        params: getPageParams(),
         responseType: 'blob'
       });
       
@@ -32,10 +32,12 @@ interface BookResponse {
 
 interface BooksApiResponse {
   books: BookResponse[]
-  total: number
+  total: number | null
   page: number
   limit: number
-  total_pages: number
+  total_pages: number | null
+  next_cursor: string | null
+  has_more: boolean
 }
 
 interface AuthorInfo {
@@ -115,6 +117,8 @@ export default function LibraryPage() {
   const [totalPages, setTotalPages] = useState(0)
   const [hasMore, setHasMore] = useState(true)
   const [totalCount, setTotalCount] = useState(0)
+  // 无限滚动使用键集分页游标
+  const nextCursorRef = useRef<string | null>(null)
   const [sizeMenuAnchor, setSizeMenuAnchor] = useState<null | HTMLElement>(null)
   const observerTarget = useRef<HTMLDivElement>(null)
   
@@ -321,6 +325,9 @@ export default function LibraryPage() {
       
       const limit = 50
       let url = `/api/books?page=${pageNum}&limit=${limit}`
+      if (append && nextCursorRef.current) {
+        url += `&cursor=${encodeURIComponent(nextCursorRef.current)}&include_total=false`
+      }
       if (selectedLibrary) {
         url += `&library_id=${selectedLibrary}`
       }
@@ -378,9 +385,12 @@ export default function LibraryPage() {
         setBooks(bookSummaries)
       }
       
-      setTotalCount(response.data.total)
-      setTotalPages(response.data.total_pages)
-      setHasMore(pageNum < response.data.total_pages)
+      if (response.data.total !== null) {
+        setTotalCount(response.data.total)
+        setTotalPages(response.data.total_pages ?? 0)
+      }
+      nextCursorRef.current = response.data.next_cursor
+      setHasMore(response.data.has_more)
       recordFilterHistory()
     } catch (err) {
       console.error('加载书籍失败:', err)
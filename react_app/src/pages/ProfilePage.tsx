@@ -70,11 +70,15 @@ export default function ProfilePage() {
 
     try {
       setPasswordSaving(true)
-      await api.put('/api/user/password', {
+      const response = await api.put('/api/user/password', {
         current_password: passwordForm.current,
         new_password: passwordForm.next,
         confirm_password: passwordForm.confirm
       })
+      // 修改密码后旧 Token 失效，换用服务端签发的新 Token
+      if (response.data?.access_token) {
+        useAuthStore.setState({ token: response.data.access_token })
+      }
       setSnackbar({ open: true, message: t('profile.message.password_updated'), severity: 'success' })
       handleClosePasswordDialog()
     } catch (error: unknown) {
@@ -275,6 +275,7 @@ export default function ReaderPage() {
   // 阅读统计相关 Refs
   const sessionIdRef = useRef<number | null>(null)
   const heartbeatTimerRef = useRef<number | null>(null)
+  const heartbeatSeqRef = useRef(0)
   const progressRef = useRef(progress) // 追踪最新进度
   
   // 更新 progressRef
@@ -306,6 +307,17 @@ export default function ReaderPage() {
       const duration = Math.floor((Date.now() - readingStartTime) / 1000)
       const position = getCurrentPosition()
       
+      // 优先通过 WebSocket 上报（无需逐次认证，服务端合并写入并推送到其他设备），不可用时回退到 HTTP
+      const sent = wsService.send({
+        type: 'progress',
+        seq: ++heartbeatSeqRef.current,
+        session_id: sessionIdRef.current,
+        duration_seconds: duration,
+        progress: progressRef.current,
+        position: position || undefined,
+      })
+      if (sent) return
+      
       await readingStatsApi.sendHeartbeat(
         sessionIdRef.current,
         duration,
@@ -1395,15 +1407,30 @@ export default function ReaderPage() {
         }
       }
       
+      const position = `${currentChapter}:${Math.round(scrollOffset)}`  // 章节号:章节内滚动偏移
+      
+      // 阅读会话进行中且 WebSocket 已连接时，随会话通过 WebSocket 上报
+      if (sessionIdRef.current && wsService.send({
+        type: 'progress',
+        seq: ++heartbeatSeqRef.current,
+        session_id: sessionIdRef.current,
+        duration_seconds: Math.floor((Date.now() - readingStartTime) / 1000),
+        progress: progress,
+        position: position,
+        finished: progress >= 0.98,
+      })) {
+        return
+      }
+      
       await api.post(`/api/progress/${id}`, {
         progress: progress,
-        position: `${currentChapter}:${Math.round(scrollOffset)}`,  // 章节号:章节内滚动偏移
+        position: position,
         finished: progress >= 0.98,
       })
     } catch (err) {
       console.error('保存进度失败:', err)
     }
-  }, [id, format, currentChapter, progress, totalChapters])
+  }, [id, format, currentChapter, progress, totalChapters, readingStartTime])
 
   // 更新 saveProgressRef
   useEffect(() => {
@@ -63,11 +63,16 @@ class WebSocketService {
         }
       };
 
-      this.ws.onclose = () => {
+      this.ws.onclose = (event) => {
         console.log('WebSocket 已断开');
         this.isConnecting = false;
         this.stopHeartbeat();
         this.ws = null;
+        // 4401: 服务端判定 Token 已失效（密码修改、用户删除等），重连也会失败，直接注销
+        if (event.code === 4401) {
+          useAuthStore.getState().logout();
+          return;
+        }
         // 尝试重连
         this.scheduleReconnect();
       };
@@ -98,6 +103,22 @@ class WebSocketService {
     this.isConnecting = false;
   }
 
+  public isOpen(): boolean {
+    return this.ws !== null && this.ws.readyState === WebSocket.OPEN
+  }
+
+  // 通过已建立的连接发送消息，连接不可用时返回 false（调用方可回退到 HTTP）
+  public send(data: Record<string, any>): boolean {
+    if (!this.ws || this.ws.readyState !== WebSocket.OPEN) return false
+    try {
+      this.ws.send(JSON.stringify(data))
+      return true
+    } catch (e) {
+      console.error('WebSocket 发送失败:', e)
+      return false
+    }
+  }
+
   public on(type: string, handler: MessageHandler) {
     if (!this.handlers[type]) {
       this.handlers[type] = [];
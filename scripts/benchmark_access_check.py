@@ -0,0 +1,124 @@
+"""
+书籍访问权限检查基准
+对比逐本 check_book_access 与批量 get_accessible_book_ids 的 SQL 查询数与耗时
+
+用法: python scripts/benchmark_access_check.py [--books 2000] [--db /tmp/sooklib_access_bench.db | --url postgresql://...]
+"""
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import URL
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+from app.database import Base
+from app.models import User
+from app.utils.permissions import check_book_access, get_accessible_book_ids
+from bench_utils import add_database_arguments, bench_url, describe, reset_database
+
+
+class QueryCounter:
+    """统计引擎执行的 SQL 语句数"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, *args, **kwargs):
+        self.count += 1
+
+
+async def populate(session: AsyncSession, books: int) -> None:
+    """生成 3 个书库（公共/授权/无权限）、标签与书籍"""
+    rng = random.Random(42)
+    await session.execute(text(
+        "INSERT INTO libraries (id, name, is_public) VALUES "
+        "(1, 'public', TRUE), (2, 'granted', FALSE), (3, 'private', FALSE)"
+    ))
+    await session.execute(text(
+        "INSERT INTO users (id, username, password_hash, is_admin, age_rating_limit, blocked_tags) "
+        "VALUES (1, 'reader', '-', FALSE, 'teen', :blocked)"
+    ), {"blocked": json.dumps([1])})
+    await session.execute(text("INSERT INTO library_permissions (user_id, library_id) VALUES (1, 2)"))
+    await session.execute(text(
+        "INSERT INTO tags (id, name, type) VALUES (1, 'blocked', 'custom'), (2, 'normal', 'genre')"
+    ))
+    await session.execute(
+        text(
+            "INSERT INTO books (id, library_id, title, age_rating, added_at) "
+            "VALUES (:id, :library_id, :title, :age_rating, CURRENT_TIMESTAMP)"
+        ),
+        [
+            {
+                "id": book_id,
+                "library_id": rng.randint(1, 3),
+                "title": f"book {book_id}",
+                "age_rating": rng.choice(["general", "general", "teen", "adult"]),
+            }
+            for book_id in range(1, books + 1)
+        ],
+    )
+    await session.execute(
+        text("INSERT INTO book_tags (book_id, tag_id) VALUES (:book_id, :tag_id)"),
+        [{"book_id": book_id, "tag_id": rng.randint(1, 2)} for book_id in range(1, books + 1)],
+    )
+    await session.commit()
+
+
+async def run(books: int, url: URL) -> None:
+    await reset_database(url)
+
+    engine = create_async_engine(url)
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+
+    session_factory = async_sessionmaker(engine, expire_on_commit=False)
+    async with session_factory() as session:
+        await populate(session, books)
+
+    counter = QueryCounter()
+    event.listen(engine.sync_engine, "before_cursor_execute", counter)
+    book_ids = list(range(1, books + 1))
+
+    async with session_factory() as session:
+        user = await session.get(User, 1)
+        counter.count = 0
+        started = time.perf_counter()
+        loop_result = {book_id for book_id in book_ids if await check_book_access(user, book_id, session)}
+        loop_ms = (time.perf_counter() - started) * 1000
+        loop_queries = counter.count
+
+    async with session_factory() as session:
+        user = await session.get(User, 1)
+        counter.count = 0
+        started = time.perf_counter()
+        batch_result = await get_accessible_book_ids(user, book_ids, session)
+        batch_ms = (time.perf_counter() - started) * 1000
+        batch_queries = counter.count
+
+    await engine.dispose()
+
+    print(f"数据库: {describe(url)}")
+    print(f"书籍数: {books}，可访问: {len(batch_result)}，结果一致: {loop_result == batch_result}")
+    print(f"{'方式':<24}{'查询数':>10}{'耗时(ms)':>12}")
+    print(f"{'逐本 check_book_access':<24}{loop_queries:>10}{loop_ms:>12.1f}")
+    print(f"{'批量 get_accessible_book_ids':<24}{batch_queries:>10}{batch_ms:>12.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="逐本与批量权限检查对比")
+    parser.add_argument("--books", type=int, default=2000, help="生成的书籍数量")
+    add_database_arguments(parser, "/tmp/sooklib_access_bench.db")
+    args = parser.parse_args()
+    asyncio.run(run(args.books, bench_url(args)))
+
+
+if __name__ == "__main__":
+    main()
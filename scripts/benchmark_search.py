@@ -0,0 +1,147 @@
+"""
+搜索性能基准
+在临时数据库中生成指定数量的书籍（默认 100 万本），
+对比 LIKE '%q%' 与全文索引（SQLite FTS5 / PostgreSQL pg_trgm）的查询耗时
+
+用法: python scripts/benchmark_search.py [--books 1000000] [--db /tmp/sooklib_bench.db | --url postgresql://...]
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import select, text
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import app.models  # noqa: F401  注册所有模型
+from app.core.search_index import install_search_index, search_subquery
+from app.database import Base
+from bench_utils import add_database_arguments, bench_url, describe, reset_database
+
+CHARS = "天地玄黄宇宙洪荒日月盈昃辰宿列张寒来暑往秋收冬藏闰余成岁律吕调阳云腾致雨露结为霜金生丽水玉出昆冈剑号巨阙珠称夜光"
+WORDS = ["dragon", "empire", "shadow", "river", "silent", "crystal", "garden", "winter", "storm", "legend"]
+TAGS = ["科幻", "奇幻", "推理", "悬疑", "武侠", "仙侠", "玄幻", "历史", "轻小说", "完结"]
+
+QUERIES = ["玄黄宇", "秋收冬", "dragon", "crystal garden", "剑号巨阙"]
+
+
+def _phrase(rng: random.Random, length: int) -> str:
+    return "".join(rng.choice(CHARS) for _ in range(length))
+
+
+def populate(conn, books: int, batch: int = 20000) -> None:
+    """生成书库、作者、标签与书籍（此时尚未建立触发器，索引在数据生成后一次性构建）"""
+    rng = random.Random(42)
+    conn.execute(text("INSERT INTO libraries (id, name, is_public) VALUES (1, 'bench', TRUE)"))
+    conn.execute(
+        text("INSERT INTO authors (id, name, book_count) VALUES (:id, :name, 0)"),
+        [{"id": i, "name": f"{_phrase(rng, 3)}{i}"} for i in range(1, books // 20 + 2)],
+    )
+    conn.execute(
+        text("INSERT INTO tags (id, name, type) VALUES (:id, :name, 'genre')"),
+        [{"id": i, "name": name} for i, name in enumerate(TAGS, start=1)],
+    )
+
+    author_count = books // 20 + 1
+    for start in range(1, books + 1, batch):
+        rows, tag_rows = [], []
+        for book_id in range(start, min(start + batch, books + 1)):
+            rows.append({
+                "id": book_id,
+                "title": _phrase(rng, rng.randint(4, 10)) + " " + rng.choice(WORDS),
+                "author_id": rng.randint(1, author_count),
+                "description": _phrase(rng, 60) + " " + " ".join(rng.sample(WORDS, 3)),
+            })
+            tag_rows.append({"book_id": book_id, "tag_id": rng.randint(1, len(TAGS))})
+        conn.execute(
+            text(
+                "INSERT INTO books (id, library_id, title, author_id, description, age_rating, added_at) "
+                "VALUES (:id, 1, :title, :author_id, :description, 'general', CURRENT_TIMESTAMP)"
+            ),
+            rows,
+        )
+        conn.execute(
+            text("INSERT INTO book_tags (book_id, tag_id, created_at) VALUES (:book_id, :tag_id, CURRENT_TIMESTAMP)"),
+            tag_rows,
+        )
+        print(f"\r  已生成 {min(start + batch - 1, books)} / {books}", end="", flush=True)
+    print()
+
+
+def timed(conn, statement, params: dict, repeat: int) -> tuple:
+    durations = []
+    rows = 0
+    for _ in range(repeat):
+        started = time.perf_counter()
+        rows = len(conn.execute(statement, params).all())
+        durations.append((time.perf_counter() - started) * 1000)
+    return statistics.median(durations), rows
+
+
+async def run(args) -> None:
+    url = bench_url(args)
+    await reset_database(url)
+    engine = create_async_engine(url)
+    dialect = engine.dialect.name
+    print(f"数据库: {describe(url)}")
+
+    async with engine.begin() as conn:
+        if dialect == "sqlite":
+            await conn.execute(text("PRAGMA journal_mode = WAL"))
+            await conn.execute(text("PRAGMA synchronous = OFF"))
+        await conn.run_sync(Base.metadata.create_all)
+
+        print(f"📚 生成 {args.books} 本书...")
+        started = time.perf_counter()
+        await conn.run_sync(populate, args.books)
+        print(f"  耗时 {time.perf_counter() - started:.1f}s")
+
+        print("🔎 构建全文索引...")
+        started = time.perf_counter()
+        if not await conn.run_sync(install_search_index):
+            print("❌ 全文索引不可用（SQLite 需支持 FTS5 trigram 分词，PostgreSQL 需可创建 pg_trgm 扩展）")
+            return
+        print(f"  耗时 {time.perf_counter() - started:.1f}s")
+
+    # 与应用回退路径一致：SQLite LIKE 对 ASCII 不区分大小写，PostgreSQL 使用 ILIKE
+    like = "ILIKE" if dialect == "postgresql" else "LIKE"
+    like_sql = (
+        "SELECT b.id FROM books b LEFT JOIN authors a ON a.id = b.author_id "
+        f"WHERE b.title {like} :q OR a.name {like} :q ORDER BY b.title LIMIT :limit"
+    )
+    index_name = "FTS5" if dialect == "sqlite" else "pg_trgm"
+
+    print(f"\n{'查询':<16}{'LIKE(ms)':>12}{'行数':>8}{index_name + '(ms)':>12}{'行数':>8}")
+    async with engine.connect() as conn:
+        for query in QUERIES:
+            like_ms, like_rows = await conn.run_sync(
+                timed, text(like_sql), {"q": f"%{query}%", "limit": args.limit}, args.repeat
+            )
+            # 与应用搜索相同的子查询（按相关度排序）
+            fts = search_subquery(query)
+            index_query = select(fts.c.book_id).order_by(fts.c.rank).limit(args.limit)
+            index_ms, index_rows = await conn.run_sync(timed, index_query, {}, args.repeat)
+            print(f"{query:<16}{like_ms:>12.1f}{like_rows:>8}{index_ms:>12.1f}{index_rows:>8}")
+
+    await engine.dispose()
+    print(f"\n数据保留在 {describe(url)}，可手动删除")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="LIKE 与全文索引搜索性能对比")
+    parser.add_argument("--books", type=int, default=1_000_000, help="生成的书籍数量")
+    add_database_arguments(parser, "/tmp/sooklib_bench.db")
+    parser.add_argument("--repeat", type=int, default=5, help="每个查询重复次数")
+    parser.add_argument("--limit", type=int, default=50, help="每次查询返回条数")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
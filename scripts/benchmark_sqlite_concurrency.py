@@ -0,0 +1,232 @@
+"""
+数据库并发读写基准
+在临时数据库中模拟混合负载：多个读请求（书籍列表）、大量小写事务（阅读进度更新）
+与一个扫描式批量写入同时进行，对比三种配置下的吞吐、延迟与 database is locked 错误：
+
+- baseline: 默认连接参数，读写共用一个连接池，每次写入独立提交
+- tuned:    应用的连接配置（SQLite 为默认 PRAGMA + 只读连接池，PostgreSQL 为 app.database 的连接池参数），
+            每次写入独立提交
+- queue:    tuned 配置 + 单写入者队列合并提交（见 app.core.write_queue）
+
+用法: python scripts/benchmark_sqlite_concurrency.py [--books 20000] [--seconds 10] [--readers 16] [--writers 64]
+      [--db /tmp/sooklib_concurrency_bench.db | --url postgresql://...]
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from sqlalchemy import event, text
+from sqlalchemy.engine import URL
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+import app.models  # noqa: F401  注册所有模型
+from app.core.write_queue import WriteQueue
+from app.database import Base, _engine_options, sqlite_pragmas
+from bench_utils import add_database_arguments, bench_url, describe, reset_database
+
+USERS = 50
+LIST_SQL = (
+    "SELECT b.id, b.title, a.name FROM books b LEFT JOIN authors a ON a.id = b.author_id "
+    "WHERE b.library_id = 1 ORDER BY b.added_at DESC LIMIT 50 OFFSET :offset"
+)
+COUNT_SQL = "SELECT COUNT(*) FROM books WHERE library_id = 1"
+PROGRESS_SQL = (
+    "UPDATE reading_progress SET progress = :progress, position = :position, last_read_at = :now "
+    "WHERE user_id = :user_id AND book_id = :book_id"
+)
+SCAN_SQL = (
+    "INSERT INTO books (library_id, title, author_id, age_rating, added_at) "
+    "VALUES (1, :title, 1, 'general', CURRENT_TIMESTAMP)"
+)
+
+
+async def prepare(url: URL, books: int) -> None:
+    """清空数据库，建表并生成书籍与阅读进度"""
+    await reset_database(url)
+    engine = create_async_engine(url)
+    async with engine.begin() as conn:
+        if url.get_backend_name() == "sqlite":
+            await conn.execute(text("PRAGMA journal_mode = WAL"))
+        await conn.run_sync(Base.metadata.create_all)
+        await conn.execute(text("INSERT INTO libraries (id, name, is_public) VALUES (1, 'bench', TRUE)"))
+        await conn.execute(text("INSERT INTO authors (id, name, book_count) VALUES (1, 'bench', 0)"))
+        await conn.execute(
+            text("INSERT INTO users (id, username, password_hash) VALUES (:id, :name, '')"),
+            [{"id": i, "name": f"user{i}"} for i in range(1, USERS + 1)],
+        )
+        await conn.execute(
+            text(SCAN_SQL),
+            [{"title": f"book {i}"} for i in range(books)],
+        )
+        await conn.execute(
+            text(
+                "INSERT INTO reading_progress (user_id, book_id, progress, finished, last_read_at) "
+                "VALUES (:user_id, :book_id, 0, FALSE, CURRENT_TIMESTAMP)"
+            ),
+            [{"user_id": user_id, "book_id": book_id} for user_id in range(1, USERS + 1) for book_id in range(1, 21)],
+        )
+    await engine.dispose()
+
+
+def make_engine(url: URL, pragmas: dict, **kwargs):
+    engine = create_async_engine(url, **kwargs)
+    if url.get_backend_name() != "sqlite":
+        return engine
+
+    @event.listens_for(engine.sync_engine, "connect")
+    def _on_connect(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+
+    return engine
+
+
+def percentile(values: list, ratio: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * ratio))]
+
+
+async def run_profile(name: str, url: URL, args) -> dict:
+    if name == "baseline":
+        # SQLite 仅开启 WAL，其余为默认值（写锁等待沿用驱动默认的 5 秒）；PostgreSQL 为默认连接池
+        write_engine = make_engine(url, {"journal_mode": "WAL"})
+        read_engine = write_engine
+    elif url.get_backend_name() != "sqlite":
+        # PostgreSQL 由 MVCC 处理读写并发，应用与写引擎共用连接池（见 app.database）
+        write_engine = make_engine(url, {}, **_engine_options(url))
+        read_engine = write_engine
+    else:
+        pragmas = sqlite_pragmas()
+        write_engine = make_engine(url, pragmas)
+        read_engine = make_engine(url, {**pragmas, "query_only": "ON"}, pool_size=args.readers)
+    write_sessions = async_sessionmaker(write_engine, class_=AsyncSession, expire_on_commit=False)
+    read_sessions = async_sessionmaker(read_engine, class_=AsyncSession, expire_on_commit=False)
+
+    queue = WriteQueue(write_sessions)
+    if name == "queue":
+        queue.start()
+
+    rng = random.Random(7)
+    deadline = time.monotonic() + args.seconds
+    read_latencies, write_latencies = [], []
+    counters = {"locked": 0, "errors": 0, "scanned": 0}
+
+    async def reader():
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            async with read_sessions() as db:
+                await db.execute(text(COUNT_SQL))
+                await db.execute(text(LIST_SQL), {"offset": rng.randint(0, 50) * 50})
+            read_latencies.append((time.perf_counter() - started) * 1000)
+
+    async def writer():
+        while time.monotonic() < deadline:
+            params = {
+                "user_id": rng.randint(1, USERS),
+                "book_id": rng.randint(1, 20),
+                "progress": rng.random(),
+                "position": str(rng.randint(0, 10000)),
+                "now": datetime.utcnow(),
+            }
+
+            async def save(db: AsyncSession, params=params):
+                await db.execute(text(PROGRESS_SQL), params)
+
+            started = time.perf_counter()
+            try:
+                await queue.submit(save)
+            except OperationalError as e:
+                counters["locked" if "locked" in str(e) else "errors"] += 1
+                continue
+            write_latencies.append((time.perf_counter() - started) * 1000)
+            await asyncio.sleep(args.write_interval)
+
+    async def scanner():
+        while time.monotonic() < deadline:
+            try:
+                async with write_sessions() as db:
+                    await db.execute(text(SCAN_SQL), [{"title": f"scan {i}"} for i in range(args.scan_batch)])
+                    await db.commit()
+                counters["scanned"] += args.scan_batch
+            except OperationalError as e:
+                counters["locked" if "locked" in str(e) else "errors"] += 1
+            await asyncio.sleep(0.05)
+
+    started = time.monotonic()
+    await asyncio.gather(
+        *(reader() for _ in range(args.readers)),
+        *(writer() for _ in range(args.writers)),
+        scanner(),
+    )
+    elapsed = time.monotonic() - started
+    await queue.stop()
+    await write_engine.dispose()
+    if read_engine is not write_engine:
+        await read_engine.dispose()
+
+    return {
+        "reads/s": len(read_latencies) / elapsed,
+        "read p50": statistics.median(read_latencies) if read_latencies else 0.0,
+        "read p99": percentile(read_latencies, 0.99),
+        "writes/s": len(write_latencies) / elapsed,
+        "write p50": statistics.median(write_latencies) if write_latencies else 0.0,
+        "write p99": percentile(write_latencies, 0.99),
+        "scanned/s": counters["scanned"] / elapsed,
+        "locked": counters["locked"],
+        "errors": counters["errors"],
+        "commits": queue.transactions,
+    }
+
+
+async def run(url: URL, args) -> dict:
+    results = {}
+    for name in args.profiles.split(","):
+        await prepare(url, args.books)
+        print(f"⏱  {name} 运行 {args.seconds:g}s ...")
+        results[name] = await run_profile(name, url, args)
+    await reset_database(url)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="数据库并发读写基准")
+    parser.add_argument("--books", type=int, default=20000, help="初始书籍数量")
+    add_database_arguments(parser, "/tmp/sooklib_concurrency_bench.db")
+    parser.add_argument("--seconds", type=float, default=10, help="每种配置的运行时长")
+    parser.add_argument("--readers", type=int, default=16, help="并发读请求数")
+    parser.add_argument("--writers", type=int, default=64, help="并发写请求数")
+    parser.add_argument("--write-interval", type=float, default=0.01, help="每个写请求两次写入间的间隔（秒）")
+    parser.add_argument("--scan-batch", type=int, default=500, help="扫描每个事务插入的书籍数")
+    parser.add_argument(
+        "--profiles", default="baseline,tuned,queue", help="要运行的配置，逗号分隔（baseline/tuned/queue）"
+    )
+    args = parser.parse_args()
+
+    url = bench_url(args)
+    print(f"数据库: {describe(url)}")
+    results = asyncio.run(run(url, args))
+
+    columns = list(next(iter(results.values())).keys())
+    print(f"\n{'':<10}" + "".join(f"{column:>12}" for column in columns))
+    for name, result in results.items():
+        cells = "".join(
+            f"{value:>12.1f}" if isinstance(value, float) else f"{value:>12}" for value in result.values()
+        )
+        print(f"{name:<10}{cells}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""
+全文索引重建脚本
+从书籍、作者、标签、翻译表全量重建全文检索索引（SQLite FTS5 / PostgreSQL pg_trgm）
+"""
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+# 添加项目根目录到 Python 路径
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.core.search_index import rebuild_search_index_sync
+from app.database import engine
+
+
+async def rebuild():
+    """重建全文索引"""
+    started = time.perf_counter()
+    async with engine.begin() as conn:
+        count = await conn.run_sync(rebuild_search_index_sync)
+    await engine.dispose()
+
+    if count == 0:
+        print("⚠️  未建立索引（数据库不支持、SQLite 不支持 trigram 分词、PostgreSQL 无法启用 pg_trgm 或没有书籍）")
+        return
+
+    print(f"✅ 索引重建完成：{count} 本书，耗时 {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    print("🔎 开始重建全文检索索引...")
+    asyncio.run(rebuild())
@@ -0,0 +1,48 @@
+"""
+测试公共夹具
+
+数据库取自环境变量 TEST_DATABASE_URL，未设置时使用临时 SQLite 文件，例如：
+    TEST_DATABASE_URL=postgresql://postgres@localhost:5432/sooklib_test pytest
+测试会清空并重建该数据库（PostgreSQL 为 public schema），请勿指向正式数据库。
+备份测试在 PostgreSQL 上需要 PATH 中有 pg_dump / pg_restore。
+"""
+import os
+import tempfile
+from pathlib import Path
+
+# 必须在导入应用模块之前设置（引擎与配置在导入时创建）
+_TEMP_DIR = Path(tempfile.mkdtemp(prefix="sooklib-test-"))
+os.environ["DATABASE_URL"] = os.getenv("TEST_DATABASE_URL") or f"sqlite+aiosqlite:///{_TEMP_DIR}/test.db"
+os.environ["BACKUP_PATH"] = str(_TEMP_DIR / "backups")
+
+import pytest
+from sqlalchemy import text
+
+from app.database import AsyncSessionLocal, dispose_engines, engine, init_db
+
+
+async def reset_database() -> None:
+    """删除全部数据并重新建表、安装索引与触发器"""
+    if engine.dialect.name == "postgresql":
+        async with engine.begin() as conn:
+            await conn.execute(text("DROP SCHEMA public CASCADE"))
+            await conn.execute(text("CREATE SCHEMA public"))
+    else:
+        await dispose_engines()
+        for suffix in ("", "-wal", "-shm"):
+            Path(f"{engine.url.database}{suffix}").unlink(missing_ok=True)
+    await init_db()
+
+
+@pytest.fixture
+def temp_dir() -> Path:
+    return _TEMP_DIR
+
+
+@pytest.fixture
+async def db():
+    """空数据库上的会话；测试结束后关闭连接池（每个测试使用独立的事件循环）"""
+    await reset_database()
+    async with AsyncSessionLocal() as session:
+        yield session
+    await dispose_engines()
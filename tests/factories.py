@@ -0,0 +1,54 @@
+"""测试数据构造"""
+from itertools import count
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import Author, Book, BookVersion, Library, User
+
+_sequence = count(1)
+
+
+async def add_user(db: AsyncSession, name: str = "reader", **fields) -> User:
+    user = User(username=f"{name}{next(_sequence)}", password_hash="-", **fields)
+    db.add(user)
+    await db.flush()
+    return user
+
+
+async def add_library(db: AsyncSession, name: str = "书库") -> Library:
+    library = Library(name=f"{name}{next(_sequence)}", is_public=True)
+    db.add(library)
+    await db.flush()
+    return library
+
+
+async def add_author(db: AsyncSession, name: str) -> Author:
+    author = Author(name=name, book_count=0)
+    db.add(author)
+    await db.flush()
+    return author
+
+
+async def add_book(db: AsyncSession, library: Library, title: str, author: Author = None, **fields) -> Book:
+    book = Book(library_id=library.id, title=title, author_id=author.id if author else None, **fields)
+    db.add(book)
+    await db.flush()
+    return book
+
+
+async def add_version(
+    db: AsyncSession, book: Book, file_format: str = "epub", file_size: int = 1024, is_primary: bool = False
+) -> BookVersion:
+    n = next(_sequence)
+    version = BookVersion(
+        book_id=book.id,
+        file_path=f"/books/{n}.{file_format}",
+        file_name=f"{n}.{file_format}",
+        file_format=file_format,
+        file_size=file_size,
+        file_hash=f"hash{n}",
+        is_primary=is_primary,
+    )
+    db.add(version)
+    await db.flush()
+    return version
@@ -0,0 +1,47 @@
+"""
+后台扫描：封面派生图任务的错误记录与关闭时等待
+"""
+import threading
+from pathlib import Path
+
+from app.core import background_scanner as scanner_module
+from app.core.background_scanner import BackgroundScanner
+
+
+async def test_derivative_errors_are_logged(monkeypatch):
+    errors = []
+    monkeypatch.setattr(scanner_module.log, "error", errors.append)
+
+    def generate(cover_path: Path):
+        raise OSError("磁盘已满")
+
+    monkeypatch.setattr(scanner_module.cover_manager, "generate_derivatives", generate)
+    scanner = BackgroundScanner()
+    scanner._schedule_derivatives(Path("/covers/1.jpg"))
+    await scanner.shutdown()
+
+    assert scanner._derivative_tasks == set()
+    assert len(errors) == 1 and "磁盘已满" in errors[0]
+
+
+async def test_shutdown_waits_then_cancels_pending(monkeypatch):
+    release = threading.Event()
+    done = []
+
+    def generate(cover_path: Path):
+        release.wait(2)
+        done.append(cover_path)
+
+    monkeypatch.setattr(scanner_module.cover_manager, "generate_derivatives", generate)
+    scanner = BackgroundScanner()
+    scanner._schedule_derivatives(Path("/covers/1.jpg"))
+    release.set()
+    await scanner.shutdown()
+    assert done == [Path("/covers/1.jpg")]
+
+    # 超时后取消未完成的任务（线程内的调用无法中断，只放弃等待）
+    release.clear()
+    scanner._schedule_derivatives(Path("/covers/2.jpg"))
+    await scanner.shutdown(timeout=0.05)
+    assert scanner._derivative_tasks == set()
+    release.set()
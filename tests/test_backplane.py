@@ -0,0 +1,175 @@
+"""
+多进程协作后端（SQLite / Redis）
+
+每个用例创建两个共享同一存储的实例，模拟两个 worker。
+Redis 用例默认使用 fakeredis；设置 TEST_REDIS_URL 时改用真实的 Redis 服务（键名带随机前缀）。
+"""
+import asyncio
+import os
+import uuid
+
+import pytest
+
+from app.core import backplane as backplane_module
+from app.core.backplane import RedisBackplane, SqliteBackplane
+
+LEADER_TTL = 0.6
+
+
+@pytest.fixture(params=["sqlite", "redis"])
+async def make_backplane(request, tmp_path, monkeypatch):
+    """返回创建协作后端实例的工厂；同一用例内的实例共享存储，用例结束后全部停止"""
+    instances = []
+
+    if request.param == "sqlite":
+        def create():
+            return SqliteBackplane(str(tmp_path / "backplane.db"), poll_interval=0.02)
+    else:
+        if backplane_module.aioredis is None:
+            pytest.skip("未安装 redis 包")
+        url = os.getenv("TEST_REDIS_URL")
+        if not url:
+            fakeredis = pytest.importorskip("fakeredis")
+            pytest.importorskip("lupa")  # fakeredis 执行 Lua 脚本需要
+            server = fakeredis.FakeServer()
+            monkeypatch.setattr(
+                backplane_module.aioredis, "from_url",
+                lambda url, **kwargs: fakeredis.FakeAsyncRedis(server=server, **kwargs),
+            )
+            url = "redis://fake"
+        prefix = f"sooklib-test-{uuid.uuid4().hex[:8]}:"
+
+        def create():
+            return RedisBackplane(url, prefix)
+
+    async def factory(start: bool = True):
+        instance = create()
+        instances.append(instance)
+        if start:
+            await instance.start()
+        return instance
+
+    yield factory
+
+    for instance in instances:
+        if instance._loop is not None:
+            await instance.stop()
+
+
+async def wait_for(predicate, timeout: float = 3.0) -> bool:
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        if asyncio.get_running_loop().time() > deadline:
+            return False
+        await asyncio.sleep(0.02)
+    return True
+
+
+async def test_publish_reaches_other_worker_only(make_backplane):
+    first = await make_backplane()
+    second = await make_backplane()
+    # Redis 订阅在后台建立，先确认连通再开始计数
+    await asyncio.sleep(0.2)
+    received, echoed = [], []
+    second.subscribe("books", received.append)
+    first.subscribe("books", echoed.append)
+
+    first.publish("books", {"id": 1, "title": "三体"})
+    first.publish("books", {"id": 2})
+
+    assert await wait_for(lambda: len(received) == 2)
+    assert received == [{"id": 1, "title": "三体"}, {"id": 2}]
+    await asyncio.sleep(0.1)
+    assert echoed == []
+    assert first.published == 2 and second.received == 2
+
+
+async def test_set_if_absent(make_backplane):
+    first = await make_backplane(start=False)
+    second = await make_backplane(start=False)
+
+    assert await first.set_if_absent("scan:1", {"owner": "first"})
+    assert not await second.set_if_absent("scan:1", {"owner": "second"})
+    assert await second.get("scan:1") == {"owner": "first"}
+
+    assert await second.delete("scan:1")
+    assert await second.set_if_absent("scan:1", {"owner": "second"})
+    assert await first.get("scan:1") == {"owner": "second"}
+
+
+async def test_ttl_expiry(make_backplane):
+    first = await make_backplane(start=False)
+    second = await make_backplane(start=False)
+
+    await first.set("session", {"user": 1}, ttl=0.2)
+    assert await first.set_if_absent("claim", "first", ttl=0.2)
+    assert await second.get("session") == {"user": 1}
+    assert await second.scan("sess") == {"session": {"user": 1}}
+
+    await asyncio.sleep(0.3)
+    assert await second.get("session") is None
+    assert await second.scan("sess") == {}
+    assert await second.set_if_absent("claim", "second")
+    assert await first.get("claim") == "second"
+
+
+async def test_compare_and_set(make_backplane):
+    first = await make_backplane(start=False)
+    second = await make_backplane(start=False)
+
+    await first.set("task", {"status": "running", "progress": 0.5})
+    assert await second.compare_and_set("task", {"status": "running", "progress": 0.5}, {"status": "cancelled"})
+    assert not await first.compare_and_set("task", {"status": "running", "progress": 0.5}, {"status": "completed"})
+    assert await first.get("task") == {"status": "cancelled"}
+
+    await second.delete("task")
+    assert not await first.compare_and_set("task", {"status": "cancelled"}, {"status": "completed"})
+    assert await first.get("task") is None
+
+
+async def test_lock_owner(make_backplane):
+    first = await make_backplane(start=False)
+    second = await make_backplane(start=False)
+
+    assert await first.acquire_lock("scan", "first", ttl=LEADER_TTL)
+    assert not await second.acquire_lock("scan", "second", ttl=LEADER_TTL)
+    # 续期与释放只对持有者生效
+    assert await first.acquire_lock("scan", "first", ttl=LEADER_TTL)
+    await second.release_lock("scan", "second")
+    assert not await second.acquire_lock("scan", "second", ttl=LEADER_TTL)
+
+    await first.release_lock("scan", "first")
+    assert await second.acquire_lock("scan", "second", ttl=LEADER_TTL)
+
+
+async def test_leader_failover(make_backplane, monkeypatch):
+    monkeypatch.setattr(backplane_module, "LEADER_LOCK_TTL", LEADER_TTL)
+    events = []
+
+    async def candidate(name: str):
+        instance = await make_backplane()
+
+        async def elected():
+            events.append(("elected", name))
+
+        async def demoted():
+            events.append(("demoted", name))
+
+        await instance.start_leader(elected, demoted)
+        return instance
+
+    first = await candidate("first")
+    second = await candidate("second")
+    assert first.is_leader and not second.is_leader
+    assert events == [("elected", "first")]
+
+    # 模拟主节点失联：停止续期但不释放锁，锁过期后由另一个 worker 接任
+    first._leader_task.cancel()
+    assert await wait_for(lambda: second.is_leader, timeout=LEADER_TTL * 4)
+    assert events == [("elected", "first"), ("elected", "second")]
+
+    # 正常退出时释放锁，其他 worker 在下一次续期时接任
+    third = await candidate("third")
+    assert not third.is_leader
+    await second.stop()
+    assert await wait_for(lambda: third.is_leader, timeout=LEADER_TTL)
@@ -0,0 +1,67 @@
+"""数据库备份与恢复（SQLite 在线备份 / PostgreSQL pg_dump 与 pg_restore）"""
+import shutil
+import zipfile
+
+import pytest
+from sqlalchemy import select
+
+from app.config import settings
+from app.core.backup import POSTGRES_ARCNAME, SQLITE_ARCNAME, BackupManager
+from app.core.library_stats import summarize_libraries
+from app.database import AsyncSessionLocal, engine
+from app.models import Book
+from tests.factories import add_book, add_library, add_version
+
+
+@pytest.fixture
+def manager():
+    if engine.dialect.name == "postgresql":
+        for tool in (settings.backup.pg_dump_path, settings.backup.pg_restore_path):
+            if shutil.which(tool) is None:
+                pytest.skip(f"未找到 {tool}")
+    return BackupManager()
+
+
+async def titles() -> list:
+    async with AsyncSessionLocal() as session:
+        return list((await session.execute(select(Book.title).order_by(Book.title))).scalars())
+
+
+async def test_backup_restore_round_trip(db, manager):
+    library = await add_library(db)
+    book = await add_book(db, library, "备份前")
+    await add_version(db, book, "epub", 4096, is_primary=True)
+    await db.commit()
+
+    backup = await manager.create_backup(includes=["database"], description="test")
+    with zipfile.ZipFile(backup["file_path"]) as zipf:
+        expected = POSTGRES_ARCNAME if engine.dialect.name == "postgresql" else SQLITE_ARCNAME
+        assert expected in zipf.namelist()
+
+    await add_book(db, library, "备份后")
+    await db.commit()
+    await db.close()
+    assert await titles() == ["备份前", "备份后"]
+
+    result = await manager.restore_backup(backup["backup_id"], create_snapshot=False)
+    assert result["restored"] == ["database"]
+    assert await titles() == ["备份前"]
+
+    # 恢复后触发器仍然有效
+    async with AsyncSessionLocal() as session:
+        await add_book(session, library, "恢复后")
+        await session.commit()
+        summary = await summarize_libraries(session, [library.id])
+    assert summary.book_count == 2
+    assert summary.primary_size == 4096
+
+
+async def test_restore_rejects_other_backend(db, manager, temp_dir):
+    other = SQLITE_ARCNAME if engine.dialect.name == "postgresql" else POSTGRES_ARCNAME
+    path = temp_dir / "other_backend.zip"
+    with zipfile.ZipFile(path, "w") as zipf:
+        zipf.writestr(other, b"")
+
+    with zipfile.ZipFile(path) as zipf:
+        with pytest.raises(ValueError):
+            await manager._restore_database(zipf)
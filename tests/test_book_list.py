@@ -0,0 +1,52 @@
+"""书籍列表（键集分页与总数缓存）"""
+import inspect
+from datetime import datetime
+
+from fastapi.params import Query as QueryParam
+
+from app.web.routes.api import list_books
+from tests.factories import add_book, add_library, add_user
+
+
+async def call_list_books(db, user, **params):
+    """直接调用路由函数，未指定的参数取 Query 默认值"""
+    for name, parameter in inspect.signature(list_books).parameters.items():
+        if name not in params and isinstance(parameter.default, QueryParam):
+            params[name] = parameter.default.default
+    params.setdefault("author_id", None)
+    params.setdefault("library_id", None)
+    return await list_books(db=db, current_user=user, **params)
+
+
+async def test_cursor_pages_cover_every_book_once(db):
+    user = await add_user(db)
+    library = await add_library(db)
+    same_time = datetime(2026, 1, 1)
+    for i in range(7):
+        await add_book(db, library, f"书 {i}", added_at=same_time if i % 2 else datetime(2026, 1, 1 + i))
+    await db.commit()
+
+    for sort in ("added_at_desc", "added_at_asc", "title_asc", "size_desc"):
+        seen, cursor = [], None
+        while True:
+            page = await call_list_books(db, user, limit=2, cursor=cursor, sort=sort, include_total=False)
+            seen += [book["id"] for book in page["books"]]
+            cursor = page["next_cursor"]
+            if not page["has_more"]:
+                break
+        assert sorted(seen) == sorted(set(seen)) and len(seen) == 7, sort
+
+
+async def test_total_follows_access_changes(db):
+    user = await add_user(db, age_rating_limit="teen")
+    library = await add_library(db)
+    await add_book(db, library, "普通", age_rating="general")
+    await add_book(db, library, "成人", age_rating="adult")
+    await db.commit()
+
+    assert (await call_list_books(db, user))["total"] == 1
+
+    # 同一用户放宽分级后不能命中按旧权限缓存的总数
+    user.age_rating_limit = "adult"
+    await db.commit()
+    assert (await call_list_books(db, user))["total"] == 2
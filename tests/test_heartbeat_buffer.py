@@ -0,0 +1,77 @@
+"""阅读心跳合并写入"""
+import asyncio
+
+from sqlalchemy import select
+
+from app.core.heartbeat_buffer import PendingHeartbeat, heartbeat_buffer, merged_progress
+from app.core.write_queue import write_queue
+from app.models import ReadingProgress, ReadingSession
+from app.web.routes.api import ReadingSessionEnd, end_reading_session
+from tests.factories import add_book, add_library, add_user
+
+
+async def setup_progress(db, **fields):
+    user = await add_user(db)
+    book = await add_book(db, await add_library(db), "三体")
+    if fields:
+        db.add(ReadingProgress(user_id=user.id, book_id=book.id, **fields))
+    await db.commit()
+    return user, book
+
+
+def heartbeat(user, book, **fields) -> PendingHeartbeat:
+    return PendingHeartbeat(session_id=1, user_id=user.id, book_id=book.id, duration_seconds=60, **fields)
+
+
+async def test_merged_progress_keeps_stored_maximum(db):
+    user, book = await setup_progress(db, progress=0.6, position="12:0")
+
+    # 只带位置的心跳沿用已保存的进度
+    assert await merged_progress(db, heartbeat(user, book, position="13:5")) == {
+        "progress": 0.6, "position": "13:5"
+    }
+    # 较低的进度不回退
+    assert await merged_progress(db, heartbeat(user, book, progress=0.4)) == {
+        "progress": 0.6, "position": "12:0"
+    }
+    assert (await merged_progress(db, heartbeat(user, book, progress=0.8)))["progress"] == 0.8
+    # 显式保存（带 finished）按原值覆盖
+    assert (await merged_progress(db, heartbeat(user, book, progress=0.4, finished=False)))["progress"] == 0.4
+
+
+async def test_merged_progress_without_stored_row(db):
+    user, book = await setup_progress(db)
+
+    assert await merged_progress(db, heartbeat(user, book, position="1:0")) == {"position": "1:0"}
+    assert await merged_progress(db, heartbeat(user, book, progress=0.2)) == {"progress": 0.2}
+
+
+async def test_end_session_serialized_after_flush(db):
+    user, book = await setup_progress(db, progress=0.3)
+    reading_session = ReadingSession(user_id=user.id, book_id=book.id, duration_seconds=0)
+    db.add(reading_session)
+    await db.commit()
+    session_id, user_id = reading_session.id, user.id
+
+    write_queue.start()
+    try:
+        heartbeat_buffer.submit(PendingHeartbeat(
+            session_id=session_id, user_id=user.id, book_id=book.id, duration_seconds=120, progress=0.5,
+        ))
+        # 心跳写入已排入队列，结束请求在其之后执行，不会被旧数据覆盖
+        flush = asyncio.create_task(heartbeat_buffer.flush())
+        await asyncio.sleep(0)
+        await end_reading_session(
+            ReadingSessionEnd(session_id=session_id, duration_seconds=150, progress=0.7),
+            db=db, current_user=user,
+        )
+        assert await flush == 1
+    finally:
+        await write_queue.stop()
+
+    db.expire_all()
+    saved = await db.get(ReadingSession, session_id)
+    assert saved.end_time is not None
+    assert (saved.duration_seconds, saved.progress) == (150, 0.7)
+    progress = (await db.execute(select(ReadingProgress).where(ReadingProgress.user_id == user_id))).scalar_one()
+    assert progress.progress == 0.7
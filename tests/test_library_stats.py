@@ -0,0 +1,83 @@
+"""书库统计与主版本冗余字段触发器"""
+from sqlalchemy import select
+
+from app.core.library_stats import get_format_counts, reconcile_library_stats, summarize_libraries
+from app.database import engine
+from app.models import Book, BookVersion
+from tests.factories import add_author, add_book, add_library, add_version
+
+# 超过 int4 上限的文件大小
+LARGE_FILE = 3 * 1024 ** 3
+
+
+async def reconcile() -> dict:
+    async with engine.begin() as conn:
+        return await conn.run_sync(reconcile_library_stats)
+
+
+async def test_triggers_maintain_stats_on_insert(db):
+    library = await add_library(db)
+    author = await add_author(db, "刘慈欣")
+    first = await add_book(db, library, "三体", author, cover_path="/covers/1.jpg")
+    second = await add_book(db, library, "球状闪电", author)
+    await add_version(db, first, "epub", LARGE_FILE, is_primary=True)
+    await add_version(db, first, "txt", 2048)
+    await add_version(db, second, "txt", 4096)
+    await db.commit()
+
+    summary = await summarize_libraries(db, [library.id])
+    assert summary.book_count == 2
+    assert summary.author_count == 1
+    assert summary.cover_count == 1
+    assert summary.version_count == 3
+    assert summary.total_size == LARGE_FILE + 2048 + 4096
+    assert summary.primary_size == LARGE_FILE + 4096
+    assert await get_format_counts(db, library.id) == {"epub": 1, "txt": 2}
+
+    # 主版本文件信息同步到书籍
+    rows = (await db.execute(select(Book.id, Book.file_size, Book.file_format).order_by(Book.id))).all()
+    assert [tuple(row) for row in rows] == [(first.id, LARGE_FILE, "epub"), (second.id, 4096, "txt")]
+
+    assert (await reconcile())["drifted"] == []
+
+
+async def test_triggers_follow_updates_moves_and_deletes(db):
+    source = await add_library(db)
+    target = await add_library(db)
+    author = await add_author(db, "作者")
+    book = await add_book(db, source, "书", author)
+    other = await add_book(db, source, "另一本", author)
+    primary = await add_version(db, book, "epub", 100, is_primary=True)
+    await add_version(db, book, "pdf", 200)
+    await add_version(db, other, "epub", 300, is_primary=True)
+    await db.commit()
+
+    # 切换主版本
+    primary.is_primary = False
+    pdf = (await db.execute(select(BookVersion).where(BookVersion.file_format == "pdf"))).scalar_one()
+    pdf.is_primary = True
+    await db.commit()
+    assert (await db.execute(select(Book.file_format).where(Book.id == book.id))).scalar_one() == "pdf"
+
+    # 移动到其他书库：书籍、作者与版本统计一并移动
+    book.library_id = target.id
+    await db.commit()
+    source_summary = await summarize_libraries(db, [source.id])
+    target_summary = await summarize_libraries(db, [target.id])
+    assert (source_summary.book_count, source_summary.version_count, source_summary.total_size) == (1, 1, 300)
+    assert (target_summary.book_count, target_summary.version_count, target_summary.total_size) == (1, 2, 300)
+    assert target_summary.author_count == 1
+    assert await get_format_counts(db, target.id) == {"epub": 1, "pdf": 1}
+
+    # 删除版本与书籍
+    await db.delete(pdf)
+    await db.commit()
+    assert (await db.execute(select(Book.file_format).where(Book.id == book.id))).scalar_one() == "epub"
+    await db.delete(primary)
+    await db.delete(book)
+    await db.commit()
+    target_summary = await summarize_libraries(db, [target.id])
+    assert (target_summary.book_count, target_summary.version_count, target_summary.author_count) == (0, 0, 0)
+    assert await get_format_counts(db, target.id) == {}
+
+    assert (await reconcile())["drifted"] == []
@@ -0,0 +1,36 @@
+"""在线阅读目录"""
+import zipfile
+
+import pytest
+from fastapi import HTTPException
+
+from app.web.routes.reader import get_book_toc
+from tests.factories import add_book, add_library, add_user, add_version
+
+
+async def add_comic(db, path, pages):
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("readme.txt", "no pages")
+        for name in pages:
+            archive.writestr(name, b"\x89PNG\r\n\x1a\n")
+    book = await add_book(db, await add_library(db), "漫画")
+    version = await add_version(db, book, file_format="cbz", is_primary=True)
+    version.file_path = str(path)
+    await db.commit()
+    return book
+
+
+async def test_comic_toc_lists_pages(db, tmp_path):
+    book = await add_comic(db, tmp_path / "comic.cbz", ["002.png", "001.png"])
+    toc = await get_book_toc(book=book, db=db, current_user=await add_user(db))
+
+    assert toc["format"] == "comic"
+    assert toc["totalImages"] == 2
+
+
+async def test_comic_without_images_is_client_error(db, tmp_path):
+    book = await add_comic(db, tmp_path / "empty.cbz", [])
+
+    with pytest.raises(HTTPException) as error:
+        await get_book_toc(book=book, db=db, current_user=await add_user(db))
+    assert error.value.status_code == 400
@@ -0,0 +1,61 @@
+"""阅读统计汇总"""
+from datetime import datetime, timedelta
+
+from app.core.reading_stats import (
+    _pending_sessions, compact_reading_stats, daily_totals, fold_session, reading_totals,
+)
+from app.models import ReadingSession
+from tests.factories import add_book, add_library, add_user
+
+
+async def add_session(db, user, book, start_time, duration_seconds) -> ReadingSession:
+    session = ReadingSession(
+        user_id=user.id, book_id=book.id, start_time=start_time, duration_seconds=duration_seconds
+    )
+    db.add(session)
+    await db.flush()
+    return session
+
+
+async def test_live_delta_includes_sessions_started_before_today(db):
+    user = await add_user(db)
+    book = await add_book(db, await add_library(db), "三体")
+    now = datetime.utcnow()
+    yesterday = now - timedelta(days=1)
+
+    # 昨天开始、已部分计入的会话，今天继续心跳但尚未计入
+    overnight = await add_session(db, user, book, yesterday, 600)
+    await fold_session(db, overnight)
+    overnight.duration_seconds = 1800
+    await add_session(db, user, book, now, 300)
+    await db.commit()
+
+    expected_days = {
+        yesterday.strftime("%Y-%m-%d"): (1800, 1),
+        now.strftime("%Y-%m-%d"): (300, 1),
+    }
+    totals = await reading_totals(db, user.id)
+    assert (totals.duration_seconds, totals.session_count, totals.book_count) == (2100, 2, 1)
+    assert await daily_totals(db, user.id, yesterday) == expected_days
+
+    # 压缩计入后结果不变，且不再有未计入的会话
+    assert (await compact_reading_stats(db))["folded"] == 2
+    assert (await reading_totals(db, user.id)).duration_seconds == 2100
+    assert await daily_totals(db, user.id, yesterday) == expected_days
+
+
+async def test_pending_sessions_use_partial_index(db):
+    if db.get_bind().dialect.name != "sqlite":
+        return
+    user = await add_user(db)
+    book = await add_book(db, await add_library(db), "三体")
+    for _ in range(20):
+        await fold_session(db, await add_session(db, user, book, datetime.utcnow(), 60))
+    await db.commit()
+
+    compiled = _pending_sessions(user.id).compile(db.get_bind())
+    conn = await db.connection()
+    plan = await conn.exec_driver_sql(
+        f"EXPLAIN QUERY PLAN {compiled}", tuple(compiled.params[key] for key in compiled.positiontup)
+    )
+    assert "ix_reading_sessions_pending" in " ".join(str(row[-1]) for row in plan.all())
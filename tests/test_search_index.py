@@ -0,0 +1,93 @@
+"""全文检索（SQLite FTS5 / PostgreSQL pg_trgm）"""
+from sqlalchemy import select
+
+from app.core import search_index
+from app.models import Author, Book
+from tests.factories import add_author, add_book, add_library
+
+
+async def search(db, keyword: str):
+    query, ranked = search_index.apply_keyword_search(select(Book.id, Book.title), keyword)
+    result = await db.execute(query)
+    return [row.title for row in result.all()], ranked
+
+
+async def add_books(db):
+    library = await add_library(db)
+    liu = await add_author(db, "刘慈欣")
+    await add_book(db, library, "三体", liu, description="地球往事三部曲第一部")
+    await add_book(db, library, "三体II 黑暗森林", liu)
+    await add_book(db, library, "球状闪电", liu)
+    await add_book(db, library, "Ball Lightning", liu, description="English translation")
+    await db.commit()
+    return library
+
+
+async def test_index_available(db):
+    assert search_index.is_available()
+
+
+async def test_cjk_and_case_insensitive_search(db):
+    await add_books(db)
+
+    titles, ranked = await search(db, "三体")
+    assert ranked
+    assert sorted(titles) == ["三体", "三体II 黑暗森林"]
+
+    titles, _ = await search(db, "黑暗森林")
+    assert titles == ["三体II 黑暗森林"]
+
+    titles, _ = await search(db, "ball lightning")
+    assert titles == ["Ball Lightning"]
+
+    # 作者名与简介同样可检索，多个词取交集
+    titles, _ = await search(db, "刘慈欣 闪电")
+    assert titles == ["球状闪电"]
+    titles, _ = await search(db, "地球往事")
+    assert titles == ["三体"]
+
+
+async def test_title_match_ranks_first(db):
+    library = await add_books(db)
+    await add_book(db, library, "另一本书", description="提到了球状闪电")
+    await db.commit()
+
+    titles, _ = await search(db, "球状闪电")
+    assert titles == ["球状闪电", "另一本书"]
+
+
+async def test_index_follows_updates_and_deletes(db):
+    await add_books(db)
+    book = (await db.execute(select(Book).where(Book.title == "球状闪电"))).scalar_one()
+
+    book.title = "超新星纪元"
+    await db.commit()
+    assert (await search(db, "超新星"))[0] == ["超新星纪元"]
+    assert (await search(db, "球状闪电"))[0] == []
+
+    await db.delete(book)
+    await db.commit()
+    assert (await search(db, "超新星"))[0] == []
+
+
+async def test_snippets_mark_matches(db):
+    await add_books(db)
+    book = (await db.execute(select(Book).where(Book.title == "三体"))).scalar_one()
+
+    snippets = await search_index.get_snippets(db, "地球往事", [book.id], columns=["description"])
+    assert "<mark>" in snippets[book.id]
+
+
+async def test_like_fallback_with_author_join(db, monkeypatch):
+    await add_books(db)
+    monkeypatch.setattr(search_index, "search_subquery", lambda keyword, columns=None: None)
+
+    # 调用方已联结作者表时，回退查询不能重复联结同一张表
+    query = select(Book.title, Author.name).outerjoin(Author, Book.author_id == Author.id)
+    query, ranked = search_index.apply_keyword_search(query, "刘慈欣")
+    result = await db.execute(query.order_by(Book.id))
+    assert not ranked
+    assert [row.title for row in result.all()] == ["三体", "三体II 黑暗森林", "球状闪电", "Ball Lightning"]
+
+    titles, _ = await search(db, "ball")
+    assert titles == ["Ball Lightning"]
@@ -0,0 +1,78 @@
+"""搜索建议前缀索引：增量更新与书目变更分类"""
+from app.core import catalog_events
+from app.core.suggest_index import SuggestionIndex
+from tests.factories import add_author, add_book, add_library
+
+
+def titles(results):
+    return [text for _, _, text in results]
+
+
+async def test_incremental_delta_and_merge(db):
+    public = await add_library(db)
+    other = await add_library(db)
+    liu = await add_author(db, "刘慈欣")
+    await add_book(db, public, "三体", liu)
+    await db.commit()
+
+    index = SuggestionIndex()
+    await index.rebuild()
+    assert titles(index.suggest("st", [public.id], 10)) == ["三体"]
+
+    # 新书与新作者先进入增量数组，查询时一并查找
+    ball = await add_book(db, public, "球状闪电", liu)
+    han = await add_author(db, "韩松")
+    subway = await add_book(db, other, "地铁", han)
+    await db.commit()
+    await index.refresh_books({ball.id, subway.id})
+    assert index.stats()["delta_keys"] > 0
+    assert titles(index.suggest("qzsd", [public.id], 10)) == ["球状闪电"]
+    assert titles(index.suggest("hs", [other.id], 10)) == ["韩松"]
+    assert index.suggest("hs", [public.id], 10) == []
+
+    # 已有作者出现在新书库
+    earth = await add_book(db, other, "流浪地球", liu)
+    await db.commit()
+    await index.refresh_books({earth.id})
+    assert titles(index.suggest("刘", [other.id], 10)) == ["刘慈欣"]
+
+    # 改名后旧键失效
+    ball.title = "Ball Lightning"
+    await db.commit()
+    await index.refresh_books({ball.id})
+    assert index.suggest("qzsd", [public.id], 10) == []
+
+    await index.merge_delta()
+    stats = index.stats()
+    assert stats["delta_keys"] == 0
+    assert titles(index.suggest("ball", [public.id], 10)) == ["Ball Lightning"]
+    assert titles(index.suggest("刘", [other.id], 10)) == ["刘慈欣"]
+    assert titles(index.suggest("lldq", [other.id], 10)) == ["流浪地球"]
+    assert index.suggest("hs", [public.id], 10) == []
+
+
+async def test_catalog_change_marks_renames_only(db, monkeypatch):
+    changes = []
+    monkeypatch.setattr(catalog_events, "_listeners", [changes.append])
+    library = await add_library(db)
+    liu = await add_author(db, "刘慈欣")
+    await db.commit()
+    changes.clear()
+
+    # 扫描时的典型提交：新增作者、已有作者作品数加一
+    han = await add_author(db, "韩松")
+    await add_book(db, library, "地铁", han)
+    liu.book_count += 1
+    await db.commit()
+    assert len(changes) == 1 and "authors" in changes[0].tables
+    assert changes[0].renamed_author_ids == set() and not changes[0].full
+
+    liu.name = "大刘"
+    await db.commit()
+    assert changes[-1].renamed_author_ids == {liu.id}
+
+    empty = await add_library(db)
+    await db.commit()
+    await db.delete(empty)
+    await db.commit()
+    assert changes[-1].deleted_library_ids == {empty.id}
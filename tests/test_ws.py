@@ -0,0 +1,74 @@
+"""WebSocket 连接的认证失效处理"""
+import asyncio
+
+from app.core.websocket import manager
+from app.security import create_access_token
+from app.utils.auth_cache import invalidate_user, invalidate_user_id
+from app.web.routes.ws import AUTH_EXPIRED_CLOSE_CODE, revalidate_connections
+from tests.factories import add_user
+
+
+class FakeWebSocket:
+    def __init__(self):
+        self.close_code = None
+
+    async def accept(self):
+        pass
+
+    async def send_json(self, message):
+        pass
+
+    async def send_text(self, message):
+        pass
+
+    async def close(self, code: int = 1000):
+        self.close_code = code
+
+
+async def connect(user) -> FakeWebSocket:
+    websocket = FakeWebSocket()
+    token = create_access_token(data={"sub": user.username, "ver": user.token_version or 0})
+    await manager.connect(websocket, user.id, token)
+    return websocket
+
+
+async def wait_closed(websocket: FakeWebSocket) -> None:
+    for _ in range(100):
+        if websocket.close_code is not None:
+            return
+        await asyncio.sleep(0.01)
+
+
+async def test_password_change_closes_connections(db):
+    user = await add_user(db)
+    other = await add_user(db)
+    await db.commit()
+    websocket, other_websocket = await connect(user), await connect(other)
+
+    user.token_version = 1
+    await db.commit()
+    invalidate_user(user.username)
+    await wait_closed(websocket)
+
+    assert websocket.close_code == AUTH_EXPIRED_CLOSE_CODE
+    assert manager.user_connections(user.id) == []
+    assert other_websocket.close_code is None
+    await manager.stop()
+
+
+async def test_deleted_user_closes_connections(db):
+    user = await add_user(db)
+    await db.commit()
+    websocket = await connect(user)
+
+    # 未变更的用户重新校验后保持连接
+    await revalidate_connections(user_id=user.id)
+    assert websocket.close_code is None
+
+    await db.delete(user)
+    await db.commit()
+    invalidate_user_id(user.id)
+    await wait_closed(websocket)
+
+    assert websocket.close_code == AUTH_EXPIRED_CLOSE_CODE
+    await manager.stop()